@@ -1,20 +1,49 @@
-from dotenv import load_dotenv
-import os
-from anthropic import Anthropic
-load_dotenv()
-my_api_key = os.getenv("ANTHROPIC_API_KEY")
+import argparse
+import asyncio
 
+from assistant import Assistant
+from conversation import Conversation
+from intent_router import IntentRouter
+from model_router import MODEL_ROUTING, ModelRouter
+from response_cache import ResponseCache
 
 
-client = Anthropic()
+async def chat(user_id, show_tokens=False):
+    cache = ResponseCache()
+    cache.attach()
+    try:
+        assistant = Assistant(cache=cache)
+        await converse(IntentRouter(ModelRouter(assistant) if MODEL_ROUTING else assistant), user_id,
+                       show_tokens=show_tokens)
+    finally:
+        cache.detach()
 
-our_first_message = client.messages.create(
-    model="claude-3-haiku-20240307",
-    max_tokens=1000,
-    messages=[
-        {"role": "user", "content": "Hi there! Please write me a haiku about a pet chicken"}
-    ]
-)
 
-print(our_first_message.content[0].text)
+async def converse(assistant, user_id, conversation=None, show_tokens=False):
+    conversation = conversation or Conversation()
+    while True:
+        try:
+            prompt = await asyncio.to_thread(input, "you> ")
+        except EOFError:
+            break
+        if not prompt.strip():
+            continue
+        conversation.add_user_message(prompt)
+        reply = await assistant.respond(user_id, await conversation.messages())
+        stats = conversation.record(reply)
+        print(f"assistant> {reply['text']}")
+        if show_tokens:
+            print(f"  [turn {stats['turn']}: sent {stats['sent_tokens']} of {stats['full_tokens']} history tokens, "
+                  f"{stats['input_tokens']} input tokens billed]")
 
+
+def main():
+    parser = argparse.ArgumentParser(description="Chat with the banking assistant as a given user")
+    parser.add_argument("--user-id", type=int, required=True)
+    parser.add_argument("--show-tokens", action="store_true", help="Print per-turn token usage")
+    args = parser.parse_args()
+    asyncio.run(chat(args.user_id, show_tokens=args.show_tokens))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,619 @@
+import asyncio
+import contextvars
+import hashlib
+import json
+import os
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+import storage as db_ops
+import duplicates
+import fx
+import llm_client
+import velocity
+from conversation import CONVERSATION_TOOL_RESULT_TOKENS, truncate_tool_result
+from deadlines import Deadline, DeadlineExceeded, LatencyTracker, hedged
+from response_cache import make_key
+from schemas import TransactionCreate
+
+ASSISTANT_MODEL = os.getenv("ASSISTANT_MODEL", "claude-3-haiku-20240307")
+ASSISTANT_MAX_TOKENS = int(os.getenv("ASSISTANT_MAX_TOKENS", "1024"))
+ASSISTANT_TOOL_WORKERS = int(os.getenv("ASSISTANT_TOOL_WORKERS", "8"))
+ASSISTANT_PROMPT_CACHING = os.getenv("ASSISTANT_PROMPT_CACHING", "1") == "1"
+ASSISTANT_POLICIES_PATH = os.getenv("ASSISTANT_POLICIES_PATH")
+PROMPT_CACHING_BETA = "prompt-caching-2024-07-31"
+# Per-turn time budget. When the primary model runs into the last
+# ASSISTANT_FALLBACK_RESERVE seconds, the call is retried on the fallback model with a
+# shorter answer; if that does not finish either, the customer gets CANNED_RESPONSE.
+ASSISTANT_DEADLINE = float(os.getenv("ASSISTANT_DEADLINE", "30"))
+ASSISTANT_FALLBACK_RESERVE = float(os.getenv("ASSISTANT_FALLBACK_RESERVE", "8"))
+ASSISTANT_FALLBACK_MODEL = os.getenv("ASSISTANT_FALLBACK_MODEL", "claude-3-haiku-20240307")
+ASSISTANT_FALLBACK_MAX_TOKENS = int(os.getenv("ASSISTANT_FALLBACK_MAX_TOKENS", "256"))
+# Hedging sends a second identical model call when the first is slower than the
+# given percentile of recent calls, and keeps whichever answers first
+ASSISTANT_HEDGE = os.getenv("ASSISTANT_HEDGE", "0") == "1"
+ASSISTANT_HEDGE_PERCENTILE = float(os.getenv("ASSISTANT_HEDGE_PERCENTILE", "95"))
+MAX_TOOL_ROUNDS = 5
+MAX_TRANSACTIONS = 50
+
+SYSTEM_PROMPT = (
+    "You are the banking assistant for a money transfer service. "
+    "Use the tools to look up the customer's profile, accounts, transactions and recipients; "
+    "never guess balances or account numbers. "
+    "Before creating a transaction, confirm the sender account, recipient account and amount with the customer. "
+    "Tool results are compact JSON; lists of rows come as {\"columns\": [...], \"rows\": [[...], ...]}."
+)
+
+BANK_POLICIES = (
+    "Transfers are created as pending and settle within one business day; international transfers "
+    "can take up to five business days.",
+    "Never reveal another customer's data, full account numbers of recipients, or internal identifiers "
+    "other than the customer's own account and transaction ids.",
+    "Do not give investment, tax or legal advice; suggest a qualified advisor instead.",
+    "If the customer reports fraud, a lost card or an unrecognized transaction, tell them to contact "
+    "support immediately and do not create new transactions.",
+    "Amounts are always stated with their currency.",
+)
+
+CANNED_RESPONSE = ("I'm sorry, I couldn't put together an answer in time. "
+                   "Please try again in a moment.")
+
+USAGE_FIELDS = ("input_tokens", "output_tokens", "cache_creation_input_tokens", "cache_read_input_tokens")
+
+
+def load_policies(path=ASSISTANT_POLICIES_PATH):
+    # One policy per non-empty line, in file order; the built-in list without a file
+    if not path:
+        return BANK_POLICIES
+    with open(path) as f:
+        return tuple(line.strip() for line in f if line.strip())
+
+
+def build_system_prompt(policies=None):
+    # Assembled from constants only, in a fixed order, so the text is identical
+    # byte-for-byte on every request and the prompt cache prefix keeps matching.
+    # Per-request details (the customer id) go in a separate block after it.
+    policies = BANK_POLICIES if policies is None else policies
+    lines = [SYSTEM_PROMPT, "", "Bank policies:"] + [f"- {policy}" for policy in policies]
+    return "\n".join(lines)
+
+
+class ToolError(Exception):
+    pass
+
+
+# Tools. Every handler runs on behalf of one authenticated user: the user_id is bound
+# by the assistant, never taken from the model, and lookups are checked for ownership.
+
+def _owned_account(user_id, account_id):
+    account = db_ops.get_account(account_id)
+    if account is None or account["user_id"] != user_id:
+        raise ToolError(f"Account {account_id} not found")
+    return account
+
+
+def get_user_profile(user_id):
+    user = db_ops.get_user(user_id)
+    if user is None:
+        raise ToolError("User not found")
+    return user
+
+
+def list_accounts(user_id):
+    return db_ops.get_user_accounts(user_id)
+
+
+def get_account(user_id, account_id):
+    return _owned_account(user_id, account_id)
+
+
+def get_transaction(user_id, transaction_id):
+    transaction = db_ops.get_transaction(transaction_id)
+    if transaction is not None:
+        owned = {account["account_id"] for account in db_ops.get_user_accounts(user_id)}
+        if transaction["sender_account_id"] in owned or transaction["recipient_account_id"] in owned:
+            return transaction
+    raise ToolError(f"Transaction {transaction_id} not found")
+
+
+def list_recent_transactions(user_id, limit=10):
+    return db_ops.get_user_transactions(user_id, min(max(int(limit), 1), MAX_TRANSACTIONS))
+
+
+def search_transactions(user_id, query, start_date=None, end_date=None, limit=10):
+    # Dates are inclusive calendar days
+    start = datetime.combine(date.fromisoformat(start_date), datetime.min.time()) if start_date else None
+    end = datetime.combine(date.fromisoformat(end_date) + timedelta(days=1), datetime.min.time()) if end_date else None
+    return db_ops.search_transactions(query, user_id=user_id, start=start, end=end,
+                                      limit=min(max(int(limit), 1), MAX_TRANSACTIONS))
+
+
+def list_recipients(user_id):
+    return db_ops.get_all_recipients(user_id)
+
+
+def list_favorite_recipients(user_id):
+    return db_ops.get_favorite_recipients(user_id)
+
+
+def create_transaction(user_id, sender_account_id, recipient_account_id, amount, description=None, currency=None):
+    # The transaction is booked in the sender's currency. An amount given in another
+    # currency is converted first, and the result says what the recipient gets when
+    # their account is in a different currency, with the rates used. A repeat of a
+    # transfer made moments ago is held until confirmed and points at the earlier one.
+    sender = _owned_account(user_id, sender_account_id)
+    recipient = db_ops.get_account(recipient_account_id)
+    if recipient is None:
+        raise ToolError(f"Account {recipient_account_id} not found")
+    snapshot = fx.current()
+    try:
+        booked = snapshot.convert(amount, currency or sender["currency"], sender["currency"])
+    except ValueError as e:
+        raise ToolError(str(e))
+    risk = velocity.check_transfer(sender_account_id, recipient_account_id, booked, sender["currency"])
+    if risk["action"] == "block":
+        raise ToolError("The transfer was declined by our risk checks; the customer should contact support")
+    duplicate = duplicates.check_transfer(sender_account_id, recipient_account_id, booked, sender["currency"])
+    status = "pending"
+    if risk["action"] == "hold":
+        status = "held"
+    elif duplicate["action"] == "hold":
+        status = duplicates.HOLD_STATUS
+    transaction = TransactionCreate(
+        sender_account_id=sender_account_id,
+        recipient_account_id=recipient_account_id,
+        amount=booked,
+        currency=sender["currency"],
+        status=status,
+        transaction_type="transfer",
+        description=description,
+    )
+    transaction_id = db_ops.create_transaction(**transaction.model_dump())
+    if transaction_id is None:
+        velocity.release(risk)
+        duplicates.release(duplicate)
+        raise ToolError("Transaction creation failed")
+    result = db_ops.get_transaction(transaction_id)
+    if duplicate["action"] != "allow":
+        result["possible_duplicate_of"] = duplicate["duplicate_of"]
+    if (currency or sender["currency"]) != sender["currency"] or recipient["currency"] != sender["currency"]:
+        result["fx"] = {
+            "rate_version": snapshot.version,
+            "requested_amount": Decimal(str(amount)),
+            "requested_currency": currency or sender["currency"],
+            "recipient_amount": snapshot.convert(booked, sender["currency"], recipient["currency"]),
+            "recipient_currency": recipient["currency"],
+            "rate": snapshot.rate(sender["currency"], recipient["currency"]),
+        }
+    return result
+
+
+def _release_held_transaction(user_id, transaction_id, status):
+    # Only the sender decides on a transfer held as a likely duplicate
+    transaction = db_ops.get_transaction(transaction_id)
+    if transaction is None:
+        raise ToolError(f"Transaction {transaction_id} not found")
+    _owned_account(user_id, transaction["sender_account_id"])
+    if db_ops.set_transaction_status(transaction_id, status, duplicates.HOLD_STATUS) == 0:
+        raise ToolError(f"Transaction {transaction_id} is not awaiting confirmation")
+    return db_ops.get_transaction(transaction_id)
+
+
+def confirm_transaction(user_id, transaction_id):
+    return _release_held_transaction(user_id, transaction_id, "pending")
+
+
+def cancel_transaction(user_id, transaction_id):
+    return _release_held_transaction(user_id, transaction_id, "cancelled")
+
+
+def _model_input_schema(model, fields):
+    schema = model.model_json_schema()
+    return {
+        "type": "object",
+        "properties": {field: schema["properties"][field] for field in fields},
+        "required": [field for field in schema.get("required", []) if field in fields],
+    }
+
+
+def _id_input_schema(field):
+    return {"type": "object", "properties": {field: {"type": "integer"}}, "required": [field]}
+
+
+def _with_properties(schema, **properties):
+    schema["properties"].update(properties)
+    return schema
+
+
+NO_INPUT = {"type": "object", "properties": {}}
+
+TOOLS = {
+    "get_user_profile": {
+        "description": "Get the customer's profile: name, username, email, phone and verification status.",
+        "input_schema": NO_INPUT,
+        "handler": get_user_profile,
+    },
+    "list_accounts": {
+        "description": "List the customer's accounts with balance, account type and currency.",
+        "input_schema": NO_INPUT,
+        "handler": list_accounts,
+    },
+    "get_account": {
+        "description": "Get one of the customer's accounts by account_id.",
+        "input_schema": _id_input_schema("account_id"),
+        "handler": get_account,
+    },
+    "get_transaction": {
+        "description": "Get a transaction that involves one of the customer's accounts.",
+        "input_schema": _id_input_schema("transaction_id"),
+        "handler": get_transaction,
+    },
+    "list_recent_transactions": {
+        "description": "List the customer's most recent transactions across all their accounts, newest first.",
+        "input_schema": {"type": "object", "properties": {
+            "limit": {"type": "integer", "minimum": 1, "maximum": MAX_TRANSACTIONS, "default": 10}}},
+        "handler": list_recent_transactions,
+    },
+    "search_transactions": {
+        "description": "Search the customer's transactions by description, e.g. \"rent march\" or \"invoice 4471\"; "
+                       "partial words match too. Best matches first.",
+        "input_schema": {"type": "object", "properties": {
+            "query": {"type": "string"},
+            "start_date": {"type": "string", "format": "date", "description": "First day to include, YYYY-MM-DD"},
+            "end_date": {"type": "string", "format": "date", "description": "Last day to include, YYYY-MM-DD"},
+            "limit": {"type": "integer", "minimum": 1, "maximum": MAX_TRANSACTIONS, "default": 10}},
+            "required": ["query"]},
+        "handler": search_transactions,
+    },
+    "list_recipients": {
+        "description": "List all saved transfer recipients of the customer.",
+        "input_schema": NO_INPUT,
+        "handler": list_recipients,
+    },
+    "list_favorite_recipients": {
+        "description": "List the customer's favorite recipients.",
+        "input_schema": NO_INPUT,
+        "handler": list_favorite_recipients,
+    },
+    "create_transaction": {
+        "description": "Create a pending transfer from one of the customer's accounts. "
+                       "It is booked in the sender account's currency; an amount in another currency is "
+                       "converted at the current rate, and the result shows what the recipient receives. "
+                       "Risk checks can decline a transfer or hold it for review (status \"held\"). "
+                       "A transfer repeating one made moments ago is held (status \"unconfirmed\") and the "
+                       "result names the earlier transaction (possible_duplicate_of); ask the customer, then "
+                       "confirm_transaction or cancel_transaction it. Never create the transfer again.",
+        "input_schema": _with_properties(
+            _model_input_schema(TransactionCreate, ("sender_account_id", "recipient_account_id", "amount", "description")),
+            currency={"type": "string", "enum": list(fx.CURRENCY_EXPONENTS),
+                      "description": "Currency of amount; defaults to the sender account's"}),
+        "handler": create_transaction,
+        "writes": True,
+    },
+    "confirm_transaction": {
+        "description": "Send on a transfer held as a likely duplicate (status \"unconfirmed\") once the "
+                       "customer has said they really mean to send it again.",
+        "input_schema": _id_input_schema("transaction_id"),
+        "handler": confirm_transaction,
+        "writes": True,
+    },
+    "cancel_transaction": {
+        "description": "Cancel a transfer held as a likely duplicate (status \"unconfirmed\") that the "
+                       "customer did not mean to send.",
+        "input_schema": _id_input_schema("transaction_id"),
+        "handler": cancel_transaction,
+        "writes": True,
+    },
+}
+
+
+def tool_definitions():
+    return [
+        {"name": name, "description": tool["description"], "input_schema": tool["input_schema"]}
+        for name, tool in TOOLS.items()
+    ]
+
+
+def empty_usage():
+    return {field: 0 for field in USAGE_FIELDS}
+
+
+# Result shaping. Tool output is re-sent on every later turn, so it is kept small:
+# no nulls or secrets, short timestamps, and lists of rows in column/row form so the
+# keys are not repeated per row.
+
+HIDDEN_FIELDS = {"password_hash"}
+
+
+def _compact(value):
+    if isinstance(value, dict):
+        return {key: _compact(item) for key, item in value.items() if item is not None and key not in HIDDEN_FIELDS}
+    if isinstance(value, (list, tuple)):
+        rows = [_compact(item) for item in value]
+        if len(rows) > 1 and all(isinstance(row, dict) for row in rows):
+            columns = list(dict.fromkeys(key for row in rows for key in row))
+            return {"columns": columns, "rows": [[row.get(column) for column in columns] for row in rows]}
+        return rows
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat(timespec="seconds")
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
+def shape_result(value):
+    return json.dumps(_compact(value), separators=(",", ":"), default=str)
+
+
+_executor = None
+_executor_pid = None
+
+
+def get_tool_executor():
+    # Tool handlers call the blocking storage layer, so they run on a shared thread pool
+    global _executor, _executor_pid
+    if _executor is None or _executor_pid != os.getpid():
+        _executor = ThreadPoolExecutor(max_workers=ASSISTANT_TOOL_WORKERS, thread_name_prefix="assistant-tool")
+        _executor_pid = os.getpid()
+    return _executor
+
+
+def _content_params(content):
+    params = []
+    for block in content:
+        if block.type == "text":
+            params.append({"type": "text", "text": block.text})
+        elif block.type == "tool_use":
+            params.append({"type": "tool_use", "id": block.id, "name": block.name, "input": block.input})
+    return params
+
+
+def _single_prompt(messages):
+    # Only opening questions are cached; later turns depend on the whole conversation
+    if len(messages) == 1 and messages[0]["role"] == "user" and isinstance(messages[0]["content"], str):
+        return messages[0]["content"]
+    return None
+
+
+class Assistant:
+    def __init__(self, client=None, model=ASSISTANT_MODEL, max_tokens=ASSISTANT_MAX_TOKENS, parallel_tools=True,
+                 cache=None, prompt_caching=ASSISTANT_PROMPT_CACHING, policies=None, deadline=ASSISTANT_DEADLINE,
+                 fallback_model=ASSISTANT_FALLBACK_MODEL, fallback_reserve=ASSISTANT_FALLBACK_RESERVE,
+                 hedge=ASSISTANT_HEDGE, hedge_percentile=ASSISTANT_HEDGE_PERCENTILE,
+                 tool_result_tokens=CONVERSATION_TOOL_RESULT_TOKENS):
+        self.client = client
+        self.model = model
+        self.max_tokens = max_tokens
+        self.parallel_tools = parallel_tools
+        self.cache = cache
+        self.prompt_caching = prompt_caching
+        self.system_prompt = build_system_prompt(load_policies() if policies is None else policies)
+        # Built once so every request sends the same bytes for the cached prefix
+        self.tools = tool_definitions()
+        self.usage = Counter()
+        self.deadline = deadline
+        self.fallback_model = fallback_model
+        self.fallback_reserve = fallback_reserve
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.tool_result_tokens = tool_result_tokens  # longer tool results are cut down; 0 keeps them whole
+        self.latencies = LatencyTracker()
+        self.calls = Counter()  # model calls: primary, hedges, fallbacks, canned replies
+
+    def _cache_keys(self, user_id, prompt, model):
+        # The key covers the system blocks as sent, the customer's included, so an
+        # answer is only reused under the prompt it was written for. One that used no
+        # tools survives data changes; one that read account data is also keyed to the
+        # user's current data version.
+        system = hashlib.sha256(json.dumps([block["text"] for block in self._system_blocks(user_id)]).encode()).hexdigest()
+        params = {"max_tokens": self.max_tokens, "system": system, "tools": sorted(TOOLS)}
+        shared_key = make_key(prompt, model, params)
+        user_key = make_key(prompt, model, params, [user_id, self.cache.versions.get(user_id)])
+        return shared_key, user_key
+
+    def call_tool(self, user_id, name, tool_input):
+        tool = TOOLS.get(name)
+        if tool is None:
+            return shape_result({"error": f"Unknown tool {name}"}), True
+        try:
+            content = shape_result(tool["handler"](user_id, **tool_input))
+        except (ToolError, TypeError, ValueError) as e:
+            return shape_result({"error": str(e)}), True
+        # Cut down here, before the next model call reads it
+        if self.tool_result_tokens:
+            content = truncate_tool_result(content, self.tool_result_tokens)
+        return content, False
+
+    async def run_tools(self, user_id, tool_uses):
+        loop = asyncio.get_running_loop()
+        executor = get_tool_executor()
+
+        def run(block):
+            # Copies the caller's contextvars into the worker thread, as asyncio.to_thread does
+            context = contextvars.copy_context()
+            return loop.run_in_executor(executor, context.run, self.call_tool, user_id, block.name, block.input)
+
+        # Tool calls within one model turn are independent, so they run side by side
+        if self.parallel_tools:
+            outputs = await asyncio.gather(*(run(block) for block in tool_uses))
+        else:
+            outputs = [await run(block) for block in tool_uses]
+        return [
+            {"type": "tool_result", "tool_use_id": block.id, "content": content, "is_error": is_error}
+            for block, (content, is_error) in zip(tool_uses, outputs)
+        ]
+
+    def _cached_reply(self, user_id, messages, model):
+        # Returns (cache keys or None, cached reply or None)
+        prompt = _single_prompt(messages) if self.cache is not None else None
+        if prompt is None:
+            return None, None
+        keys = self._cache_keys(user_id, prompt, model)
+        text = self.cache.get(*keys)
+        if text is None:
+            return keys, None
+        return keys, {
+            "text": text,
+            "messages": list(messages) + [{"role": "assistant", "content": [{"type": "text", "text": text}]}],
+            "tool_calls": 0,
+            "usage": empty_usage(),
+            "cached": True,
+            "wrote": False,
+            "degraded": None,
+        }
+
+    def _remember(self, keys, reply):
+        if keys is None or reply["wrote"] or reply["degraded"]:
+            return
+        shared_key, user_key = keys
+        if reply["tool_calls"]:
+            self.cache.put(user_key, reply["text"], data_dependent=True)
+        else:
+            self.cache.put(shared_key, reply["text"])
+
+    def _system_blocks(self, user_id):
+        return [{"type": "text", "text": self.system_prompt}, {"type": "text", "text": f"The customer is user_id {user_id}."}]
+
+    def _request_params(self, user_id, messages, model):
+        # The API caches prompts in order tools -> system -> messages. The breakpoint
+        # on the static system block covers the tool definitions and the policies; the
+        # customer id follows it so the prefix is shared by every customer.
+        system = self._system_blocks(user_id)
+        static = system[0]
+        params = {
+            "model": model,
+            "max_tokens": self.max_tokens,
+            "system": system,
+            "tools": self.tools,
+            "messages": messages,
+        }
+        if self.prompt_caching:
+            static["cache_control"] = {"type": "ephemeral"}
+            params["extra_headers"] = {"anthropic-beta": PROMPT_CACHING_BETA}
+        return params
+
+    async def respond(self, user_id, messages, model=None):
+        # model overrides self.model for this turn, e.g. as chosen by a ModelRouter
+        model = model or self.model
+        keys, reply = self._cached_reply(user_id, messages, model)
+        if reply is not None:
+            return reply
+        async for event in self._run(user_id, messages, model, streaming=False):
+            if event["type"] == "done":
+                reply = event["reply"]
+        self._remember(keys, reply)
+        return reply
+
+    async def stream(self, user_id, messages, model=None):
+        # Yields {"type": "text" | "tool_use" | "tool_result" | "done", ...} events as the
+        # model generates; the final "done" event carries the same reply as respond()
+        model = model or self.model
+        keys, reply = self._cached_reply(user_id, messages, model)
+        if reply is not None:
+            yield {"type": "text", "text": reply["text"]}
+            yield {"type": "done", "reply": reply}
+            return
+        async for event in self._run(user_id, messages, model, streaming=True):
+            if event["type"] == "done":
+                self._remember(keys, event["reply"])
+            yield event
+
+    def _hedge_after(self):
+        return self.latencies.percentile(self.hedge_percentile) if self.hedge else None
+
+    async def _create_primary(self, client, params):
+        hedge_after = self._hedge_after()
+        start = time.monotonic()
+        if hedge_after is None:
+            response = await client.messages.create(**params)
+        else:
+            # Model calls have no side effects, so a duplicate is safe; tools run only once
+            response, started = await hedged(lambda: client.messages.create(**params), hedge_after)
+            self.calls["hedges"] += started - 1
+        # Hedged calls record the time to the first answer, which is still at least
+        # hedge_after, so the threshold does not drift down as hedges win
+        self.latencies.record(time.monotonic() - start)
+        return response
+
+    async def _create(self, client, params, deadline):
+        # Returns (response, degradation or None). The primary model gets the turn's
+        # remaining time minus the fallback reserve; the fallback model, asked for a
+        # shorter answer, gets the rest. Raises DeadlineExceeded if neither finishes.
+        self.calls["primary"] += 1
+        try:
+            return await deadline.run(self._create_primary(client, params), reserve=self.fallback_reserve), None
+        except DeadlineExceeded:
+            pass
+        self.calls["fallbacks"] += 1
+        fallback = dict(params, model=self.fallback_model,
+                        max_tokens=min(params["max_tokens"], ASSISTANT_FALLBACK_MAX_TOKENS))
+        return await deadline.run(client.messages.create(**fallback)), "fallback"
+
+    async def _run(self, user_id, messages, model, streaming):
+        client = self.client or llm_client.get_async_client()
+        deadline = Deadline(self.deadline)
+        messages = list(messages)
+        wrote = False
+        usage = empty_usage()
+        tool_calls = 0
+        degraded = None
+        for _ in range(MAX_TOOL_ROUNDS):
+            params = self._request_params(user_id, messages, model)
+            try:
+                if streaming:
+                    streamed = []
+                    # Leaving this block early (client disconnect or deadline) closes the
+                    # HTTP stream, which stops generation on the API side
+                    async with client.messages.stream(**params) as stream:
+                        texts = stream.text_stream.__aiter__()
+                        while True:
+                            try:
+                                text = await deadline.run(texts.__anext__())
+                            except StopAsyncIteration:
+                                break
+                            streamed.append(text)
+                            yield {"type": "text", "text": text}
+                        response = await deadline.run(stream.get_final_message())
+                else:
+                    response, fallback = await self._create(client, params, deadline)
+                    degraded = degraded or fallback
+            except DeadlineExceeded:
+                # A stream that already produced text ends there; otherwise the
+                # customer gets the canned answer
+                if streaming and streamed:
+                    degraded = "truncated"
+                    text = "".join(streamed)
+                else:
+                    self.calls["canned"] += 1
+                    degraded = "canned"
+                    text = CANNED_RESPONSE
+                    if streaming:
+                        yield {"type": "text", "text": text}
+                messages.append({"role": "assistant", "content": [{"type": "text", "text": text}]})
+                break
+            # The cache fields are only present when prompt caching was used
+            call_usage = {field: getattr(response.usage, field, None) or 0 for field in USAGE_FIELDS}
+            self.usage.update(call_usage)
+            for field in USAGE_FIELDS:
+                usage[field] += call_usage[field]
+            messages.append({"role": "assistant", "content": _content_params(response.content)})
+            text = "".join(block.text for block in response.content if block.type == "text")
+            tool_uses = [block for block in response.content if block.type == "tool_use"]
+            if response.stop_reason != "tool_use" or not tool_uses:
+                break
+            tool_calls += len(tool_uses)
+            wrote = wrote or any(TOOLS.get(block.name, {}).get("writes") for block in tool_uses)
+            for block in tool_uses:
+                yield {"type": "tool_use", "id": block.id, "name": block.name, "input": block.input}
+            results = await self.run_tools(user_id, tool_uses)
+            for result in results:
+                yield {"type": "tool_result", "tool_use_id": result["tool_use_id"], "is_error": result["is_error"]}
+            messages.append({"role": "user", "content": results})
+        reply = {"text": text, "messages": messages, "tool_calls": tool_calls, "usage": usage,
+                 "cached": False, "wrote": wrote, "degraded": degraded}
+        yield {"type": "done", "reply": reply}
@@ -0,0 +1,79 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import storage
+
+# Per-currency balance totals per user, as returned by storage.get_user_balances.
+# Entries are dropped when a storage change notification reports an account write
+# for the user, so the grouped query only runs again once balances have changed. On
+# Postgres the writes of other worker processes arrive the same way through
+# realtime.ChangeListener, a moment after they commit; a resync after a lost
+# listening connection drops every entry. Entries also expire after BALANCE_CACHE_TTL
+# seconds, which bounds staleness while that connection is down.
+
+BALANCE_CACHE_TTL = float(os.getenv("BALANCE_CACHE_TTL", "30"))
+BALANCE_CACHE_USERS = int(os.getenv("BALANCE_CACHE_USERS", "100000"))
+
+
+class BalanceCache:
+    def __init__(self, ttl=BALANCE_CACHE_TTL, max_users=BALANCE_CACHE_USERS):
+        self.ttl = ttl
+        self.max_users = max_users
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # user_id -> (rows, loaded_at), least recently used first
+        self._loading = {}  # user_id -> True once a write lands while its rows are being loaded
+        self.hits = 0
+        self.misses = 0
+
+    def attach(self):
+        storage.subscribe(self.on_change)
+
+    def detach(self):
+        storage.unsubscribe(self.on_change)
+        self.clear()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and time.monotonic() - entry[1] < self.ttl:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return [dict(row) for row in entry[0]]
+            self.misses += 1
+            self._loading.setdefault(user_id, False)
+        try:
+            rows = storage.get_user_balances(user_id)
+        except Exception:
+            with self._lock:
+                self._loading.pop(user_id, None)
+            raise
+        with self._lock:
+            # With concurrent loads of one user only the first to finish may keep its rows
+            if self._loading.pop(user_id, True) is False:
+                self._entries[user_id] = (rows, time.monotonic())
+                while len(self._entries) > self.max_users:
+                    self._entries.popitem(last=False)
+        return [dict(row) for row in rows]
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+            if user_id in self._loading:
+                self._loading[user_id] = True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            for user_id in self._loading:
+                self._loading[user_id] = True
+
+    def on_change(self, change):
+        # Balances only change through account writes; a deleted user takes their
+        # accounts along
+        if change["operation"] == "resync":
+            self.clear()
+        elif change["table"] == "accounts" or (change["table"] == "users" and change["operation"] == "delete"):
+            for user_id in change["user_ids"]:
+                self.invalidate(user_id)
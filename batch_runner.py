@@ -0,0 +1,212 @@
+# Runs a JSONL file of independent assistant requests (nightly statement explanations,
+# categorization prompts, ...) with bounded concurrency and request pacing, appending
+# one result line per request to an output JSONL file. Requests already answered in the
+# output file are skipped, so an interrupted run resumes where it stopped.
+#
+#   python batch_runner.py prompts.jsonl results.jsonl --concurrency 16 --rpm 600
+#   python batch_runner.py prompts.jsonl results.jsonl --stub --stub-error-rate 0.1
+#
+# Input lines: {"id": ..., "prompt": "..."} or {"id": ..., "messages": [...]}, optionally
+# with "user_id" (answered by the banking assistant with its tools), "system",
+# "model" and "max_tokens". "request_id" is accepted in place of "id".
+
+import argparse
+import asyncio
+import json
+import os
+import time
+
+import llm_client
+from assistant import ASSISTANT_MAX_TOKENS, ASSISTANT_MODEL, Assistant
+
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "16"))
+BATCH_RPM = float(os.getenv("BATCH_RPM", "0"))
+PROGRESS_INTERVAL = 10.0
+
+
+class Pacer:
+    # Spaces request starts evenly to stay under a requests-per-minute limit; 0 disables it
+    def __init__(self, rpm):
+        self.interval = 60.0 / rpm if rpm else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+def completed_ids(path):
+    # Ids with a successful result in an existing output file
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # a line cut short by a crash
+            if "error" not in record:
+                done.add(record["id"])
+    return done
+
+
+def ends_with_newline(path):
+    # A crash can leave half a line at the end; the next record must start on a fresh line
+    with open(path, "rb") as f:
+        if f.seek(0, os.SEEK_END) == 0:
+            return True
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+def read_requests(path, prompt_field="prompt"):
+    # Yields (id, request or None, error or None) lazily so huge inputs are never held in memory
+    with open(path) as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+            except ValueError as e:
+                yield f"line-{number}", None, f"Invalid JSON: {e}"
+                continue
+            request_id = request.get("id", request.get("request_id", f"line-{number}"))
+            if "messages" not in request and not isinstance(request.get(prompt_field), str):
+                yield request_id, None, f"Missing {prompt_field} or messages"
+                continue
+            yield request_id, request, None
+
+
+class BatchRunner:
+    def __init__(self, client=None, concurrency=BATCH_CONCURRENCY, rpm=BATCH_RPM, prompt_field="prompt"):
+        self.client = client
+        self.concurrency = concurrency
+        self.pacer = Pacer(rpm)
+        self.prompt_field = prompt_field
+        self.stats = {"completed": 0, "failed": 0, "skipped": 0, "input_tokens": 0, "output_tokens": 0}
+
+    async def execute(self, request):
+        client = self.client or llm_client.get_async_client()
+        messages = request.get("messages") or [{"role": "user", "content": request[self.prompt_field]}]
+        if "user_id" in request:
+            reply = await Assistant(client=client, max_tokens=request.get("max_tokens", ASSISTANT_MAX_TOKENS)) \
+                .respond(request["user_id"], messages)
+            return reply["text"], reply["usage"]
+        params = {
+            "model": request.get("model", ASSISTANT_MODEL),
+            "max_tokens": request.get("max_tokens", ASSISTANT_MAX_TOKENS),
+            "messages": messages,
+        }
+        if "system" in request:
+            params["system"] = request["system"]
+        response = await client.messages.create(**params)
+        text = "".join(block.text for block in response.content if block.type == "text")
+        return text, {"input_tokens": response.usage.input_tokens, "output_tokens": response.usage.output_tokens}
+
+    async def run(self, input_path, output_path, progress=False):
+        done = completed_ids(output_path)
+        queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        start = time.perf_counter()
+
+        with open(output_path, "a") as output:
+            if not ends_with_newline(output_path):
+                output.write("\n")
+
+            def write(record):
+                output.write(json.dumps(record, default=str) + "\n")
+                output.flush()
+
+            async def worker():
+                while True:
+                    request_id, request = await queue.get()
+                    try:
+                        await self.pacer.wait()
+                        began = time.perf_counter()
+                        text, usage = await self.execute(request)
+                    except Exception as e:
+                        self.stats["failed"] += 1
+                        write({"id": request_id, "error": f"{type(e).__name__}: {e}"})
+                    else:
+                        self.stats["completed"] += 1
+                        self.stats["input_tokens"] += usage["input_tokens"]
+                        self.stats["output_tokens"] += usage["output_tokens"]
+                        write({"id": request_id, "text": text, "usage": usage,
+                               "latency_ms": round((time.perf_counter() - began) * 1000)})
+                    finally:
+                        queue.task_done()
+
+            async def report():
+                while True:
+                    await asyncio.sleep(PROGRESS_INTERVAL)
+                    print(self.summary(time.perf_counter() - start))
+
+            workers = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+            reporter = asyncio.create_task(report()) if progress else None
+            try:
+                for request_id, request, error in read_requests(input_path, self.prompt_field):
+                    if request_id in done:
+                        self.stats["skipped"] += 1
+                        continue
+                    done.add(request_id)
+                    if error is not None:
+                        self.stats["failed"] += 1
+                        write({"id": request_id, "error": error})
+                        continue
+                    await queue.put((request_id, request))
+                await queue.join()
+            finally:
+                for task in workers + ([reporter] if reporter else []):
+                    task.cancel()
+                await asyncio.gather(*workers, *([reporter] if reporter else []), return_exceptions=True)
+        self.stats["elapsed"] = time.perf_counter() - start
+        return self.stats
+
+    def summary(self, elapsed):
+        stats = self.stats
+        rate = stats["completed"] / elapsed if elapsed else 0.0
+        tokens = (stats["input_tokens"] + stats["output_tokens"]) / elapsed if elapsed else 0.0
+        return (f"completed {stats['completed']}, failed {stats['failed']}, skipped {stats['skipped']} "
+                f"in {elapsed:.1f}s: {rate:.1f} requests/s, {tokens:.0f} tokens/s")
+
+
+async def run_batch(args, client):
+    runner = BatchRunner(client=client, concurrency=args.concurrency, rpm=args.rpm, prompt_field=args.prompt_field)
+    try:
+        stats = await runner.run(args.input, args.output, progress=True)
+    finally:
+        await client.close()
+    print(runner.summary(stats["elapsed"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a JSONL file of assistant requests")
+    parser.add_argument("input")
+    parser.add_argument("output")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY)
+    parser.add_argument("--rpm", type=float, default=BATCH_RPM, help="Requests per minute, 0 for no pacing")
+    parser.add_argument("--prompt-field", default="prompt")
+    parser.add_argument("--stub", action="store_true", help="Answer with a local stub_llm server")
+    parser.add_argument("--stub-latency-ms", type=float, default=200.0)
+    parser.add_argument("--stub-error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    if not args.stub:
+        asyncio.run(run_batch(args, llm_client.get_async_client()))
+        return
+    import stub_llm
+    stub = stub_llm.create_app(latency=args.stub_latency_ms / 1000, retry_after=0.5,
+                               errors=stub_llm.random_errors(args.stub_error_rate) if args.stub_error_rate else None)
+    with stub_llm.serve_in_background(stub) as url:
+        asyncio.run(run_batch(args, llm_client.create_async_client(api_key="stub", base_url=url)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+# API-layer benchmark. Drives main.app in-process over ASGI so the numbers contain
+# routing, validation and serialization but no network. With the in-memory backend
+# (the default) the storage cost is close to zero, which isolates framework overhead;
+# run again with --storage postgres to see how much of a request is database time.
+#
+#   python -m benchmarks.bench_api --requests 2000 --storage memory
+
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+import storage
+
+
+def seed(db, users=50, accounts_per_user=3, recipients_per_user=5):
+    user_ids = []
+    for i in range(users):
+        user_id = db.create_user(f"user{i}", f"user{i}@example.com", "password_hash", "Bench", "User", "1234567890", True)
+        user_ids.append(user_id)
+        for j in range(accounts_per_user):
+            db.create_account(user_id, 1000 + j, "checking", "USD")
+        for j in range(recipients_per_user):
+            db.create_recipient(user_id, f"Recipient {j}", f"ACC{i}{j}", "Bench Bank", "BENCHUS33", "friend", j == 0)
+    return user_ids
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def time_requests(client, method, url_for, count, json=None):
+    samples = []
+    for i in range(count):
+        start = time.perf_counter()
+        response = await client.request(method, url_for(i), json=json(i) if json else None)
+        samples.append((time.perf_counter() - start) * 1000)
+        response.raise_for_status()
+    return samples
+
+
+async def run(count, backend):
+    storage.set_storage(storage.create_storage(backend))
+    user_ids = seed(storage.get_storage())
+    account_ids = [a["account_id"] for a in storage.list_accounts()]
+
+    from main import app
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        scenarios = [
+            ("GET /users/{id}", "GET", lambda i: f"/users/{user_ids[i % len(user_ids)]}", None),
+            ("GET /accounts/{id}", "GET", lambda i: f"/accounts/{account_ids[i % len(account_ids)]}", None),
+            ("GET /users/{id}/recipients/", "GET", lambda i: f"/users/{user_ids[i % len(user_ids)]}/recipients/", None),
+            ("POST /transactions/", "POST", lambda i: "/transactions/", lambda i: {
+                "sender_account_id": account_ids[i % len(account_ids)],
+                "recipient_account_id": account_ids[(i + 1) % len(account_ids)],
+                "amount": "10.00",
+                "currency": "USD",
+                "status": "completed",
+                "transaction_type": "transfer",
+                "description": "bench",
+            }),
+            ("GET /accounts/", "GET", lambda i: "/accounts/", None),
+        ]
+        print(f"backend={backend} requests={count} per scenario")
+        print(f"{'scenario':32} {'mean ms':>9} {'p50 ms':>9} {'p99 ms':>9} {'req/s':>9}")
+        for name, method, url_for, body in scenarios:
+            await time_requests(client, method, url_for, min(count, 100), body)  # warm-up
+            samples = await time_requests(client, method, url_for, count, body)
+            print(f"{name:32} {statistics.mean(samples):9.3f} {percentile(samples, 50):9.3f} "
+                  f"{percentile(samples, 99):9.3f} {1000 / statistics.mean(samples):9.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--storage", choices=("memory", "postgres"), default="memory")
+    args = parser.parse_args()
+    asyncio.run(run(args.requests, args.storage))
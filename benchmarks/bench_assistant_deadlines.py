@@ -0,0 +1,67 @@
+# Tail latency of assistant replies against stub_llm with a skewed latency
+# distribution (most calls fast, a few very slow), comparing no policy, hedged calls
+# and a per-turn deadline with fallback.
+#
+#   python -m benchmarks.bench_assistant_deadlines --requests 200 --concurrency 10
+
+import argparse
+import asyncio
+import random
+import time
+from collections import Counter
+
+import storage
+import stub_llm
+from assistant import Assistant
+from benchmarks.bench_api import percentile
+from test_assistant import stub_client
+
+CONFIGS = {
+    "no policy": {"deadline": 3600},
+    "hedged": {"deadline": 3600, "hedge": True},
+    "deadline 1s": {"deadline": 1.0, "fallback_reserve": 0.4},
+    "hedged + 1s": {"deadline": 1.0, "fallback_reserve": 0.4, "hedge": True},
+}
+
+
+async def run(assistant, user_id, requests, concurrency):
+    gate = asyncio.Semaphore(concurrency)
+    latencies = []
+    degraded = Counter()
+
+    async def one(i):
+        async with gate:
+            start = time.perf_counter()
+            reply = await assistant.respond(user_id, [{"role": "user", "content": f"What are your fees? {i}"}])
+            latencies.append((time.perf_counter() - start) * 1000)
+            degraded[reply["degraded"]] += 1
+
+    # Warm-up calls give the hedge threshold its latency samples
+    await asyncio.gather(*(assistant.respond(user_id, [{"role": "user", "content": f"warm-up {i}"}])
+                           for i in range(30)))
+    assistant.calls.clear()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    return latencies, degraded
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=10)
+    args = parser.parse_args()
+
+    storage.set_storage(storage.InMemoryStorage())
+    user_id = storage.create_user("bench", "bench@example.com", "x", "Bench", "User", "1", True)
+    print(f"{args.requests} requests, {args.concurrency} concurrent; stub latency 90% 50 ms, 8% 500 ms, 2% 3 s")
+    print(f"{'policy':12} {'p50 ms':>7} {'p95 ms':>7} {'p99 ms':>7} {'max ms':>7} {'calls':>6} {'hedges':>7} "
+          f"{'fallback':>9} {'canned':>7}")
+    for label, options in CONFIGS.items():
+        random.seed(7)
+        stub = stub_llm.create_app(latency=stub_llm.skewed_latency((0.9, 0.05), (0.08, 0.5), (0.02, 3.0)))
+        assistant = Assistant(client=stub_client(stub), **options)
+        latencies, degraded = asyncio.run(run(assistant, user_id, args.requests, args.concurrency))
+        calls = assistant.calls
+        print(f"{label:12} {percentile(latencies, 50):7.0f} {percentile(latencies, 95):7.0f} "
+              f"{percentile(latencies, 99):7.0f} {max(latencies):7.0f} "
+              f"{calls['primary'] + calls['hedges'] + calls['fallbacks']:6} {calls['hedges']:7} "
+              f"{degraded['fallback']:9} {degraded['canned']:7}")
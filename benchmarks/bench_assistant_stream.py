@@ -0,0 +1,78 @@
+# Time-to-first-byte of the streaming /assistant/chat endpoint against stub_llm.
+#
+# The API and the stub run as real HTTP servers. For each request the client records
+# when the first text event arrives and when the stream ends; the blocking
+# Assistant.respond() path is timed on the same prompts for comparison.
+#
+#   python -m benchmarks.bench_assistant_stream --requests 10 --latency-ms 300 --token-delay-ms 20
+
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+from anthropic import AsyncAnthropic
+
+import main
+import storage
+import stub_llm
+from assistant import Assistant
+from benchmarks.bench_api import percentile
+
+PROMPTS = {
+    "no tools": "Please explain how international transfers work and what the usual processing times are {i}",
+    "one tool": "What is my balance? {i}",
+}
+
+
+def stream_once(api_url, user_id, prompt):
+    start = time.perf_counter()
+    first_text = None
+    body = {"user_id": user_id, "messages": [{"role": "user", "content": prompt}]}
+    with httpx.stream("POST", f"{api_url}/assistant/chat", json=body, timeout=60) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if first_text is None and line.startswith("event: text"):
+                first_text = time.perf_counter()
+    end = time.perf_counter()
+    return (first_text - start) * 1000, (end - start) * 1000
+
+
+async def blocking_once(stub_url, user_id, prompt):
+    client = AsyncAnthropic(api_key="stub", base_url=stub_url, max_retries=0)
+    start = time.perf_counter()
+    await Assistant(client=client).respond(user_id, [{"role": "user", "content": prompt}])
+    elapsed = (time.perf_counter() - start) * 1000
+    await client.close()
+    return elapsed
+
+
+def summary(samples):
+    return f"{statistics.mean(samples):8.0f} {percentile(samples, 50):8.0f} {percentile(samples, 95):8.0f}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=10)
+    parser.add_argument("--latency-ms", type=float, default=300.0)
+    parser.add_argument("--token-delay-ms", type=float, default=20.0)
+    args = parser.parse_args()
+
+    storage.set_storage(storage.InMemoryStorage())
+    user_id = storage.create_user("bench", "bench@example.com", "x", "Bench", "User", "1", True)
+    storage.create_account(user_id, 1500, "checking", "USD")
+
+    stub = stub_llm.create_app(latency=args.latency_ms / 1000, token_delay=args.token_delay_ms / 1000)
+    with stub_llm.serve_in_background(stub) as stub_url, \
+            stub_llm.serve_in_background(main.app, lifespan="on") as api_url:
+        main.chat_assistant.client = AsyncAnthropic(api_key="stub", base_url=stub_url, max_retries=0)
+        print(f"stub latency {args.latency_ms:.0f} ms to first byte, {args.token_delay_ms:.0f} ms per chunk, "
+              f"{args.requests} requests per row")
+        print(f"{'prompt':10} {'measure':22} {'mean ms':>8} {'p50 ms':>8} {'p95 ms':>8}")
+        for label, template in PROMPTS.items():
+            streamed = [stream_once(api_url, user_id, template.format(i=i)) for i in range(args.requests)]
+            blocking = [asyncio.run(blocking_once(stub_url, user_id, template.format(i=i))) for i in range(args.requests)]
+            print(f"{label:10} {'SSE first text event':22} {summary([ttfb for ttfb, _ in streamed])}")
+            print(f"{label:10} {'SSE complete':22} {summary([total for _, total in streamed])}")
+            print(f"{label:10} {'blocking respond()':22} {summary(blocking)}")
@@ -0,0 +1,71 @@
+# Assistant turn latency with sequential versus parallel tool execution.
+#
+# The assistant talks to stub_llm over real HTTP, and every storage call sleeps for
+# --db-latency-ms to stand in for a database round trip. An "overview" question makes
+# the stub request four independent tools in one model turn.
+#
+#   python -m benchmarks.bench_assistant_tools --turns 20 --model-latency-ms 200 --db-latency-ms 20
+
+import argparse
+import asyncio
+import statistics
+import time
+
+from anthropic import AsyncAnthropic
+
+import storage
+import stub_llm
+from assistant import Assistant
+from benchmarks.bench_api import percentile, seed
+
+
+class SlowStorage(storage.InMemoryStorage):
+    def __init__(self, delay):
+        super().__init__()
+        self.delay = delay
+
+    def __getattribute__(self, name):
+        attribute = super().__getattribute__(name)
+        if name in storage.OPERATIONS:
+            delay = super().__getattribute__("delay")
+
+            def slow(*args, **kwargs):
+                time.sleep(delay)
+                return attribute(*args, **kwargs)
+            return slow
+        return attribute
+
+
+async def run_turns(base_url, parallel, turns, user_ids):
+    client = AsyncAnthropic(api_key="stub", base_url=base_url, max_retries=0)
+    assistant = Assistant(client=client, parallel_tools=parallel)
+    samples = []
+    for i in range(turns):
+        start = time.perf_counter()
+        reply = await assistant.respond(user_ids[i % len(user_ids)], [{"role": "user", "content": "Give me an overview"}])
+        samples.append((time.perf_counter() - start) * 1000)
+        assert reply["tool_calls"] == 4, reply
+    await client.close()
+    return samples
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--model-latency-ms", type=float, default=200.0)
+    parser.add_argument("--db-latency-ms", type=float, default=20.0)
+    args = parser.parse_args()
+
+    backend = SlowStorage(0)
+    user_ids = seed(backend, users=10)
+    backend.delay = args.db_latency_ms / 1000
+    storage.set_storage(backend)
+
+    app = stub_llm.create_app(latency=args.model_latency_ms / 1000)
+    with stub_llm.serve_in_background(app) as base_url:
+        print(f"model latency {args.model_latency_ms:.0f} ms, db latency {args.db_latency_ms:.0f} ms per call, "
+              f"{args.turns} turns with 4 tool calls each")
+        print(f"{'mode':12} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9}")
+        for label, parallel in (("sequential", False), ("parallel", True)):
+            samples = asyncio.run(run_turns(base_url, parallel, args.turns, user_ids))
+            print(f"{label:12} {statistics.mean(samples):9.1f} {percentile(samples, 50):9.1f} {percentile(samples, 95):9.1f}")
@@ -0,0 +1,74 @@
+# Memory footprint and lookup throughput of the BIC directory: the compact layout in
+# bic_directory versus a plain dict of row dicts, as the CSV would naturally be loaded.
+# Also times opening the compiled file, which is what each worker pays at startup.
+#
+#   python -m benchmarks.bench_bic_directory --codes 200000 --lookups 200000
+
+import argparse
+import os
+import random
+import string
+import tempfile
+import time
+import tracemalloc
+
+from bic_directory import BicDirectory, normalize
+
+
+def synthetic_entries(count, rng):
+    entries = {}
+    while len(entries) < count:
+        code = "".join(rng.choices(string.ascii_uppercase, k=6)) + "".join(
+            rng.choices(string.ascii_uppercase + string.digits, k=2))
+        branch = "XXX" if rng.random() < 0.5 else "".join(rng.choices(string.digits, k=3))
+        entries[code + branch] = f"Bank {rng.randrange(count // 20)} {rng.choice(['AG', 'SA', 'PLC', 'NA'])}"
+    return list(entries.items())
+
+
+def measured(build):
+    tracemalloc.start()
+    result = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size
+
+
+def lookups_per_second(lookup, codes):
+    start = time.perf_counter()
+    for code in codes:
+        lookup(code)
+    return len(codes) / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--codes", type=int, default=200000)
+    parser.add_argument("--lookups", type=int, default=200000)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    entries = synthetic_entries(args.codes, rng)
+    # Half hits, half well-formed misses
+    queries = [rng.choice(entries)[0] for _ in range(args.lookups // 2)]
+    queries += [e[0][:8] + "999" for e in rng.sample(entries, args.lookups - len(queries))]
+    rng.shuffle(queries)
+
+    rows, dict_bytes = measured(lambda: {bic: {"bic": bic, "bank_name": name} for bic, name in entries})
+    directory, compact_bytes = measured(lambda: BicDirectory.build(entries))
+
+    def dict_lookup(code):
+        return rows.get(normalize(code))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bic.idx")
+        directory.save(path)
+        start = time.perf_counter()
+        mapped = BicDirectory.open(path)
+        open_ms = (time.perf_counter() - start) * 1000
+
+        print(f"{len(directory)} codes, {len(queries)} lookups; compiled file opens in {open_ms:.2f} ms")
+        print(f"{'layout':14} {'MiB':>8} {'lookups/s':>12}")
+        for layout, size, lookup in (("dict of rows", dict_bytes, dict_lookup),
+                                     ("compact", compact_bytes, directory.lookup),
+                                     ("compact mmap", mapped.nbytes(), mapped.lookup)):
+            print(f"{layout:14} {size / 2 ** 20:8.1f} {lookups_per_second(lookup, queries):12.0f}")
@@ -0,0 +1,66 @@
+# Per-turn input tokens of a long assistant chat, sending the full history every turn
+# versus the token-budgeted Conversation (sliding window, running summary, truncated
+# tool results). Runs against stub_llm, whose usage numbers are estimates.
+#
+#   python -m benchmarks.bench_conversation --turns 20 --recipients 80
+
+import argparse
+import asyncio
+
+import storage
+import stub_llm
+from assistant import Assistant
+from conversation import Conversation, messages_tokens
+from test_assistant import stub_client
+
+PROMPTS = ["Give me an overview", "What is my balance?", "Show my favorite recipients", "Thanks, and my profile?",
+           "Which recipients do I have?", "Tell me about account 1"]
+
+
+async def full_history(assistant, user_id, turns):
+    history = []
+    rows = []
+    for i in range(turns):
+        history.append({"role": "user", "content": f"{PROMPTS[i % len(PROMPTS)]} ({i})"})
+        sent_tokens = messages_tokens(history)
+        reply = await assistant.respond(user_id, history)
+        history = reply["messages"]
+        rows.append((sent_tokens, reply["usage"]["input_tokens"]))
+    return rows
+
+
+async def managed(assistant, user_id, turns, conversation):
+    rows = []
+    for i in range(turns):
+        conversation.add_user_message(f"{PROMPTS[i % len(PROMPTS)]} ({i})")
+        reply = await assistant.respond(user_id, await conversation.messages())
+        stats = conversation.record(reply)
+        rows.append((stats["sent_tokens"], stats["input_tokens"]))
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--recipients", type=int, default=80)
+    parser.add_argument("--budget", type=int, default=3000)
+    args = parser.parse_args()
+
+    storage.set_storage(storage.InMemoryStorage())
+    user_id = storage.create_user("bench", "bench@example.com", "x", "Bench", "User", "1", True)
+    storage.create_account(user_id, 1500, "checking", "USD")
+    for i in range(args.recipients):
+        storage.create_recipient(user_id, f"Recipient {i}", f"{i:09d}", "Test Bank", "TESTSWIFT", "friend", i % 5 == 0)
+
+    stub = stub_llm.create_app()
+    full = asyncio.run(full_history(Assistant(client=stub_client(stub)), user_id, args.turns))
+    compact = asyncio.run(managed(Assistant(client=stub_client(stub)), user_id, args.turns,
+                                  Conversation(budget=args.budget)))
+
+    print(f"{'turn':>4} {'full history':>13} {'billed':>8} {'managed':>9} {'billed':>8}")
+    for turn, ((full_sent, full_billed), (sent, billed)) in enumerate(zip(full, compact), 1):
+        print(f"{turn:4} {full_sent:13} {full_billed:8} {sent:9} {billed:8}")
+    total_full = sum(billed for _, billed in full)
+    total_managed = sum(billed for _, billed in compact)
+    print(f"total billed input tokens: full {total_full}, managed {total_managed} "
+          f"({100 * (1 - total_managed / total_full):.0f}% fewer)")
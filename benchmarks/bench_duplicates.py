@@ -0,0 +1,62 @@
+# Memory per million fingerprints in the duplicate detector's hash window, its false
+# positive rate (distinct transfers reported as repeats, measured by probing a full
+# window with transfers it has never seen) and the latency of the check-and-reserve
+# done inline on every transfer, next to the cost of the fingerprint alone.
+#
+#   python -m benchmarks.bench_duplicates --fingerprints 1000000 --probes 1000000
+
+import argparse
+import random
+import time
+import tracemalloc
+
+from benchmarks.bench_api import percentile
+from duplicates import DuplicateDetector, fingerprint
+
+
+def transfers(rng, count, offset):
+    # Distinct transfers: each (sender, recipient, amount) occurs once per offset range
+    for i in range(offset, offset + count):
+        yield rng.randrange(100000), rng.randrange(100000), f"{i // 100}.{i % 100:02d}", "USD"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fingerprints", type=int, default=1000000)
+    parser.add_argument("--probes", type=int, default=1000000)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    now = time.time()
+    detector = DuplicateDetector(window=3600, max_entries=args.fingerprints + args.probes)
+    seen = list(transfers(rng, args.fingerprints, 0))
+    tracemalloc.start()
+    start = time.perf_counter()
+    for transfer in seen:
+        detector.claim(fingerprint(*transfer), now)
+    fill_s = time.perf_counter() - start
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    false_positives = 0
+    latencies = []
+    for transfer in transfers(rng, args.probes, args.fingerprints):
+        start = time.perf_counter()
+        result = detector.check(*transfer, now=now + 1)
+        latencies.append((time.perf_counter() - start) * 1e6)
+        false_positives += result["action"] != "allow"
+    missed = sum(detector.check(*transfer, now=now + 2)["action"] == "allow" for transfer in rng.sample(seen, 10000))
+
+    start = time.perf_counter()
+    for transfer in seen[:100000]:
+        fingerprint(*transfer)
+    fingerprint_us = (time.perf_counter() - start) / min(100000, len(seen)) * 1e6
+
+    print(f"{args.fingerprints} fingerprints loaded in {fill_s:.1f} s: {memory / 2 ** 20:.1f} MiB, "
+          f"{memory / args.fingerprints:.0f} B per fingerprint, "
+          f"{memory / args.fingerprints * 1e6 / 2 ** 20:.0f} MiB per million")
+    print(f"false positives: {false_positives} of {args.probes} unseen transfers "
+          f"(expected {args.fingerprints * args.probes / 2 ** 64:.1e} with 64-bit fingerprints); "
+          f"{missed} of 10000 repeats missed")
+    print(f"check: p50 {percentile(latencies, 50):.1f} us, p99 {percentile(latencies, 99):.1f} us, "
+          f"of which fingerprint {fingerprint_us:.1f} us")
@@ -0,0 +1,57 @@
+# Bulk currency conversion throughput: one Decimal multiply-and-quantize per amount
+# versus RateSnapshot.convert_many, which groups by currency and does integer
+# arithmetic against one exact factor per group, and convert_minor for callers that
+# already hold minor units. The batch results are checked against the per-amount ones.
+#
+#   python -m benchmarks.bench_fx --amounts 1000000
+
+import argparse
+import random
+import time
+from decimal import ROUND_HALF_UP, Decimal
+
+import fx
+
+
+def per_amount(snapshot, amounts, currencies, target):
+    exponent = Decimal(1).scaleb(-fx.CURRENCY_EXPONENTS[target])
+    return [(amount * snapshot.rate(currency, target)).quantize(exponent, rounding=ROUND_HALF_UP)
+            for amount, currency in zip(amounts, currencies)]
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--amounts", type=int, default=1000000)
+    parser.add_argument("--target", default="USD")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    snapshot = fx.current()
+    codes = list(fx.CURRENCY_EXPONENTS)
+    currencies = [rng.choice(codes) for _ in range(args.amounts)]
+    minor = [rng.randrange(1, 10 ** 7) for _ in range(args.amounts)]
+    amounts = [fx.from_minor(units, currency) for units, currency in zip(minor, currencies)]
+
+    naive, naive_s = timed(lambda: per_amount(snapshot, amounts, currencies, args.target))
+    batch, batch_s = timed(lambda: snapshot.convert_many(amounts, currencies, args.target))
+
+    def minor_units():
+        groups = {}
+        for units, currency in zip(minor, currencies):
+            groups.setdefault(currency, []).append(units)
+        return {currency: snapshot.convert_minor(units, currency, args.target) for currency, units in groups.items()}
+
+    _, minor_s = timed(minor_units)
+    mismatches = sum(a != b for a, b in zip(naive, batch))
+
+    print(f"{args.amounts} amounts in {len(codes)} currencies to {args.target}, snapshot {snapshot.version}; "
+          f"{mismatches} mismatches")
+    print(f"{'method':20} {'seconds':>9} {'amounts/s':>12}")
+    for method, seconds in (("Decimal per amount", naive_s), ("convert_many", batch_s), ("convert_minor", minor_s)):
+        print(f"{method:20} {seconds:9.3f} {args.amounts / seconds:12.0f}")
@@ -0,0 +1,107 @@
+# Accuracy and latency of the intent router on a labelled sample of assistant prompts
+# that are not in its training examples, plus end-to-end reply latency for routed
+# prompts versus the model path (stub_llm with a fixed latency per call).
+#
+#   python -m benchmarks.bench_intent_router --latency-ms 300
+
+import argparse
+import asyncio
+import time
+from collections import Counter
+
+import storage
+import stub_llm
+from assistant import Assistant
+from benchmarks.bench_api import percentile
+from intent_router import IntentRouter, classify
+from test_assistant import stub_client
+
+# (prompt, expected intent or None for the model)
+LABELLED = [
+    ("What's my current balance?", "balance"),
+    ("how much money is in my checking", "balance"),
+    ("balances", "balance"),
+    ("Can you tell me how much I have?", "balance"),
+    ("how much do i have in savings", "balance"),
+    ("what's left in my account", "balance"),
+    ("what are my totals across accounts", "balance"),
+    ("Show me my favorite recipients", "favorite_recipients"),
+    ("who are my favourite payees", "favorite_recipients"),
+    ("list favorites", "favorite_recipients"),
+    ("which contacts are starred", "favorite_recipients"),
+    ("my favorite people", "favorite_recipients"),
+    ("last 5 transactions", "recent_transactions"),
+    ("show me my last 3 payments", "recent_transactions"),
+    ("what's my recent activity", "recent_transactions"),
+    ("latest transfers please", "recent_transactions"),
+    ("transaction history", "recent_transactions"),
+    ("what did I spend money on recently", "recent_transactions"),
+    ("show my previous ten transactions", "recent_transactions"),
+    ("anything come in or out lately", "recent_transactions"),
+    ("Send $20 to Jane", None),
+    ("transfer 100 from checking to savings", None),
+    ("Pay my favorite recipient 50 dollars", None),
+    ("why is my balance negative", None),
+    ("explain my last transaction", None),
+    ("cancel my last transfer", None),
+    ("What are your fees for international transfers?", None),
+    ("How long does a SWIFT transfer take?", None),
+    ("give me an overview", None),
+    ("show account 12", None),
+    ("remove Acme from my favorites", None),
+    ("what's the USD to EUR rate", None),
+    ("hi there", None),
+    ("is my profile verified", None),
+    ("help me budget for next month", None),
+    ("what is my IBAN", None),
+]
+
+
+async def time_replies(router, user_id, prompts):
+    latencies = []
+    for prompt in prompts:
+        start = time.perf_counter()
+        await router.respond(user_id, [{"role": "user", "content": prompt}])
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency-ms", type=float, default=300.0)
+    args = parser.parse_args()
+
+    outcomes = Counter()
+    misses = []
+    start = time.perf_counter()
+    for prompt, expected in LABELLED:
+        intent, _, _ = classify(prompt)
+        if intent == expected:
+            outcomes["correct"] += 1
+        elif intent is None:
+            outcomes["missed (sent to model)"] += 1
+            misses.append((prompt, expected, intent))
+        else:
+            outcomes["wrong answer"] += 1
+            misses.append((prompt, expected, intent))
+    classify_us = (time.perf_counter() - start) / len(LABELLED) * 1e6
+
+    print(f"{len(LABELLED)} labelled prompts, {classify_us:.0f} us per classification")
+    for outcome in ("correct", "missed (sent to model)", "wrong answer"):
+        print(f"  {outcome:24} {outcomes[outcome]:3} ({outcomes[outcome] / len(LABELLED):.0%})")
+    for prompt, expected, intent in misses:
+        print(f"  {prompt!r}: expected {expected}, got {intent}")
+
+    storage.set_storage(storage.InMemoryStorage())
+    user_id = storage.create_user("bench", "bench@example.com", "x", "Bench", "User", "1", True)
+    account_id = storage.create_account(user_id, 1500, "checking", "USD")
+    for i in range(10):
+        storage.create_transaction(account_id, account_id, i + 1, "USD", "completed", "transfer", f"Payment {i}")
+    router = IntentRouter(Assistant(client=stub_client(stub_llm.create_app(latency=args.latency_ms / 1000))))
+    routed = [prompt for prompt, _ in LABELLED if classify(prompt)[0]]
+    model = [prompt for prompt, _ in LABELLED if not classify(prompt)[0]][:10]
+    routed_ms = asyncio.run(time_replies(router, user_id, routed))
+    model_ms = asyncio.run(time_replies(router, user_id, model))
+    print(f"reply latency, stub model at {args.latency_ms:.0f} ms per call:")
+    print(f"  routed intents  p50 {percentile(routed_ms, 50):7.1f} ms  p95 {percentile(routed_ms, 95):7.1f} ms")
+    print(f"  model path      p50 {percentile(model_ms, 50):7.1f} ms  p95 {percentile(model_ms, 95):7.1f} ms")
@@ -0,0 +1,65 @@
+# Concurrent assistant calls through the default SDK client versus the shared, pooled,
+# retrying client from llm_client, against stub_llm injecting latency and 429/529s.
+#
+#   python -m benchmarks.bench_llm_client --requests 300 --concurrency 100 --error-rate 0.1
+
+import argparse
+import asyncio
+import time
+
+import anthropic
+from anthropic import AsyncAnthropic
+
+import stub_llm
+from benchmarks.bench_api import percentile
+from llm_client import create_async_client
+
+
+async def run(client, requests, concurrency):
+    gate = asyncio.Semaphore(concurrency)
+    latencies = []
+    failures = 0
+
+    async def one(i):
+        nonlocal failures
+        async with gate:
+            start = time.perf_counter()
+            try:
+                await client.messages.create(model="stub", max_tokens=64,
+                                             messages=[{"role": "user", "content": f"What are your fees? {i}"}])
+            except anthropic.APIError:
+                failures += 1
+                return
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    elapsed = time.perf_counter() - start
+    await client.close()
+    return latencies, failures, elapsed
+
+
+def report(label, latencies, failures, elapsed):
+    print(f"{label:16} {len(latencies):6} {failures:6} {percentile(latencies, 50):8.0f} "
+          f"{percentile(latencies, 95):8.0f} {len(latencies) / elapsed:8.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--error-rate", type=float, default=0.1)
+    parser.add_argument("--retry-after", type=float, default=0.2)
+    args = parser.parse_args()
+
+    stub = stub_llm.create_app(latency=args.latency_ms / 1000, errors=stub_llm.random_errors(args.error_rate),
+                               retry_after=args.retry_after)
+    with stub_llm.serve_in_background(stub) as url:
+        print(f"{args.requests} requests, {args.concurrency} concurrent, {args.error_rate:.0%} injected 429/529")
+        print(f"{'client':16} {'ok':>6} {'failed':>6} {'p50 ms':>8} {'p95 ms':>8} {'ok/s':>8}")
+        report("sdk default", *asyncio.run(run(AsyncAnthropic(api_key="stub", base_url=url),
+                                               args.requests, args.concurrency)))
+        client = create_async_client(api_key="stub", base_url=url)
+        report("llm_client", *asyncio.run(run(client, args.requests, args.concurrency)))
+        print(f"upstream requests {stub.state.requests}, injected errors {stub.state.errors}")
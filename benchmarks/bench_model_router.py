@@ -0,0 +1,64 @@
+# Turn latency with every turn on the large model versus per-turn model routing. The
+# stub answers the small model faster than the large one; the prompt mix is mostly
+# lookups with some transfers and overviews, which the router keeps on the large model.
+#
+#   python -m benchmarks.bench_model_router --turns 60 --small-ms 300 --large-ms 1200
+
+import argparse
+import asyncio
+import random
+import time
+from collections import Counter
+
+import storage
+import stub_llm
+from assistant import Assistant
+from benchmarks.bench_api import percentile
+from model_router import MODEL_ROUTER_LARGE, MODEL_ROUTER_SMALL, ModelRouter
+from test_assistant import stub_client
+
+PROMPTS = [
+    (0.3, "Show my profile"),
+    (0.2, "Which recipients do I have saved?"),
+    (0.15, "Explain my recent transactions"),
+    (0.15, "What are your fees for international transfers?"),
+    (0.1, "Give me an overview"),
+    (0.1, "Send 25 USD from checking to Jane"),
+]
+
+
+async def run(assistant, user_id, prompts):
+    latencies = []
+    for prompt in prompts:
+        start = time.perf_counter()
+        await assistant.respond(user_id, [{"role": "user", "content": prompt}])
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=60)
+    parser.add_argument("--small-ms", type=float, default=300.0)
+    parser.add_argument("--large-ms", type=float, default=1200.0)
+    args = parser.parse_args()
+
+    storage.set_storage(storage.InMemoryStorage())
+    user_id = storage.create_user("bench", "bench@example.com", "x", "Bench", "User", "1", True)
+    storage.create_account(user_id, 1000, "checking", "USD")
+    storage.create_recipient(user_id, "Jane", "123", "Bench Bank", "BENCHUS33", "friend", True)
+    rng = random.Random(0)
+    prompts = rng.choices([p for _, p in PROMPTS], weights=[w for w, _ in PROMPTS], k=args.turns)
+    model_latency = {MODEL_ROUTER_SMALL: args.small_ms / 1000, MODEL_ROUTER_LARGE: args.large_ms / 1000}
+
+    print(f"{args.turns} turns, small model {args.small_ms:.0f} ms, large model {args.large_ms:.0f} ms per call")
+    print(f"{'mode':14} {'p50 ms':>8} {'p95 ms':>8} {'large calls':>12} {'small calls':>12}")
+    for mode in ("large only", "routed"):
+        stub = stub_llm.create_app(model_latency=model_latency)
+        assistant = Assistant(client=stub_client(stub), model=MODEL_ROUTER_LARGE)
+        if mode == "routed":
+            assistant = ModelRouter(assistant, log_path=None)
+        latencies = asyncio.run(run(assistant, user_id, prompts))
+        models = Counter(stub.state.models)
+        print(f"{mode:14} {percentile(latencies, 50):8.0f} {percentile(latencies, 95):8.0f} "
+              f"{models[MODEL_ROUTER_LARGE]:12} {models[MODEL_ROUTER_SMALL]:12}")
@@ -0,0 +1,70 @@
+# Outbox dispatch throughput by batch size. Appends a backlog of account updates spread
+# over --aggregates accounts, then drains it through an OutboxDispatcher into the
+# in-process queue or, with --sink http, into the stub_webhook stand-in, and reports
+# events per second and the number of claim round trips. With --aggregates 1 every
+# event queues behind the previous one, which shows the cost of per-aggregate ordering.
+#
+#   python -m benchmarks.bench_outbox --events 20000 --aggregates 1000 --batch-sizes 1,50,500
+#   python -m benchmarks.bench_outbox --storage postgres --sink http --latency-ms 5
+
+import argparse
+import random
+import time
+from contextlib import nullcontext
+
+import storage
+import stub_llm
+import stub_webhook
+from outbox import HttpSink, OutboxDispatcher, QueueSink
+
+
+def seed(events, aggregates, rng):
+    user_id = storage.create_user(f"bench-outbox-{time.time_ns()}", f"bench-outbox-{time.time_ns()}@example.com", "x",
+                                  "Bench", "Outbox", "1", True)
+    accounts = [storage.create_account(user_id, 0, "checking", "USD") for _ in range(aggregates)]
+    for i in range(events - aggregates - 1):
+        storage.update_account(rng.choice(accounts), balance=i)
+    return user_id
+
+
+def drain(dispatcher):
+    # (events, seconds, claim round trips)
+    start = time.perf_counter()
+    drained = claims = 0
+    while True:
+        claims += 1
+        claimed = dispatcher.dispatch_once()
+        if not claimed:
+            return drained, time.perf_counter() - start, claims
+        drained += claimed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--storage", choices=("memory", "postgres"), default="memory")
+    parser.add_argument("--events", type=int, default=20000)
+    parser.add_argument("--aggregates", type=int, default=1000)
+    parser.add_argument("--batch-sizes", default="1,50,500")
+    parser.add_argument("--sink", choices=("queue", "http"), default="queue")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Stand-in response time for --sink http")
+    args = parser.parse_args()
+
+    backend = storage.create_storage(args.storage)
+    backend.open()
+    backend.set_outbox(True)
+    storage.set_storage(backend)
+    rng = random.Random(0)
+    receiver = stub_webhook.create_app(latency=args.latency_ms / 1000)
+    with stub_llm.serve_in_background(receiver) if args.sink == "http" else nullcontext() as url:
+        for batch_size in map(int, args.batch_sizes.split(",")):
+            # Leftovers from earlier runs would be counted too
+            OutboxDispatcher([QueueSink(0)]).drain()
+            user_id = seed(args.events, args.aggregates, rng)
+            sink = HttpSink(f"{url}/events") if args.sink == "http" else QueueSink(0)
+            dispatcher = OutboxDispatcher([sink], batch_size=batch_size)
+            drained, elapsed, claims = drain(dispatcher)
+            dispatcher.close()
+            print(f"batch {batch_size:>4}: {drained} events in {elapsed:.2f} s, {drained / elapsed:,.0f} events/s, "
+                  f"{claims} claims")
+            storage.delete_user(user_id)
+    backend.close()
@@ -0,0 +1,56 @@
+# Effect of prompt-prefix caching on input tokens and latency. The assistant carries a
+# long policy list (synthetic here) and its tool schemas; with caching on, that prefix
+# is written once and then read from cache. stub_llm charges prefill time per uncached
+# input token and a tenth of it for cache reads.
+#
+#   python -m benchmarks.bench_prompt_cache --requests 20 --policies 150 --input-token-delay-us 200
+
+import argparse
+import asyncio
+import time
+from collections import Counter
+
+import storage
+import stub_llm
+from assistant import Assistant, BANK_POLICIES
+from benchmarks.bench_api import percentile
+from test_assistant import stub_client
+
+
+async def run(stub, user_ids, requests, policies, prompt_caching):
+    assistant = Assistant(client=stub_client(stub), policies=policies, prompt_caching=prompt_caching)
+    latencies = []
+    for i in range(requests):
+        start = time.perf_counter()
+        await assistant.respond(user_ids[i % len(user_ids)], [{"role": "user", "content": f"What is my balance? {i}"}])
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies, assistant.usage
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--policies", type=int, default=150, help="Synthetic policy lines added to the built-in ones")
+    parser.add_argument("--input-token-delay-us", type=float, default=200.0)
+    args = parser.parse_args()
+
+    storage.set_storage(storage.InMemoryStorage())
+    user_ids = []
+    for i in range(5):
+        user_id = storage.create_user(f"user{i}", f"user{i}@example.com", "x", "Bench", "User", "1", True)
+        storage.create_account(user_id, 1000 + i, "checking", "USD")
+        user_ids.append(user_id)
+    policies = BANK_POLICIES + tuple(
+        f"Policy {i}: transfers of category {i} above the daily limit require a second confirmation "
+        f"from the customer and are reviewed by the compliance team before settlement." for i in range(args.policies))
+
+    print(f"{args.requests} requests (2 model calls each) over {len(user_ids)} customers, "
+          f"{len(policies)} policy lines")
+    print(f"{'prompt caching':15} {'uncached in':>12} {'cache write':>12} {'cache read':>11} {'p50 ms':>8} {'p95 ms':>8}")
+    for prompt_caching in (False, True):
+        stub = stub_llm.create_app(input_token_delay=args.input_token_delay_us / 1e6)
+        latencies, usage = asyncio.run(run(stub, user_ids, args.requests, policies, prompt_caching))
+        usage = Counter(usage)
+        print(f"{'on' if prompt_caching else 'off':15} {usage['input_tokens']:12} "
+              f"{usage['cache_creation_input_tokens']:12} {usage['cache_read_input_tokens']:11} "
+              f"{percentile(latencies, 50):8.1f} {percentile(latencies, 95):8.1f}")
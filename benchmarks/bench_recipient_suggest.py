@@ -0,0 +1,67 @@
+# Per-keystroke cost of recipient suggestions: fetching every recipient and filtering
+# in Python (what the transfer form did) versus the per-user prefix index. Storage is
+# the in-memory backend, so the fetch-all numbers leave out the database round trip
+# they pay in production.
+#
+#   python -m benchmarks.bench_recipient_suggest --recipients 2000 --queries 2000
+
+import argparse
+import random
+import string
+import time
+
+import storage
+from benchmarks.bench_api import percentile
+from recipient_index import RecipientIndex
+
+
+def fetch_and_filter(user_id, query, limit=10):
+    query = query.casefold()
+    matches = [r for r in storage.get_all_recipients(user_id)
+               if query in r["name"].casefold() or query in r["bank_name"].casefold() or query in r["account_info"]]
+    return matches[:limit]
+
+
+def time_calls(fn, user_id, queries):
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        fn(user_id, query)
+        latencies.append((time.perf_counter() - start) * 1e6)
+    return latencies
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--recipients", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    storage.set_storage(storage.InMemoryStorage())
+    user_id = storage.create_user("bench", "bench@example.com", "x", "Bench", "User", "1", True)
+    names = []
+    for i in range(args.recipients):
+        name = " ".join("".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 9))).capitalize() for _ in range(2))
+        names.append(name)
+        storage.create_recipient(user_id, name, str(rng.randrange(10 ** 8, 10 ** 9)), f"Bank {i % 40}", "BENCHUS33",
+                                 "friend", i % 25 == 0)
+    # Keystrokes: growing prefixes of existing names
+    queries = []
+    while len(queries) < args.queries:
+        name = rng.choice(names)
+        queries.extend(name[:n] for n in range(1, min(len(name), 6) + 1))
+    queries = queries[:args.queries]
+
+    index = RecipientIndex()
+    index.attach()
+    start = time.perf_counter()
+    index.user_index(user_id)
+    load_ms = (time.perf_counter() - start) * 1000
+
+    print(f"{args.recipients} recipients, {len(queries)} keystrokes; index load {load_ms:.1f} ms")
+    print(f"{'method':18} {'p50 us':>9} {'p99 us':>9} {'max us':>9}")
+    for method, fn in (("fetch and filter", fetch_and_filter), ("prefix index", index.suggest)):
+        latencies = time_calls(fn, user_id, queries)
+        print(f"{method:18} {percentile(latencies, 50):9.1f} {percentile(latencies, 99):9.1f} {max(latencies):9.1f}")
+    index.detach()
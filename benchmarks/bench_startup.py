@@ -0,0 +1,88 @@
+# Cold-start benchmark for the API and assistant entry points.
+#
+# 1. Import-time profile: runs `python -X importtime` on each entry point in a fresh
+#    interpreter and prints the total plus the slowest modules by cumulative time.
+# 2. Time-to-first-request: starts uvicorn in a subprocess and measures the time from
+#    spawning it until the first request is answered.
+#
+# The run fails (exit code 1) when time-to-first-request exceeds the startup budget.
+#
+#   python -m benchmarks.bench_startup --budget-ms 2500
+
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+
+ENTRY_POINTS = ("main", "agent")
+
+
+def import_profile(module, top=8):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, check=True,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        fields = line[len("import time:"):].split("|")
+        rows.append((int(fields[1]), int(fields[0]), fields[2].rstrip()))
+    total_us = next(cumulative for cumulative, _, name in rows if name.strip() == module)
+    print(f"\nimport {module}: {total_us / 1000:.1f} ms")
+    slowest = [row for row in sorted(rows, reverse=True) if row[2].strip() != module][:top]
+    for cumulative, self_us, name in slowest:
+        print(f"  {cumulative / 1000:8.1f} ms cumulative {self_us / 1000:8.1f} ms self  {name.strip()}")
+    return total_us / 1000
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def time_to_first_request(storage_backend, timeout=30.0):
+    port = free_port()
+    env = dict(os.environ, BANKING_STORAGE=storage_backend)
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        env=env,
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                response = httpx.get(f"http://127.0.0.1:{port}/users/", timeout=1.0)
+                if response.status_code == 200:
+                    return (time.perf_counter() - start) * 1000
+            except httpx.TransportError:
+                pass
+            time.sleep(0.01)
+        raise RuntimeError(f"server did not answer within {timeout}s")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("STARTUP_BUDGET_MS", "2500")))
+    parser.add_argument("--storage", choices=("memory", "postgres"), default="memory")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    for module in ENTRY_POINTS:
+        import_profile(module)
+
+    samples = [time_to_first_request(args.storage) for _ in range(args.runs)]
+    best = min(samples)
+    print(f"\ntime-to-first-request ({args.storage}): best {best:.0f} ms, "
+          f"runs {', '.join(f'{s:.0f}' for s in samples)} ms, budget {args.budget_ms:.0f} ms")
+    if best > args.budget_ms:
+        print("startup budget exceeded")
+        sys.exit(1)
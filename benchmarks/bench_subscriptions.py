@@ -0,0 +1,118 @@
+# Cost of idle WebSocket subscribers and fan-out latency of a change to all of them.
+#
+# Starts server.py with one worker and opens --subscribers connections to /subscriptions,
+# each watching its own account plus one shared "hot" account. Reports the server's
+# resident memory per idle subscriber and its CPU use while they sit idle, then updates
+# the hot account --updates times and measures, per subscriber, the time from sending
+# the PUT to receiving the change, plus the server CPU each fan-out takes. The clients
+# run in this process, so on a machine with few cores the latencies mostly measure the
+# clients competing with the server; the server CPU per update is the figure to watch.
+#
+#   python -m benchmarks.bench_subscriptions --subscribers 10000 --updates 20
+#   python -m benchmarks.bench_subscriptions --storage postgres   # fan-out via LISTEN/NOTIFY
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+import websockets
+
+from benchmarks.bench_api import percentile
+from benchmarks.bench_startup import free_port
+from benchmarks.bench_workers import wait_until_ready
+
+
+def rss_bytes(pid):
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) * 1024
+
+
+def cpu_seconds(pid):
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+async def connect(url, account_id, hot_account_id):
+    ws = await websockets.connect(url, max_queue=None, ping_interval=None)
+    await ws.send(f'{{"action":"subscribe","accounts":[{account_id},{hot_account_id}]}}')
+    while True:
+        if '"subscribed"' in await ws.recv():
+            return ws
+
+
+async def fan_out(url, api, server_pid, subscribers, updates, idle):
+    async with httpx.AsyncClient(base_url=api, timeout=30) as client:
+        user = (await client.post("/users/", json={
+            "username": f"bench-ws-{time.time_ns()}", "email": f"bench-ws-{time.time_ns()}@example.com",
+            "password": "x", "first_name": "Bench", "last_name": "Ws", "phone_number": "1"})).json()
+
+        async def account():
+            response = await client.post("/accounts/", json={"user_id": user["user_id"], "balance": "0",
+                                                               "account_type": "checking", "currency": "USD"})
+            return response.json()["account_id"]
+
+        hot = await account()
+        accounts = [await account() for _ in range(subscribers)]
+        base_rss = rss_bytes(server_pid)
+        start = time.perf_counter()
+        sockets = []
+        for i in range(0, subscribers, 500):
+            sockets += await asyncio.gather(*(connect(url, a, hot) for a in accounts[i:i + 500]))
+        connect_s = time.perf_counter() - start
+        await asyncio.sleep(1)
+        rss = rss_bytes(server_pid) - base_rss
+        cpu = cpu_seconds(server_pid)
+        await asyncio.sleep(idle)
+        idle_cpu = (cpu_seconds(server_pid) - cpu) / idle
+
+        latencies, complete = [], []
+        cpu = cpu_seconds(server_pid)
+
+        async def receive(ws, sent):
+            await ws.recv()
+            latencies.append((time.perf_counter() - sent) * 1000)
+
+        for i in range(updates):
+            sent = time.perf_counter()
+            await asyncio.gather(client.put(f"/accounts/{hot}", json={"balance": str(i + 1)}),
+                                 *(receive(ws, sent) for ws in sockets))
+            complete.append((time.perf_counter() - sent) * 1000)
+        fan_out_cpu = (cpu_seconds(server_pid) - cpu) / updates * 1000
+        await asyncio.gather(*(ws.close() for ws in sockets))
+    return connect_s, rss, idle_cpu, latencies, complete, fan_out_cpu
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--storage", choices=("memory", "postgres"), default="memory")
+    parser.add_argument("--subscribers", type=int, default=10000)
+    parser.add_argument("--updates", type=int, default=20)
+    parser.add_argument("--idle", type=float, default=5.0, help="Seconds to measure idle CPU over")
+    args = parser.parse_args()
+
+    port = free_port()
+    api = f"http://127.0.0.1:{port}"
+    server = subprocess.Popen(
+        [sys.executable, "server.py", "--workers", "1", "--port", str(port), "--host", "127.0.0.1",
+         "--log-level", "warning", "--backlog", "4096"],
+        env=dict(os.environ, BANKING_STORAGE=args.storage),
+    )
+    try:
+        wait_until_ready(f"{api}/health/live")
+        connect_s, rss, idle_cpu, latencies, complete, fan_out_cpu = asyncio.run(
+            fan_out(f"ws://127.0.0.1:{port}/subscriptions", api, server.pid, args.subscribers, args.updates, args.idle))
+    finally:
+        server.terminate()
+        server.wait()
+    print(f"{args.subscribers} subscribers connected in {connect_s:.1f} s; server RSS +{rss / 2 ** 20:.1f} MiB, "
+          f"{rss / args.subscribers / 1024:.1f} KiB per subscriber; idle CPU {idle_cpu * 100:.1f}% of a core")
+    print(f"fan-out of {args.updates} updates to all subscribers: per subscriber p50 {percentile(latencies, 50):.1f} ms, "
+          f"p99 {percentile(latencies, 99):.1f} ms; last subscriber p50 {percentile(complete, 50):.1f} ms, "
+          f"max {max(complete):.1f} ms; server CPU {fan_out_cpu:.0f} ms per update")
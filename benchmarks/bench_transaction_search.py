@@ -0,0 +1,164 @@
+# Query latency of search_transactions on a large Postgres table. Seeds bench users,
+# accounts and transactions with generated descriptions ("Rent march 4471") straight
+# in SQL, applies pending migrations (the search indexes) and times each query shape,
+# once with the indexes and once with index and bitmap scans disabled for comparison.
+# Seeding tens of millions of rows takes a while; reuse them with --skip-seed.
+#
+#   python -m benchmarks.bench_transaction_search --rows 20000000 --users 200000
+#   python -m benchmarks.bench_transaction_search --skip-seed --queries 50
+
+import argparse
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+import database_operations as db
+import migrate
+from benchmarks.bench_api import percentile
+
+BATCH_ROWS = 1_000_000
+CATEGORIES = ["Rent", "Invoice", "Groceries", "Salary", "Utilities", "Insurance", "Gym", "Dinner", "Refund",
+              "Tuition", "Phone bill", "Car loan"]
+MONTHS = ["january", "february", "march", "april", "may", "june", "july", "august", "september", "october",
+          "november", "december"]
+NO_INDEXES = "-c enable_bitmapscan=off -c enable_indexscan=off -c enable_indexonlyscan=off"
+
+
+def seed(rows, users):
+    # Bench users are named bench-search-<run>-<n>; earlier runs' rows are left in place
+    prefix = f"bench-search-{int(time.time())}-"
+    with db.get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO transfer.Users (username, email, password_hash, first_name, last_name, phone_number, is_verified)
+                SELECT %(prefix)s || g, %(prefix)s || g || '@example.com', 'x', 'Bench', 'Search', '1', true
+                FROM generate_series(1, %(users)s) g
+            """, {"prefix": prefix, "users": users})
+            cur.execute("""
+                INSERT INTO transfer.Accounts (user_id, balance, account_type, currency)
+                SELECT user_id, 1000, 'checking', 'USD' FROM transfer.Users WHERE username LIKE %s
+            """, (prefix + "%",))
+        conn.commit()
+    first, last = account_range()
+    categories = "ARRAY[" + ", ".join(f"'{c}'" for c in CATEGORIES) + "]"
+    months = "ARRAY[" + ", ".join(f"'{m}'" for m in MONTHS) + "]"
+    for offset in range(0, rows, BATCH_ROWS):
+        start = time.perf_counter()
+        with db.get_db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(f"""
+                    INSERT INTO transfer.Transactions
+                    (sender_account_id, recipient_account_id, amount, currency, status, transaction_type, description, created_at)
+                    SELECT %(first)s + floor(random() * %(accounts)s)::int, %(first)s + floor(random() * %(accounts)s)::int,
+                           round((random() * 2000)::numeric, 2), 'USD', 'completed', 'transfer',
+                           ({categories})[1 + floor(random() * {len(CATEGORIES)})::int] || ' '
+                           || ({months})[1 + floor(random() * 12)::int] || ' ' || (1000 + floor(random() * 9000)::int),
+                           now() - random() * interval '730 days'
+                    FROM generate_series(1, %(batch)s)
+                """, {"first": first, "accounts": last - first + 1, "batch": min(BATCH_ROWS, rows - offset)})
+            conn.commit()
+        print(f"  seeded {min(offset + BATCH_ROWS, rows):,} rows ({time.perf_counter() - start:.1f} s for the batch)")
+
+
+def account_range():
+    with db.get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT min(a.account_id), max(a.account_id) FROM transfer.Accounts a
+                JOIN transfer.Users u ON u.user_id = a.user_id WHERE u.username LIKE 'bench-search-%'
+            """)
+            return cur.fetchone()
+
+
+def bench_users():
+    with db.get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT user_id FROM transfer.Users WHERE username LIKE 'bench-search-%'")
+            return [row[0] for row in cur.fetchall()]
+
+
+def analyze():
+    with db.get_db_connection() as conn:
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("ANALYZE transfer.Transactions")
+                cur.execute("SELECT count(*) FROM transfer.Transactions")
+                return cur.fetchone()[0]
+        finally:
+            conn.autocommit = False
+
+
+def query_shapes(rng, user_ids, first_account, last_account):
+    # (name, zero-argument callable running one search)
+    def user():
+        return rng.choice(user_ids)
+
+    def window():
+        end = datetime.now() - timedelta(days=rng.randrange(0, 700))
+        return end - timedelta(days=30), end
+
+    def in_window():
+        start, end = window()
+        return db.search_transactions(rng.choice(CATEGORIES), account_id=rng.randint(first_account, last_account),
+                                      start=start, end=end)
+    return [
+        ("user, full text", lambda: db.search_transactions(
+            f"{rng.choice(CATEGORIES)} {rng.choice(MONTHS)}", user_id=user())),
+        ("user, partial", lambda: db.search_transactions(rng.choice(CATEGORIES)[:4].lower(), user_id=user())),
+        ("account + 30 days", in_window),
+        ("all, full text", lambda: db.search_transactions(f"invoice {rng.randint(1000, 9999)}")),
+        ("all, partial", lambda: db.search_transactions(f"tuit {rng.randint(100, 999)}")),
+    ]
+
+
+def run(shapes, queries):
+    results = []
+    for name, search in shapes:
+        search()  # warm the cache for this shape
+        latencies = []
+        found = 0
+        for _ in range(queries):
+            start = time.perf_counter()
+            found += len(search())
+            latencies.append((time.perf_counter() - start) * 1000)
+        results.append((name, latencies, found / queries))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=20_000_000)
+    parser.add_argument("--users", type=int, default=200_000)
+    parser.add_argument("--queries", type=int, default=30, help="Queries per shape")
+    parser.add_argument("--skip-seed", action="store_true", help="Reuse bench rows from an earlier run")
+    parser.add_argument("--skip-unindexed", action="store_true", help="Do not time the run without indexes")
+    args = parser.parse_args()
+
+    if not args.skip_seed:
+        print(f"Seeding {args.users:,} users and {args.rows:,} transactions")
+        seed(args.rows, args.users)
+    for name in sorted(set(migrate.migration_files()) - migrate.applied_migrations()):
+        print(f"Applying {name}")
+        migrate.apply(name)
+    total = analyze()
+    first_account, last_account = account_range()
+    user_ids = bench_users()
+
+    print(f"{total:,} transactions, {len(user_ids):,} bench users, {args.queries} queries per shape")
+    print(f"{'shape':20} {'indexes':8} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9} {'rows':>6}")
+    for indexed in (True, False):
+        if not indexed and args.skip_unindexed:
+            continue
+        # Planner settings apply to connections opened after this; the pool is rebuilt
+        db.close_pool()
+        if indexed:
+            os.environ.pop("PGOPTIONS", None)
+        else:
+            os.environ["PGOPTIONS"] = NO_INDEXES
+        rng = random.Random(0)
+        for name, latencies, found in run(query_shapes(rng, user_ids, first_account, last_account), args.queries):
+            print(f"{name:20} {'on' if indexed else 'off':8} {percentile(latencies, 50):9.1f} "
+                  f"{percentile(latencies, 95):9.1f} {max(latencies):9.1f} {found:6.1f}")
+    db.close_pool()
@@ -0,0 +1,73 @@
+# Latency of the inline velocity check at peak transfer rate, against a day of history
+# already in the windows. Each simulated transfer is checked and then recorded, as in
+# production; the pruning sweep a sync runs under the same lock is timed separately,
+# because a check that lands behind it waits for it. Also reports memory per account
+# window and per event.
+#
+#   python -m benchmarks.bench_velocity --accounts 100000 --history 1000000 --rate 500 --seconds 20
+
+import argparse
+import itertools
+import random
+import time
+import tracemalloc
+
+from benchmarks.bench_api import percentile
+from velocity import HISTORY, VelocityChecker
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--accounts", type=int, default=100000)
+    parser.add_argument("--history", type=int, default=1000000, help="Transfers in the preceding 24 hours")
+    parser.add_argument("--rate", type=int, default=500, help="Peak transfers per second")
+    parser.add_argument("--seconds", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    # A few busy accounts (merchants, payroll) take a large share of the traffic
+    weights = list(itertools.accumulate(50 if i < args.accounts // 1000 else 1 for i in range(args.accounts)))
+    now = time.time()
+    checker = VelocityChecker()
+
+    def transfer(transaction_id, when):
+        sender, recipient = rng.choices(range(args.accounts), cum_weights=weights, k=2)
+        return {"transaction_id": transaction_id, "sender_account_id": sender, "recipient_account_id": recipient,
+                "amount": round(rng.uniform(1, 2000), 2), "currency": rng.choice(["USD", "EUR", "GBP", "JPY"]),
+                "created_at": when}
+
+    history = sorted((now - rng.uniform(0, HISTORY) for _ in range(args.history)))
+    tracemalloc.start()
+    start = time.perf_counter()
+    for transaction_id, when in enumerate(history):
+        checker.record(transfer(transaction_id, when))
+    load_s = time.perf_counter() - start
+    checker._seen.clear()
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    stats = checker.stats()
+
+    latencies = []
+    transaction_id = len(history)
+    for i in range(args.rate * args.seconds):
+        when = now + i / args.rate
+        transaction = transfer(transaction_id, when)
+        start = time.perf_counter()
+        checker.check(transaction["sender_account_id"], transaction["recipient_account_id"], transaction["amount"],
+                      transaction["currency"], now=when)
+        latencies.append((time.perf_counter() - start) * 1e6)
+        checker.record(transaction)
+        transaction_id += 1
+
+    sweeps = []
+    for _ in range(20):
+        start = time.perf_counter()
+        with checker._lock:
+            checker._prune(now + args.seconds)
+        sweeps.append((time.perf_counter() - start) * 1000)
+
+    print(f"{stats['accounts']} account windows, {stats['events']} events loaded in {load_s:.1f} s; "
+          f"{memory / 2 ** 20:.1f} MiB, {memory / stats['events']:.0f} B per event")
+    print(f"{len(latencies)} checks at {args.rate}/s with {len(checker.rules)} rules: p50 {percentile(latencies, 50):.1f} us, "
+          f"p99 {percentile(latencies, 99):.1f} us, max {max(latencies):.1f} us")
+    print(f"pruning sweep per sync: p50 {percentile(sweeps, 50):.2f} ms, max {max(sweeps):.2f} ms")
@@ -0,0 +1,99 @@
+# Throughput scaling of server.py with the number of uvicorn workers.
+#
+# For each worker count a fresh server is started on the in-memory backend and driven
+# by several client processes, each keeping a fixed number of keep-alive connections
+# busy for the given duration. Run it on a machine with at least as many cores as the
+# largest worker count plus the client processes, otherwise the clients and the
+# workers compete for the same CPUs and the curve flattens.
+#
+#   python -m benchmarks.bench_workers --workers 1 2 4 8 --duration 10
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+
+from benchmarks.bench_startup import free_port
+
+
+async def drive(url, concurrency, duration):
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=10.0) as client:
+        deadline = time.perf_counter() + duration
+        completed = 0
+        errors = 0
+
+        async def loop():
+            nonlocal completed, errors
+            while time.perf_counter() < deadline:
+                try:
+                    response = await client.get(url)
+                    if response.status_code == 200:
+                        completed += 1
+                    else:
+                        errors += 1
+                except httpx.TransportError:
+                    errors += 1
+
+        await asyncio.gather(*(loop() for _ in range(concurrency)))
+        return completed, errors
+
+
+def client_process(args):
+    return asyncio.run(drive(*args))
+
+
+def wait_until_ready(url, timeout=30.0):
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        try:
+            if httpx.get(url, timeout=1.0).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.05)
+    raise RuntimeError("server did not become ready")
+
+
+def measure(workers, clients, concurrency, duration, path):
+    port = free_port()
+    url = f"http://127.0.0.1:{port}{path}"
+    env = dict(os.environ, BANKING_STORAGE="memory")
+    server = subprocess.Popen(
+        [sys.executable, "server.py", "--workers", str(workers), "--port", str(port),
+         "--host", "127.0.0.1", "--log-level", "warning"],
+        env=env,
+    )
+    try:
+        wait_until_ready(url)
+        with multiprocessing.Pool(clients) as pool:
+            results = pool.map(client_process, [(url, concurrency, duration)] * clients)
+    finally:
+        server.terminate()
+        server.wait()
+    completed = sum(done for done, _ in results)
+    errors = sum(failed for _, failed in results)
+    return completed / duration, errors
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--clients", type=int, default=4, help="load generator processes")
+    parser.add_argument("--concurrency", type=int, default=32, help="connections per client process")
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--path", default="/users/")
+    args = parser.parse_args()
+
+    print(f"cpus={os.cpu_count()} clients={args.clients}x{args.concurrency} duration={args.duration}s path={args.path}")
+    print(f"{'workers':>8} {'req/s':>10} {'speedup':>8} {'errors':>7}")
+    baseline = None
+    for workers in args.workers:
+        throughput, errors = measure(workers, args.clients, args.concurrency, args.duration, args.path)
+        baseline = baseline or throughput
+        print(f"{workers:8d} {throughput:10.0f} {throughput / baseline:8.2f} {errors:7d}")
@@ -0,0 +1,337 @@
+# Offline evaluation and latency regression harness for the assistant.
+#
+# A corpus of recorded conversations is replayed through the production path
+# (IntentRouter -> Assistant -> tools -> storage) against stub_llm, which answers each
+# model call with the recorded response instead of generating one. Every conversation
+# gets its own seeded customer in the in-memory backend, so tool calls run real
+# storage queries. Per turn the harness records latency, tool calls, tokens and the
+# number of storage queries issued; results are written as JSON tagged with the commit
+# so two runs can be compared.
+#
+#   python -m benchmarks.eval_harness replay --repeat 20 --output eval-new.json
+#   python -m benchmarks.eval_harness replay --compare eval-old.json
+#   python -m benchmarks.eval_harness record --scenarios benchmarks/eval_scenarios.jsonl
+#
+# record runs the scenario prompts against the model (llm_client, or the keyword stub
+# with --stub) and writes the corpus. Ids of seeded rows in tool inputs are stored as
+# references like "$account:0" so a recording replays against any freshly seeded store.
+
+import argparse
+import asyncio
+import contextvars
+import json
+import os
+import random
+import re
+import statistics
+import subprocess
+import time
+from collections import Counter
+from datetime import datetime
+
+import storage
+import stub_llm
+from assistant import Assistant
+from benchmarks.bench_api import percentile
+from intent_router import IntentRouter
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SCENARIOS_PATH = os.path.join(HERE, "eval_scenarios.jsonl")
+CORPUS_PATH = os.path.join(HERE, "eval_corpus.jsonl")
+
+REFERENCE_KINDS = {"account_id": "account", "sender_account_id": "account", "recipient_account_id": "account",
+                   "transaction_id": "transaction", "recipient_id": "recipient"}
+REFERENCE = re.compile(r"\$(account|transaction|recipient):(\d+)")
+CUSTOMER = re.compile(r"The customer is user_id (\d+)\.")
+
+_queries = contextvars.ContextVar("eval_queries", default=None)
+
+
+class CountingStorage:
+    # Wraps a backend and counts operations into the Counter of the current context, so
+    # conversations running in parallel each see only their own queries
+    def __init__(self, backend):
+        self._backend = backend
+
+    def __getattr__(self, name):
+        value = getattr(self._backend, name)
+        if name not in storage.OPERATIONS:
+            return value
+
+        def counted(*args, **kwargs):
+            queries = _queries.get()
+            if queries is not None:
+                queries[name] += 1
+            return value(*args, **kwargs)
+        return counted
+
+
+# Seeded dataset
+
+def seed_customer(db, name, spec, counterparty_account):
+    # Deterministic per conversation: the same name and spec always give the same rows
+    rng = random.Random(name)
+    user_id = db.create_user(name, f"{name}@example.com", "x", "Eval", name.capitalize(), "5550100", True)
+    refs = {"account": [], "transaction": [], "recipient": []}
+    for i in range(spec.get("accounts", 1)):
+        account_type = ("checking", "savings")[i % 2]
+        refs["account"].append(db.create_account(user_id, rng.randrange(100, 50000), account_type, "USD"))
+    for i in range(spec.get("recipients", 0)):
+        refs["recipient"].append(db.create_recipient(
+            user_id, f"Recipient {i}", f"{rng.randrange(10 ** 8, 10 ** 9)}", "Eval Bank", "EVALUS33", "friend",
+            i < spec.get("favorites", 0)))
+    for i in range(spec.get("transactions", 0)):
+        own = refs["account"][i % len(refs["account"])]
+        sender, recipient = (own, counterparty_account) if i % 3 else (counterparty_account, own)
+        refs["transaction"].append(db.create_transaction(
+            sender, recipient, rng.randrange(5, 500), "USD", "completed", "transfer", f"Payment {i}"))
+    return user_id, refs
+
+
+def resolve(value, refs):
+    if isinstance(value, dict):
+        return {key: resolve(item, refs) for key, item in value.items()}
+    if isinstance(value, list):
+        return [resolve(item, refs) for item in value]
+    match = REFERENCE.fullmatch(value) if isinstance(value, str) else None
+    if match:
+        return refs[match.group(1)][int(match.group(2))]
+    return value
+
+
+def resolve_text(text, refs):
+    # References inside a prompt, e.g. "show account $account:1"
+    return REFERENCE.sub(lambda match: str(refs[match.group(1)][int(match.group(2))]), text)
+
+
+def symbolize(value, refs, key=None):
+    if isinstance(value, dict):
+        return {k: symbolize(item, refs, k) for k, item in value.items()}
+    if isinstance(value, list):
+        return [symbolize(item, refs) for item in value]
+    kind = REFERENCE_KINDS.get(key)
+    if kind and value in refs[kind]:
+        return f"${kind}:{refs[kind].index(value)}"
+    return value
+
+
+# Replay
+
+def _turn_position(messages):
+    # (turn index, model call within the turn) of the request being made
+    prompts = [i for i, message in enumerate(messages) if message["role"] == "user"
+               and (isinstance(message["content"], str)
+                    or all(block.get("type") == "text" for block in message["content"]))]
+    calls = sum(1 for message in messages[prompts[-1]:] if message["role"] == "assistant")
+    return len(prompts) - 1, calls
+
+
+def replay_responder(conversations, divergences):
+    # conversations maps user_id -> (recorded conversation, seeded refs)
+    def respond(body):
+        system = body["system"] if isinstance(body["system"], str) else " ".join(b["text"] for b in body["system"])
+        user_id = int(CUSTOMER.search(system).group(1))
+        conversation, refs = conversations[user_id]
+        turn, call = _turn_position(body["messages"])
+        responses = conversation["turns"][turn]["responses"]
+        if call >= len(responses):
+            divergences[conversation["id"]] += 1
+            return [{"type": "text", "text": "[no recorded response]"}], "end_turn"
+        response = responses[call]
+        return resolve(response["content"], refs), response["stop_reason"]
+    return respond
+
+
+async def replay_conversation(router, user_id, refs, conversation):
+    turns = []
+    history = []
+    for number, turn in enumerate(conversation["turns"]):
+        queries = Counter()
+        _queries.set(queries)
+        history.append({"role": "user", "content": resolve_text(turn["user"], refs)})
+        prompt_index = len(history)
+        start = time.perf_counter()
+        reply = await router.respond(user_id, history)
+        latency = (time.perf_counter() - start) * 1000
+        history = reply["messages"]
+        model_calls = 0 if reply.get("intent") else \
+            sum(1 for message in history[prompt_index:] if message["role"] == "assistant")
+        errors = sum(1 for message in history if message["role"] == "user" and isinstance(message["content"], list)
+                     for block in message["content"] if block.get("type") == "tool_result" and block.get("is_error"))
+        turns.append({
+            "conversation": conversation["id"],
+            "turn": number,
+            "latency_ms": round(latency, 3),
+            "model_calls": model_calls,
+            "tool_calls": reply["tool_calls"],
+            "intent": reply.get("intent"),
+            "input_tokens": reply["usage"]["input_tokens"],
+            "output_tokens": reply["usage"]["output_tokens"],
+            "db_queries": sum(queries.values()),
+            "tool_errors": errors,
+        })
+    return turns
+
+
+async def replay(corpus, repeat, concurrency, model_latency):
+    db = storage.InMemoryStorage()
+    storage.set_storage(CountingStorage(db))
+    counterparty = db.create_user("counterparty", "counterparty@example.com", "x", "Counter", "Party", "1", True)
+    counterparty_account = db.create_account(counterparty, 10 ** 6, "checking", "USD")
+    conversations = {}
+    runs = []
+    for copy in range(repeat):
+        for conversation in corpus:
+            user_id, refs = seed_customer(db, f"{conversation['id']}-{copy}", conversation.get("seed", {}),
+                                          counterparty_account)
+            conversations[user_id] = (conversation, refs)
+            runs.append((user_id, refs, conversation))
+
+    divergences = Counter()
+    stub = stub_llm.create_app(latency=model_latency, responder=replay_responder(conversations, divergences))
+    from test_assistant import stub_client
+    router = IntentRouter(Assistant(client=stub_client(stub)))
+    gate = asyncio.Semaphore(concurrency)
+
+    async def run(user_id, refs, conversation):
+        async with gate:
+            return await replay_conversation(router, user_id, refs, conversation)
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(run(*args) for args in runs))
+    elapsed = time.perf_counter() - start
+    storage.set_storage(None)
+    turns = [turn for conversation_turns in results for turn in conversation_turns]
+    return turns, divergences, elapsed
+
+
+def summarize(turns, divergences, elapsed):
+    latencies = [turn["latency_ms"] for turn in turns]
+
+    def mean(field):
+        return round(statistics.mean(turn[field] for turn in turns), 3)
+    return {
+        "conversations": sum(1 for turn in turns if turn["turn"] == 0),
+        "turns": len(turns),
+        "turn_latency_p50_ms": round(percentile(latencies, 50), 3),
+        "turn_latency_p95_ms": round(percentile(latencies, 95), 3),
+        "turn_latency_max_ms": round(max(latencies), 3),
+        "model_calls_per_turn": mean("model_calls"),
+        "tool_calls_per_turn": mean("tool_calls"),
+        "input_tokens_per_turn": mean("input_tokens"),
+        "output_tokens_per_turn": mean("output_tokens"),
+        "db_queries_per_turn": mean("db_queries"),
+        "tool_errors": sum(turn["tool_errors"] for turn in turns),
+        "routed_turns": sum(1 for turn in turns if turn["intent"]),
+        "divergences": sum(divergences.values()),
+        "turns_per_second": round(len(turns) / elapsed, 1),
+    }
+
+
+def current_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=HERE, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_summary(summary, baseline=None):
+    print(f"{'metric':24} {'value':>12}" + (f" {'baseline':>12} {'change':>8}" if baseline else ""))
+    for metric, value in summary.items():
+        line = f"{metric:24} {value:12}"
+        if baseline and metric in baseline:
+            old = baseline[metric]
+            change = f"{(value - old) / old:+.0%}" if old else ("=" if value == old else "new")
+            line += f" {old:12} {change:>8}"
+        print(line)
+
+
+# Recording
+
+async def record(scenarios, client):
+    db = storage.InMemoryStorage()
+    storage.set_storage(db)
+    counterparty = db.create_user("counterparty", "counterparty@example.com", "x", "Counter", "Party", "1", True)
+    counterparty_account = db.create_account(counterparty, 10 ** 6, "checking", "USD")
+    router = IntentRouter(Assistant(client=client))
+    corpus = []
+    for scenario in scenarios:
+        user_id, refs = seed_customer(db, f"{scenario['id']}-0", scenario.get("seed", {}), counterparty_account)
+        history = []
+        turns = []
+        for prompt in scenario["turns"]:
+            history.append({"role": "user", "content": resolve_text(prompt, refs)})
+            start = len(history)
+            reply = await router.respond(user_id, history)
+            history = reply["messages"]
+            responses = []
+            for message in history[start:]:
+                if message["role"] == "assistant":
+                    content = symbolize(message["content"], refs)
+                    tool_use = any(block["type"] == "tool_use" for block in content)
+                    responses.append({"content": content, "stop_reason": "tool_use" if tool_use else "end_turn"})
+            turns.append({"user": prompt, "responses": [] if reply.get("intent") else responses})
+        corpus.append({"id": scenario["id"], "seed": scenario.get("seed", {}), "turns": turns})
+    storage.set_storage(None)
+    return corpus
+
+
+def read_jsonl(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded assistant conversations")
+    commands = parser.add_subparsers(dest="command", required=True)
+    replay_parser = commands.add_parser("replay")
+    replay_parser.add_argument("--corpus", default=CORPUS_PATH)
+    replay_parser.add_argument("--repeat", type=int, default=20, help="Copies of each conversation")
+    replay_parser.add_argument("--concurrency", type=int, default=50)
+    replay_parser.add_argument("--model-latency-ms", type=float, default=0.0)
+    replay_parser.add_argument("--output", help="Write results as JSON")
+    replay_parser.add_argument("--compare", help="Results JSON of an earlier run")
+    record_parser = commands.add_parser("record")
+    record_parser.add_argument("--scenarios", default=SCENARIOS_PATH)
+    record_parser.add_argument("--output", default=CORPUS_PATH)
+    record_parser.add_argument("--stub", action="store_true", help="Record the keyword stub instead of the model")
+    args = parser.parse_args()
+
+    if args.command == "record":
+        if args.stub:
+            from test_assistant import stub_client
+            client = stub_client(stub_llm.create_app())
+        else:
+            import llm_client
+            client = llm_client.get_async_client()
+        corpus = asyncio.run(record(read_jsonl(args.scenarios), client))
+        with open(args.output, "w") as f:
+            for conversation in corpus:
+                f.write(json.dumps(conversation, separators=(",", ":")) + "\n")
+        print(f"recorded {len(corpus)} conversations to {args.output}")
+        return
+
+    corpus = read_jsonl(args.corpus)
+    turns, divergences, elapsed = asyncio.run(
+        replay(corpus, args.repeat, args.concurrency, args.model_latency_ms / 1000))
+    summary = summarize(turns, divergences, elapsed)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["summary"]
+    print(f"commit {current_commit()}, {len(corpus)} recorded conversations x {args.repeat}, "
+          f"model latency {args.model_latency_ms:.0f} ms")
+    print_summary(summary, baseline)
+    for conversation_id, count in sorted(divergences.items()):
+        print(f"  diverged from the recording: {conversation_id} ({count} unrecorded model calls)")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"commit": current_commit(), "date": datetime.now().isoformat(timespec="seconds"),
+                       "config": {"corpus": os.path.basename(args.corpus), "repeat": args.repeat,
+                                  "concurrency": args.concurrency, "model_latency_ms": args.model_latency_ms},
+                       "summary": summary, "turns": turns}, f)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+import argparse
+import csv
+import mmap
+import os
+import re
+import struct
+import zlib
+from array import array
+
+# SWIFT/BIC directory. Loaded once per worker at startup from BIC_DIRECTORY_PATH,
+# either a CSV with "bic" and "bank_name" columns or a file compiled from one with
+#
+#   python bic_directory.py compile bic.csv bic.idx
+#
+# A compiled file is memory-mapped, so workers share its pages and startup does not
+# parse anything. In memory the directory is a few flat arrays rather than a dict of
+# rows: the 11-character codes sorted in one bytes blob, a bank name number per code,
+# the distinct bank names in one blob with offsets, and an open-addressing hash table
+# of code positions. A lookup is a crc32, usually one probe and one slice compare.
+# With no directory configured, recipients are only checked for length as before.
+
+BIC_DIRECTORY_PATH = os.getenv("BIC_DIRECTORY_PATH")
+BIC_PATTERN = re.compile(r"^[A-Z]{4}[A-Z]{2}[A-Z0-9]{2}([A-Z0-9]{3})?$")
+MAGIC = b"BICDIR1\0"
+HEADER = struct.Struct("=8sIIII")  # magic, codes, bank names, name blob bytes, hash slots
+KEY = 11
+EMPTY = 0xFFFFFFFF
+
+
+def normalize(code):
+    # "deut de ff" -> "DEUTDEFFXXX"; None if it is not shaped like a BIC
+    code = re.sub(r"\s", "", str(code)).upper()
+    if not BIC_PATTERN.match(code):
+        return None
+    return code if len(code) == 11 else code + "XXX"
+
+
+def _padded(size):
+    # Sections start on 4-byte boundaries so the uint32 arrays can be cast in place
+    return size + -size % 4
+
+
+def _pad(data):
+    return data + b"\0" * (_padded(len(data)) - len(data))
+
+
+def _slots(count):
+    size = 8
+    while size < count * 2:
+        size *= 2
+    return size
+
+
+class BicDirectory:
+    def __init__(self, buffer):
+        # buffer holds the compiled layout: bytes, or an mmap of a compiled file
+        self._buffer = buffer
+        view = memoryview(buffer)
+        magic, self.count, self.name_count, blob_size, self.slots = HEADER.unpack_from(view)
+        if magic != MAGIC:
+            raise ValueError("Not a compiled BIC directory")
+        offset = HEADER.size
+        self._keys = view[offset:offset + self.count * KEY]
+        offset += _padded(self.count * KEY)
+        self._name_ids = view[offset:offset + self.count * 4].cast("I")
+        offset += self.count * 4
+        self._name_offsets = view[offset:offset + (self.name_count + 1) * 4].cast("I")
+        offset += (self.name_count + 1) * 4
+        self._names = view[offset:offset + blob_size]
+        offset += _padded(blob_size)
+        self._table = view[offset:offset + self.slots * 4].cast("I")
+
+    @classmethod
+    def build(cls, entries):
+        # entries: iterable of (bic, bank name); malformed codes are skipped, and the
+        # last name wins for a repeated code
+        rows = {}
+        for bic, bank_name in entries:
+            key = normalize(bic)
+            if key is not None and bank_name:
+                rows[key] = bank_name.strip()
+        keys = sorted(rows)
+        names = sorted(set(rows.values()))
+        name_numbers = {name: i for i, name in enumerate(names)}
+        encoded = [name.encode() for name in names]
+        name_offsets = array("I", [0])
+        for data in encoded:
+            name_offsets.append(name_offsets[-1] + len(data))
+        blob = b"".join(encoded)
+        slots = _slots(len(keys))
+        table = array("I", [EMPTY]) * slots
+        for position, key in enumerate(keys):
+            slot = zlib.crc32(key.encode()) & (slots - 1)
+            while table[slot] != EMPTY:
+                slot = (slot + 1) & (slots - 1)
+            table[slot] = position
+        data = b"".join([
+            HEADER.pack(MAGIC, len(keys), len(names), len(blob), slots),
+            _pad("".join(keys).encode()),
+            array("I", [name_numbers[rows[key]] for key in keys]).tobytes(),
+            name_offsets.tobytes(),
+            _pad(blob),
+            table.tobytes(),
+        ])
+        return cls(data)
+
+    @classmethod
+    def from_csv(cls, path):
+        with open(path, newline="") as f:
+            reader = csv.DictReader(f)
+            columns = {name.strip().lower(): name for name in reader.fieldnames or ()}
+            if "bic" not in columns or "bank_name" not in columns:
+                raise ValueError(f"{path}: expected bic and bank_name columns")
+            return cls.build((row[columns["bic"]], row[columns["bank_name"]]) for row in reader)
+
+    @classmethod
+    def open(cls, path):
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                return cls.from_csv(path)
+            return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def save(self, path):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(self._buffer)
+        os.replace(tmp_path, path)
+
+    def __len__(self):
+        return self.count
+
+    def nbytes(self):
+        return len(self._buffer)
+
+    def _position(self, key):
+        encoded = key.encode()
+        slot = zlib.crc32(encoded) & (self.slots - 1)
+        while True:
+            position = self._table[slot]
+            if position == EMPTY:
+                return None
+            if self._keys[position * KEY:(position + 1) * KEY] == encoded:
+                return position
+            slot = (slot + 1) & (self.slots - 1)
+
+    def bank_name(self, position):
+        number = self._name_ids[position]
+        return bytes(self._names[self._name_offsets[number]:self._name_offsets[number + 1]]).decode()
+
+    def lookup(self, code):
+        # Returns {"bic", "bank_name"} or None. An 8-character code is its head office (XXX)
+        key = normalize(code)
+        position = self._position(key) if key is not None else None
+        if position is None:
+            return None
+        return {"bic": key, "bank_name": self.bank_name(position)}
+
+    def validate_many(self, codes):
+        results = []
+        for code in codes:
+            key = normalize(code)
+            if key is None:
+                results.append({"swift_code": code, "valid": False, "bank_name": None, "error": "Malformed BIC"})
+                continue
+            position = self._position(key)
+            if position is None:
+                results.append({"swift_code": code, "valid": False, "bank_name": None, "error": "Unknown BIC"})
+            else:
+                results.append({"swift_code": code, "valid": True, "bank_name": self.bank_name(position), "error": None})
+        return results
+
+
+_directory = None
+
+
+def load(path=BIC_DIRECTORY_PATH):
+    # Called from the app lifespan; returns the number of codes loaded
+    global _directory
+    _directory = BicDirectory.open(path) if path else None
+    return len(_directory) if _directory is not None else 0
+
+
+def get_directory():
+    return _directory
+
+
+def set_directory(directory):
+    global _directory
+    _directory = directory
+
+
+def resolve(swift_code, bank_name=None):
+    # Returns (swift_code, bank_name) to store for a recipient: the code cleaned up and
+    # the given bank name, else the directory's. Raises ValueError for a code the loaded
+    # directory does not know; without a directory the code is taken as given.
+    directory = get_directory()
+    if directory is None:
+        if not bank_name:
+            raise ValueError("bank_name is required")
+        return swift_code, bank_name
+    entry = directory.lookup(swift_code)
+    if entry is None:
+        raise ValueError(f"Unknown SWIFT/BIC code {swift_code}")
+    return re.sub(r"\s", "", swift_code).upper(), bank_name or entry["bank_name"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="BIC directory tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+    compile_parser = commands.add_parser("compile", help="Compile a CSV directory for memory mapping")
+    compile_parser.add_argument("csv")
+    compile_parser.add_argument("output")
+    args = parser.parse_args()
+    directory = BicDirectory.from_csv(args.csv)
+    directory.save(args.output)
+    print(f"Compiled {len(directory)} codes, {directory.nbytes()} bytes, to {args.output}")
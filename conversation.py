@@ -0,0 +1,208 @@
+import json
+import os
+import re
+
+CONVERSATION_TOKEN_BUDGET = int(os.getenv("CONVERSATION_TOKEN_BUDGET", "3000"))
+CONVERSATION_MAX_TURNS = int(os.getenv("CONVERSATION_MAX_TURNS", "8"))
+CONVERSATION_TOOL_RESULT_TOKENS = int(os.getenv("CONVERSATION_TOOL_RESULT_TOKENS", "400"))
+CONVERSATION_SUMMARY_TOKENS = int(os.getenv("CONVERSATION_SUMMARY_TOKENS", "400"))
+SUMMARY_MODEL = os.getenv("SUMMARY_MODEL", "claude-3-haiku-20240307")
+CONVERSATION_TOKENIZER = os.getenv("CONVERSATION_TOKENIZER")
+
+# Rough per-message framing cost on top of the content tokens
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+# Token counting. Counts only need to be local and consistent from turn to turn, not
+# exact. With CONVERSATION_TOKENIZER set to a tokenizer.json file they come from the
+# tokenizers package; otherwise every run of up to four word characters or up to three
+# other non-space characters is a token, which slightly overcounts English and JSON.
+
+_TOKEN = re.compile(r"\w{1,4}|[^\w\s]{1,3}")
+_tokenizer = None
+
+
+def _token_ends(text):
+    # End offset of each token of text
+    global _tokenizer
+    if not CONVERSATION_TOKENIZER:
+        return [match.end() for match in _TOKEN.finditer(text)]
+    if _tokenizer is None:
+        from tokenizers import Tokenizer
+        _tokenizer = Tokenizer.from_file(CONVERSATION_TOKENIZER)
+    return [end for _, end in _tokenizer.encode(text).offsets]
+
+
+def count_tokens(text):
+    return len(_token_ends(text))
+
+
+def _block_text(block):
+    if block["type"] == "text":
+        return block["text"]
+    if block["type"] == "tool_use":
+        return block["name"] + json.dumps(block["input"])
+    if block["type"] == "tool_result":
+        return block["content"] if isinstance(block["content"], str) else json.dumps(block["content"])
+    return json.dumps(block)
+
+
+def message_tokens(message):
+    content = message["content"]
+    if isinstance(content, str):
+        return count_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+    return sum(count_tokens(_block_text(block)) for block in content) + MESSAGE_OVERHEAD_TOKENS
+
+
+def messages_tokens(messages):
+    return sum(message_tokens(message) for message in messages)
+
+
+def truncate_text(text, max_tokens):
+    ends = _token_ends(text)
+    if len(ends) <= max_tokens:
+        return text
+    return f"{text[:ends[max_tokens - 1]]}... [truncated {len(ends) - max_tokens} tokens]"
+
+
+def truncate_tool_result(content, max_tokens):
+    # Row lists ({"columns", "rows"} from assistant.shape_result) lose rows from the end
+    # so the result stays valid JSON; anything else is cut off as text.
+    if count_tokens(content) <= max_tokens:
+        return content
+    try:
+        value = json.loads(content)
+    except ValueError:
+        value = None
+    if isinstance(value, dict) and isinstance(value.get("rows"), list):
+        rows = value["rows"]
+        kept = len(rows)
+        while kept > 1:
+            kept = max(1, kept // 2) if kept > 8 else kept - 1
+            shortened = json.dumps(dict(value, rows=rows[:kept], omitted_rows=len(rows) - kept), separators=(",", ":"))
+            if count_tokens(shortened) <= max_tokens:
+                return shortened
+    return truncate_text(content, max_tokens)
+
+
+def _compact_message(message, tool_result_tokens):
+    content = message["content"]
+    if isinstance(content, str):
+        return message
+    blocks = []
+    for block in content:
+        if block["type"] == "tool_result" and isinstance(block["content"], str):
+            block = dict(block, content=truncate_tool_result(block["content"], tool_result_tokens))
+        blocks.append(block)
+    return dict(message, content=blocks)
+
+
+# Summaries. A summarizer takes the running summary and the turns that just left the
+# window and returns the new summary.
+
+def _turn_outline(messages):
+    question = messages[0]["content"]
+    if not isinstance(question, str):
+        question = " ".join(block["text"] for block in question if block["type"] == "text")
+    tools = [block["name"] for message in messages if message["role"] == "assistant" and isinstance(message["content"], list)
+             for block in message["content"] if block["type"] == "tool_use"]
+    answer = ""
+    last = messages[-1]
+    if last["role"] == "assistant":
+        answer = _block_text(last["content"][0]) if isinstance(last["content"], list) and last["content"] else str(last["content"])
+    line = f"- Customer: {truncate_text(question, 60)}"
+    if tools:
+        line += f" | tools: {', '.join(dict.fromkeys(tools))}"
+    if answer:
+        line += f" | assistant: {truncate_text(answer, 80)}"
+    return line
+
+
+async def outline_summarizer(summary, turns):
+    # Free and deterministic: one line per turn with the question, tools and answer
+    lines = [summary] if summary else []
+    lines.extend(_turn_outline(turn) for turn in turns)
+    return "\n".join(lines)
+
+
+def model_summarizer(client=None, model=SUMMARY_MODEL, max_tokens=CONVERSATION_SUMMARY_TOKENS):
+    async def summarize(summary, turns):
+        import llm_client
+        transcript = "\n".join(_turn_outline(turn) for turn in turns)
+        prompt = (
+            "Update the running summary of a banking support conversation. Keep account ids, amounts, "
+            "recipients and anything the customer asked to do; drop pleasantries.\n\n"
+            f"Current summary:\n{summary or '(none)'}\n\nNew turns:\n{transcript}\n\nUpdated summary:"
+        )
+        response = await (client or llm_client.get_async_client()).messages.create(
+            model=model, max_tokens=max_tokens, messages=[{"role": "user", "content": prompt}])
+        return "".join(block.text for block in response.content if block.type == "text")
+    return summarize
+
+
+class Conversation:
+    # Keeps a chat inside a token budget: the latest turns are sent verbatim (a sliding
+    # window) and older turns are folded into a running summary. Oversized tool results
+    # are cut down by the Assistant before the model reads them (tool_result_tokens);
+    # record() applies the same limit to replies of assistants that do not.
+    #
+    #   conversation.add_user_message(prompt)
+    #   reply = await assistant.respond(user_id, await conversation.messages())
+    #   conversation.record(reply)
+
+    def __init__(self, budget=CONVERSATION_TOKEN_BUDGET, max_turns=CONVERSATION_MAX_TURNS,
+                 tool_result_tokens=CONVERSATION_TOOL_RESULT_TOKENS, summary_tokens=CONVERSATION_SUMMARY_TOKENS,
+                 summarizer=outline_summarizer):
+        self.budget = budget
+        self.max_turns = max_turns
+        self.tool_result_tokens = tool_result_tokens
+        self.summary_tokens = summary_tokens
+        self.summarizer = summarizer
+        self.summary = ""
+        self.turns = []  # {"messages": [...], "tokens": n}
+        self.stats = []
+        self._full_tokens = 0
+        self._sent = []
+
+    def add_user_message(self, text):
+        message = {"role": "user", "content": text}
+        tokens = message_tokens(message)
+        self._full_tokens += tokens
+        self.turns.append({"messages": [message], "tokens": tokens})
+
+    async def messages(self):
+        # The newest turn is always sent; older ones are kept while they fit
+        summary_tokens = count_tokens(self.summary) if self.summary else 0
+        used = summary_tokens + self.turns[-1]["tokens"]
+        keep = 1
+        for turn in reversed(self.turns[:-1]):
+            if keep >= self.max_turns or used + turn["tokens"] > self.budget:
+                break
+            used += turn["tokens"]
+            keep += 1
+        dropped = self.turns[:-keep]
+        if dropped:
+            self.turns = self.turns[-keep:]
+            summary = await self.summarizer(self.summary, [turn["messages"] for turn in dropped])
+            self.summary = truncate_text(summary, self.summary_tokens) if summary else ""
+        self._sent = [message for turn in self.turns for message in turn["messages"]]
+        if self.summary:
+            first = self._sent[0]
+            content = first["content"] if isinstance(first["content"], list) else [{"type": "text", "text": first["content"]}]
+            summary_block = {"type": "text", "text": f"Summary of the conversation so far:\n{self.summary}"}
+            self._sent[0] = dict(first, content=[summary_block] + content)
+        return list(self._sent)
+
+    def record(self, reply):
+        new_messages = reply["messages"][len(self._sent):]
+        self._full_tokens += messages_tokens(new_messages)
+        turn = self.turns[-1]
+        turn["messages"] = turn["messages"] + [_compact_message(message, self.tool_result_tokens) for message in new_messages]
+        turn["tokens"] = messages_tokens(turn["messages"])
+        self.stats.append({
+            "turn": len(self.stats) + 1,
+            "sent_tokens": messages_tokens(self._sent),
+            "full_tokens": self._full_tokens - messages_tokens(new_messages),
+            "input_tokens": reply["usage"]["input_tokens"],
+        })
+        return self.stats[-1]
@@ -0,0 +1,65 @@
+import asyncio
+import time
+from collections import deque
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class Deadline:
+    def __init__(self, seconds):
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self):
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    async def run(self, awaitable, reserve=0.0):
+        # Awaits with whatever time is left minus reserve; DeadlineExceeded on timeout
+        budget = self.remaining() - reserve
+        if budget <= 0:
+            if asyncio.iscoroutine(awaitable):
+                awaitable.close()
+            raise DeadlineExceeded
+        try:
+            return await asyncio.wait_for(awaitable, budget)
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded from None
+
+
+class LatencyTracker:
+    # Recent call durations in seconds, for deciding when a call is slow enough to hedge
+    def __init__(self, window=200, min_samples=20):
+        self.samples = deque(maxlen=window)
+        self.min_samples = min_samples
+
+    def record(self, seconds):
+        self.samples.append(seconds)
+
+    def percentile(self, p):
+        if len(self.samples) < self.min_samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+async def hedged(make_call, hedge_after):
+    # Starts make_call(); if it has not finished after hedge_after seconds, starts a
+    # second identical call and returns whichever finishes first, cancelling the other.
+    # Returns (result, number of calls started). A failed call leaves the other running.
+    tasks = [asyncio.ensure_future(make_call())]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+        if not done:
+            tasks.append(asyncio.ensure_future(make_call()))
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result(), len(tasks)
+        return tasks[0].result(), len(tasks)  # every call failed: raise the first error
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
@@ -0,0 +1,150 @@
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from decimal import Decimal
+
+import recent_transfers
+from recent_transfers import RecentTransfers, timestamp
+
+# Catches accidental double submissions: a transfer with the same sender, recipient,
+# amount and currency as one created less than DUPLICATE_WINDOW seconds earlier. With
+# DUPLICATE_ACTION "hold" the repeat is created with status HOLD_STATUS until the
+# customer confirms it (it becomes "pending") or cancels it; with "flag" it goes through
+# and is only reported. Either way the caller learns which transaction it repeats.
+#
+# Transfers are kept as 64-bit fingerprints in an insertion-ordered hash window that
+# expires from the front and never holds more than DUPLICATE_MAX_ENTRIES. Two distinct
+# transfers share a fingerprint with probability 2**-64, so practically every hit is a
+# real repeat. Like the velocity windows, the window is loaded from the database on
+# startup and reads back the transfers of other workers every DUPLICATE_SYNC_INTERVAL
+# seconds.
+
+DUPLICATE_CHECKS = os.getenv("DUPLICATE_CHECKS", "1") == "1"
+DUPLICATE_WINDOW = float(os.getenv("DUPLICATE_WINDOW", "60"))
+DUPLICATE_ACTION = os.getenv("DUPLICATE_ACTION", "hold")
+DUPLICATE_MAX_ENTRIES = int(os.getenv("DUPLICATE_MAX_ENTRIES", "1000000"))
+DUPLICATE_SYNC_INTERVAL = float(os.getenv("DUPLICATE_SYNC_INTERVAL", "1"))
+DUPLICATE_SYNC_OVERLAP = float(os.getenv("DUPLICATE_SYNC_OVERLAP", "10"))
+
+ACTIONS = ("flag", "hold")
+HOLD_STATUS = "unconfirmed"
+
+
+def fingerprint(sender_account_id, recipient_account_id, amount, currency):
+    # 10, 10.0 and 10.00 are the same amount
+    amount = Decimal(str(amount)).normalize()
+    key = f"{sender_account_id}:{recipient_account_id}:{amount:f}:{currency}".encode()
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "big")
+
+
+def _transaction_fingerprint(transaction):
+    return fingerprint(transaction["sender_account_id"], transaction["recipient_account_id"], transaction["amount"],
+                       transaction["currency"])
+
+
+class DuplicateDetector(RecentTransfers):
+    def __init__(self, window=DUPLICATE_WINDOW, action=DUPLICATE_ACTION, max_entries=DUPLICATE_MAX_ENTRIES,
+                 overlap=DUPLICATE_SYNC_OVERLAP):
+        if action not in ACTIONS:
+            raise ValueError(f"Invalid duplicate action {action!r}, expected one of {', '.join(ACTIONS)}")
+        super().__init__(window, overlap)
+        self.window = window
+        self.action = action
+        self.max_entries = max_entries
+        # fingerprint -> (last seen, id of the first transaction, None while it is being created),
+        # least recently seen first
+        self._entries = OrderedDict()
+        self.duplicates = 0
+        self.evicted = 0
+
+    def _clear(self):
+        self._entries.clear()
+
+    def _prune(self, now):
+        # Caller holds the lock
+        entries = self._entries
+        while entries and next(iter(entries.values()))[0] <= now - self.window:
+            entries.popitem(last=False)
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+            self.evicted += 1
+
+    def _add(self, key, when, transaction_id):
+        # Caller holds the lock. A repeat within the window keeps the id of the first transaction.
+        entry = self._entries.get(key)
+        if entry is not None and abs(when - entry[0]) < self.window:
+            if entry[1] is not None:
+                transaction_id = entry[1]
+            when = max(when, entry[0])
+        self._entries[key] = (when, transaction_id)
+        self._entries.move_to_end(key)
+
+    def claim(self, key, now=None):
+        # Returns the entry of an earlier transfer with this fingerprint, or None after
+        # reserving the fingerprint for the transfer about to be created
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[0] >= self.window:
+                entry = None
+            self._add(key, now, None)
+            self._prune(now)
+            if entry is not None:
+                self.duplicates += 1
+            return entry
+
+    def release(self, key):
+        # Drops a reservation whose transfer was never created
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] is None:
+                del self._entries[key]
+
+    def _record(self, transaction):
+        # A repeat keeps the first transaction's id, so re-reading one also counts as new
+        key = _transaction_fingerprint(transaction)
+        entry = self._entries.get(key)
+        self._add(key, timestamp(transaction["created_at"]), transaction["transaction_id"])
+        return entry is None or entry[1] != transaction["transaction_id"]
+
+    def check(self, sender_account_id, recipient_account_id, amount, currency, now=None):
+        # Returns {"action": "allow" | "flag" | "hold", "duplicate_of": id of the earlier
+        # transaction or None, "fingerprint": the fingerprint reserved by an allowed transfer}
+        key = fingerprint(sender_account_id, recipient_account_id, amount, currency)
+        entry = self.claim(key, now)
+        if entry is None:
+            return {"action": "allow", "duplicate_of": None, "fingerprint": key}
+        return {"action": self.action, "duplicate_of": entry[1], "fingerprint": None}
+
+    def stats(self):
+        with self._lock:
+            return {"fingerprints": len(self._entries), "duplicates": self.duplicates, "evicted": self.evicted}
+
+
+async def run_sync(detector, interval=DUPLICATE_SYNC_INTERVAL):
+    await recent_transfers.run_sync(detector, interval, "Duplicate detector")
+
+
+_detector = None
+
+
+def get_detector():
+    return _detector
+
+
+def set_detector(detector):
+    global _detector
+    _detector = detector
+
+
+def check_transfer(sender_account_id, recipient_account_id, amount, currency):
+    if _detector is None:
+        return {"action": "allow", "duplicate_of": None, "fingerprint": None}
+    return _detector.check(sender_account_id, recipient_account_id, amount, currency)
+
+
+def release(result):
+    # Called when the transfer checked with check_transfer could not be created
+    if _detector is not None and result["fingerprint"] is not None:
+        _detector.release(result["fingerprint"])
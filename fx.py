@@ -0,0 +1,216 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from decimal import ROUND_HALF_UP, Decimal
+from fractions import Fraction
+
+# Foreign exchange rates and conversion. Rates are read from FX_RATES_PATH, a JSON file
+# standing in for a rate feed:
+#
+#   {"base": "USD", "as_of": "2024-06-03T16:00:00", "rates": {"EUR": "0.9210", ...}}
+#
+# with DEFAULT_RATES used when no file is configured. Every load becomes an immutable
+# snapshot whose version is a hash of its rates, so all workers reading the same file
+# agree on it and a quote can be re-priced later against the snapshot it was made with.
+# The file is checked for changes at most every FX_REFRESH_INTERVAL seconds.
+#
+# Amounts are exact: they are taken to integer minor units of their currency (cents,
+# yen), multiplied by the rate as a fraction and rounded half up to the minor units of
+# the target. Batch conversion groups amounts by currency so each group is integer
+# arithmetic against one precomputed factor; callers that already hold minor units
+# use convert_minor and skip Decimal altogether.
+
+FX_RATES_PATH = os.getenv("FX_RATES_PATH")
+FX_REFRESH_INTERVAL = float(os.getenv("FX_REFRESH_INTERVAL", "60"))
+FX_SNAPSHOTS_KEPT = int(os.getenv("FX_SNAPSHOTS_KEPT", "20"))
+
+# ISO 4217 minor unit digits
+CURRENCY_EXPONENTS = {"USD": 2, "EUR": 2, "GBP": 2, "JPY": 0}
+
+DEFAULT_RATES = {
+    "base": "USD",
+    "as_of": "2024-06-03T16:00:00",
+    "rates": {"USD": "1", "EUR": "0.9210", "GBP": "0.7834", "JPY": "156.92"},
+}
+
+
+def _currency(currency):
+    code = getattr(currency, "value", currency)
+    if code not in CURRENCY_EXPONENTS:
+        raise ValueError(f"Unsupported currency {code}")
+    return code
+
+
+def _round_div(numerator, denominator):
+    # numerator / denominator rounded half away from zero; denominator > 0
+    quotient = (abs(numerator) * 2 + denominator) // (denominator * 2)
+    return quotient if numerator >= 0 else -quotient
+
+
+def _to_minor(amount, exponent):
+    if not isinstance(amount, Decimal):
+        amount = Decimal(str(amount))
+    return int(amount.scaleb(exponent).to_integral_value(ROUND_HALF_UP))
+
+
+def to_minor(amount, currency):
+    return _to_minor(amount, CURRENCY_EXPONENTS[_currency(currency)])
+
+
+def from_minor(units, currency):
+    return Decimal(units).scaleb(-CURRENCY_EXPONENTS[_currency(currency)])
+
+
+class RateSnapshot:
+    def __init__(self, base, rates, as_of=None):
+        self.base = _currency(base)
+        # Units of each currency per one unit of base
+        self.rates = {_currency(code): Decimal(str(rate)) for code, rate in rates.items()}
+        self.rates[self.base] = Decimal(1)
+        for code, rate in self.rates.items():
+            if rate <= 0:
+                raise ValueError(f"Rate for {code} must be positive")
+        self.as_of = datetime.fromisoformat(as_of) if isinstance(as_of, str) else as_of
+        canonical = json.dumps({code: str(rate.normalize()) for code, rate in sorted(self.rates.items())})
+        self.version = hashlib.sha256(f"{self.base}:{canonical}".encode()).hexdigest()[:12]
+        self._factors = {}
+
+    def rate(self, source, target):
+        return self.rates[_currency(target)] / self.rates[_currency(source)]
+
+    def factor(self, source, target):
+        # Minor units of target per minor unit of source, as an exact fraction
+        source, target = _currency(source), _currency(target)
+        factor = self._factors.get((source, target))
+        if factor is None:
+            factor = (Fraction(self.rates[target]) / Fraction(self.rates[source])
+                      * Fraction(10) ** (CURRENCY_EXPONENTS[target] - CURRENCY_EXPONENTS[source]))
+            self._factors[(source, target)] = factor
+        return factor
+
+    def convert_minor(self, units, source, target):
+        # units: iterable of integer minor units, all in source
+        factor = self.factor(source, target)
+        numerator, denominator = factor.numerator, factor.denominator
+        if denominator == 1:
+            return [unit * numerator for unit in units]
+        return [_round_div(unit * numerator, denominator) for unit in units]
+
+    def convert(self, amount, source, target):
+        return from_minor(self.convert_minor((to_minor(amount, source),), source, target)[0], target)
+
+    def convert_many(self, amounts, currencies, target):
+        # Returns the converted amounts in input order; currencies is one per amount or a
+        # single currency for all of them
+        amounts = list(amounts)
+        if isinstance(currencies, str) or not hasattr(currencies, "__iter__"):
+            currencies = [currencies] * len(amounts)
+        groups = {}
+        for i, currency in enumerate(currencies):
+            groups.setdefault(currency, []).append(i)
+        groups = {_currency(currency): positions for currency, positions in groups.items()}
+        results = [None] * len(amounts)
+        scale = -CURRENCY_EXPONENTS[_currency(target)]
+        for currency, positions in groups.items():
+            exponent = CURRENCY_EXPONENTS[currency]
+            units = [_to_minor(amounts[i], exponent) for i in positions]
+            for i, unit in zip(positions, self.convert_minor(units, currency, target)):
+                results[i] = Decimal(unit).scaleb(scale)
+        return results
+
+    def total(self, amounts_by_currency, target):
+        # {currency: amount} -> their sum in target; each amount is converted and rounded
+        # on its own, as it would be if moved, then summed
+        units = sum(self.convert_minor((to_minor(amount, currency),), currency, target)[0]
+                    for currency, amount in amounts_by_currency.items())
+        return from_minor(units, target)
+
+    def to_dict(self):
+        return {"version": self.version, "base": self.base, "as_of": self.as_of,
+                "rates": {code: rate for code, rate in sorted(self.rates.items())}}
+
+
+def load_rates(path):
+    with open(path) as f:
+        data = json.load(f)
+    return RateSnapshot(data["base"], data["rates"], data.get("as_of"))
+
+
+class RateTable:
+    def __init__(self, path=FX_RATES_PATH, refresh_interval=FX_REFRESH_INTERVAL, kept=FX_SNAPSHOTS_KEPT):
+        self.path = path
+        self.refresh_interval = refresh_interval
+        self.kept = kept
+        self._lock = threading.Lock()
+        self._snapshots = OrderedDict()  # version -> RateSnapshot, oldest first
+        self._current = None
+        self._mtime = None
+        self._checked_at = None
+
+    def _add(self, snapshot):
+        self._snapshots.pop(snapshot.version, None)
+        self._snapshots[snapshot.version] = snapshot
+        while len(self._snapshots) > self.kept:
+            self._snapshots.popitem(last=False)
+        self._current = snapshot
+
+    def refresh(self, force=False):
+        # Reloads the rate file if it changed; a file that fails to load keeps the last
+        # good snapshot in service
+        now = time.monotonic()
+        if not force and self._checked_at is not None and now - self._checked_at < self.refresh_interval:
+            return self._current
+        with self._lock:
+            self._checked_at = now
+            if not self.path:
+                if self._current is None:
+                    self._add(RateSnapshot(DEFAULT_RATES["base"], DEFAULT_RATES["rates"], DEFAULT_RATES["as_of"]))
+                return self._current
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+                if mtime != self._mtime or self._current is None:
+                    self._add(load_rates(self.path))
+                    self._mtime = mtime
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Error loading FX rates from {self.path}: {e}")
+                if self._current is None:
+                    raise
+            return self._current
+
+    def publish(self, snapshot):
+        # For feeds that push rates rather than writing the file
+        with self._lock:
+            self._add(snapshot)
+            self._checked_at = time.monotonic()
+
+    def current(self):
+        return self.refresh()
+
+    def snapshot(self, version=None):
+        # The current snapshot, or a retained earlier one by version (None if dropped)
+        if version is None:
+            return self.current()
+        with self._lock:
+            return self._snapshots.get(version)
+
+    def versions(self):
+        with self._lock:
+            return list(self._snapshots)
+
+
+rate_table = RateTable()
+
+
+def current():
+    return rate_table.current()
+
+
+def convert(amount, source, target, version=None):
+    snapshot = rate_table.snapshot(version)
+    if snapshot is None:
+        raise KeyError(f"FX snapshot {version} is no longer available")
+    return snapshot.convert(amount, source, target)
@@ -0,0 +1,270 @@
+import asyncio
+import contextvars
+import math
+import os
+import re
+from collections import Counter
+
+from assistant import empty_usage, get_tool_executor
+import fx
+import storage as db_ops
+
+# Intent router. The most common assistant questions ("what's my balance", "show my
+# favorite recipients", "last 5 transactions") are answered straight from the storage
+# layer with templated text, skipping the model round trip. Recognition is cheap:
+# high-precision rules first, then a small naive Bayes classifier trained on the
+# examples below. Anything else, or anything asking to change data, falls through to
+# the assistant, as does every turn after the first.
+
+INTENT_THRESHOLD = float(os.getenv("INTENT_THRESHOLD", "0.9"))
+DEFAULT_TRANSACTIONS = 5
+MAX_TRANSACTIONS = 20
+
+# Requests to act or to explain always go to the model
+ACTION_PATTERN = re.compile(
+    r"\b(send|pay|wire|move|add|delete|remove|change|update|cancel|dispute|close|open|block|why|explain)\b"
+    r"|\btransfer (money|funds|\$?\d|to|from)\b",
+    re.IGNORECASE)
+
+# Balances at another time ("what was my balance last month") are not the current
+# balances the template shows; they go to the model
+HISTORICAL_PATTERN = re.compile(
+    r"\b(was|were|had|used to|yesterday|ago|since|before|after|history|trend|end of|start of)\b"
+    r"|\b(last|past|previous) (night|week|month|quarter|year|time)\b"
+    r"|\b(in|on|at|during) (january|february|march|april|may|june|july|august|september|october|november|"
+    r"december|\d{1,2}/\d{1,2}|\d{4}-\d{2})",
+    re.IGNORECASE)
+
+RULES = [
+    ("balance", re.compile(
+        r"\b(balances?|how much (money )?(do i have|is (there )?in|have i got)|available funds|funds available)\b",
+        re.IGNORECASE)),
+    ("favorite_recipients", re.compile(
+        r"\bfavou?rite (recipients?|payees?|contacts?|people)\b|\bmy favou?rites\b", re.IGNORECASE)),
+    ("recent_transactions", re.compile(
+        r"\b(last|latest|recent|past|previous)\b.*\b(transactions?|transfers?|payments?|activity)\b"
+        r"|\b(transaction|payment) history\b",
+        re.IGNORECASE)),
+]
+
+NUMBER_WORDS = {"one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8,
+                "nine": 9, "ten": 10, "twenty": 20}
+COUNT_PATTERN = re.compile(
+    r"\b(\d{1,3}|" + "|".join(NUMBER_WORDS) + r")\s+(\w+\s+)?(transactions?|transfers?|payments?)\b", re.IGNORECASE)
+
+TRAINING_EXAMPLES = {
+    "balance": [
+        "what's my balance", "what is my account balance", "check my balance", "show me my balances",
+        "how much money do i have", "how much is in my savings", "how much is in my checking account",
+        "what do i have in my accounts", "balance please", "current balance", "money left in my account",
+        "how much have i got", "what are my account totals", "show balance of all accounts",
+        "how much cash is in my account right now", "tell me my balance",
+    ],
+    "favorite_recipients": [
+        "show my favorite recipients", "who are my favorites", "list favourite payees", "my favorite contacts",
+        "which recipients did i star", "favorite recipients please", "show starred recipients",
+        "list my favourite people to pay", "who is on my favorites list", "display favorite payees",
+        "my saved favorites", "show favourites",
+    ],
+    "recent_transactions": [
+        "last 5 transactions", "show my recent transactions", "what were my latest payments",
+        "list my last transfers", "recent activity on my account", "transaction history", "my last ten payments",
+        "show the past transactions", "what did i spend recently", "latest account activity",
+        "show previous transfers", "what came in and out recently", "my most recent transaction",
+        "list transactions from this week",
+    ],
+    "other": [
+        "send 100 dollars to jane", "transfer money to my savings", "pay my rent", "what are your fees",
+        "how do international transfers work", "open a new account", "close my account", "i lost my card",
+        "why was my transfer declined", "add a new recipient", "change my email address",
+        "what is the exchange rate to euro", "how long does a transfer take", "hello", "thanks",
+        "can you help me", "what is a swift code", "dispute a transaction", "is my account verified",
+        "update my phone number", "cancel the last transfer", "what can you do", "show my profile",
+        "remove jane from my recipients", "what currencies do you support", "explain this charge",
+    ],
+}
+
+
+def tokenize(text):
+    words = re.findall(r"[a-z0-9]+", text.lower().replace("'", ""))
+    return words + [f"{a}_{b}" for a, b in zip(words, words[1:])]
+
+
+class NaiveBayesClassifier:
+    def __init__(self, examples):
+        self.vocabulary = set()
+        self.word_counts = {}
+        self.totals = {}
+        self.priors = {}
+        total_examples = sum(len(texts) for texts in examples.values())
+        for intent, texts in examples.items():
+            counts = Counter(token for text in texts for token in tokenize(text))
+            self.word_counts[intent] = counts
+            self.totals[intent] = sum(counts.values())
+            self.priors[intent] = math.log(len(texts) / total_examples)
+            self.vocabulary.update(counts)
+
+    def predict(self, text):
+        # Returns (intent, posterior probability) with add-one smoothing
+        tokens = [token for token in tokenize(text) if token in self.vocabulary]
+        size = len(self.vocabulary)
+        scores = {
+            intent: self.priors[intent] + sum(
+                math.log((self.word_counts[intent][token] + 1) / (self.totals[intent] + size)) for token in tokens)
+            for intent in self.word_counts
+        }
+        best = max(scores, key=scores.get)
+        norm = sum(math.exp(score - scores[best]) for score in scores.values())
+        return best, 1.0 / norm
+
+
+_classifier = NaiveBayesClassifier(TRAINING_EXAMPLES)
+
+
+def classify(text, threshold=INTENT_THRESHOLD):
+    # Returns (intent or None, slots, how it was recognized)
+    if ACTION_PATTERN.search(text):
+        return None, {}, "action"
+    for intent, pattern in RULES:
+        if pattern.search(text):
+            return _recognized(intent, text, "rule")
+    intent, probability = _classifier.predict(text)
+    if intent != "other" and probability >= threshold:
+        return _recognized(intent, text, "classifier")
+    return None, {}, "model"
+
+
+def _recognized(intent, text, how):
+    if intent == "balance" and HISTORICAL_PATTERN.search(text):
+        return None, {}, "historical"
+    return intent, _slots(intent, text), how
+
+
+def _slots(intent, text):
+    if intent != "recent_transactions":
+        return {}
+    match = COUNT_PATTERN.search(text)
+    if match is None:
+        return {"limit": DEFAULT_TRANSACTIONS}
+    count = match.group(1).lower()
+    count = NUMBER_WORDS[count] if count in NUMBER_WORDS else int(count)
+    return {"limit": min(max(count, 1), MAX_TRANSACTIONS)}
+
+
+# Templated answers
+
+def _money(amount, currency):
+    # In the currency's minor units: 1,500.00 USD but 1,500 JPY
+    return f"{amount:,.{fx.CURRENCY_EXPONENTS.get(currency, 2)}f} {currency}"
+
+
+def answer_balance(user_id):
+    accounts = db_ops.get_user_accounts(user_id)
+    if not accounts:
+        return "You don't have any accounts yet."
+    lines = [f"- {account['account_type'].capitalize()} account #{account['account_id']}: "
+             f"{_money(account['balance'], account['currency'])}" for account in accounts]
+    return "Here are your balances:\n" + "\n".join(lines)
+
+
+def answer_favorite_recipients(user_id):
+    recipients = db_ops.get_favorite_recipients(user_id)
+    if not recipients:
+        return "You don't have any favorite recipients yet."
+    lines = [f"- {recipient['name']} ({recipient['bank_name']})" for recipient in recipients]
+    return "Your favorite recipients:\n" + "\n".join(lines)
+
+
+def answer_recent_transactions(user_id, limit=DEFAULT_TRANSACTIONS):
+    transactions = db_ops.get_user_transactions(user_id, limit)
+    if not transactions:
+        return "You don't have any transactions yet."
+    owned = {account["account_id"] for account in db_ops.get_user_accounts(user_id)}
+    lines = []
+    for t in transactions:
+        sent = t["sender_account_id"] in owned
+        received = t["recipient_account_id"] in owned
+        if sent and received:
+            action = f"moved {_money(t['amount'], t['currency'])} from account #{t['sender_account_id']} " \
+                     f"to your account #{t['recipient_account_id']}"
+        elif sent:
+            action = f"sent {_money(t['amount'], t['currency'])} from account #{t['sender_account_id']} " \
+                     f"to account #{t['recipient_account_id']}"
+        else:
+            action = f"received {_money(t['amount'], t['currency'])} into account #{t['recipient_account_id']}"
+        line = f"- {t['created_at']:%Y-%m-%d}: {action}, {t['status']}"
+        if t.get("description"):
+            line += f" ({t['description']})"
+        lines.append(line)
+    heading = "Your most recent transaction:" if len(lines) == 1 else f"Your last {len(lines)} transactions:"
+    return heading + "\n" + "\n".join(lines)
+
+
+ANSWERS = {
+    "balance": answer_balance,
+    "favorite_recipients": answer_favorite_recipients,
+    "recent_transactions": answer_recent_transactions,
+}
+
+
+def _latest_prompt(messages):
+    if not messages or messages[-1]["role"] != "user":
+        return None
+    content = messages[-1]["content"]
+    if isinstance(content, str):
+        return content
+    texts = [block["text"] for block in content if block.get("type") == "text"]
+    # Tool results mean the model is mid-turn; only fresh questions are routed
+    if len(texts) != len(content):
+        return None
+    return texts[-1] if texts else None
+
+
+def _opening_prompt(messages):
+    # Only a conversation's opening question is answered from a template: later turns
+    # lean on what came before ("and the balance after that?"), which it cannot see
+    return _latest_prompt(messages) if len(messages) == 1 else None
+
+
+class IntentRouter:
+    # Sits in front of an Assistant with the same respond()/stream() interface. Routed
+    # replies carry "intent"; everything else is the assistant's reply unchanged.
+
+    def __init__(self, assistant, threshold=INTENT_THRESHOLD):
+        self.assistant = assistant
+        self.threshold = threshold
+        self.stats = Counter()
+
+    async def _answer(self, user_id, messages):
+        prompt = _opening_prompt(messages)
+        intent, slots, _ = classify(prompt, self.threshold) if prompt else (None, {}, None)
+        self.stats[intent or "model"] += 1
+        if intent is None:
+            return None
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        text = await loop.run_in_executor(get_tool_executor(), context.run, lambda: ANSWERS[intent](user_id, **slots))
+        return {
+            "text": text,
+            "messages": list(messages) + [{"role": "assistant", "content": [{"type": "text", "text": text}]}],
+            "tool_calls": 0,
+            "usage": empty_usage(),
+            "cached": False,
+            "wrote": False,
+            "intent": intent,
+        }
+
+    async def respond(self, user_id, messages):
+        reply = await self._answer(user_id, messages)
+        if reply is None:
+            reply = await self.assistant.respond(user_id, messages)
+        return reply
+
+    async def stream(self, user_id, messages):
+        reply = await self._answer(user_id, messages)
+        if reply is None:
+            async for event in self.assistant.stream(user_id, messages):
+                yield event
+            return
+        yield {"type": "text", "text": reply["text"]}
+        yield {"type": "done", "reply": reply}
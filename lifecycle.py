@@ -0,0 +1,138 @@
+import asyncio
+import os
+import signal
+import threading
+import time
+from datetime import datetime
+from decimal import Decimal
+
+from fastapi.encoders import jsonable_encoder
+
+from schemas import (
+    UserOut, UserList, AccountResponse, AccountList, Transaction, TransactionList,
+    RecipientResponse, RecipientList, FavoriteToggleResponse,
+)
+
+DB_POOL_WARM = int(os.getenv("DB_POOL_WARM", os.getenv("DB_POOL_MIN", "1")))
+DRAIN_TIMEOUT = float(os.getenv("DRAIN_TIMEOUT", "25"))
+HEALTH_CHECK_INTERVAL = float(os.getenv("HEALTH_CHECK_INTERVAL", "5"))
+
+
+class HealthState:
+    # Probes read these fields; only the background checker and the lifespan write them
+    def __init__(self):
+        self.ready = False
+        self.draining = False
+        self.database_ok = False
+        self.checked_at = None
+        self.started_at = time.time()
+
+    def snapshot(self):
+        return {
+            "ready": self.ready and self.database_ok and not self.draining,
+            "draining": self.draining,
+            "database_ok": self.database_ok,
+            "checked_at": self.checked_at,
+            "uptime": round(time.time() - self.started_at, 3),
+        }
+
+
+class InFlightTracker:
+    # Number of HTTP requests that have started but not finished in this worker
+    def __init__(self):
+        self.in_flight = 0
+        self._idle = None
+
+    def _idle_event(self):
+        if self._idle is None:
+            self._idle = asyncio.Event()
+            self._idle.set()
+        return self._idle
+
+    def started(self):
+        self.in_flight += 1
+        self._idle_event().clear()
+
+    def finished(self):
+        self.in_flight -= 1
+        if self.in_flight == 0:
+            self._idle_event().set()
+
+    async def wait_idle(self, timeout):
+        try:
+            await asyncio.wait_for(self._idle_event().wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+
+class TrackInFlight:
+    # Pure ASGI middleware, cheaper than BaseHTTPMiddleware on every request
+    def __init__(self, app, tracker):
+        self.app = app
+        self.tracker = tracker
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        self.tracker.started()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.tracker.finished()
+
+
+def warm_serializers():
+    # Run every response model through validation and JSON encoding once, so the
+    # first real requests don't pay pydantic's lazy first-use costs.
+    now = datetime.now()
+    user = UserOut(user_id=0, username="warm", email="warm@example.com", first_name="w", last_name="w",
+                   phone_number="0", created_at=now, updated_at=now)
+    account = AccountResponse(account_id=0, user_id=0, balance=Decimal("0.00"), account_type="checking", currency="USD")
+    transaction = Transaction(transaction_id=0, sender_account_id=0, recipient_account_id=0, amount=Decimal("0.00"),
+                              currency="USD", status="completed", transaction_type="transfer",
+                              created_at=now, updated_at=now)
+    recipient = RecipientResponse(recipient_id=0, user_id=0, name="warm", account_info="0", bank_name="warm",
+                                  swift_code="WARMUS33", relationship="other")
+    models = [
+        UserList(users=[user]),
+        AccountList(accounts=[account]),
+        TransactionList(transactions=[transaction]),
+        RecipientList(recipients=[recipient]),
+        FavoriteToggleResponse(recipient_id=0, is_favorite=True),
+    ]
+    for model in models:
+        type(model).model_validate(model.model_dump())
+        model.model_dump_json()
+        jsonable_encoder(model)
+    return len(models)
+
+
+async def refresh_health(state, backend):
+    state.database_ok = await asyncio.to_thread(backend.ping)
+    state.checked_at = time.time()
+
+
+async def check_health(state, backend, interval):
+    # The only place that touches the database for health; probes read the cached result
+    while True:
+        await asyncio.sleep(interval)
+        await refresh_health(state, backend)
+
+
+def install_drain_signal(state):
+    # Flip readiness as soon as SIGTERM arrives, then hand over to the server's own
+    # handler (uvicorn stops accepting connections and waits for open requests).
+    if threading.current_thread() is not threading.main_thread():
+        return
+    previous = signal.getsignal(signal.SIGTERM)
+
+    def handle_sigterm(signum, frame):
+        state.draining = True
+        if callable(previous):
+            previous(signum, frame)
+        else:
+            signal.signal(signum, previous)
+            signal.raise_signal(signum)
+
+    signal.signal(signal.SIGTERM, handle_sigterm)
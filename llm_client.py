@@ -0,0 +1,169 @@
+import asyncio
+import os
+import random
+import time
+
+import httpx
+
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "50"))
+LLM_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_KEEPALIVE_CONNECTIONS", "20"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "120"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_RETRY_BASE = float(os.getenv("LLM_RETRY_BASE", "0.5"))
+LLM_RETRY_CAP = float(os.getenv("LLM_RETRY_CAP", "20"))
+LLM_RETRY_AFTER_MAX = float(os.getenv("LLM_RETRY_AFTER_MAX", "60"))
+
+# 529 is the API's "overloaded" status
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504, 529}
+
+# The Anthropic SDK is slow to import and its client owns an HTTP connection pool,
+# so both are deferred until the first call instead of happening at import time.
+
+_async_client = None
+_async_client_pid = None
+
+
+def client_timeout():
+    return httpx.Timeout(LLM_READ_TIMEOUT, connect=LLM_CONNECT_TIMEOUT)
+
+
+def retry_after(response):
+    # Seconds from retry-after-ms or retry-after (delta seconds only), or None
+    for header, scale in (("retry-after-ms", 1000), ("retry-after", 1)):
+        value = response.headers.get(header)
+        if value is not None:
+            try:
+                return float(value) / scale
+            except ValueError:
+                pass
+    return None
+
+
+def backoff_delay(attempt, base=LLM_RETRY_BASE, cap=LLM_RETRY_CAP):
+    # Full jitter: spreads retries from many callers instead of synchronizing them
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class _ReleasingStream(httpx.AsyncByteStream):
+    # Holds a concurrency slot until the response body is consumed or closed, so
+    # streamed responses count against the cap for as long as they are open
+    def __init__(self, stream, release):
+        self._stream = stream
+        self._release = release
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            if self._release is not None:
+                self._release()
+                self._release = None
+
+
+class RetryingTransport(httpx.AsyncBaseTransport):
+    # Wraps the pooled HTTP transport with a concurrency cap and retries on 429/5xx and
+    # connection failures. A retry-after from a 429 pauses every caller sharing this
+    # transport, not just the one that got it, so a rate-limited process backs off as a whole.
+
+    def __init__(self, transport, max_concurrency=LLM_MAX_CONCURRENCY, max_retries=LLM_MAX_RETRIES,
+                 retry_base=LLM_RETRY_BASE, retry_cap=LLM_RETRY_CAP, retry_after_max=LLM_RETRY_AFTER_MAX):
+        self.transport = transport
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.retry_base = retry_base
+        self.retry_cap = retry_cap
+        self.retry_after_max = retry_after_max
+        self.retries = 0
+        self._semaphore = None
+        self._resume_at = 0.0
+
+    async def _wait_for_cooldown(self):
+        delay = self._resume_at - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def handle_async_request(self, request):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        await self._semaphore.acquire()
+        try:
+            response = await self._send(request)
+        except BaseException:
+            self._semaphore.release()
+            raise
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=_ReleasingStream(response.stream, self._semaphore.release),
+            extensions=response.extensions,
+        )
+
+    async def _send(self, request):
+        attempt = 0
+        while True:
+            await self._wait_for_cooldown()
+            try:
+                response = await self.transport.handle_async_request(request)
+            except (httpx.ConnectError, httpx.ConnectTimeout):
+                if attempt >= self.max_retries:
+                    raise
+                delay = backoff_delay(attempt, self.retry_base, self.retry_cap)
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt >= self.max_retries:
+                    return response
+                wait = retry_after(response)
+                if wait is not None and wait > self.retry_after_max:
+                    return response
+                await response.aclose()
+                if wait is not None:
+                    delay = wait + random.uniform(0, self.retry_base)
+                    if response.status_code == 429:
+                        self._resume_at = max(self._resume_at, time.monotonic() + wait)
+                else:
+                    delay = backoff_delay(attempt, self.retry_base, self.retry_cap)
+            attempt += 1
+            self.retries += 1
+            await asyncio.sleep(delay)
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+def create_async_client(api_key=None, base_url=None, transport=None, **options):
+    # One tuned client per process: pooled keep-alive connections, explicit timeouts, and
+    # retries/concurrency handled by RetryingTransport instead of the SDK's own retries.
+    # transport replaces the network transport (tests pass an ASGI transport).
+    from anthropic import AsyncAnthropic
+    if transport is None:
+        transport = httpx.AsyncHTTPTransport(limits=httpx.Limits(
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+        ))
+    http_client = httpx.AsyncClient(transport=RetryingTransport(transport, **options), timeout=client_timeout())
+    return AsyncAnthropic(api_key=api_key, base_url=base_url, http_client=http_client, max_retries=0)
+
+
+def get_async_client():
+    global _async_client, _async_client_pid
+    if _async_client is None or _async_client_pid != os.getpid():
+        from dotenv import load_dotenv
+        load_dotenv()
+        _async_client = create_async_client(api_key=os.getenv("ANTHROPIC_API_KEY"))
+        _async_client_pid = os.getpid()
+    return _async_client
+
+
+async def close_async_client():
+    global _async_client, _async_client_pid
+    if _async_client is not None and _async_client_pid == os.getpid():
+        await _async_client.close()
+    _async_client = None
+    _async_client_pid = None
@@ -1,9 +1,138 @@
-from fastapi import FastAPI, HTTPException, Depends
-from typing import List
-import database_operations as db_ops
-from schemas import *
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from datetime import date, datetime
+from typing import Optional
+from fastapi import FastAPI, HTTPException, Query, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+import storage as db_ops
+import bic_directory
+import duplicates
+import fx
+import llm_client
+import lifecycle
+import outbox
+import realtime
+import velocity
+from assistant import Assistant
+from balance_cache import BalanceCache
+from intent_router import IntentRouter
+from pydantic import ValidationError
+from model_router import MODEL_ROUTING, ModelRouter
+from recipient_index import RecipientIndex
+from response_cache import ResponseCache
+from schemas import (
+    UserCreate, UserUpdate, UserOut, UserList,
+    AccountCreate, AccountResponse, AccountUpdate, AccountList, AccountDelete, UserBalances, Currency,
+    TransactionCreate, TransactionUpdate, Transaction, TransactionList, TransactionSearchResults,
+    SpendingGroup, SpendingSummary,
+    RecipientCreate, RecipientUpdate, RecipientResponse, RecipientList, FavoriteToggleResponse,
+    SwiftValidationRequest, SwiftValidationResponse,
+    FxRates, FxConvertRequest, FxConvertResponse,
+    SubscriptionAction, SubscriptionRequest,
+    AssistantChatRequest,
+)
 
-app = FastAPI()
+health = lifecycle.HealthState()
+in_flight = lifecycle.InFlightTracker()
+response_cache = ResponseCache()
+recipient_index = RecipientIndex()
+balance_cache = BalanceCache()
+subscription_hub = realtime.SubscriptionHub()
+chat_assistant = Assistant(cache=response_cache)
+chat_router = IntentRouter(ModelRouter(chat_assistant) if MODEL_ROUTING else chat_assistant)
+
+# Nothing touches the database or the LLM API at import time. The storage backend
+# is opened and warmed here, inside each worker process, and the LLM client is built
+# lazily on first use. On shutdown the worker reports not-ready, waits for in-flight
+# requests to finish and then releases the pool.
+@asynccontextmanager
+async def lifespan(app):
+    backend = db_ops.get_storage()
+    backend.open()
+    await asyncio.to_thread(backend.warm, lifecycle.DB_POOL_WARM)
+    lifecycle.warm_serializers()
+    await asyncio.to_thread(fx.rate_table.refresh, True)
+    if bic_directory.BIC_DIRECTORY_PATH:
+        print(f"Loaded {await asyncio.to_thread(bic_directory.load)} BIC directory entries")
+    await lifecycle.refresh_health(health, backend)
+    response_cache.attach()
+    recipient_index.attach()
+    balance_cache.attach()
+    velocity_sync = None
+    if velocity.VELOCITY_CHECKS:
+        checker = velocity.VelocityChecker()
+        await asyncio.to_thread(checker.attach)
+        velocity.set_checker(checker)
+        velocity_sync = asyncio.create_task(velocity.run_sync(checker))
+    duplicates_sync = None
+    if duplicates.DUPLICATE_CHECKS:
+        detector = duplicates.DuplicateDetector()
+        await asyncio.to_thread(detector.attach)
+        duplicates.set_detector(detector)
+        duplicates_sync = asyncio.create_task(duplicates.run_sync(detector))
+    outbox_dispatch = None
+    sinks = outbox.create_sinks()
+    if sinks:
+        backend.set_outbox(True)
+        outbox.set_dispatcher(outbox.OutboxDispatcher(sinks))
+        outbox_dispatch = asyncio.create_task(outbox.run(outbox.get_dispatcher()))
+    # On Postgres one LISTEN connection per process sees the writes of every worker
+    subscription_hub.start(asyncio.get_running_loop())
+    change_listener = None
+    if isinstance(backend, db_ops.PostgresStorage):
+        change_listener = realtime.ChangeListener([subscription_hub.on_notify, response_cache.versions,
+                                                   balance_cache.on_change])
+        change_listener.start()
+    else:
+        subscription_hub.attach()
+    lifecycle.install_drain_signal(health)
+    checker = asyncio.create_task(lifecycle.check_health(health, backend, lifecycle.HEALTH_CHECK_INTERVAL))
+    health.draining = False
+    health.ready = True
+    yield
+    health.ready = False
+    health.draining = True
+    checker.cancel()
+    if not await in_flight.wait_idle(lifecycle.DRAIN_TIMEOUT):
+        print(f"Shutting down with {in_flight.in_flight} requests still in flight")
+    response_cache.detach()
+    recipient_index.detach()
+    balance_cache.detach()
+    if velocity_sync is not None:
+        velocity_sync.cancel()
+        velocity.get_checker().detach()
+        velocity.set_checker(None)
+    if duplicates_sync is not None:
+        duplicates_sync.cancel()
+        duplicates.get_detector().detach()
+        duplicates.set_detector(None)
+    if outbox_dispatch is not None:
+        # Undelivered events stay in the outbox for the next dispatcher
+        outbox_dispatch.cancel()
+        outbox.get_dispatcher().close()
+        outbox.set_dispatcher(None)
+    if change_listener is not None:
+        await asyncio.to_thread(change_listener.stop)
+    else:
+        subscription_hub.detach()
+    backend.close()
+    await llm_client.close_async_client()
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(lifecycle.TrackInFlight, tracker=in_flight)
+
+# Health endpoints answer from cached state and never query the database
+@app.get("/health/live", response_model=dict)
+async def liveness():
+    return {"status": "alive"}
+
+@app.get("/health/ready", response_model=dict)
+async def readiness(response: Response):
+    snapshot = health.snapshot()
+    if not snapshot["ready"]:
+        response.status_code = 503
+    return snapshot
 
 # User endpoints
 @app.post("/users/", response_model=UserOut)
@@ -48,6 +177,21 @@ async def delete_user(user_id: int):
         raise HTTPException(status_code=404, detail="User not found")
     return {"message": "User deleted successfully"}
 
+# Totals per currency across the user's accounts, and optionally their sum converted
+# to one currency at the current FX rates
+@app.get("/users/{user_id}/balances", response_model=UserBalances)
+async def get_user_balances(user_id: int, currency: Optional[Currency] = None):
+    balances = balance_cache.get(user_id)
+    if not balances and db_ops.get_user(user_id) is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    result = UserBalances(user_id=user_id, balances=balances)
+    if currency is not None:
+        snapshot = fx.current()
+        result.currency = currency
+        result.total = snapshot.total({row["currency"]: row["balance"] for row in balances}, currency)
+        result.rate_version = snapshot.version
+    return result
+
 # Account endpoints
 
 @app.post("/accounts/", response_model=AccountResponse)
@@ -96,20 +240,61 @@ async def delete_account(account_id: int):
 # Transaction endpoints
 
 @app.post("/transactions/", response_model=Transaction)
-async def create_transaction(transaction: TransactionCreate):
+async def create_transaction(transaction: TransactionCreate, response: Response):
+    # Booked in the sender account's currency, as the assistant books transfers: an
+    # amount in another currency is converted at the current rates, named by
+    # X-FX-Rate-Version, and X-Requested-Amount gives the amount as sent, since the
+    # booked one is rounded to the sender currency's minor units. A repeat of a transfer made moments ago is held until
+    # confirmed (or only flagged); X-Duplicate-Of names the transaction it repeats.
+    # Risk holds take precedence.
+    sender = db_ops.get_account(transaction.sender_account_id)
+    if sender is None:
+        raise HTTPException(status_code=400, detail="Sender account not found")
+    snapshot = fx.current()
+    try:
+        amount = snapshot.convert(transaction.amount, transaction.currency, sender["currency"])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    risk = velocity.check_transfer(transaction.sender_account_id, transaction.recipient_account_id,
+                                   amount, sender["currency"])
+    if risk["action"] == "block":
+        raise HTTPException(status_code=403, detail=f"Transfer blocked by risk rules: {', '.join(risk['rules'])}")
+    duplicate = duplicates.check_transfer(transaction.sender_account_id, transaction.recipient_account_id,
+                                          amount, sender["currency"])
+    status = transaction.status
+    if risk["action"] == "hold":
+        status = "held"
+    elif duplicate["action"] == "hold":
+        status = duplicates.HOLD_STATUS
     transaction_id = db_ops.create_transaction(
         sender_account_id=transaction.sender_account_id,
         recipient_account_id=transaction.recipient_account_id,
-        amount=transaction.amount,
-        currency=transaction.currency,
-        status=transaction.status,
+        amount=amount,
+        currency=sender["currency"],
+        status=status,
         transaction_type=transaction.transaction_type,
         description=transaction.description
     )
     if transaction_id is None:
+        velocity.release(risk)
+        duplicates.release(duplicate)
         raise HTTPException(status_code=400, detail="Transaction creation failed")
+    if transaction.currency != sender["currency"]:
+        response.headers["X-FX-Rate-Version"] = snapshot.version
+        response.headers["X-Requested-Amount"] = f"{transaction.amount} {transaction.currency}"
+    if duplicate["duplicate_of"] is not None:
+        response.headers["X-Duplicate-Of"] = str(duplicate["duplicate_of"])
     return db_ops.get_transaction(transaction_id)
 
+# Declared before /transactions/{transaction_id} so "search" is not taken for an id
+@app.get("/transactions/search", response_model=TransactionSearchResults)
+async def search_transactions(q: str = Query(..., min_length=1, max_length=200), user_id: Optional[int] = None,
+                              account_id: Optional[int] = None, start: Optional[datetime] = None,
+                              end: Optional[datetime] = None, limit: int = Query(20, ge=1, le=100)):
+    transactions = db_ops.search_transactions(q, user_id=user_id, account_id=account_id, start=start, end=end,
+                                              limit=limit)
+    return TransactionSearchResults(transactions=transactions)
+
 @app.get("/transactions/{transaction_id}", response_model=Transaction)
 async def get_transaction(transaction_id: int):
     transaction = db_ops.get_transaction(transaction_id)
@@ -133,6 +318,23 @@ async def update_transaction(transaction_id: int, transaction_update: Transactio
         raise HTTPException(status_code=404, detail="Transaction not found")
     return db_ops.get_transaction(transaction_id)
 
+# A transfer held as a likely duplicate waits for the customer: confirming sends it on as
+# "pending", cancelling drops it. Transfers held by the risk rules cannot be released here.
+@app.post("/transactions/{transaction_id}/confirm", response_model=Transaction)
+async def confirm_transaction(transaction_id: int):
+    return _release_held_transaction(transaction_id, "pending")
+
+@app.post("/transactions/{transaction_id}/cancel", response_model=Transaction)
+async def cancel_transaction(transaction_id: int):
+    return _release_held_transaction(transaction_id, "cancelled")
+
+def _release_held_transaction(transaction_id, status):
+    if db_ops.set_transaction_status(transaction_id, status, duplicates.HOLD_STATUS) == 0:
+        if db_ops.get_transaction(transaction_id) is None:
+            raise HTTPException(status_code=404, detail="Transaction not found")
+        raise HTTPException(status_code=409, detail="Transaction is not awaiting confirmation")
+    return db_ops.get_transaction(transaction_id)
+
 @app.delete("/transactions/{transaction_id}", response_model=dict)
 async def delete_transaction(transaction_id: int):
     rows_affected = db_ops.delete_transaction(transaction_id)
@@ -140,17 +342,34 @@ async def delete_transaction(transaction_id: int):
         raise HTTPException(status_code=404, detail="Transaction not found")
     return {"message": "Transaction deleted successfully"}
 
+# Monthly outgoing totals per transaction type or per recipient account, read from the
+# spending rollups; by default the last twelve months including this one
+@app.get("/users/{user_id}/spending", response_model=SpendingSummary)
+async def get_spending(user_id: int, group_by: SpendingGroup = SpendingGroup.TRANSACTION_TYPE,
+                       start: Optional[date] = None, end: Optional[date] = None):
+    if db_ops.get_user(user_id) is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    if start is None:
+        today = date.today()
+        start = date(today.year - (today.month <= 11), (today.month - 12) % 12 + 1, 1)
+    rows = db_ops.get_spending(user_id, start=start, end=end, group_by=group_by.value)
+    return SpendingSummary(user_id=user_id, group_by=group_by, start=start, end=end, rows=rows)
+
 
 # Recipient endpoints
 
 @app.post("/recipients/", response_model=RecipientResponse)
 async def create_recipient(recipient: RecipientCreate):
+    try:
+        swift_code, bank_name = bic_directory.resolve(recipient.swift_code, recipient.bank_name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     recipient_id = db_ops.create_recipient(
         user_id=recipient.user_id,
         name=recipient.name,
         account_info=recipient.account_info,
-        bank_name=recipient.bank_name,
-        swift_code=recipient.swift_code,
+        bank_name=bank_name,
+        swift_code=swift_code,
         relationship=recipient.relationship,
         is_favorite=recipient.is_favorite
     )
@@ -158,6 +377,14 @@ async def create_recipient(recipient: RecipientCreate):
         raise HTTPException(status_code=400, detail="Recipient creation failed")
     return db_ops.get_recipient(recipient_id)
 
+# Bulk check for recipient imports
+@app.post("/recipients/validate-swift", response_model=SwiftValidationResponse)
+async def validate_swift_codes(request: SwiftValidationRequest):
+    directory = bic_directory.get_directory()
+    if directory is None:
+        raise HTTPException(status_code=503, detail="BIC directory not loaded")
+    return SwiftValidationResponse(results=directory.validate_many(request.swift_codes))
+
 @app.get("/recipients/{recipient_id}", response_model=RecipientResponse)
 async def get_recipient(recipient_id: int):
     recipient = db_ops.get_recipient(recipient_id)
@@ -168,6 +395,12 @@ async def get_recipient(recipient_id: int):
 @app.put("/recipients/{recipient_id}", response_model=RecipientResponse)
 async def update_recipient(recipient_id: int, recipient_update: RecipientUpdate):
     update_data = recipient_update.dict(exclude_unset=True)
+    if "swift_code" in update_data and bic_directory.get_directory() is not None:
+        try:
+            update_data["swift_code"], update_data["bank_name"] = bic_directory.resolve(
+                update_data["swift_code"], update_data.get("bank_name"))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
     rows_affected = db_ops.update_recipient(recipient_id, **update_data)
     if rows_affected == 0:
         raise HTTPException(status_code=404, detail="Recipient not found")
@@ -185,6 +418,13 @@ async def get_all_recipients(user_id: int):
     recipients = db_ops.get_all_recipients(user_id)
     return RecipientList(recipients=recipients)
 
+@app.get("/users/{user_id}/recipients/suggest", response_model=RecipientList)
+async def suggest_recipients(user_id: int, q: str = Query(..., min_length=1, max_length=100),
+                             limit: int = Query(10, ge=1, le=50)):
+    # As-you-type suggestions: favorites and recently paid recipients first
+    recipients = recipient_index.suggest(user_id, q, limit)
+    return RecipientList(recipients=recipients)
+
 @app.get("/users/{user_id}/recipients/favorites/", response_model=RecipientList)
 async def get_favorite_recipients(user_id: int):
     recipients = db_ops.get_favorite_recipients(user_id)
@@ -198,6 +438,128 @@ async def toggle_favorite_recipient(recipient_id: int):
     return FavoriteToggleResponse(recipient_id=recipient_id, is_favorite=is_favorite)
 
 
+# FX endpoints
+
+@app.get("/fx/rates", response_model=FxRates)
+async def get_fx_rates(version: Optional[str] = None):
+    snapshot = fx.rate_table.snapshot(version)
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail="FX snapshot not found")
+    return snapshot.to_dict()
+
+@app.post("/fx/convert", response_model=FxConvertResponse)
+async def convert_amounts(request: FxConvertRequest):
+    snapshot = fx.rate_table.snapshot(request.version)
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail="FX snapshot not found")
+    amounts = snapshot.convert_many([a.amount for a in request.amounts], [a.currency for a in request.amounts],
+                                    request.target)
+    return FxConvertResponse(version=snapshot.version, target=request.target, amounts=amounts,
+                             total=sum(amounts, fx.from_minor(0, request.target)))
+
+
+# Subscription endpoint. Clients send
+#   {"action": "subscribe" | "unsubscribe", "accounts": [ids], "transactions": [ids]}
+# and get a "snapshot" with the current fields of each newly subscribed row, then a
+# "subscribed" message listing the connection's subscriptions and ids not found. After
+# that every write to a subscribed row arrives as a "change" message.
+
+async def _send_messages(websocket, subscriber):
+    # The only writer to the socket; the hub queues everything for it
+    while True:
+        text = await subscriber.queue.get()
+        if text is None:
+            await websocket.close(code=1013, reason="Subscriber too slow")
+            return
+        await websocket.send_text(text)
+
+async def _send_snapshots(subscriber, table, ids):
+    # A row that changed while it was read already got the newer change message, so no
+    # snapshot is sent for it. Returns the ids that do not exist.
+    get_row = db_ops.get_account if table == "accounts" else db_ops.get_transaction
+    subscriber.changed = set()
+    try:
+        rows = await asyncio.to_thread(lambda: [get_row(row_id) for row_id in ids])
+    finally:
+        changed, subscriber.changed = subscriber.changed, None
+    missing = [row_id for row_id, row in zip(ids, rows) if row is None]
+    subscription_hub.unsubscribe(subscriber, table, missing)
+    for row_id, row in zip(ids, rows):
+        if row is not None and (table, row_id) not in changed:
+            subscription_hub.send(subscriber, {"type": "snapshot", "table": table, "id": row_id,
+                                               **realtime.fields(table, row)})
+    return missing
+
+@app.websocket("/subscriptions")
+async def subscriptions(websocket: WebSocket):
+    await websocket.accept()
+    subscriber = subscription_hub.connect()
+    sender = asyncio.create_task(_send_messages(websocket, subscriber))
+    try:
+        while True:
+            try:
+                request = SubscriptionRequest.model_validate_json(await websocket.receive_text())
+            except ValidationError as e:
+                subscription_hub.send(subscriber, {"type": "error", "detail": e.errors(include_url=False,
+                                                                                      include_context=False)})
+                continue
+            not_found = {}
+            for table in realtime.FIELDS:
+                ids = getattr(request, table)
+                if request.action == SubscriptionAction.UNSUBSCRIBE:
+                    subscription_hub.unsubscribe(subscriber, table, ids)
+                    continue
+                try:
+                    new = subscription_hub.subscribe(subscriber, table, ids)
+                except ValueError as e:
+                    subscription_hub.send(subscriber, {"type": "error", "detail": str(e)})
+                    break
+                missing = await _send_snapshots(subscriber, table, new) if new else []
+                if missing:
+                    not_found[table] = missing
+            subscription_hub.send(subscriber, {"type": "subscribed", **subscription_hub.subscriptions(subscriber),
+                                               "not_found": not_found})
+    except (WebSocketDisconnect, RuntimeError):
+        # RuntimeError: the sender closed the socket of a slow subscriber
+        pass
+    finally:
+        subscription_hub.disconnect(subscriber)
+        sender.cancel()
+
+
+# Assistant endpoints
+
+def _sse(event):
+    return f"event: {event['type']}\ndata: {json.dumps(event, separators=(',', ':'), default=str)}\n\n"
+
+async def _chat_events(user_id, messages):
+    try:
+        async for event in chat_router.stream(user_id, messages):
+            if event["type"] == "done":
+                reply = event["reply"]
+                event = {"type": "done", "tool_calls": reply["tool_calls"], "usage": reply["usage"], "cached": reply["cached"],
+                         "intent": reply.get("intent"), "degraded": reply.get("degraded")}
+            yield _sse(event)
+    except Exception as e:
+        # Headers are already sent, so failures are reported in-band
+        print(f"Assistant stream failed: {e}")
+        yield _sse({"type": "error", "message": "The assistant is unavailable, please try again"})
+
+# Streams the reply as Server-Sent Events: text deltas, tool_use/tool_result pauses and
+# a final done event. If the client disconnects, starlette cancels the generator, which
+# closes the upstream model stream and stops generation.
+@app.post("/assistant/chat")
+async def assistant_chat(chat: AssistantChatRequest):
+    if db_ops.get_user(chat.user_id) is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    messages = [{"role": message.role.value, "content": message.content} for message in chat.messages]
+    return StreamingResponse(
+        _chat_events(chat.user_id, messages),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
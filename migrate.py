@@ -0,0 +1,79 @@
+# Applies the SQL files in migrations/ in name order, each once. Applied files are
+# recorded in transfer.schema_migrations. A file starting with the line
+# "-- migrate: no-transaction" runs statement by statement outside a transaction,
+# which CREATE INDEX CONCURRENTLY requires; such files must be safe to re-run. A
+# concurrent build that fails leaves an INVALID index behind; drop it before retrying.
+#
+#   python migrate.py           # apply pending migrations
+#   python migrate.py --list    # show applied and pending migrations
+
+import argparse
+import os
+
+import database_operations as db
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+NO_TRANSACTION = "-- migrate: no-transaction"
+
+
+def migration_files():
+    return sorted(name for name in os.listdir(MIGRATIONS_DIR) if name.endswith(".sql"))
+
+
+def statements(sql):
+    # Splits on semicolons at line ends; migrations keep one statement per block
+    lines = [line for line in sql.splitlines() if not line.strip().startswith("--")]
+    return [statement.strip() for statement in "\n".join(lines).split(";\n") if statement.strip(" ;\n")]
+
+
+def applied_migrations():
+    with db.get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS transfer.schema_migrations (
+                    name TEXT PRIMARY KEY,
+                    applied_at TIMESTAMP NOT NULL DEFAULT now()
+                )
+            """)
+            cur.execute("SELECT name FROM transfer.schema_migrations")
+            return {row[0] for row in cur.fetchall()}
+
+
+def apply(name):
+    with open(os.path.join(MIGRATIONS_DIR, name)) as f:
+        sql = f.read()
+    with db.get_db_connection() as conn:
+        if sql.startswith(NO_TRANSACTION):
+            conn.autocommit = True
+            try:
+                with conn.cursor() as cur:
+                    for statement in statements(sql):
+                        cur.execute(statement)
+                    cur.execute("INSERT INTO transfer.schema_migrations (name) VALUES (%s)", (name,))
+            finally:
+                conn.autocommit = False
+        else:
+            with conn.cursor() as cur:
+                cur.execute(sql)
+                cur.execute("INSERT INTO transfer.schema_migrations (name) VALUES (%s)", (name,))
+            conn.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply database migrations")
+    parser.add_argument("--list", action="store_true", help="Show migrations without applying them")
+    args = parser.parse_args()
+    applied = applied_migrations()
+    pending = [name for name in migration_files() if name not in applied]
+    if args.list:
+        for name in migration_files():
+            print(f"{'applied' if name in applied else 'pending':8} {name}")
+        return
+    for name in pending:
+        print(f"Applying {name}")
+        apply(name)
+    print(f"{len(pending)} migration(s) applied")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,21 @@
+-- migrate: no-transaction
+-- Full-text and trigram search over transaction descriptions (search_transactions).
+-- The tsvector is an expression index rather than a stored column: adding a stored
+-- generated column rewrites the whole table under an exclusive lock. The expression
+-- must stay the same as DESCRIPTION_TSV in database_operations for the index to be
+-- used. Indexes are built concurrently so the table stays writable meanwhile.
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS transactions_description_tsv_idx
+    ON transfer.Transactions USING GIN (to_tsvector('english', coalesce(description, '')));
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS transactions_description_trgm_idx
+    ON transfer.Transactions USING GIN (description gin_trgm_ops);
+
+-- Account scoping and date bounds
+CREATE INDEX CONCURRENTLY IF NOT EXISTS transactions_sender_created_idx
+    ON transfer.Transactions (sender_account_id, created_at);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS transactions_recipient_created_idx
+    ON transfer.Transactions (recipient_account_id, created_at);
@@ -0,0 +1,7 @@
+-- migrate: no-transaction
+-- Per-user account lookups (get_user_accounts, get_user_balances). currency and
+-- balance are included so the balances query is an index-only scan; the index is
+-- built concurrently so accounts stay writable meanwhile.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS accounts_user_id_idx
+    ON transfer.Accounts (user_id) INCLUDE (currency, balance);
@@ -0,0 +1,26 @@
+-- migrate: no-transaction
+-- Daily spending rollups, maintained by the transaction writes in database_operations
+-- and read by the analytics endpoints instead of scanning transfer.Transactions. One
+-- row per sender account, day, transaction type, recipient account and currency.
+-- Existing history is loaded afterwards with
+--
+--   python spending.py backfill
+
+CREATE TABLE IF NOT EXISTS transfer.spending_daily (
+    account_id INTEGER NOT NULL,
+    day DATE NOT NULL,
+    transaction_type VARCHAR(50) NOT NULL,
+    recipient_account_id INTEGER NOT NULL,
+    currency VARCHAR(3) NOT NULL,
+    transaction_count INTEGER NOT NULL DEFAULT 0,
+    amount NUMERIC NOT NULL DEFAULT 0,
+    PRIMARY KEY (account_id, day, transaction_type, recipient_account_id, currency)
+);
+
+-- Account deletes remove the rollups of transfers into the account
+CREATE INDEX IF NOT EXISTS spending_daily_recipient_idx
+    ON transfer.spending_daily (recipient_account_id);
+
+-- Backfill batches select transactions by day
+CREATE INDEX CONCURRENTLY IF NOT EXISTS transactions_created_at_idx
+    ON transfer.Transactions (created_at);
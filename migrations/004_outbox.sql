@@ -0,0 +1,27 @@
+-- Transactional outbox. Every write in database_operations appends one event here in
+-- the same database transaction, and outbox.py delivers the events to downstream sinks
+-- and deletes them. Events of one aggregate (a user, account, transaction or recipient)
+-- are delivered in event_id order; events that keep failing move to outbox_dead.
+
+CREATE TABLE IF NOT EXISTS transfer.outbox (
+    event_id BIGSERIAL PRIMARY KEY,
+    aggregate_type VARCHAR(20) NOT NULL,
+    aggregate_id INTEGER NOT NULL,
+    operation VARCHAR(10) NOT NULL,
+    payload JSONB,
+    created_at TIMESTAMP NOT NULL DEFAULT now(),
+    -- Not claimed before this time: set while a dispatcher holds the event and while
+    -- a failed delivery backs off
+    available_at TIMESTAMP NOT NULL DEFAULT now(),
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT
+);
+
+-- A dispatcher only claims the oldest pending event of each aggregate
+CREATE INDEX IF NOT EXISTS outbox_aggregate_idx
+    ON transfer.outbox (aggregate_type, aggregate_id, event_id);
+
+CREATE TABLE IF NOT EXISTS transfer.outbox_dead (
+    LIKE transfer.outbox,
+    dead_at TIMESTAMP NOT NULL DEFAULT now()
+);
@@ -0,0 +1,212 @@
+import argparse
+import json
+import os
+import re
+import statistics
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+
+from assistant import CANNED_RESPONSE, TOOLS
+from intent_router import ACTION_PATTERN, _latest_prompt, classify
+
+# Model router. Picks the model for each assistant turn from cheap features of the
+# conversation, so lookups go to a small fast model and only transfer planning, long
+# conversations and retries after a failed turn pay for the large one. Rules are
+# checked in order and the first match wins; they can be replaced with a JSON file
+# (MODEL_ROUTES_PATH) holding a list of {"name", "model", "when"} objects. Every
+# decision is logged with the turn's outcome to MODEL_ROUTER_LOG (JSON lines) so the
+# rules can be tuned from data:
+#
+#   python model_router.py report model-router.jsonl
+
+MODEL_ROUTING = os.getenv("MODEL_ROUTING", "1") == "1"
+MODEL_ROUTER_SMALL = os.getenv("MODEL_ROUTER_SMALL", "claude-3-haiku-20240307")
+MODEL_ROUTER_LARGE = os.getenv("MODEL_ROUTER_LARGE", "claude-3-5-sonnet-20240620")
+MODEL_ROUTES_PATH = os.getenv("MODEL_ROUTES_PATH")
+MODEL_ROUTER_LOG = os.getenv("MODEL_ROUTER_LOG")
+
+# Model aliases usable in rules besides full model names
+MODEL_ALIASES = {"small": MODEL_ROUTER_SMALL, "large": MODEL_ROUTER_LARGE}
+
+DEFAULT_ROUTES = [
+    {"name": "previous_failed", "model": "large", "when": {"previous_failed": True}},
+    {"name": "transfer_planning", "model": "large", "when": {"writes": True}},
+    {"name": "multi_step", "model": "large", "when": {"min_tools": 3}},
+    {"name": "long_conversation", "model": "large", "when": {"min_turns": 10}},
+    {"name": "lookup", "model": "small", "when": {}},
+]
+
+CONDITIONS = {"intents", "action", "tools", "writes", "min_tools", "min_turns", "max_turns", "previous_failed"}
+
+# (pattern in the customer's message, tools the turn is likely to need)
+TOOL_HINTS = [
+    (re.compile(r"\b(send|pay|wire|transfer|move)\b", re.IGNORECASE), ["create_transaction"]),
+    (re.compile(r"\b(confirm|cancel)\b", re.IGNORECASE), ["confirm_transaction", "cancel_transaction"]),
+    (re.compile(r"\boverview\b", re.IGNORECASE),
+     ["get_user_profile", "list_accounts", "list_recipients", "list_favorite_recipients"]),
+    (re.compile(r"\b(balances?|accounts?|savings|checking)\b", re.IGNORECASE), ["list_accounts"]),
+    (re.compile(r"\baccount #?\d+\b", re.IGNORECASE), ["get_account"]),
+    (re.compile(r"\b(transactions?|payments?|activity|spent|history)\b", re.IGNORECASE),
+     ["list_recent_transactions"]),
+    (re.compile(r"\b(find|search|look for|look up)\b", re.IGNORECASE), ["search_transactions"]),
+    (re.compile(r"\b(recipients?|payees?|contacts?)\b", re.IGNORECASE), ["list_recipients"]),
+    (re.compile(r"\bfavou?rites?\b", re.IGNORECASE), ["list_favorite_recipients"]),
+    (re.compile(r"\b(profile|email|phone|verified)\b", re.IGNORECASE), ["get_user_profile"]),
+]
+
+
+def _prompt_indexes(messages):
+    return [i for i, message in enumerate(messages) if message["role"] == "user"
+            and (isinstance(message["content"], str)
+                 or all(block.get("type") == "text" for block in message["content"]))]
+
+
+def _turn_failed(messages):
+    # A turn failed if a tool returned an error or the customer got the canned answer
+    for message in messages:
+        if isinstance(message["content"], str):
+            continue
+        for block in message["content"]:
+            if block.get("type") == "tool_result" and block.get("is_error"):
+                return True
+            if block.get("type") == "text" and block.get("text") == CANNED_RESPONSE:
+                return True
+    return False
+
+
+def required_tools(text):
+    tools = []
+    for pattern, names in TOOL_HINTS:
+        if pattern.search(text):
+            tools.extend(name for name in names if name not in tools)
+    return tools
+
+
+def extract_features(messages):
+    prompt = _latest_prompt(messages) or ""
+    intent, _, how = classify(prompt) if prompt else (None, {}, None)
+    tools = required_tools(prompt)
+    prompts = _prompt_indexes(messages)
+    previous = messages[prompts[-2]:prompts[-1]] if len(prompts) > 1 else []
+    return {
+        "intent": intent,
+        "action": how == "action" or bool(ACTION_PATTERN.search(prompt)),
+        "tools": tools,
+        "writes": any(TOOLS.get(name, {}).get("writes") for name in tools),
+        "turns": len(prompts),
+        "history_messages": len(messages),
+        "previous_failed": _turn_failed(previous),
+    }
+
+
+def rule_matches(when, features):
+    if "intents" in when and features["intent"] not in when["intents"]:
+        return False
+    if "tools" in when and not set(when["tools"]) & set(features["tools"]):
+        return False
+    for flag in ("action", "writes", "previous_failed"):
+        if flag in when and features[flag] != when[flag]:
+            return False
+    if features["turns"] < when.get("min_turns", 0) or len(features["tools"]) < when.get("min_tools", 0):
+        return False
+    if "max_turns" in when and features["turns"] > when["max_turns"]:
+        return False
+    return True
+
+
+def load_routes(path=MODEL_ROUTES_PATH):
+    if not path:
+        return DEFAULT_ROUTES
+    with open(path) as f:
+        routes = json.load(f)
+    for route in routes:
+        unknown = set(route.get("when", {})) - CONDITIONS
+        if unknown or "model" not in route:
+            raise ValueError(f"Invalid model route {route.get('name')!r}: "
+                             f"{'unknown conditions ' + ', '.join(sorted(unknown)) if unknown else 'no model'}")
+    return routes
+
+
+class ModelRouter:
+    # Sits in front of an Assistant with the same respond()/stream() interface and
+    # passes the chosen model for the turn. Falls back to the assistant's own model
+    # when no rule matches.
+
+    def __init__(self, assistant, routes=None, log_path=MODEL_ROUTER_LOG):
+        self.assistant = assistant
+        self.routes = load_routes() if routes is None else routes
+        self.log_path = log_path
+        self.stats = Counter()
+
+    def route(self, messages):
+        # Returns (rule name, model, features)
+        features = extract_features(messages)
+        for route in self.routes:
+            if rule_matches(route.get("when", {}), features):
+                return route["name"], MODEL_ALIASES.get(route["model"], route["model"]), features
+        return None, self.assistant.model, features
+
+    def _log(self, user_id, rule, model, features, reply, started):
+        self.stats[rule] += 1
+        if not self.log_path:
+            return
+        prompts = _prompt_indexes(reply["messages"])
+        record = {
+            "time": datetime.now().isoformat(timespec="seconds"),
+            "user_id": user_id,
+            "rule": rule,
+            "model": model,
+            "features": features,
+            "latency_ms": round((time.perf_counter() - started) * 1000, 1),
+            "tool_calls": reply["tool_calls"],
+            "failed": _turn_failed(reply["messages"][prompts[-1] if prompts else 0:]),
+            "degraded": reply.get("degraded"),
+            "input_tokens": reply["usage"]["input_tokens"],
+            "output_tokens": reply["usage"]["output_tokens"],
+        }
+        with open(self.log_path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+    async def respond(self, user_id, messages):
+        rule, model, features = self.route(messages)
+        started = time.perf_counter()
+        reply = await self.assistant.respond(user_id, messages, model=model)
+        self._log(user_id, rule, model, features, reply, started)
+        return reply
+
+    async def stream(self, user_id, messages):
+        rule, model, features = self.route(messages)
+        started = time.perf_counter()
+        async for event in self.assistant.stream(user_id, messages, model=model):
+            if event["type"] == "done":
+                self._log(user_id, rule, model, features, event["reply"], started)
+            yield event
+
+
+def report(path):
+    # Per rule and model: turns, latency, failures and tokens from a decision log
+    groups = defaultdict(list)
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                groups[(record["rule"], record["model"])].append(record)
+    print(f"{'rule':20} {'model':30} {'turns':>6} {'p50 ms':>8} {'max ms':>8} {'failed':>7} "
+          f"{'degraded':>9} {'in tok':>8} {'out tok':>8}")
+    for (rule, model), records in sorted(groups.items(), key=lambda item: -len(item[1])):
+        latencies = [record["latency_ms"] for record in records]
+        print(f"{str(rule):20} {model:30} {len(records):6} {statistics.median(latencies):8.0f} "
+              f"{max(latencies):8.0f} {sum(r['failed'] for r in records) / len(records):7.0%} "
+              f"{sum(bool(r['degraded']) for r in records) / len(records):9.0%} "
+              f"{statistics.mean(r['input_tokens'] for r in records):8.0f} "
+              f"{statistics.mean(r['output_tokens'] for r in records):8.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Model router decision log tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+    report_parser = commands.add_parser("report", help="Summarize a decision log")
+    report_parser.add_argument("log")
+    args = parser.parse_args()
+    report(args.log)
@@ -0,0 +1,191 @@
+import asyncio
+import json
+import os
+import queue
+import threading
+import time
+
+import storage
+
+# Delivers the change events that storage writes append to the outbox
+# (transfer.outbox, migrations/004) to downstream consumers, so they need not poll the
+# list endpoints. Each worker runs a dispatcher; batches are claimed with SKIP LOCKED
+# and leased, so dispatchers never hand out the same event at once, and an
+# aggregate's next events are only claimed after its earlier ones were delivered.
+#
+# Delivery is at least once: a batch that fails on any sink is retried on all of
+# them with exponential backoff, and after OUTBOX_MAX_ATTEMPTS it moves to
+# transfer.outbox_dead. Consumers deduplicate on event_id.
+#
+# Sinks are configured as a comma-separated list in OUTBOX_SINKS:
+#
+#   queue                        in-process queue, read with get_sink("queue").queue
+#   file:/var/log/outbox.jsonl   appends one JSON line per event
+#   http://host/events           POSTs each batch as {"events": [...]}
+#
+# Without sinks no dispatcher runs and writes append no events (Storage.set_outbox).
+# Events left undelivered at shutdown stay in the outbox for the next dispatcher.
+
+OUTBOX_SINKS = os.getenv("OUTBOX_SINKS", "")
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "500"))
+OUTBOX_INTERVAL = float(os.getenv("OUTBOX_INTERVAL", "0.5"))
+OUTBOX_LEASE = float(os.getenv("OUTBOX_LEASE", "30"))
+OUTBOX_RETRY_DELAY = float(os.getenv("OUTBOX_RETRY_DELAY", "1"))
+OUTBOX_MAX_RETRY_DELAY = float(os.getenv("OUTBOX_MAX_RETRY_DELAY", "300"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "10"))
+OUTBOX_QUEUE_SIZE = int(os.getenv("OUTBOX_QUEUE_SIZE", "100000"))
+OUTBOX_HTTP_TIMEOUT = float(os.getenv("OUTBOX_HTTP_TIMEOUT", "5"))
+
+
+def encode(event):
+    return json.dumps(event, default=str, separators=(",", ":"))
+
+
+class QueueSink:
+    name = "queue"
+
+    def __init__(self, maxsize=OUTBOX_QUEUE_SIZE):
+        self.queue = queue.Queue(maxsize)
+
+    def deliver(self, events):
+        # A full queue fails the batch instead of blocking the dispatcher
+        if self.queue.maxsize and self.queue.qsize() + len(events) > self.queue.maxsize:
+            raise RuntimeError(f"queue full ({self.queue.qsize()} events)")
+        for event in events:
+            self.queue.put_nowait(event)
+
+    def close(self):
+        pass
+
+
+class FileSink:
+    name = "file"
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "a", encoding="utf-8")
+
+    def deliver(self, events):
+        self._file.write("".join(encode(event) + "\n" for event in events))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+
+class HttpSink:
+    name = "http"
+
+    def __init__(self, url, timeout=OUTBOX_HTTP_TIMEOUT):
+        import httpx
+        self.url = url
+        self._client = httpx.Client(timeout=timeout)
+
+    def deliver(self, events):
+        response = self._client.post(self.url, content="{\"events\":[" + ",".join(map(encode, events)) + "]}",
+                                     headers={"content-type": "application/json"})
+        response.raise_for_status()
+
+    def close(self):
+        self._client.close()
+
+
+def create_sink(spec):
+    if spec == "queue":
+        return QueueSink()
+    if spec.startswith("file:"):
+        return FileSink(spec[len("file:"):])
+    if spec.startswith(("http://", "https://")):
+        return HttpSink(spec)
+    raise ValueError(f"Unknown outbox sink: {spec}")
+
+
+def create_sinks(specs=OUTBOX_SINKS):
+    return [create_sink(spec.strip()) for spec in specs.split(",") if spec.strip()]
+
+
+class OutboxDispatcher:
+    def __init__(self, sinks, batch_size=OUTBOX_BATCH_SIZE, lease=OUTBOX_LEASE, retry_delay=OUTBOX_RETRY_DELAY,
+                 max_retry_delay=OUTBOX_MAX_RETRY_DELAY, max_attempts=OUTBOX_MAX_ATTEMPTS):
+        self.sinks = sinks
+        self.batch_size = batch_size
+        self.lease = lease
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self.delivered = 0
+        self.failed = 0
+        self.dead = 0
+
+    def dispatch_once(self):
+        # Delivers one batch; returns the number of events claimed
+        events = storage.claim_outbox(self.batch_size, self.lease)
+        if not events:
+            return 0
+        event_ids = [event["event_id"] for event in events]
+        try:
+            for sink in self.sinks:
+                sink.deliver(events)
+        except Exception as e:
+            print(f"Outbox delivery of {len(events)} events failed: {e}")
+            dead = storage.retry_outbox(event_ids, str(e), self.retry_delay, self.max_retry_delay, self.max_attempts)
+            with self._lock:
+                self.failed += len(events)
+                self.dead += dead
+            return len(events)
+        storage.ack_outbox(event_ids)
+        with self._lock:
+            self.delivered += len(events)
+        return len(events)
+
+    def drain(self, timeout=None):
+        # Dispatches until no event can be claimed; returns the number of events claimed
+        deadline = None if timeout is None else time.monotonic() + timeout
+        total = 0
+        while deadline is None or time.monotonic() < deadline:
+            claimed = self.dispatch_once()
+            if not claimed:
+                break
+            total += claimed
+        return total
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+    def stats(self):
+        with self._lock:
+            return {"delivered": self.delivered, "failed": self.failed, "dead": self.dead}
+
+
+async def run(dispatcher, interval=OUTBOX_INTERVAL):
+    # Full batches are followed straight away by the next; otherwise waits interval
+    while True:
+        try:
+            claimed = await asyncio.to_thread(dispatcher.dispatch_once)
+        except Exception as e:
+            print(f"Outbox dispatch failed: {e}")
+            claimed = 0
+        if claimed < dispatcher.batch_size:
+            await asyncio.sleep(interval)
+
+
+_dispatcher = None
+
+
+def get_dispatcher():
+    return _dispatcher
+
+
+def set_dispatcher(dispatcher):
+    global _dispatcher
+    _dispatcher = dispatcher
+
+
+def get_sink(name):
+    # The first configured sink of a kind, e.g. the in-process queue
+    if _dispatcher is None:
+        return None
+    return next((sink for sink in _dispatcher.sinks if sink.name == name), None)
@@ -0,0 +1,235 @@
+import asyncio
+import json
+import os
+import select
+import threading
+import time
+
+import storage
+
+# Pushes account balance and transaction status changes to subscribers of the
+# /subscriptions WebSocket in main.py, so apps need not poll GET /accounts/{id} and
+# GET /transactions/{id}.
+#
+# On Postgres every write NOTIFYs CHANGES_CHANNEL when it commits, with the owning
+# users and, for accounts and transactions, the watched fields
+# (database_operations._append_event), so writes of all workers are seen. Each process
+# keeps one listening connection on a background thread (ChangeListener), which hands
+# the notifications to the hub and to the caches that must forget other workers'
+# writes. The hub fans them out on the event loop to the subscribers of that row. A
+# notification is serialized once, however many subscribers get it. On the in-memory
+# backend the hub is fed by the storage change notifications of this process instead.
+#
+# A subscriber that falls WS_QUEUE_SIZE messages behind is disconnected. After the
+# listening connection is lost and reopened, subscribers get {"type": "resync"}, as
+# changes in between were missed.
+
+WS_QUEUE_SIZE = int(os.getenv("WS_QUEUE_SIZE", "100"))
+WS_MAX_SUBSCRIPTIONS = int(os.getenv("WS_MAX_SUBSCRIPTIONS", "100"))
+LISTEN_RECONNECT_DELAY = float(os.getenv("LISTEN_RECONNECT_DELAY", "1"))
+
+# Fields sent for each table; must match the NOTIFY payload in database_operations
+FIELDS = {"accounts": ("balance", "currency"), "transactions": ("status",)}
+
+# Passed to ChangeListener listeners in place of a change after a reconnect
+RESYNC = {"table": None, "operation": "resync", "id": None, "user_ids": []}
+
+
+def fields(table, row):
+    return {field: row[field] for field in FIELDS[table]}
+
+
+def encode(message):
+    return json.dumps(message, default=str, separators=(",", ":"))
+
+
+class Subscriber:
+    # One WebSocket connection
+    __slots__ = ("queue", "keys", "changed")
+
+    def __init__(self, queue_size):
+        self.queue = asyncio.Queue(queue_size)
+        self.keys = set()  # (table, id) subscribed to
+        self.changed = None  # keys that got a change while their snapshots were read
+
+
+class SubscriptionHub:
+    def __init__(self, queue_size=WS_QUEUE_SIZE, max_subscriptions=WS_MAX_SUBSCRIPTIONS):
+        self.queue_size = queue_size
+        self.max_subscriptions = max_subscriptions
+        # (table, id) -> subscribers; only touched on the event loop
+        self._subscriptions = {}
+        self._subscribers = set()
+        self._loop = None
+        self.published = 0
+        self.delivered = 0
+        self.disconnected = 0
+
+    def start(self, loop):
+        self._loop = loop
+
+    def attach(self):
+        storage.subscribe(self.on_change)
+
+    def detach(self):
+        storage.unsubscribe(self.on_change)
+
+    def connect(self):
+        subscriber = Subscriber(self.queue_size)
+        self._subscribers.add(subscriber)
+        return subscriber
+
+    def disconnect(self, subscriber):
+        self._subscribers.discard(subscriber)
+        for key in subscriber.keys:
+            subscribers = self._subscriptions.get(key)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscriptions[key]
+        subscriber.keys = set()
+
+    def subscribe(self, subscriber, table, ids):
+        # Returns the ids newly subscribed to; raises ValueError past the limit
+        new = [row_id for row_id in dict.fromkeys(ids) if (table, row_id) not in subscriber.keys]
+        if len(subscriber.keys) + len(new) > self.max_subscriptions:
+            raise ValueError(f"At most {self.max_subscriptions} subscriptions per connection")
+        for row_id in new:
+            subscriber.keys.add((table, row_id))
+            self._subscriptions.setdefault((table, row_id), set()).add(subscriber)
+        return new
+
+    def unsubscribe(self, subscriber, table, ids):
+        for row_id in ids:
+            key = (table, row_id)
+            if key in subscriber.keys:
+                subscriber.keys.discard(key)
+                subscribers = self._subscriptions[key]
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscriptions[key]
+
+    def subscriptions(self, subscriber):
+        return {table: sorted(row_id for key_table, row_id in subscriber.keys if key_table == table)
+                for table in FIELDS}
+
+    def publish(self, change):
+        # Thread-safe; change is {"table", "id", "operation", **fields}
+        self._loop.call_soon_threadsafe(self._fan_out, change)
+
+    def broadcast(self, message):
+        self._loop.call_soon_threadsafe(self._broadcast, message)
+
+    def _send(self, subscriber, text):
+        try:
+            subscriber.queue.put_nowait(text)
+            return True
+        except asyncio.QueueFull:
+            # Too slow: the connection is closed once the sentinel is read
+            while not subscriber.queue.empty():
+                subscriber.queue.get_nowait()
+            subscriber.queue.put_nowait(None)
+            self.disconnect(subscriber)
+            self.disconnected += 1
+            return False
+
+    def _fan_out(self, change):
+        key = (change["table"], change["id"])
+        subscribers = self._subscriptions.get(key)
+        if not subscribers:
+            return
+        self.published += 1
+        text = encode({"type": "change", **change})
+        for subscriber in list(subscribers):
+            if subscriber.changed is not None:
+                subscriber.changed.add(key)
+            self.delivered += self._send(subscriber, text)
+        if change["operation"] == "delete":
+            for subscriber in list(self._subscriptions.get(key, ())):
+                self.unsubscribe(subscriber, key[0], [key[1]])
+
+    def _broadcast(self, message):
+        text = encode(message)
+        for subscriber in list(self._subscribers):
+            self._send(subscriber, text)
+
+    def send(self, subscriber, message):
+        # For replies on the event loop; False once the subscriber was dropped
+        return self._send(subscriber, encode(message))
+
+    def on_notify(self, change):
+        # ChangeListener listener (Postgres backend); runs on the listener thread
+        if change["operation"] == "resync":
+            self.broadcast({"type": "resync"})
+        elif change["table"] in FIELDS:
+            self.publish(self._message(change))
+
+    def on_change(self, change):
+        # Storage change notification (in-memory backend); runs in the writing thread.
+        # The record carries the row's fields, and whether anyone subscribed to the row
+        # is only looked up on the event loop, in _fan_out.
+        if change["table"] in FIELDS:
+            self.publish(self._message(change))
+
+    def _message(self, change):
+        message = {"table": change["table"], "id": change["id"], "operation": change["operation"]}
+        message.update((field, change[field]) for field in FIELDS[change["table"]] if field in change)
+        return message
+
+    def stats(self):
+        return {"subscribers": len(self._subscribers), "rows": len(self._subscriptions),
+                "published": self.published, "delivered": self.delivered, "disconnected": self.disconnected}
+
+
+class ChangeListener:
+    # The process's one LISTEN connection (Postgres backend), read on a background
+    # thread. Every change committed by any process, this one included, is passed to
+    # each listener as {"table", "operation", "id", "user_ids", **fields}, on that thread;
+    # after the connection is lost and reopened they get RESYNC instead.
+    def __init__(self, listeners, reconnect_delay=LISTEN_RECONNECT_DELAY):
+        self.listeners = listeners
+        self.reconnect_delay = reconnect_delay
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="change-listener", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        import database_operations
+        connected_before = False
+        while not self._stopping.is_set():
+            try:
+                conn = database_operations.open_listener()
+            except Exception as e:
+                print(f"Change listener could not connect: {e}")
+                self._stopping.wait(self.reconnect_delay)
+                continue
+            if connected_before:
+                self._deliver(RESYNC)
+            connected_before = True
+            try:
+                while not self._stopping.is_set():
+                    # Wakes up at least once a second to notice stop()
+                    if select.select([conn], [], [], 1.0)[0]:
+                        conn.poll()
+                        while conn.notifies:
+                            self._deliver(json.loads(conn.notifies.pop(0).payload))
+            except Exception as e:
+                print(f"Change listener lost its connection: {e}")
+                time.sleep(self.reconnect_delay)
+            finally:
+                conn.close()
+
+    def _deliver(self, change):
+        for listener in self.listeners:
+            try:
+                listener(change)
+            except Exception as e:
+                print(f"Change listener failed: {e}")
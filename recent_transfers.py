@@ -0,0 +1,91 @@
+import asyncio
+import threading
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime
+
+import storage
+
+# In-memory views of recent transfers, shared by the velocity windows and the
+# duplicate detector. A view is loaded from the database on startup and keeps the
+# transfers of the last `history` seconds. Transfers created by this process are
+# recorded from storage change notifications, whose records carry the transfer's
+# fields, so nothing is read back. Those of other workers are read back by sync(),
+# which re-reads `overlap` seconds before the previous sync so that transactions
+# committed shortly after their created_at are not missed.
+
+
+def timestamp(value):
+    return value.timestamp() if hasattr(value, "timestamp") else float(value)
+
+
+class RecentTransfers(ABC):
+    def __init__(self, history, overlap):
+        self.history = history
+        self.overlap = overlap
+        self._lock = threading.Lock()
+        self._synced_to = None
+
+    # Called with the lock held
+    @abstractmethod
+    def _clear(self):
+        ...
+
+    @abstractmethod
+    def _record(self, transaction):
+        # Returns whether the transaction was new to the view
+        ...
+
+    @abstractmethod
+    def _prune(self, now):
+        ...
+
+    def attach(self):
+        storage.subscribe(self.on_change)
+        self.rebuild()
+
+    def detach(self):
+        storage.unsubscribe(self.on_change)
+        with self._lock:
+            self._clear()
+            self._synced_to = None
+
+    def record(self, transaction):
+        with self._lock:
+            return self._record(transaction)
+
+    def rebuild(self, now=None):
+        # Loads the transfers of the last `history` seconds; returns how many were read
+        now = time.time() if now is None else now
+        transactions = storage.get_transactions_since(datetime.fromtimestamp(now - self.history))
+        with self._lock:
+            self._clear()
+            for transaction in transactions:
+                self._record(transaction)
+            self._synced_to = now
+            self._prune(now)
+        return len(transactions)
+
+    def sync(self, now=None):
+        # Picks up transfers created by other workers; returns how many were new
+        now = time.time() if now is None else now
+        since = max(self._synced_to if self._synced_to is not None else 0.0, now - self.history) - self.overlap
+        transactions = storage.get_transactions_since(datetime.fromtimestamp(since))
+        with self._lock:
+            added = sum(bool(self._record(transaction)) for transaction in transactions)
+            self._synced_to = now
+            self._prune(now)
+        return added
+
+    def on_change(self, change):
+        if change["table"] == "transactions" and change["operation"] == "create":
+            self.record(dict(change, transaction_id=change["id"]))
+
+
+async def run_sync(view, interval, name):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(view.sync)
+        except Exception as e:
+            print(f"{name} sync failed: {e}")
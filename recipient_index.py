@@ -0,0 +1,188 @@
+import bisect
+import heapq
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import storage
+
+# Recipient autocomplete. Each user's recipients are indexed on first lookup as a
+# sorted array of (token, recipient_id), where tokens are the words of the name and
+# bank name, the whole name and the account number; a prefix lookup is a bisect. The
+# index is kept current from storage change notifications, so it only sees writes made
+# by this process; entries are reloaded after RECIPIENT_INDEX_TTL seconds to pick up
+# writes from other workers. Transfers go to internal accounts and carry no link to a
+# saved recipient, so ranking uses where the query matches and favorites only.
+
+RECIPIENT_INDEX_TTL = float(os.getenv("RECIPIENT_INDEX_TTL", "300"))
+RECIPIENT_INDEX_USERS = int(os.getenv("RECIPIENT_INDEX_USERS", "10000"))
+
+_WORD = re.compile(r"\w+")
+
+
+def _account_key(account_info):
+    return re.sub(r"\W", "", str(account_info).casefold())
+
+
+def recipient_tokens(recipient):
+    name = recipient["name"].casefold()
+    tokens = set(_WORD.findall(name)) | set(_WORD.findall(recipient["bank_name"].casefold()))
+    tokens.add(name)
+    tokens.add(_account_key(recipient["account_info"]))
+    tokens.discard("")
+    return tokens
+
+
+def query_terms(query):
+    # Longest first, so the candidate scan uses the most selective prefix
+    return sorted(set(_WORD.findall(query.casefold())), key=len, reverse=True)
+
+
+class UserRecipientIndex:
+    def __init__(self, recipients=()):
+        self.keys = []  # sorted (token, recipient_id)
+        self.recipients = {}
+        self.tokens = {}
+        self.names = {}  # recipient_id -> (casefolded name, its words), for scoring
+        self.loaded_at = time.monotonic()
+        # Sorted once here; insort per entry would shift the list on every insert
+        for recipient in recipients:
+            self._store(recipient)
+        self.keys = sorted((token, recipient_id) for recipient_id, tokens in self.tokens.items() for token in tokens)
+
+    def _store(self, recipient):
+        recipient_id = recipient["recipient_id"]
+        self.recipients[recipient_id] = dict(recipient)
+        self.tokens[recipient_id] = recipient_tokens(recipient)
+        name = recipient["name"].casefold()
+        self.names[recipient_id] = (name, _WORD.findall(name))
+
+    def add(self, recipient):
+        self.remove(recipient["recipient_id"])
+        self._store(recipient)
+        for token in self.tokens[recipient["recipient_id"]]:
+            bisect.insort(self.keys, (token, recipient["recipient_id"]))
+
+    def remove(self, recipient_id):
+        for token in self.tokens.pop(recipient_id, ()):
+            i = bisect.bisect_left(self.keys, (token, recipient_id))
+            if i < len(self.keys) and self.keys[i] == (token, recipient_id):
+                del self.keys[i]
+        self.recipients.pop(recipient_id, None)
+        self.names.pop(recipient_id, None)
+
+    def _prefixed(self, term):
+        ids = set()
+        i = bisect.bisect_left(self.keys, (term,))
+        while i < len(self.keys) and self.keys[i][0].startswith(term):
+            ids.add(self.keys[i][1])
+            i += 1
+        return ids
+
+    def _score(self, recipient_id, phrase, terms):
+        # Where the match is, then favorites
+        name, words = self.names[recipient_id]
+        if name.startswith(phrase):
+            score = 4.0
+        elif any(word.startswith(term) for term in terms for word in words):
+            score = 2.0
+        else:
+            score = 1.0
+        if self.recipients[recipient_id].get("is_favorite"):
+            score += 3.0
+        return score
+
+    def search(self, query, limit=10):
+        terms = query_terms(query)
+        if not terms:
+            return []
+        candidates = self._prefixed(terms[0])
+        matches = [
+            recipient_id for recipient_id in candidates
+            if all(any(token.startswith(term) for token in self.tokens[recipient_id]) for term in terms[1:])
+        ]
+        phrase = " ".join(_WORD.findall(query.casefold()))
+        best = heapq.nsmallest(limit, matches, key=lambda recipient_id: (
+            -self._score(recipient_id, phrase, terms), self.names[recipient_id][0], recipient_id))
+        return [dict(self.recipients[recipient_id]) for recipient_id in best]
+
+
+class RecipientIndex:
+    def __init__(self, ttl=RECIPIENT_INDEX_TTL, max_users=RECIPIENT_INDEX_USERS):
+        self.ttl = ttl
+        self.max_users = max_users
+        self._lock = threading.RLock()
+        self._users = OrderedDict()  # user_id -> UserRecipientIndex, least recently used first
+        self._loading = {}  # user_id -> changes buffered for each load in progress
+        self.loads = 0
+
+    def attach(self):
+        storage.subscribe(self.on_change)
+
+    def detach(self):
+        storage.unsubscribe(self.on_change)
+        with self._lock:
+            self._users.clear()
+
+    def _load(self, user_id):
+        index = UserRecipientIndex(storage.get_all_recipients(user_id))
+        self.loads += 1
+        return index
+
+    def user_index(self, user_id):
+        with self._lock:
+            index = self._users.get(user_id)
+            if index is not None and time.monotonic() - index.loaded_at < self.ttl:
+                self._users.move_to_end(user_id)
+                return index
+            # Loaded outside the lock so a slow query does not hold up other users. Writes
+            # landing meanwhile are buffered and replayed once the index is in place;
+            # replaying re-reads the row, so one the load already saw is harmless
+            changes = []
+            self._loading.setdefault(user_id, []).append(changes)
+        index = None
+        try:
+            index = self._load(user_id)
+        finally:
+            with self._lock:
+                self._loading[user_id] = [buffered for buffered in self._loading[user_id] if buffered is not changes]
+                if not self._loading[user_id]:
+                    del self._loading[user_id]
+                if index is not None:
+                    self._users[user_id] = index
+                    while len(self._users) > self.max_users:
+                        self._users.popitem(last=False)
+        for change in changes:
+            self.on_change(change)
+        return index
+
+    def suggest(self, user_id, query, limit=10):
+        index = self.user_index(user_id)
+        with self._lock:
+            return index.search(query, limit)
+
+    def on_change(self, change):
+        # Storage listener; only users whose index is loaded are touched, so writes for
+        # everyone else cost no extra query
+        table, operation = change["table"], change["operation"]
+        with self._lock:
+            for user_id in change["user_ids"]:
+                for changes in self._loading.get(user_id, ()):
+                    changes.append(change)
+            loaded = [user_id for user_id in change["user_ids"] if user_id in self._users]
+        if not loaded:
+            return
+        if table == "users" and operation == "delete":
+            with self._lock:
+                for user_id in loaded:
+                    self._users.pop(user_id, None)
+        elif table == "recipients":
+            recipient = storage.get_recipient(change["id"]) if operation != "delete" else None
+            with self._lock:
+                for user_id in loaded:
+                    if user_id in self._users and (recipient is None or recipient["user_id"] != user_id):
+                        self._users[user_id].remove(change["id"])
+                if recipient is not None and recipient["user_id"] in self._users:
+                    self._users[recipient["user_id"]].add(recipient)
@@ -0,0 +1,149 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import storage
+
+ASSISTANT_CACHE_SIZE = int(os.getenv("ASSISTANT_CACHE_SIZE", "10000"))
+ASSISTANT_CACHE_TTL = float(os.getenv("ASSISTANT_CACHE_TTL", "86400"))
+# Answers built from account data also expire quickly. Writes made by other worker
+# processes bump this process's data versions only once their change notification
+# arrives (realtime.ChangeListener, Postgres only), so this TTL bounds how stale such
+# an answer can be while the listening connection is down, or without one.
+ASSISTANT_CACHE_DATA_TTL = float(os.getenv("ASSISTANT_CACHE_DATA_TTL", "60"))
+ASSISTANT_CACHE_PATH = os.getenv("ASSISTANT_CACHE_PATH")
+
+_PUNCTUATION = re.compile(r"[\s?!.,;:]+")
+
+
+def normalize_prompt(prompt):
+    # "What are your fees?" and "what are your  fees" share an entry
+    return _PUNCTUATION.sub(" ", prompt.casefold()).strip()
+
+
+def make_key(prompt, model, params, data_version=None):
+    material = json.dumps([normalize_prompt(prompt), model, params, data_version], sort_keys=True, default=str)
+    return hashlib.sha256(material.encode()).hexdigest()
+
+
+class DataVersions:
+    # Per-user counters bumped by storage change notifications; part of the cache key
+    # for answers that read account data, so those answers miss after a write. A resync
+    # (changes were missed) moves every user to a new epoch.
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._versions = {}
+        self._epoch = 0
+
+    def __call__(self, change):
+        with self._lock:
+            if change["operation"] == "resync":
+                self._epoch += 1
+                self._versions.clear()
+            for user_id in change["user_ids"]:
+                self._versions[user_id] = self._versions.get(user_id, 0) + 1
+
+    def get(self, user_id):
+        return self._epoch, self._versions.get(user_id, 0)
+
+
+class ResponseCache:
+    def __init__(self, max_entries=ASSISTANT_CACHE_SIZE, ttl=ASSISTANT_CACHE_TTL,
+                 data_ttl=ASSISTANT_CACHE_DATA_TTL, path=ASSISTANT_CACHE_PATH):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.data_ttl = data_ttl
+        self.path = path
+        self.versions = DataVersions()
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (value, expires_at, data_dependent)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def attach(self):
+        storage.subscribe(self.versions)
+        if self.path:
+            self.load()
+
+    def detach(self):
+        storage.unsubscribe(self.versions)
+        if self.path:
+            self.save()
+
+    def get(self, *keys):
+        # Returns the value of the first live key; counts as one lookup for the stats
+        with self._lock:
+            now = time.time()
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                if entry[1] <= now:
+                    del self._entries[key]
+                    self.expirations += 1
+                    continue
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            return None
+
+    def put(self, key, value, data_dependent=False):
+        ttl = self.data_ttl if data_dependent else self.ttl
+        with self._lock:
+            self._entries[key] = (value, time.time() + ttl, data_dependent)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+    def save(self, path=None):
+        # Only answers that did not read account data survive a restart: data versions
+        # start again from zero in a new process, so older data answers could be stale.
+        path = path or self.path
+        now = time.time()
+        with self._lock:
+            rows = [
+                {"key": key, "value": value, "expires_at": expires_at}
+                for key, (value, expires_at, data_dependent) in self._entries.items()
+                if not data_dependent and expires_at > now
+            ]
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            for row in rows:
+                f.write(json.dumps(row) + "\n")
+        os.replace(tmp_path, path)
+        return len(rows)
+
+    def load(self, path=None):
+        path = path or self.path
+        if not os.path.exists(path):
+            return 0
+        now = time.time()
+        loaded = 0
+        with open(path) as f, self._lock:
+            for line in f:
+                row = json.loads(line)
+                if row["expires_at"] > now:
+                    self._entries[row["key"]] = (row["value"], row["expires_at"], False)
+                    loaded += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return loaded
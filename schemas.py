@@ -1,6 +1,6 @@
 from pydantic import BaseModel, EmailStr, Field
 from typing import Optional, List
-from datetime import datetime
+from datetime import date, datetime
 from enum import Enum
 from decimal import Decimal 
 
@@ -87,6 +87,19 @@ class AccountDelete(BaseModel):
     deleted: bool
     message: str
 
+class CurrencyBalance(BaseModel):
+    currency: Currency
+    balance: Decimal
+    accounts: int
+
+class UserBalances(BaseModel):
+    user_id: int
+    balances: List[CurrencyBalance]
+    # Set when a target currency is requested
+    currency: Optional[Currency] = None
+    total: Optional[Decimal] = None
+    rate_version: Optional[str] = None
+
 # Transaction Schemas
 
 class TransactionBase(BaseModel):
@@ -124,6 +137,34 @@ class Transaction(TransactionInDB):
 class TransactionList(BaseModel):
     transactions: list[Transaction]
 
+class TransactionSearchResult(Transaction):
+    rank: float
+
+class TransactionSearchResults(BaseModel):
+    transactions: list[TransactionSearchResult]
+
+# Spending Schemas
+
+class SpendingGroup(str, Enum):
+    TRANSACTION_TYPE = "transaction_type"
+    RECIPIENT = "recipient_account_id"
+
+class SpendingRow(BaseModel):
+    month: date
+    # One of the two, depending on group_by
+    transaction_type: Optional[str] = None
+    recipient_account_id: Optional[int] = None
+    currency: str
+    transaction_count: int
+    amount: Decimal
+
+class SpendingSummary(BaseModel):
+    user_id: int
+    group_by: SpendingGroup
+    start: date
+    end: Optional[date] = None
+    rows: List[SpendingRow]
+
 # Recipients Schemas
 
 class RelationshipType(str, Enum):
@@ -142,6 +183,8 @@ class RecipientBase(BaseModel):
 
 class RecipientCreate(RecipientBase):
     user_id: int
+    # Filled in from the BIC directory when left out
+    bank_name: Optional[str] = Field(None, min_length=1, max_length=100)
 
 class RecipientUpdate(BaseModel):
     name: Optional[str] = Field(None, min_length=1, max_length=100)
@@ -166,4 +209,65 @@ class RecipientList(BaseModel):
 
 class FavoriteToggleResponse(BaseModel):
     recipient_id: int
-    is_favorite: bool
\ No newline at end of file
+    is_favorite: bool
+
+class SwiftValidationRequest(BaseModel):
+    swift_codes: list[str] = Field(..., max_length=10000)
+
+class SwiftValidationResult(BaseModel):
+    swift_code: str
+    valid: bool
+    bank_name: Optional[str] = None
+    error: Optional[str] = None
+
+class SwiftValidationResponse(BaseModel):
+    results: list[SwiftValidationResult]
+
+# FX Schemas
+
+class FxRates(BaseModel):
+    version: str
+    base: Currency
+    as_of: Optional[datetime] = None
+    rates: dict[Currency, Decimal]
+
+class FxAmount(BaseModel):
+    amount: Decimal
+    currency: Currency
+
+class FxConvertRequest(BaseModel):
+    amounts: list[FxAmount] = Field(..., max_length=100000)
+    target: Currency
+    # Re-price against an earlier snapshot, while it is still retained
+    version: Optional[str] = None
+
+class FxConvertResponse(BaseModel):
+    version: str
+    target: Currency
+    amounts: list[Decimal]
+    total: Decimal
+
+# Subscription Schemas
+
+class SubscriptionAction(str, Enum):
+    SUBSCRIBE = "subscribe"
+    UNSUBSCRIBE = "unsubscribe"
+
+class SubscriptionRequest(BaseModel):
+    action: SubscriptionAction
+    accounts: List[int] = Field(default_factory=list, max_length=1000)
+    transactions: List[int] = Field(default_factory=list, max_length=1000)
+
+# Assistant Schemas
+
+class ChatRole(str, Enum):
+    USER = "user"
+    ASSISTANT = "assistant"
+
+class ChatMessage(BaseModel):
+    role: ChatRole
+    content: str = Field(..., min_length=1)
+
+class AssistantChatRequest(BaseModel):
+    user_id: int
+    messages: List[ChatMessage] = Field(..., min_length=1)
@@ -0,0 +1,75 @@
+# Production entry point. `python main.py` stays the single-process development
+# server; this launcher runs the API under uvicorn's process supervisor.
+#
+#   python server.py --workers 4 --max-requests 50000
+#
+# Every option can also be set through the environment (WEB_CONCURRENCY, PORT, ...).
+# Workers are started with the spawn method, so each one imports main.py itself and
+# opens its own DB pool from the app lifespan; nothing is shared across the fork.
+
+import argparse
+import importlib
+import os
+
+import uvicorn
+
+
+def default_workers():
+    return int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1))
+
+
+def server_options(args):
+    return dict(
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        loop="uvloop",
+        http="httptools",
+        backlog=args.backlog,
+        timeout_keep_alive=args.keep_alive,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        # A worker exits after this many requests and the supervisor starts a fresh
+        # one, which bounds memory growth from fragmentation or slow leaks. A single
+        # worker runs without a supervisor and would just exit, so it is never recycled.
+        limit_max_requests=(args.max_requests or None) if args.workers > 1 else None,
+        access_log=args.access_log,
+        proxy_headers=True,
+        # Subscription messages are a few hundred bytes at most; per-message deflate
+        # would hold compression buffers of about 100 KiB per idle WebSocket
+        ws_per_message_deflate=False,
+        log_level=args.log_level,
+    )
+
+
+def preload():
+    # Import the application once in the supervisor so a broken deploy fails before
+    # any worker is spawned, and the workers find warm bytecode caches.
+    importlib.import_module("main")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the banking API with multiple uvicorn workers")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=default_workers())
+    parser.add_argument("--backlog", type=int, default=int(os.getenv("BACKLOG", "2048")))
+    parser.add_argument("--keep-alive", type=int, default=int(os.getenv("KEEP_ALIVE", "75")),
+                        help="seconds to hold idle keep-alive connections; keep above the load balancer's idle timeout")
+    parser.add_argument("--graceful-timeout", type=int, default=int(os.getenv("GRACEFUL_TIMEOUT", "30")))
+    parser.add_argument("--max-requests", type=int, default=int(os.getenv("MAX_REQUESTS", "0")),
+                        help="recycle a worker after this many requests (0 disables recycling)")
+    parser.add_argument("--access-log", action="store_true", default=os.getenv("ACCESS_LOG") == "1")
+    parser.add_argument("--log-level", default=os.getenv("LOG_LEVEL", "info"))
+    parser.add_argument("--no-preload", dest="preload", action="store_false")
+    args = parser.parse_args(argv)
+    if args.max_requests and args.workers == 1:
+        print("Ignoring --max-requests: a single worker has no supervisor to restart it")
+
+    if args.preload:
+        preload()
+
+    uvicorn.run("main:app", **server_options(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+import argparse
+import sys
+from datetime import date, timedelta
+
+import storage
+
+# Maintenance for the spending rollups that back the analytics endpoints. New
+# transactions keep the rollups current by themselves; these commands load history
+# written before the rollups existed and verify the rollups against the raw
+# transactions.
+#
+#   python spending.py backfill --start 2022-01-01
+#   python spending.py check --start 2024-01-01
+#
+# Backfill rebuilds BACKFILL_BATCH_DAYS days at a time. Each batch briefly holds off
+# transaction writes, so batches stay short on a live database.
+
+BACKFILL_BATCH_DAYS = 7
+
+
+def backfill(start, end=None, batch_days=BACKFILL_BATCH_DAYS, progress=None):
+    # Rebuilds the rollups for days in [start, end); returns the rollup rows written
+    end = end or date.today() + timedelta(days=1)
+    rows_written = 0
+    while start < end:
+        batch_end = min(start + timedelta(days=batch_days), end)
+        rows = storage.rebuild_spending(start, batch_end)
+        rows_written += rows
+        if progress is not None:
+            progress(start, batch_end, rows)
+        start = batch_end
+    return rows_written
+
+
+def check(start=None, end=None):
+    # Rollup rows that disagree with the transactions; empty when they are correct
+    return storage.diff_spending(start, end)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Spending rollup maintenance")
+    commands = parser.add_subparsers(dest="command", required=True)
+    backfill_parser = commands.add_parser("backfill", help="Rebuild the rollups from transfer.Transactions")
+    backfill_parser.add_argument("--start", type=date.fromisoformat, required=True)
+    backfill_parser.add_argument("--end", type=date.fromisoformat, help="First day not rebuilt, default tomorrow")
+    backfill_parser.add_argument("--batch-days", type=int, default=BACKFILL_BATCH_DAYS)
+    check_parser = commands.add_parser("check", help="Compare the rollups with transfer.Transactions")
+    check_parser.add_argument("--start", type=date.fromisoformat)
+    check_parser.add_argument("--end", type=date.fromisoformat)
+    args = parser.parse_args()
+
+    if args.command == "backfill":
+        rows = backfill(args.start, args.end, args.batch_days,
+                        progress=lambda start, end, rows: print(f"{start} .. {end}: {rows} rollup rows"))
+        print(f"Backfill done, {rows} rollup rows written")
+        return 0
+    differences = check(args.start, args.end)
+    for row in differences:
+        print(f"{row['day']} account {row['account_id']} {row['transaction_type']} -> {row['recipient_account_id']} "
+              f"{row['currency']}: rollup {row['rollup_count']}/{row['rollup_amount']}, "
+              f"actual {row['actual_count']}/{row['actual_amount']}")
+    print(f"{len(differences)} rollup rows differ")
+    return 1 if differences else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
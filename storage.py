@@ -0,0 +1,904 @@
+import os
+import re
+import threading
+from abc import ABC, abstractmethod, update_abstractmethods
+from datetime import datetime, timedelta
+from decimal import Decimal
+from enum import Enum
+
+# Storage backends for the users, accounts, transactions and recipients operations.
+# Every backend follows the conventions of database_operations: rows come back as
+# plain dicts, create_* returns the new id (or None on failure), update_* and
+# delete_* return the number of affected rows. Writes take an optional `changed`
+# list, which receives {"table", "operation", "id", "user_ids"} for every row written,
+# plus the row's CHANGE_FIELDS unless it was deleted.
+
+OPERATIONS = (
+    "create_user", "get_user", "list_users", "update_user", "delete_user",
+    "create_account", "get_account", "update_account", "delete_account", "list_accounts", "get_user_accounts",
+    "get_user_balances",
+    "create_transaction", "get_transaction", "update_transaction", "set_transaction_status", "delete_transaction",
+    "list_transactions",
+    "get_user_transactions", "search_transactions", "get_transactions_since",
+    "get_spending", "rebuild_spending", "diff_spending",
+    "create_recipient", "get_recipient", "update_recipient", "delete_recipient",
+    "get_all_recipients", "get_favorite_recipients", "toggle_favorite_recipient",
+    "claim_outbox", "ack_outbox", "retry_outbox",
+)
+
+USER_COLUMNS = ("username", "email", "password_hash", "first_name", "last_name", "phone_number", "is_verified")
+ACCOUNT_COLUMNS = ("user_id", "balance", "account_type", "currency")
+TRANSACTION_COLUMNS = ("sender_account_id", "recipient_account_id", "amount", "currency", "status", "transaction_type", "description")
+RECIPIENT_COLUMNS = ("user_id", "name", "account_info", "bank_name", "swift_code", "relationship", "is_favorite")
+
+# Spending rollups: outgoing transactions summed per sender account, day, transaction
+# type, recipient account and currency, kept up to date by the transaction writes.
+# Statuses below are not spending; must match database_operations.
+SPENDING_EXCLUDED_STATUSES = ("rejected", "failed", "cancelled")
+SPENDING_GROUPS = ("transaction_type", "recipient_account_id")
+
+# Row fields carried in change records; must match database_operations
+CHANGE_FIELDS = {
+    "accounts": ("balance", "currency"),
+    "transactions": ("sender_account_id", "recipient_account_id", "amount", "currency", "status", "created_at"),
+}
+
+# Outbox events as handed to the dispatcher
+OUTBOX_EVENT_COLUMNS = ("event_id", "aggregate_type", "aggregate_id", "operation", "payload", "created_at", "attempts")
+
+
+class Storage(ABC):
+    # Called from the app lifespan, after any fork, to acquire and release resources
+    def open(self):
+        pass
+
+    # Writes only append outbox events while a dispatcher delivers them; the app
+    # lifespan turns this on when OUTBOX_SINKS is set
+    @abstractmethod
+    def set_outbox(self, enabled):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def warm(self, connections):
+        return 0
+
+    def ping(self):
+        return True
+
+    @abstractmethod
+    def create_user(self, username, email, password_hash, first_name, last_name, phone_number, is_verified, changed=None):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_user(self, user_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def list_users(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    def update_user(self, user_id, changed=None, **kwargs):
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete_user(self, user_id, changed=None):
+        raise NotImplementedError
+
+    @abstractmethod
+    def create_account(self, user_id, balance, account_type, currency, changed=None):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_account(self, account_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def update_account(self, account_id, changed=None, **kwargs):
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete_account(self, account_id, changed=None):
+        raise NotImplementedError
+
+    @abstractmethod
+    def list_accounts(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_user_accounts(self, user_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_user_balances(self, user_id):
+        raise NotImplementedError
+
+    def create_transaction(self, sender_account_id, recipient_account_id, amount, currency, status, transaction_type, description,
+                           changed=None):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_transaction(self, transaction_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def update_transaction(self, transaction_id, changed=None, **kwargs):
+        raise NotImplementedError
+
+    @abstractmethod
+    def set_transaction_status(self, transaction_id, status, current_status, changed=None):
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete_transaction(self, transaction_id, changed=None):
+        raise NotImplementedError
+
+    @abstractmethod
+    def list_transactions(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_user_transactions(self, user_id, limit=None):
+        raise NotImplementedError
+
+    @abstractmethod
+    def search_transactions(self, query, user_id=None, account_id=None, start=None, end=None, limit=20):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_transactions_since(self, since):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_spending(self, user_id, start=None, end=None, group_by="transaction_type"):
+        raise NotImplementedError
+
+    @abstractmethod
+    def rebuild_spending(self, start=None, end=None):
+        raise NotImplementedError
+
+    @abstractmethod
+    def diff_spending(self, start=None, end=None):
+        raise NotImplementedError
+
+    @abstractmethod
+    def create_recipient(self, user_id, name, account_info, bank_name, swift_code, relationship, is_favorite, changed=None):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_recipient(self, recipient_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def update_recipient(self, recipient_id, changed=None, **kwargs):
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete_recipient(self, recipient_id, changed=None):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_all_recipients(self, user_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_favorite_recipients(self, user_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def toggle_favorite_recipient(self, recipient_id, changed=None):
+        raise NotImplementedError
+
+    @abstractmethod
+    def claim_outbox(self, limit, lease):
+        raise NotImplementedError
+
+    @abstractmethod
+    def ack_outbox(self, event_ids):
+        raise NotImplementedError
+
+    @abstractmethod
+    def retry_outbox(self, event_ids, error, delay, max_delay, max_attempts):
+        raise NotImplementedError
+
+
+class PostgresStorage(Storage):
+    def __init__(self):
+        # Imported here so processes running on the in-memory backend never load psycopg2
+        import database_operations
+        self._db = database_operations
+
+    def open(self):
+        self._db.get_pool()
+
+    def close(self):
+        self._db.close_pool()
+
+    def warm(self, connections):
+        return self._db.warm_pool(connections)
+
+    def ping(self):
+        return self._db.ping()
+
+    def set_outbox(self, enabled):
+        self._db.set_outbox(enabled)
+
+
+def _delegate(name):
+    def operation(self, *args, **kwargs):
+        return getattr(self._db, name)(*args, **kwargs)
+    operation.__name__ = name
+    return operation
+
+
+# Every operation is the database_operations function of the same name
+for _name in OPERATIONS:
+    setattr(PostgresStorage, _name, _delegate(_name))
+update_abstractmethods(PostgresStorage)
+
+
+def _plain(value):
+    # Enums arrive from the pydantic schemas; the database hands back their raw values
+    if isinstance(value, Enum):
+        return value.value
+    return value
+
+
+def _money(value):
+    return Decimal(str(value))
+
+
+def _words(text):
+    return re.findall(r"\w+", text.lower())
+
+
+def _spending_key(transaction):
+    # (day, transaction_type, recipient_account_id, currency) under the sender account
+    if transaction["status"] in SPENDING_EXCLUDED_STATUSES:
+        return None
+    return (transaction["created_at"].date(), transaction["transaction_type"], transaction["recipient_account_id"],
+            transaction["currency"])
+
+
+def _in_days(day, start, end):
+    return (start is None or day >= start) and (end is None or day < end)
+
+
+class InMemoryStorage(Storage):
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._next_id = {"users": 1, "accounts": 1, "transactions": 1, "recipients": 1}
+
+        self._users = {}
+        self._user_by_username = {}
+        self._user_by_email = {}
+
+        self._accounts = {}
+        self._accounts_by_user = {}
+
+        self._transactions = {}
+        self._transactions_by_account = {}
+        self._spending = {}  # sender account_id -> {spending key: [transaction_count, amount]}
+
+        self._recipients = {}
+        self._recipients_by_user = {}
+
+        self._next_event_id = 1
+        self._outbox_enabled = False
+        self._outbox = {}  # event_id -> event, oldest first
+        self._outbox_dead = []
+
+    def _new_id(self, table):
+        new_id = self._next_id[table]
+        self._next_id[table] = new_id + 1
+        return new_id
+
+    def _check_columns(self, table, kwargs, allowed):
+        for key in kwargs:
+            if key not in allowed:
+                raise ValueError(f"column \"{key}\" of relation \"{table}\" does not exist")
+
+    # Users
+
+    def create_user(self, username, email, password_hash, first_name, last_name, phone_number, is_verified, changed=None):
+        with self._lock:
+            if username in self._user_by_username or email in self._user_by_email:
+                print(f"User with username {username} or email {email} already exists")
+                return None
+            user_id = self._new_id("users")
+            now = datetime.now()
+            self._users[user_id] = {
+                "user_id": user_id,
+                "username": username,
+                "email": email,
+                "password_hash": password_hash,
+                "first_name": first_name,
+                "last_name": last_name,
+                "phone_number": phone_number,
+                "is_verified": is_verified,
+                "created_at": now,
+                "updated_at": now,
+            }
+            self._user_by_username[username] = user_id
+            self._user_by_email[email] = user_id
+            self._append_event("users", user_id, "create", self._users[user_id], changed)
+            return user_id
+
+    def get_user(self, user_id):
+        with self._lock:
+            user = self._users.get(user_id)
+            return dict(user) if user is not None else None
+
+    def list_users(self):
+        with self._lock:
+            return [dict(user) for user in self._users.values()]
+
+    def update_user(self, user_id, changed=None, **kwargs):
+        self._check_columns("users", kwargs, USER_COLUMNS)
+        with self._lock:
+            user = self._users.get(user_id)
+            if user is None:
+                return 0
+            username = kwargs.get("username", user["username"])
+            email = kwargs.get("email", user["email"])
+            if self._user_by_username.get(username, user_id) != user_id or self._user_by_email.get(email, user_id) != user_id:
+                raise ValueError("duplicate key value violates unique constraint on users")
+            del self._user_by_username[user["username"]]
+            del self._user_by_email[user["email"]]
+            user.update(kwargs)
+            user["updated_at"] = datetime.now()
+            self._user_by_username[username] = user_id
+            self._user_by_email[email] = user_id
+            self._append_event("users", user_id, "update", user, changed)
+            return 1
+
+    def delete_user(self, user_id, changed=None):
+        with self._lock:
+            user = self._users.pop(user_id, None)
+            if user is None:
+                return 0
+            for account_id in sorted(self._accounts_by_user.get(user_id, ())):
+                self._remove_account(account_id, changed)
+            for recipient_id in sorted(self._recipients_by_user.get(user_id, ())):
+                self._append_event("recipients", recipient_id, "delete", self._recipients[recipient_id], changed)
+                self._remove_recipient(recipient_id)
+            self._append_event("users", user_id, "delete", user, changed)
+            self._accounts_by_user.pop(user_id, None)
+            self._recipients_by_user.pop(user_id, None)
+            del self._user_by_username[user["username"]]
+            del self._user_by_email[user["email"]]
+            return 1
+
+    # Accounts
+
+    def create_account(self, user_id, balance, account_type, currency, changed=None):
+        with self._lock:
+            if user_id not in self._users:
+                raise ValueError(f"Key (user_id)=({user_id}) is not present in table \"users\"")
+            account_id = self._new_id("accounts")
+            self._accounts[account_id] = {
+                "account_id": account_id,
+                "user_id": user_id,
+                "balance": _money(balance),
+                "account_type": _plain(account_type),
+                "currency": _plain(currency),
+            }
+            self._accounts_by_user.setdefault(user_id, set()).add(account_id)
+            self._append_event("accounts", account_id, "create", self._accounts[account_id], changed)
+            return account_id
+
+    def get_account(self, account_id):
+        with self._lock:
+            account = self._accounts.get(account_id)
+            return dict(account) if account is not None else None
+
+    def update_account(self, account_id, changed=None, **kwargs):
+        self._check_columns("accounts", kwargs, ACCOUNT_COLUMNS)
+        with self._lock:
+            account = self._accounts.get(account_id)
+            if account is None:
+                return 0
+            owners = {account["user_id"]}
+            changes = {key: _plain(value) for key, value in kwargs.items()}
+            if "balance" in changes:
+                changes["balance"] = _money(changes["balance"])
+            if "user_id" in changes and changes["user_id"] != account["user_id"]:
+                if changes["user_id"] not in self._users:
+                    raise ValueError(f"Key (user_id)=({changes['user_id']}) is not present in table \"users\"")
+                self._accounts_by_user[account["user_id"]].discard(account_id)
+                self._accounts_by_user.setdefault(changes["user_id"], set()).add(account_id)
+            account.update(changes)
+            self._append_event("accounts", account_id, "update", account, changed, owners)
+            return 1
+
+    def _remove_account(self, account_id, changed=None):
+        # Transactions go along with the account, each with its own delete event
+        for transaction_id in sorted(self._transactions_by_account.get(account_id, ())):
+            self._append_event("transactions", transaction_id, "delete", self._transactions[transaction_id], changed)
+            self._remove_transaction(transaction_id)
+        self._append_event("accounts", account_id, "delete", self._accounts[account_id], changed)
+        self._transactions_by_account.pop(account_id, None)
+        self._spending.pop(account_id, None)
+        account = self._accounts.pop(account_id)
+        self._accounts_by_user[account["user_id"]].discard(account_id)
+
+    def delete_account(self, account_id, changed=None):
+        with self._lock:
+            if account_id not in self._accounts:
+                return 0
+            self._remove_account(account_id, changed)
+            return 1
+
+    def list_accounts(self):
+        with self._lock:
+            return [dict(account) for account in self._accounts.values()]
+
+    def get_user_accounts(self, user_id):
+        with self._lock:
+            return [dict(self._accounts[account_id]) for account_id in sorted(self._accounts_by_user.get(user_id, ()))]
+
+    def get_user_balances(self, user_id):
+        with self._lock:
+            totals = {}
+            for account_id in self._accounts_by_user.get(user_id, ()):
+                account = self._accounts[account_id]
+                row = totals.setdefault(account["currency"], {"currency": account["currency"], "balance": Decimal(0),
+                                                              "accounts": 0})
+                row["balance"] += account["balance"]
+                row["accounts"] += 1
+            return [totals[currency] for currency in sorted(totals)]
+
+    # Transactions
+
+    def create_transaction(self, sender_account_id, recipient_account_id, amount, currency, status, transaction_type, description,
+                           changed=None):
+        with self._lock:
+            for account_id in (sender_account_id, recipient_account_id):
+                if account_id not in self._accounts:
+                    print(f"Error creating transaction: account {account_id} does not exist")
+                    return None
+            transaction_id = self._new_id("transactions")
+            now = datetime.now()
+            self._transactions[transaction_id] = {
+                "transaction_id": transaction_id,
+                "sender_account_id": sender_account_id,
+                "recipient_account_id": recipient_account_id,
+                "amount": _money(amount),
+                "currency": _plain(currency),
+                "status": status,
+                "transaction_type": transaction_type,
+                "description": description,
+                "created_at": now,
+                "updated_at": now,
+            }
+            self._index_transaction(transaction_id, sender_account_id, recipient_account_id)
+            self._count_spending(self._transactions[transaction_id], 1)
+            self._append_event("transactions", transaction_id, "create", self._transactions[transaction_id], changed)
+            return transaction_id
+
+    def _index_transaction(self, transaction_id, sender_account_id, recipient_account_id):
+        self._transactions_by_account.setdefault(sender_account_id, set()).add(transaction_id)
+        self._transactions_by_account.setdefault(recipient_account_id, set()).add(transaction_id)
+
+    def _unindex_transaction(self, transaction):
+        for account_id in (transaction["sender_account_id"], transaction["recipient_account_id"]):
+            self._transactions_by_account.get(account_id, set()).discard(transaction["transaction_id"])
+
+    def get_transaction(self, transaction_id):
+        with self._lock:
+            transaction = self._transactions.get(transaction_id)
+            return dict(transaction) if transaction is not None else None
+
+    def update_transaction(self, transaction_id, changed=None, **kwargs):
+        self._check_columns("transactions", kwargs, TRANSACTION_COLUMNS)
+        with self._lock:
+            transaction = self._transactions.get(transaction_id)
+            if transaction is None:
+                return 0
+            changes = {key: _plain(value) for key, value in kwargs.items()}
+            for key in ("sender_account_id", "recipient_account_id"):
+                if key in changes and changes[key] not in self._accounts:
+                    print(f"Error updating transaction: account {changes[key]} does not exist")
+                    return 0
+            if "amount" in changes:
+                changes["amount"] = _money(changes["amount"])
+            owners = self._owners("transactions", transaction)
+            self._unindex_transaction(transaction)
+            self._count_spending(transaction, -1)
+            transaction.update(changes)
+            transaction["updated_at"] = datetime.now()
+            self._index_transaction(transaction_id, transaction["sender_account_id"], transaction["recipient_account_id"])
+            self._count_spending(transaction, 1)
+            self._append_event("transactions", transaction_id, "update", transaction, changed, owners)
+            return 1
+
+    def set_transaction_status(self, transaction_id, status, current_status, changed=None):
+        with self._lock:
+            transaction = self._transactions.get(transaction_id)
+            if transaction is None or transaction["status"] != current_status:
+                return 0
+            return self.update_transaction(transaction_id, changed=changed, status=status)
+
+    def _remove_transaction(self, transaction_id):
+        transaction = self._transactions.pop(transaction_id)
+        self._unindex_transaction(transaction)
+        self._count_spending(transaction, -1)
+
+    def delete_transaction(self, transaction_id, changed=None):
+        with self._lock:
+            if transaction_id not in self._transactions:
+                return 0
+            self._append_event("transactions", transaction_id, "delete", self._transactions[transaction_id], changed)
+            self._remove_transaction(transaction_id)
+            return 1
+
+    def list_transactions(self):
+        with self._lock:
+            return [dict(transaction) for transaction in self._transactions.values()]
+
+    def get_user_transactions(self, user_id, limit=None):
+        with self._lock:
+            transaction_ids = set()
+            for account_id in self._accounts_by_user.get(user_id, ()):
+                transaction_ids.update(self._transactions_by_account.get(account_id, ()))
+            transactions = sorted((self._transactions[transaction_id] for transaction_id in transaction_ids),
+                                  key=lambda t: (t["created_at"], t["transaction_id"]), reverse=True)
+            return [dict(transaction) for transaction in transactions[:limit]]
+
+    def search_transactions(self, query, user_id=None, account_id=None, start=None, end=None, limit=20):
+        # Approximates the Postgres search without stemming or typo tolerance: every query
+        # word has to appear in the description, whole or inside a word, and whole-word
+        # matches rank higher
+        terms = _words(query or "")
+        if not terms:
+            return []
+        with self._lock:
+            if user_id is not None or account_id is not None:
+                account_ids = set(self._accounts_by_user.get(user_id, ())) if user_id is not None else None
+                if account_id is not None:
+                    account_ids = {account_id} if account_ids is None else account_ids & {account_id}
+                transaction_ids = set()
+                for scoped_id in account_ids:
+                    transaction_ids.update(self._transactions_by_account.get(scoped_id, ()))
+                candidates = [self._transactions[transaction_id] for transaction_id in transaction_ids]
+            else:
+                candidates = list(self._transactions.values())
+            results = []
+            for transaction in candidates:
+                if (start is not None and transaction["created_at"] < start) or \
+                        (end is not None and transaction["created_at"] >= end):
+                    continue
+                description = (transaction["description"] or "").lower()
+                if not all(term in description for term in terms):
+                    continue
+                words = set(_words(description))
+                results.append(dict(transaction, rank=sum(term in words for term in terms) / len(terms)))
+            results.sort(key=lambda t: (t["rank"], t["created_at"], t["transaction_id"]), reverse=True)
+            return results[:limit]
+
+    def get_transactions_since(self, since):
+        with self._lock:
+            transactions = [dict(t) for t in self._transactions.values() if t["created_at"] >= since]
+        transactions.sort(key=lambda t: (t["created_at"], t["transaction_id"]))
+        return transactions
+
+    # Spending rollups
+
+    def _count_spending(self, transaction, sign):
+        key = _spending_key(transaction)
+        if key is None:
+            return
+        rollups = self._spending.setdefault(transaction["sender_account_id"], {})
+        row = rollups.setdefault(key, [0, Decimal(0)])
+        row[0] += sign
+        row[1] += sign * transaction["amount"]
+        if row[0] == 0:
+            del rollups[key]
+
+    def _actual_spending(self, start, end):
+        # The rollups as they should be, computed from the transactions
+        spending = {}
+        for transaction in self._transactions.values():
+            key = _spending_key(transaction)
+            if key is None or not _in_days(key[0], start, end):
+                continue
+            row = spending.setdefault(transaction["sender_account_id"], {}).setdefault(key, [0, Decimal(0)])
+            row[0] += 1
+            row[1] += transaction["amount"]
+        return spending
+
+    def get_spending(self, user_id, start=None, end=None, group_by="transaction_type"):
+        if group_by not in SPENDING_GROUPS:
+            raise ValueError(f"Cannot group spending by {group_by}")
+        position = 1 if group_by == "transaction_type" else 2
+        with self._lock:
+            totals = {}
+            for account_id in self._accounts_by_user.get(user_id, ()):
+                for key, (count, amount) in self._spending.get(account_id, {}).items():
+                    if not _in_days(key[0], start, end):
+                        continue
+                    row = totals.setdefault((key[0].replace(day=1), key[position], key[3]), [0, Decimal(0)])
+                    row[0] += count
+                    row[1] += amount
+        rows = [{"month": month, group_by: group, "currency": currency, "transaction_count": count, "amount": amount}
+                for (month, group, currency), (count, amount) in totals.items()]
+        rows.sort(key=lambda row: (row["month"], -row["amount"], str(row[group_by])))
+        return rows
+
+    def rebuild_spending(self, start=None, end=None):
+        with self._lock:
+            for rollups in self._spending.values():
+                for key in [key for key in rollups if _in_days(key[0], start, end)]:
+                    del rollups[key]
+            rows_written = 0
+            for account_id, rollups in self._actual_spending(start, end).items():
+                self._spending.setdefault(account_id, {}).update(rollups)
+                rows_written += len(rollups)
+            return rows_written
+
+    def diff_spending(self, start=None, end=None):
+        with self._lock:
+            actual = self._actual_spending(start, end)
+            differences = []
+            for account_id in set(actual) | set(self._spending):
+                rollups = {key: row for key, row in self._spending.get(account_id, {}).items()
+                           if _in_days(key[0], start, end)}
+                expected = actual.get(account_id, {})
+                for key in set(rollups) | set(expected):
+                    rollup, row = rollups.get(key, [None, None]), expected.get(key, [None, None])
+                    if rollup != row:
+                        day, transaction_type, recipient_account_id, currency = key
+                        differences.append({
+                            "account_id": account_id, "day": day, "transaction_type": transaction_type,
+                            "recipient_account_id": recipient_account_id, "currency": currency,
+                            "rollup_count": rollup[0], "rollup_amount": rollup[1],
+                            "actual_count": row[0], "actual_amount": row[1]})
+        differences.sort(key=lambda row: (row["day"], row["account_id"]))
+        return differences
+
+    # Recipients
+
+    def create_recipient(self, user_id, name, account_info, bank_name, swift_code, relationship, is_favorite, changed=None):
+        with self._lock:
+            if user_id not in self._users:
+                print(f"Error creating recipient: user {user_id} does not exist")
+                return None
+            recipient_id = self._new_id("recipients")
+            self._recipients[recipient_id] = {
+                "recipient_id": recipient_id,
+                "user_id": user_id,
+                "name": name,
+                "account_info": account_info,
+                "bank_name": bank_name,
+                "swift_code": swift_code,
+                "relationship": _plain(relationship),
+                "is_favorite": is_favorite,
+            }
+            self._recipients_by_user.setdefault(user_id, set()).add(recipient_id)
+            self._append_event("recipients", recipient_id, "create", self._recipients[recipient_id], changed)
+            return recipient_id
+
+    def get_recipient(self, recipient_id):
+        with self._lock:
+            recipient = self._recipients.get(recipient_id)
+            return dict(recipient) if recipient is not None else None
+
+    def update_recipient(self, recipient_id, changed=None, **kwargs):
+        self._check_columns("recipients", kwargs, RECIPIENT_COLUMNS)
+        with self._lock:
+            recipient = self._recipients.get(recipient_id)
+            if recipient is None:
+                return 0
+            owners = {recipient["user_id"]}
+            changes = {key: _plain(value) for key, value in kwargs.items()}
+            if "user_id" in changes and changes["user_id"] != recipient["user_id"]:
+                if changes["user_id"] not in self._users:
+                    print(f"Error updating recipient: user {changes['user_id']} does not exist")
+                    return 0
+                self._recipients_by_user[recipient["user_id"]].discard(recipient_id)
+                self._recipients_by_user.setdefault(changes["user_id"], set()).add(recipient_id)
+            recipient.update(changes)
+            self._append_event("recipients", recipient_id, "update", recipient, changed, owners)
+            return 1
+
+    def _remove_recipient(self, recipient_id):
+        recipient = self._recipients.pop(recipient_id)
+        self._recipients_by_user[recipient["user_id"]].discard(recipient_id)
+
+    def delete_recipient(self, recipient_id, changed=None):
+        with self._lock:
+            if recipient_id not in self._recipients:
+                return 0
+            self._append_event("recipients", recipient_id, "delete", self._recipients[recipient_id], changed)
+            self._remove_recipient(recipient_id)
+            return 1
+
+    def get_all_recipients(self, user_id):
+        with self._lock:
+            return [dict(self._recipients[recipient_id]) for recipient_id in sorted(self._recipients_by_user.get(user_id, ()))]
+
+    def get_favorite_recipients(self, user_id):
+        with self._lock:
+            return [
+                dict(self._recipients[recipient_id])
+                for recipient_id in sorted(self._recipients_by_user.get(user_id, ()))
+                if self._recipients[recipient_id]["is_favorite"]
+            ]
+
+    def toggle_favorite_recipient(self, recipient_id, changed=None):
+        with self._lock:
+            recipient = self._recipients.get(recipient_id)
+            if recipient is None:
+                return None
+            recipient["is_favorite"] = not recipient["is_favorite"]
+            self._append_event("recipients", recipient_id, "update", recipient, changed)
+            return recipient["is_favorite"]
+
+    # Outbox: every write above appends an event under the same lock, like the database
+    # backend does in the same transaction
+
+    def _owners(self, aggregate_type, row):
+        if aggregate_type == "transactions":
+            return {self._accounts[account_id]["user_id"]
+                    for account_id in (row["sender_account_id"], row["recipient_account_id"])
+                    if account_id in self._accounts}
+        return {row["user_id"]}
+
+    def _append_event(self, aggregate_type, aggregate_id, operation, row, changed=None, owners=()):
+        if changed is not None:
+            change = {"table": aggregate_type, "operation": operation, "id": aggregate_id,
+                      "user_ids": sorted(self._owners(aggregate_type, row) | set(owners))}
+            if operation != "delete":
+                change.update((field, row[field]) for field in CHANGE_FIELDS.get(aggregate_type, ()))
+            changed.append(change)
+        if not self._outbox_enabled:
+            return
+        event_id = self._next_event_id
+        self._next_event_id += 1
+        now = datetime.now()
+        payload = {key: value for key, value in row.items() if key != "password_hash"}
+        self._outbox[event_id] = {
+            "event_id": event_id,
+            "aggregate_type": aggregate_type,
+            "aggregate_id": aggregate_id,
+            "operation": operation,
+            "payload": payload,
+            "created_at": now,
+            "available_at": now,
+            "attempts": 0,
+            "last_error": None,
+        }
+
+    def set_outbox(self, enabled):
+        self._outbox_enabled = enabled
+
+    def claim_outbox(self, limit, lease):
+        with self._lock:
+            now = datetime.now()
+            seen = set()
+            claimed_aggregates = set()
+            claimed = []
+            for event in self._outbox.values():
+                aggregate = (event["aggregate_type"], event["aggregate_id"])
+                if aggregate not in seen:
+                    seen.add(aggregate)
+                    if event["available_at"] <= now and len(claimed_aggregates) < limit:
+                        claimed_aggregates.add(aggregate)
+                if aggregate in claimed_aggregates:
+                    claimed.append(event)
+                    if len(claimed) == limit:
+                        break
+            for event in claimed:
+                event["available_at"] = now + timedelta(seconds=lease)
+            return [{key: event[key] for key in OUTBOX_EVENT_COLUMNS} for event in claimed]
+
+    def ack_outbox(self, event_ids):
+        with self._lock:
+            return sum(self._outbox.pop(event_id, None) is not None for event_id in event_ids)
+
+    def retry_outbox(self, event_ids, error, delay, max_delay, max_attempts):
+        with self._lock:
+            now = datetime.now()
+            dead = 0
+            for event_id in event_ids:
+                event = self._outbox.get(event_id)
+                if event is None:
+                    continue
+                event["available_at"] = now + timedelta(seconds=min(delay * 2 ** event["attempts"], max_delay))
+                event["attempts"] += 1
+                event["last_error"] = error
+                if event["attempts"] >= max_attempts:
+                    self._outbox_dead.append(dict(self._outbox.pop(event_id), dead_at=now))
+                    dead += 1
+            return dead
+
+
+# Active backend, selected with BANKING_STORAGE=postgres|memory. The module itself
+# exposes every operation, so `import storage as db_ops` is a drop-in replacement
+# for `import database_operations as db_ops`.
+
+_storage = None
+
+
+def create_storage(kind):
+    if kind == "postgres":
+        return PostgresStorage()
+    if kind == "memory":
+        return InMemoryStorage()
+    raise ValueError(f"Unknown storage backend: {kind}")
+
+
+def get_storage():
+    global _storage
+    if _storage is None:
+        _storage = create_storage(os.getenv("BANKING_STORAGE", "postgres"))
+    return _storage
+
+
+def set_storage(storage):
+    global _storage
+    _storage = storage
+
+
+def __getattr__(name):
+    if name in OPERATIONS:
+        return getattr(get_storage(), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# Change notifications. Writes made through this module are reported to subscribed
+# listeners with the change records of the backend (see `changed` above), where user_ids
+# are the users whose data changed. Listeners run synchronously in the writing thread
+# and only see writes made by this process; on Postgres, realtime.ChangeListener brings
+# in the writes of other processes.
+
+WRITE_OPERATIONS = (
+    "create_user", "update_user", "delete_user",
+    "create_account", "update_account", "delete_account",
+    "create_transaction", "update_transaction", "set_transaction_status", "delete_transaction",
+    "create_recipient", "update_recipient", "delete_recipient", "toggle_favorite_recipient",
+)
+
+_listeners = []
+
+
+def subscribe(listener):
+    _listeners.append(listener)
+
+
+def unsubscribe(listener):
+    if listener in _listeners:
+        _listeners.remove(listener)
+
+
+def _succeeded(name, result):
+    if name == "toggle_favorite_recipient":
+        return result is not None
+    return result is not None and result != 0
+
+
+def _make_write(name):
+    def write(*args, **kwargs):
+        method = getattr(get_storage(), name)
+        if not _listeners:
+            return method(*args, **kwargs)
+        changed = []
+        result = method(*args, changed=changed, **kwargs)
+        if not _succeeded(name, result):
+            return result
+        for change in changed:
+            for listener in list(_listeners):
+                try:
+                    listener(change)
+                except Exception as e:
+                    print(f"Change listener failed for {name}: {e}")
+        return result
+
+    write.__name__ = name
+    return write
+
+
+for _name in WRITE_OPERATIONS:
+    globals()[_name] = _make_write(_name)
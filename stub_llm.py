@@ -0,0 +1,267 @@
+# Local stand-in for the Anthropic Messages API, used by tests and benchmarks so the
+# assistant can be exercised without network access or API cost.
+#
+#   python stub_llm.py --port 8100 --latency-ms 300
+#   ANTHROPIC_BASE_URL=http://127.0.0.1:8100 ANTHROPIC_API_KEY=stub python agent.py
+#
+# The stub answers POST /v1/messages in the real response shape. When tools are
+# offered it requests them based on keywords in the latest user message, and once the
+# tool results come back it answers with a short text that quotes them.
+
+import argparse
+import asyncio
+import hashlib
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# (pattern in the user's message, tool calls to request)
+KEYWORD_TOOLS = [
+    (r"\boverview\b", ["get_user_profile", "list_accounts", "list_recipients", "list_favorite_recipients"]),
+    (r"\bbalances?\b", ["list_accounts"]),
+    (r"\btransactions?\b", ["list_recent_transactions"]),
+    (r"\bfavou?rites?\b", ["list_favorite_recipients"]),
+    (r"\brecipients?\b", ["list_recipients"]),
+    (r"\bprofile\b", ["get_user_profile"]),
+]
+ACCOUNT_PATTERN = re.compile(r"\baccount #?(\d+)\b", re.IGNORECASE)
+ERROR_TYPES = {429: "rate_limit_error", 500: "api_error", 503: "api_error", 529: "overloaded_error"}
+
+_ids = itertools.count(1)
+
+
+def estimate_tokens(value):
+    return max(1, len(json.dumps(value)) // 4)
+
+
+def message_text(message):
+    content = message["content"]
+    if isinstance(content, str):
+        return content
+    return " ".join(block.get("text", "") for block in content if block.get("type") == "text")
+
+
+def has_tool_results(message):
+    content = message["content"]
+    return isinstance(content, list) and any(block.get("type") == "tool_result" for block in content)
+
+
+def plan_tool_calls(text, tool_names):
+    calls = []
+    for pattern, names in KEYWORD_TOOLS:
+        if re.search(pattern, text, re.IGNORECASE):
+            calls.extend((name, {}) for name in names if name in tool_names)
+            break
+    for account_id in ACCOUNT_PATTERN.findall(text):
+        if "get_account" in tool_names:
+            calls.append(("get_account", {"account_id": int(account_id)}))
+    return calls
+
+
+def default_responder(body):
+    # Returns (content blocks, stop_reason) for a request body
+    last = body["messages"][-1]
+    tool_names = {tool["name"] for tool in body.get("tools", ())}
+    if has_tool_results(last):
+        results = [block for block in last["content"] if block.get("type") == "tool_result"]
+        quoted = "; ".join(str(block.get("content", ""))[:200] for block in results)
+        return [{"type": "text", "text": f"Here is what I found: {quoted}"}], "end_turn"
+    calls = plan_tool_calls(message_text(last), tool_names)
+    if calls:
+        content = [
+            {"type": "tool_use", "id": f"toolu_stub_{next(_ids)}", "name": name, "input": arguments}
+            for name, arguments in calls
+        ]
+        return content, "tool_use"
+    return [{"type": "text", "text": f"Stub answer to: {message_text(last)[:200]}"}], "end_turn"
+
+
+def _prompt_blocks(body):
+    # The prompt in the order the API caches it: tools, system, then messages
+    system = body.get("system", "")
+    blocks = list(body.get("tools", []))
+    blocks.extend([{"type": "text", "text": system}] if isinstance(system, str) else system)
+    for message in body["messages"]:
+        content = message["content"]
+        blocks.extend([{"type": "text", "text": content}] if isinstance(content, str) else content)
+    return blocks
+
+
+def _input_usage(body, prompt_cache=None):
+    # Returns (usage, cache key or None). With prompt caching on, the blocks up to the
+    # last cache_control breakpoint are a cache write the first time and a read after.
+    total = estimate_tokens([body.get("system", ""), body.get("tools", []), body["messages"]])
+    usage = {"input_tokens": total}
+    if prompt_cache is None:
+        return usage, None
+    blocks = _prompt_blocks(body)
+    marked = [i for i, block in enumerate(blocks) if "cache_control" in block]
+    usage.update(cache_creation_input_tokens=0, cache_read_input_tokens=0)
+    if not marked:
+        return usage, None
+    prefix = blocks[:marked[-1] + 1]
+    key = hashlib.sha256(json.dumps([body["model"], prefix], sort_keys=True).encode()).hexdigest()
+    prefix_tokens = min(estimate_tokens(prefix), total - 1)
+    usage["input_tokens"] = total - prefix_tokens
+    usage["cache_read_input_tokens" if key in prompt_cache else "cache_creation_input_tokens"] = prefix_tokens
+    return usage, key
+
+
+def _chunks(text):
+    words = text.split(" ")
+    return [word if i == 0 else " " + word for i, word in enumerate(words)]
+
+
+def _sse(event):
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+
+def random_errors(rate, statuses=(429, 529)):
+    # An errors callable for create_app that fails the given share of requests
+    def errors():
+        return random.choice(statuses) if random.random() < rate else None
+    return errors
+
+
+def skewed_latency(*buckets):
+    # A latency callable for create_app from (share, seconds) pairs, e.g.
+    # skewed_latency((0.9, 0.05), (0.08, 0.5), (0.02, 3.0))
+    shares = [share for share, _ in buckets]
+    seconds = [value for _, value in buckets]
+    return lambda: random.choices(seconds, weights=shares)[0]
+
+
+def create_app(latency=0.0, responder=default_responder, token_delay=0.0, errors=None, retry_after=None,
+               input_token_delay=0.0, model_latency=None):
+    # latency is a number of seconds or a zero-argument callable returning one; it is
+    # the time to the first byte. token_delay is added per streamed text chunk, and
+    # non-streaming requests wait for the same total before answering. errors is a
+    # zero-argument callable returning an HTTP status to fail the request with, or None;
+    # failed 429 responses carry retry_after seconds when it is set. input_token_delay
+    # is prefill time per uncached input token; prompt cache reads cost a tenth of it.
+    # model_latency maps model names to a latency used instead of latency for them.
+    app = FastAPI()
+    app.state.prompt_cache = set()
+    app.state.requests = 0
+    app.state.models = Counter()
+    app.state.errors = 0
+    app.state.in_flight = 0
+    app.state.max_in_flight = 0
+    app.state.streams_completed = 0
+    app.state.streams_cancelled = 0
+
+    def build_message(body, content, stop_reason, usage):
+        return {
+            "id": f"msg_stub_{next(_ids)}",
+            "type": "message",
+            "role": "assistant",
+            "model": body["model"],
+            "content": content,
+            "stop_reason": stop_reason,
+            "stop_sequence": None,
+            "usage": dict(usage, output_tokens=estimate_tokens(content)),
+        }
+
+    async def stream_message(message):
+        completed = False
+        try:
+            usage = message["usage"]
+            start = dict(message, content=[], stop_reason=None, usage=dict(usage, output_tokens=1))
+            yield _sse({"type": "message_start", "message": start})
+            for index, block in enumerate(message["content"]):
+                if block["type"] == "text":
+                    yield _sse({"type": "content_block_start", "index": index, "content_block": {"type": "text", "text": ""}})
+                    for chunk in _chunks(block["text"]):
+                        await asyncio.sleep(token_delay)
+                        yield _sse({"type": "content_block_delta", "index": index,
+                                    "delta": {"type": "text_delta", "text": chunk}})
+                else:
+                    yield _sse({"type": "content_block_start", "index": index, "content_block": dict(block, input={})})
+                    yield _sse({"type": "content_block_delta", "index": index,
+                                "delta": {"type": "input_json_delta", "partial_json": json.dumps(block["input"])}})
+                yield _sse({"type": "content_block_stop", "index": index})
+            yield _sse({"type": "message_delta", "delta": {"stop_reason": message["stop_reason"], "stop_sequence": None},
+                        "usage": {"output_tokens": usage["output_tokens"]}})
+            yield _sse({"type": "message_stop"})
+            completed = True
+        finally:
+            if completed:
+                app.state.streams_completed += 1
+            else:
+                app.state.streams_cancelled += 1
+
+    @app.post("/v1/messages")
+    async def create_message(request: Request):
+        body = await request.json()
+        app.state.requests += 1
+        app.state.models[body["model"]] += 1
+        app.state.in_flight += 1
+        app.state.max_in_flight = max(app.state.max_in_flight, app.state.in_flight)
+        try:
+            caching = "prompt-caching" in request.headers.get("anthropic-beta", "")
+            usage, cache_key = _input_usage(body, app.state.prompt_cache if caching else None)
+            prefill = usage["input_tokens"] + usage.get("cache_creation_input_tokens", 0) \
+                + usage.get("cache_read_input_tokens", 0) / 10
+            delay = (model_latency or {}).get(body["model"], latency)
+            await asyncio.sleep((delay() if callable(delay) else delay) + input_token_delay * prefill)
+            status = errors() if errors else None
+            if status:
+                app.state.errors += 1
+                headers = {"retry-after": str(retry_after)} if status == 429 and retry_after is not None else None
+                error = {"type": ERROR_TYPES.get(status, "api_error"), "message": f"Injected {status}"}
+                return JSONResponse({"type": "error", "error": error}, status_code=status, headers=headers)
+            if cache_key is not None:
+                app.state.prompt_cache.add(cache_key)
+            content, stop_reason = responder(body)
+            message = build_message(body, content, stop_reason, usage)
+            if body.get("stream"):
+                return StreamingResponse(stream_message(message), media_type="text/event-stream")
+            chunks = sum(len(_chunks(block["text"])) for block in content if block["type"] == "text")
+            await asyncio.sleep(token_delay * chunks)
+            return message
+        finally:
+            app.state.in_flight -= 1
+
+    return app
+
+
+@contextmanager
+def serve_in_background(app, host="127.0.0.1", port=0, lifespan="off"):
+    # Runs an ASGI app with uvicorn on a background thread and yields its base URL
+    import uvicorn
+    server = uvicorn.Server(uvicorn.Config(app, host=host, port=port, log_level="warning", lifespan=lifespan))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError("stub server failed to start")
+        time.sleep(0.01)
+    bound_port = server.servers[0].sockets[0].getsockname()[1]
+    try:
+        yield f"http://{host}:{bound_port}"
+    finally:
+        server.should_exit = True
+        thread.join()
+
+
+if __name__ == "__main__":
+    import uvicorn
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--token-delay-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests failed with 429/529")
+    parser.add_argument("--retry-after", type=float, default=None, help="retry-after seconds sent with 429s")
+    args = parser.parse_args()
+    app = create_app(latency=args.latency_ms / 1000, token_delay=args.token_delay_ms / 1000,
+                     errors=random_errors(args.error_rate) if args.error_rate else None, retry_after=args.retry_after)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
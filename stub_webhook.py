@@ -0,0 +1,64 @@
+# Local stand-in for a downstream consumer of outbox events, used by tests and
+# benchmarks of the HTTP sink.
+#
+#   python stub_webhook.py --port 8200 --latency-ms 20 --error-rate 0.1
+#   OUTBOX_SINKS=http://127.0.0.1:8200/events uvicorn main:app
+#
+# POST /events takes {"events": [...]} and keeps them in app.state.events in arrival
+# order; GET /events returns them with the number of repeated deliveries.
+
+import argparse
+import asyncio
+import random
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+
+def random_errors(rate, rng=None):
+    rng = rng or random.Random()
+    return lambda: 503 if rng.random() < rate else None
+
+
+def create_app(latency=0.0, errors=None):
+    # errors is a zero-argument callable returning an HTTP status to fail the request
+    # with, or None
+    app = FastAPI()
+    app.state.events = []
+    app.state.event_ids = set()
+    app.state.repeats = 0
+    app.state.requests = 0
+
+    @app.post("/events")
+    async def receive(request: Request):
+        app.state.requests += 1
+        if latency:
+            await asyncio.sleep(latency)
+        status = errors() if errors else None
+        if status:
+            return JSONResponse({"error": "unavailable"}, status_code=status)
+        body = await request.json()
+        for event in body["events"]:
+            if event["event_id"] in app.state.event_ids:
+                app.state.repeats += 1
+            app.state.event_ids.add(event["event_id"])
+            app.state.events.append(event)
+        return {"received": len(body["events"])}
+
+    @app.get("/events")
+    async def received():
+        return {"events": app.state.events, "repeats": app.state.repeats, "requests": app.state.requests}
+
+    return app
+
+
+if __name__ == "__main__":
+    import uvicorn
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8200)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests failed with 503")
+    args = parser.parse_args()
+    app = create_app(latency=args.latency_ms / 1000, errors=random_errors(args.error_rate) if args.error_rate else None)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,140 @@
+import asyncio
+import json
+import threading
+import unittest
+from datetime import datetime, timedelta
+import httpx
+from anthropic import AsyncAnthropic
+import storage
+from storage import InMemoryStorage
+from assistant import Assistant, build_system_prompt, shape_result, tool_definitions
+import stub_llm
+
+
+def stub_client(app):
+    http_client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://stub")
+    return AsyncAnthropic(api_key="stub", base_url="http://stub", http_client=http_client, max_retries=0)
+
+
+class TestAssistant(unittest.TestCase):
+
+    def setUp(self):
+        self.db = InMemoryStorage()
+        storage.set_storage(self.db)
+        self.user_id = self.db.create_user("johndoe", "john@example.com", "secret_hash", "John", "Doe", "1234567890", True)
+        self.other_id = self.db.create_user("other", "other@example.com", "x", "Other", "User", "1", False)
+        self.account_id = self.db.create_account(self.user_id, 1500, "checking", "USD")
+        self.other_account_id = self.db.create_account(self.other_id, 99, "checking", "EUR")
+        self.db.create_recipient(self.user_id, "Jane Doe", "123456789", "Test Bank", "TESTSWIFT", "friend", True)
+        self.stub = stub_llm.create_app()
+
+    def tearDown(self):
+        storage.set_storage(None)
+
+    def respond(self, prompt, **kwargs):
+        async def run():
+            assistant = Assistant(client=stub_client(self.stub), **kwargs)
+            return await assistant.respond(self.user_id, [{"role": "user", "content": prompt}])
+        return asyncio.run(run())
+
+    def test_overview_runs_all_tools_in_one_round(self):
+        reply = self.respond("Give me an overview")
+        self.assertEqual(reply['tool_calls'], 4)
+        self.assertEqual(self.stub.state.requests, 2)
+        self.assertIn("1500", reply['text'])
+        self.assertIn("Jane Doe", reply['text'])
+        self.assertNotIn("secret_hash", json.dumps(reply['messages']))
+
+    def test_tool_results_follow_tool_uses(self):
+        reply = self.respond("What is my balance?")
+        roles = [message['role'] for message in reply['messages']]
+        self.assertEqual(roles, ["user", "assistant", "user", "assistant"])
+        tool_use = reply['messages'][1]['content'][0]
+        tool_result = reply['messages'][2]['content'][0]
+        self.assertEqual(tool_result['tool_use_id'], tool_use['id'])
+        self.assertFalse(tool_result['is_error'])
+
+    def test_accounts_of_other_users_are_hidden(self):
+        reply = self.respond(f"Show account {self.other_account_id}")
+        tool_result = reply['messages'][2]['content'][0]
+        self.assertTrue(tool_result['is_error'])
+        self.assertNotIn("99", tool_result['content'])
+
+    def test_create_transaction_requires_owned_sender(self):
+        assistant = Assistant()
+        content, is_error = assistant.call_tool(self.user_id, "create_transaction", {
+            "sender_account_id": self.other_account_id, "recipient_account_id": self.account_id, "amount": "10"})
+        self.assertTrue(is_error)
+        content, is_error = assistant.call_tool(self.user_id, "create_transaction", {
+            "sender_account_id": self.account_id, "recipient_account_id": self.other_account_id, "amount": "10"})
+        self.assertFalse(is_error)
+        self.assertEqual(json.loads(content)['status'], "pending")
+        self.assertEqual(json.loads(content)['currency'], "USD")
+
+    def test_search_transactions_is_scoped_to_the_customer(self):
+        self.db.create_transaction(self.account_id, self.other_account_id, 900, "USD", "completed", "transfer", "Rent March")
+        self.db.create_transaction(self.other_account_id, self.other_account_id, 5, "EUR", "completed", "transfer", "Rent")
+        assistant = Assistant()
+        content, is_error = assistant.call_tool(self.user_id, "search_transactions", {"query": "rent"})
+        self.assertFalse(is_error)
+        self.assertEqual([row['description'] for row in json.loads(content)], ["Rent March"])
+        today = datetime.now().date()
+        content, _ = assistant.call_tool(self.user_id, "search_transactions",
+                                         {"query": "rent", "start_date": str(today), "end_date": str(today)})
+        self.assertEqual(len(json.loads(content)), 1)
+        content, _ = assistant.call_tool(self.user_id, "search_transactions",
+                                         {"query": "rent", "end_date": str(today - timedelta(days=1))})
+        self.assertEqual(json.loads(content), [])
+        _, is_error = assistant.call_tool(self.user_id, "search_transactions", {"query": "rent", "start_date": "March"})
+        self.assertTrue(is_error)
+
+    def test_tools_run_concurrently(self):
+        barrier = threading.Barrier(2, timeout=2)
+        self.db.get_all_recipients = lambda user_id: (barrier.wait(), [])[1]
+        self.db.get_favorite_recipients = lambda user_id: (barrier.wait(), [])[1]
+        reply = self.respond("Give me an overview")
+        self.assertEqual(reply['tool_calls'], 4)
+        self.assertFalse(barrier.broken)
+
+    def test_shape_result_is_columnar(self):
+        shaped = json.loads(shape_result([{"a": 1, "b": None}, {"a": 2, "b": "x"}]))
+        self.assertEqual(shaped, {"columns": ["a", "b"], "rows": [[1, None], [2, "x"]]})
+        self.assertEqual(json.loads(shape_result({"a": 1, "b": None})), {"a": 1})
+
+    def test_tool_definitions(self):
+        names = [tool['name'] for tool in tool_definitions()]
+        self.assertIn("create_transaction", names)
+        schema = next(t for t in tool_definitions() if t['name'] == "create_transaction")['input_schema']
+        self.assertEqual(set(schema['required']), {"sender_account_id", "recipient_account_id", "amount"})
+
+    def test_prompt_prefix_is_cached_across_users(self):
+        bodies = []
+        self.stub = stub_llm.create_app(responder=lambda body: (bodies.append(body), stub_llm.default_responder(body))[1])
+        first = self.respond("What are your fees?")
+        self.assertGreater(first['usage']['cache_creation_input_tokens'], 0)
+        self.assertEqual(first['usage']['cache_read_input_tokens'], 0)
+
+        async def ask_as_other():
+            assistant = Assistant(client=stub_client(self.stub))
+            return await assistant.respond(self.other_id, [{"role": "user", "content": "Something else"}])
+        second = asyncio.run(ask_as_other())
+        self.assertEqual(second['usage']['cache_read_input_tokens'], first['usage']['cache_creation_input_tokens'])
+        self.assertEqual(second['usage']['cache_creation_input_tokens'], 0)
+        # Identical static prefix; only the block after the breakpoint names the customer
+        self.assertEqual(bodies[0]['system'][0], bodies[1]['system'][0])
+        self.assertEqual(bodies[0]['tools'], bodies[1]['tools'])
+        self.assertEqual(bodies[0]['system'][0]['cache_control'], {"type": "ephemeral"})
+        self.assertNotEqual(bodies[0]['system'][1], bodies[1]['system'][1])
+
+    def test_prompt_caching_can_be_disabled(self):
+        reply = self.respond("What are your fees?", prompt_caching=False)
+        self.assertEqual(reply['usage']['cache_creation_input_tokens'], 0)
+        self.assertEqual(reply['usage']['cache_read_input_tokens'], 0)
+
+    def test_system_prompt_is_deterministic(self):
+        self.assertEqual(build_system_prompt(), build_system_prompt())
+        self.assertIn("- Custom policy", build_system_prompt(["Custom policy"]))
+        self.assertEqual(Assistant().system_prompt, build_system_prompt())
+
+if __name__ == '__main__':
+    unittest.main()
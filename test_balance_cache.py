@@ -0,0 +1,79 @@
+import threading
+import unittest
+import realtime
+import storage
+from balance_cache import BalanceCache
+from storage import InMemoryStorage
+
+class TestBalanceCache(unittest.TestCase):
+
+    def setUp(self):
+        storage.set_storage(InMemoryStorage())
+        self.user_id = storage.create_user("johndoe", "john@example.com", "x", "John", "Doe", "1", True)
+        self.account = storage.create_account(self.user_id, 100, "checking", "USD")
+        self.cache = BalanceCache()
+        self.cache.attach()
+
+    def tearDown(self):
+        self.cache.detach()
+        storage.set_storage(None)
+
+    def balance(self):
+        return self.cache.get(self.user_id)[0]["balance"]
+
+    def test_cached_until_balances_change(self):
+        self.assertEqual(self.balance(), 100)
+        self.assertEqual(self.balance(), 100)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+        # Recipients and other users' accounts leave the entry alone
+        storage.create_recipient(self.user_id, "Jane", "111", "Test Bank", "TESTSWIFT", "friend", False)
+        other = storage.create_user("other", "other@example.com", "x", "O", "U", "1", True)
+        storage.create_account(other, 5, "checking", "USD")
+        self.assertEqual(self.balance(), 100)
+        self.assertEqual(self.cache.misses, 1)
+        storage.update_account(self.account, balance=250)
+        self.assertEqual(self.balance(), 250)
+        storage.create_account(self.user_id, 1, "savings", "USD")
+        self.assertEqual(self.balance(), 251)
+        self.assertEqual(self.cache.misses, 3)
+
+    def test_writes_of_other_workers(self):
+        self.assertEqual(self.balance(), 100)
+        # Written by another worker: only this process's listeners are bypassed
+        storage.get_storage().update_account(self.account, balance=40)
+        self.assertEqual(self.balance(), 100)
+        self.cache.on_change({"table": "accounts", "operation": "update", "id": self.account,
+                              "user_ids": [self.user_id], "balance": "40", "currency": "USD"})
+        self.assertEqual(self.balance(), 40)
+        storage.get_storage().update_account(self.account, balance=30)
+        self.cache.on_change(realtime.RESYNC)
+        self.assertEqual(self.balance(), 30)
+
+    def test_load_racing_a_write_is_not_kept(self):
+        loading, release = threading.Event(), threading.Event()
+        backend = storage.get_storage()
+        get_user_balances = backend.get_user_balances
+
+        def slow(user_id):
+            rows = get_user_balances(user_id)
+            loading.set()
+            release.wait(2)
+            return rows
+        backend.get_user_balances = slow
+        reader = threading.Thread(target=self.cache.get, args=(self.user_id,))
+        reader.start()
+        loading.wait(2)
+        storage.update_account(self.account, balance=300)
+        release.set()
+        reader.join()
+        backend.get_user_balances = get_user_balances
+        self.assertEqual(self.balance(), 300)
+
+    def test_expires_after_ttl(self):
+        self.cache.ttl = 0
+        self.balance()
+        self.balance()
+        self.assertEqual(self.cache.misses, 2)
+
+if __name__ == '__main__':
+    unittest.main()
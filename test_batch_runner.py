@@ -0,0 +1,85 @@
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+import httpx
+import storage
+from storage import InMemoryStorage
+from batch_runner import BatchRunner, completed_ids
+from llm_client import create_async_client
+import stub_llm
+
+class TestBatchRunner(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.input = os.path.join(self.directory.name, "requests.jsonl")
+        self.output = os.path.join(self.directory.name, "results.jsonl")
+
+    def tearDown(self):
+        self.directory.cleanup()
+        storage.set_storage(None)
+
+    def write_input(self, lines):
+        with open(self.input, "w") as f:
+            for line in lines:
+                f.write((line if isinstance(line, str) else json.dumps(line)) + "\n")
+
+    def run_batch(self, stub, **options):
+        async def run():
+            client = create_async_client(api_key="stub", base_url="http://stub", retry_base=0.01,
+                                         transport=httpx.ASGITransport(app=stub))
+            return await BatchRunner(client=client, **options).run(self.input, self.output)
+        return asyncio.run(run())
+
+    def results(self):
+        with open(self.output) as f:
+            return {record['id']: record for record in map(json.loads, f)}
+
+    def test_runs_every_request_with_bounded_concurrency(self):
+        self.write_input([{"id": i, "prompt": f"Explain statement {i}"} for i in range(20)])
+        stub = stub_llm.create_app(latency=0.01)
+        stats = self.run_batch(stub, concurrency=4)
+        self.assertEqual(stats['completed'], 20)
+        self.assertEqual(stub.state.max_in_flight, 4)
+        results = self.results()
+        self.assertEqual(results[7]['text'], "Stub answer to: Explain statement 7")
+        self.assertGreater(results[7]['usage']['input_tokens'], 0)
+
+    def test_resume_skips_completed_requests(self):
+        self.write_input([{"id": i, "prompt": f"q{i}"} for i in range(10)])
+        with open(self.output, "w") as f:
+            f.write(json.dumps({"id": 0, "text": "done"}) + "\n")
+            f.write(json.dumps({"id": 1, "error": "RateLimitError"}) + "\n")
+            f.write('{"id": 2, "te')  # cut short by a crash
+        stub = stub_llm.create_app()
+        stats = self.run_batch(stub)
+        self.assertEqual(stats['skipped'], 1)
+        self.assertEqual(stats['completed'], 9)
+        self.assertEqual(stub.state.requests, 9)
+        self.assertEqual(completed_ids(self.output), set(range(10)))
+
+    def test_bad_lines_and_exhausted_retries_are_recorded(self):
+        self.write_input(["not json", {"request_id": "no-prompt", "title": "x"}, {"id": "ok", "prompt": "hi"}])
+        stats = self.run_batch(stub_llm.create_app())
+        self.assertEqual(stats['failed'], 2)
+        results = self.results()
+        self.assertIn("Invalid JSON", results['line-1']['error'])
+        self.assertIn("Missing prompt", results['no-prompt']['error'])
+
+        self.write_input([{"id": "down", "prompt": "hi"}])
+        stub = stub_llm.create_app(errors=lambda: 529)
+        self.run_batch(stub, concurrency=1)
+        self.assertIn("InternalServerError", self.results()['down']['error'])
+
+    def test_user_requests_go_through_the_assistant(self):
+        storage.set_storage(InMemoryStorage())
+        user_id = storage.create_user("johndoe", "john@example.com", "x", "John", "Doe", "1", True)
+        storage.create_account(user_id, 1500, "checking", "USD")
+        self.write_input([{"id": "balance", "user_id": user_id, "prompt": "What is my balance?"}])
+        self.run_batch(stub_llm.create_app())
+        self.assertIn("1500", self.results()['balance']['text'])
+
+if __name__ == '__main__':
+    unittest.main()
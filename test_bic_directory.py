@@ -0,0 +1,117 @@
+import os
+import tempfile
+import unittest
+from fastapi.testclient import TestClient
+import bic_directory
+import storage
+from bic_directory import BicDirectory, normalize
+from storage import InMemoryStorage
+from main import app
+
+ENTRIES = [("DEUTDEFF", "Deutsche Bank"), ("DEUTDEFF500", "Deutsche Bank"), ("COBADEFFXXX", "Commerzbank"),
+           ("CHASUS33", "JPMorgan Chase"), ("not a bic", "Nobody")]
+
+
+class TestBicDirectory(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = BicDirectory.build(ENTRIES)
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_normalize(self):
+        self.assertEqual(normalize("deut de ff"), "DEUTDEFFXXX")
+        self.assertEqual(normalize("DEUTDEFF500"), "DEUTDEFF500")
+        self.assertIsNone(normalize("DEUT1EFF"))
+        self.assertIsNone(normalize("DEUTDEFF5"))
+
+    def test_lookup(self):
+        self.assertEqual(len(self.directory), 4)
+        self.assertEqual(self.directory.lookup("deutdeff"), {"bic": "DEUTDEFFXXX", "bank_name": "Deutsche Bank"})
+        self.assertEqual(self.directory.lookup("DEUTDEFFXXX")["bank_name"], "Deutsche Bank")
+        self.assertEqual(self.directory.lookup("DEUTDEFF500")["bank_name"], "Deutsche Bank")
+        self.assertEqual(self.directory.lookup("COBADEFF")["bank_name"], "Commerzbank")
+        self.assertIsNone(self.directory.lookup("DEUTDEFF501"))
+        self.assertIsNone(self.directory.lookup("TESTSWIFT"))
+
+    def test_every_code_is_found_in_a_large_directory(self):
+        letters = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+        codes = [f"BN{letters[i // 26 % 26]}{letters[i % 26]}DE{i // 676:02d}{i % 1000:03d}" for i in range(5000)]
+        directory = BicDirectory.build((code, f"Bank {i % 50}") for i, code in enumerate(codes))
+        for i, code in enumerate(codes):
+            self.assertEqual(directory.lookup(code), {"bic": code, "bank_name": f"Bank {i % 50}"})
+
+    def test_csv_and_compiled_file(self):
+        csv_path = os.path.join(self.tmp.name, "bic.csv")
+        with open(csv_path, "w") as f:
+            f.write("BIC,Bank_Name,City\nDEUTDEFF,Deutsche Bank,Frankfurt\nCHASUS33,JPMorgan Chase,New York\n")
+        from_csv = BicDirectory.open(csv_path)
+        self.assertEqual(from_csv.lookup("CHASUS33")["bank_name"], "JPMorgan Chase")
+        compiled_path = os.path.join(self.tmp.name, "bic.idx")
+        from_csv.save(compiled_path)
+        mapped = BicDirectory.open(compiled_path)
+        self.assertEqual(mapped.lookup("DEUTDEFF")["bank_name"], "Deutsche Bank")
+        self.assertEqual(mapped.nbytes(), from_csv.nbytes())
+        with open(csv_path, "w") as f:
+            f.write("code,name\nDEUTDEFF,Deutsche Bank\n")
+        with self.assertRaises(ValueError):
+            BicDirectory.open(csv_path)
+
+    def test_validate_many(self):
+        results = self.directory.validate_many(["COBADEFF", "ABCDEFGH", "xx"])
+        self.assertEqual([r["valid"] for r in results], [True, False, False])
+        self.assertEqual(results[0]["bank_name"], "Commerzbank")
+        self.assertEqual([r["error"] for r in results], [None, "Unknown BIC", "Malformed BIC"])
+
+
+class TestRecipientValidation(unittest.TestCase):
+
+    def setUp(self):
+        storage.set_storage(InMemoryStorage())
+        self.user_id = storage.create_user("johndoe", "john@example.com", "x", "John", "Doe", "1", True)
+        self.client = TestClient(app)
+        self.client.__enter__()
+        bic_directory.set_directory(BicDirectory.build(ENTRIES))
+
+    def tearDown(self):
+        bic_directory.set_directory(None)
+        self.client.__exit__(None, None, None)
+        storage.set_storage(None)
+
+    def create(self, **fields):
+        return self.client.post("/recipients/", json=dict({
+            "user_id": self.user_id, "name": "Jane", "account_info": "DE89370400440532013000",
+            "swift_code": "deutdeff", "relationship": "friend"}, **fields))
+
+    def test_bank_name_is_filled_from_the_directory(self):
+        response = self.create()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["bank_name"], "Deutsche Bank")
+        self.assertEqual(response.json()["swift_code"], "DEUTDEFF")
+        self.assertEqual(self.create(bank_name="My Bank").json()["bank_name"], "My Bank")
+
+    def test_unknown_codes_are_rejected(self):
+        response = self.create(swift_code="TESTSWIFT")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("Unknown SWIFT/BIC code", response.json()["detail"])
+        recipient_id = self.create().json()["recipient_id"]
+        self.assertEqual(self.client.put(f"/recipients/{recipient_id}", json={"swift_code": "ABCDEFGH"}).status_code,
+                         400)
+        response = self.client.put(f"/recipients/{recipient_id}", json={"swift_code": "COBADEFF"})
+        self.assertEqual(response.json()["bank_name"], "Commerzbank")
+
+    def test_bank_name_is_required_without_a_directory(self):
+        bic_directory.set_directory(None)
+        self.assertEqual(self.create().status_code, 400)
+        self.assertEqual(self.create(bank_name="Test Bank", swift_code="TESTSWIFT").status_code, 200)
+        self.assertEqual(self.client.post("/recipients/validate-swift", json={"swift_codes": []}).status_code, 503)
+
+    def test_bulk_validation(self):
+        response = self.client.post("/recipients/validate-swift", json={"swift_codes": ["CHASUS33", "ABCDEFGH"]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([r["valid"] for r in response.json()["results"]], [True, False])
+
+if __name__ == '__main__':
+    unittest.main()
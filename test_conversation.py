@@ -0,0 +1,89 @@
+import asyncio
+import json
+import unittest
+import storage
+from storage import InMemoryStorage
+from assistant import Assistant, shape_result
+from conversation import Conversation, count_tokens, truncate_text, truncate_tool_result
+from test_assistant import stub_client
+import stub_llm
+
+class TestTruncation(unittest.TestCase):
+
+    def test_truncate_text(self):
+        text = "word " * 200
+        self.assertEqual(truncate_text("short", 10), "short")
+        truncated = truncate_text(text, 10)
+        self.assertLess(len(truncated), len(text))
+        self.assertIn("[truncated", truncated)
+
+    def test_row_results_keep_valid_json(self):
+        rows = [{"recipient_id": i, "name": f"Recipient {i}", "bank_name": "Test Bank"} for i in range(100)]
+        content = shape_result(rows)
+        truncated = truncate_tool_result(content, 150)
+        value = json.loads(truncated)
+        self.assertLessEqual(count_tokens(truncated), 150)
+        self.assertEqual(len(value['rows']) + value['omitted_rows'], 100)
+        self.assertEqual(value['rows'][0][0], 0)
+
+    def test_small_results_are_unchanged(self):
+        content = shape_result({"balance": "10.00"})
+        self.assertEqual(truncate_tool_result(content, 150), content)
+
+
+class TestConversation(unittest.TestCase):
+
+    def setUp(self):
+        storage.set_storage(InMemoryStorage())
+        self.user_id = storage.create_user("johndoe", "john@example.com", "x", "John", "Doe", "1", True)
+        storage.create_account(self.user_id, 1500, "checking", "USD")
+        for i in range(60):
+            storage.create_recipient(self.user_id, f"Recipient {i}", f"{i:09d}", "Test Bank", "TESTSWIFT", "friend", False)
+        self.stub = stub_llm.create_app()
+
+    def tearDown(self):
+        storage.set_storage(None)
+
+    def chat(self, conversation, prompts):
+        async def run():
+            assistant = Assistant(client=stub_client(self.stub))
+            for prompt in prompts:
+                conversation.add_user_message(prompt)
+                sent = await conversation.messages()
+                conversation.record(await assistant.respond(self.user_id, sent))
+            return sent
+        return asyncio.run(run())
+
+    def test_tool_results_are_cut_down_before_the_model_reads_them(self):
+        assistant = Assistant(client=stub_client(self.stub), tool_result_tokens=100)
+        reply = asyncio.run(assistant.respond(self.user_id, [{"role": "user", "content": "List my recipients"}]))
+        # The messages of the reply are the ones the follow-up model call was sent
+        content = reply['messages'][2]['content'][0]['content']
+        self.assertIn("omitted_rows", content)
+        self.assertLessEqual(count_tokens(content), 100)
+
+    def test_finished_tool_results_are_truncated(self):
+        conversation = Conversation(tool_result_tokens=100)
+        sent = self.chat(conversation, ["List my recipients", "Thanks"])
+        tool_result = sent[2]['content'][0]
+        self.assertIn("omitted_rows", tool_result['content'])
+        self.assertLess(conversation.stats[1]['sent_tokens'], conversation.stats[1]['full_tokens'])
+
+    def test_old_turns_move_into_summary(self):
+        conversation = Conversation(max_turns=2)
+        sent = self.chat(conversation, ["What is my balance?", "Show my profile", "Hello there"])
+        self.assertEqual(len(conversation.turns), 2)
+        self.assertIn("list_accounts", conversation.summary)
+        first = sent[0]['content']
+        self.assertTrue(first[0]['text'].startswith("Summary of the conversation so far"))
+        self.assertEqual(first[1]['text'], "Show my profile")
+        self.assertEqual([message['role'] for message in sent][-1], "user")
+
+    def test_window_stays_within_budget(self):
+        conversation = Conversation(budget=600, max_turns=20, tool_result_tokens=100)
+        self.chat(conversation, [f"Give me an overview {i}" for i in range(8)])
+        self.assertLessEqual(conversation.stats[-1]['sent_tokens'], 600 + conversation.summary_tokens + 20)
+        self.assertGreater(conversation.stats[-1]['full_tokens'], 3 * conversation.stats[-1]['sent_tokens'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+import asyncio
+import time
+import unittest
+from anthropic import AsyncAnthropic
+import storage
+from storage import InMemoryStorage
+from assistant import Assistant, CANNED_RESPONSE
+from deadlines import Deadline, DeadlineExceeded, hedged
+from response_cache import ResponseCache
+from test_assistant import stub_client
+import stub_llm
+
+def sequence(*values):
+    remaining = list(values)
+    return lambda: remaining.pop(0) if len(remaining) > 1 else remaining[0]
+
+
+class TestDeadlines(unittest.TestCase):
+
+    def test_deadline_run(self):
+        async def run():
+            deadline = Deadline(0.05)
+            self.assertEqual(await deadline.run(asyncio.sleep(0, result=1)), 1)
+            with self.assertRaises(DeadlineExceeded):
+                await deadline.run(asyncio.sleep(1))
+            with self.assertRaises(DeadlineExceeded):
+                await Deadline(1).run(asyncio.sleep(0), reserve=2)
+        asyncio.run(run())
+
+    def test_hedge_wins_and_loser_is_cancelled(self):
+        delays = sequence(1.0, 0.01)
+        cancelled = []
+
+        async def call():
+            try:
+                await asyncio.sleep(delays())
+                return "done"
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+
+        async def run():
+            start = time.perf_counter()
+            result = await hedged(call, 0.05)
+            await asyncio.sleep(0)
+            return result, time.perf_counter() - start
+        (result, started), elapsed = asyncio.run(run())
+        self.assertEqual((result, started), ("done", 2))
+        self.assertLess(elapsed, 0.5)
+        self.assertEqual(cancelled, [True])
+
+    def test_no_hedge_for_fast_calls(self):
+        async def call():
+            return "fast"
+        self.assertEqual(asyncio.run(hedged(call, 0.05)), ("fast", 1))
+
+
+class TestAssistantDeadlines(unittest.TestCase):
+
+    def setUp(self):
+        storage.set_storage(InMemoryStorage())
+        self.user_id = storage.create_user("johndoe", "john@example.com", "x", "John", "Doe", "1", True)
+
+    def tearDown(self):
+        storage.set_storage(None)
+
+    def respond(self, stub, prompt="What are your fees?", **options):
+        async def run():
+            assistant = Assistant(client=stub_client(stub), **options)
+            reply = await assistant.respond(self.user_id, [{"role": "user", "content": prompt}])
+            return assistant, reply
+        return asyncio.run(run())
+
+    def test_falls_back_to_smaller_model_with_shorter_answer(self):
+        bodies = []
+        stub = stub_llm.create_app(latency=sequence(1.0, 0.0),
+                                   responder=lambda body: (bodies.append(body), stub_llm.default_responder(body))[1])
+        assistant, reply = self.respond(stub, deadline=0.4, fallback_reserve=0.3, fallback_model="small-model")
+        self.assertEqual(reply['degraded'], "fallback")
+        self.assertIn("Stub answer", reply['text'])
+        self.assertEqual(bodies[-1]['model'], "small-model")
+        self.assertLessEqual(bodies[-1]['max_tokens'], 256)
+        self.assertEqual(assistant.calls['fallbacks'], 1)
+
+    def test_canned_answer_when_nothing_finishes(self):
+        cache = ResponseCache(path=None)
+        stub = stub_llm.create_app(latency=1.0)
+        start = time.perf_counter()
+        _, reply = self.respond(stub, deadline=0.2, fallback_reserve=0.1, cache=cache)
+        self.assertLess(time.perf_counter() - start, 0.5)
+        self.assertEqual(reply['degraded'], "canned")
+        self.assertEqual(reply['text'], CANNED_RESPONSE)
+        self.assertEqual(reply['messages'][-1]['role'], "assistant")
+        self.assertEqual(len(cache._entries), 0)
+
+    def test_slow_stream_is_truncated(self):
+        # Over a real socket: the ASGI test transport buffers whole responses
+        stub = stub_llm.create_app(token_delay=0.05)
+
+        async def run(url):
+            client = AsyncAnthropic(api_key="stub", base_url=url, max_retries=0)
+            assistant = Assistant(client=client, deadline=0.3)
+            return [event async for event in assistant.stream(self.user_id, [{"role": "user", "content": "a " * 100}])]
+        with stub_llm.serve_in_background(stub) as url:
+            events = asyncio.run(run(url))
+        reply = events[-1]['reply']
+        self.assertEqual(reply['degraded'], "truncated")
+        self.assertTrue(reply['text'].startswith("Stub answer"))
+        self.assertLess(len(reply['text']), 100)
+
+    def test_slow_calls_are_hedged(self):
+        stub = stub_llm.create_app(latency=sequence(1.0, 0.0))
+
+        async def run():
+            assistant = Assistant(client=stub_client(stub), hedge=True)
+            for _ in range(20):
+                assistant.latencies.record(0.01)
+            start = time.perf_counter()
+            reply = await assistant.respond(self.user_id, [{"role": "user", "content": "hi"}])
+            return assistant, reply, time.perf_counter() - start
+        assistant, reply, elapsed = asyncio.run(run())
+        self.assertIsNone(reply['degraded'])
+        self.assertEqual(assistant.calls['hedges'], 1)
+        self.assertEqual(stub.state.requests, 2)
+        self.assertLess(elapsed, 0.5)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,150 @@
+import time
+import unittest
+from decimal import Decimal
+from fastapi.testclient import TestClient
+import assistant
+import duplicates
+import storage
+from duplicates import DuplicateDetector, fingerprint
+from storage import InMemoryStorage
+from main import app
+
+
+class TestDuplicateDetector(unittest.TestCase):
+
+    def setUp(self):
+        storage.set_storage(InMemoryStorage())
+        self.user_id = storage.create_user("johndoe", "john@example.com", "x", "John", "Doe", "1", True)
+        self.a = storage.create_account(self.user_id, 10000, "checking", "USD")
+        self.b = storage.create_account(self.user_id, 10000, "checking", "USD")
+        self.detector = DuplicateDetector(window=60)
+        self.detector.attach()
+
+    def tearDown(self):
+        self.detector.detach()
+        storage.set_storage(None)
+
+    def create(self, amount=10, backend=storage):
+        return backend.create_transaction(self.a, self.b, amount, "USD", "pending", "transfer", None)
+
+    def test_fingerprint_normalizes_amounts(self):
+        self.assertEqual(fingerprint(1, 2, 10, "USD"), fingerprint(1, 2, Decimal("10.00"), "USD"))
+        self.assertNotEqual(fingerprint(1, 2, 10, "USD"), fingerprint(1, 2, 10, "EUR"))
+        self.assertNotEqual(fingerprint(1, 2, 10, "USD"), fingerprint(2, 1, 10, "USD"))
+
+    def test_repeat_within_window(self):
+        now = time.time()
+        self.assertEqual(self.detector.check(self.a, self.b, 10, "USD", now=now)["action"], "allow")
+        first = self.create()
+        result = self.detector.check(self.a, self.b, "10.00", "USD", now=now + 5)
+        self.assertEqual(result, {"action": "hold", "duplicate_of": first, "fingerprint": None})
+        self.assertEqual(self.detector.check(self.a, self.b, 11, "USD", now=now + 5)["action"], "allow")
+        # The repeat was seen at +5, so the window runs from there
+        self.assertEqual(self.detector.check(self.a, self.b, 10, "USD", now=now + 64)["duplicate_of"], first)
+        self.assertEqual(self.detector.check(self.a, self.b, 10, "USD", now=now + 200)["action"], "allow")
+
+    def test_transfers_are_recorded_from_change_records(self):
+        reads = []
+        backend = storage.get_storage()
+        get_transaction = backend.get_transaction
+        backend.get_transaction = lambda transaction_id: reads.append(transaction_id) or get_transaction(transaction_id)
+        first = self.create()
+        self.assertEqual(reads, [])
+        self.assertEqual(self.detector.check(self.a, self.b, 10, "USD")["duplicate_of"], first)
+
+    def test_release_after_failed_create(self):
+        result = self.detector.check(self.a, self.b, 10, "USD")
+        duplicates.set_detector(self.detector)
+        try:
+            duplicates.release(result)
+        finally:
+            duplicates.set_detector(None)
+        self.assertEqual(self.detector.check(self.a, self.b, 10, "USD")["action"], "allow")
+
+    def test_sync_and_rebuild(self):
+        first = self.create(backend=storage.get_storage())
+        self.assertEqual(self.detector.check(self.a, self.b, 25, "USD")["action"], "allow")
+        self.create(amount=25, backend=storage.get_storage())
+        self.detector.sync()
+        self.assertEqual(self.detector.check(self.a, self.b, 10, "USD")["duplicate_of"], first)
+        detector = DuplicateDetector(window=60, action="flag")
+        self.assertEqual(detector.rebuild(), 2)
+        self.assertEqual(detector.check(self.a, self.b, 10, "USD"), {"action": "flag", "duplicate_of": first,
+                                                                    "fingerprint": None})
+
+    def test_bounded(self):
+        detector = DuplicateDetector(window=60, max_entries=3)
+        for amount in range(5):
+            detector.check(self.a, self.b, amount, "USD")
+        self.assertEqual(detector.stats(), {"fingerprints": 3, "duplicates": 0, "evicted": 2})
+        self.assertEqual(detector.check(self.a, self.b, 0, "USD")["action"], "allow")
+        self.assertEqual(detector.check(self.a, self.b, 4, "USD")["action"], "hold")
+
+    def test_invalid_action(self):
+        with self.assertRaises(ValueError):
+            DuplicateDetector(action="block")
+
+
+class TestDuplicateTransfers(unittest.TestCase):
+
+    def setUp(self):
+        storage.set_storage(InMemoryStorage())
+        self.user_id = storage.create_user("johndoe", "john@example.com", "x", "John", "Doe", "1", True)
+        self.a = storage.create_account(self.user_id, 10000, "checking", "USD")
+        self.b = storage.create_account(self.user_id, 10000, "checking", "USD")
+        self.client = TestClient(app)
+        self.client.__enter__()
+
+    def tearDown(self):
+        self.client.__exit__(None, None, None)
+        storage.set_storage(None)
+
+    def post(self, amount):
+        return self.client.post("/transactions/", json={
+            "sender_account_id": self.a, "recipient_account_id": self.b, "amount": amount, "currency": "USD",
+            "status": "pending", "transaction_type": "transfer"})
+
+    def test_repeat_is_held_until_confirmed(self):
+        first = self.post("10")
+        self.assertEqual(first.json()["status"], "pending")
+        self.assertNotIn("X-Duplicate-Of", first.headers)
+        repeat = self.post("10.00")
+        self.assertEqual(repeat.json()["status"], duplicates.HOLD_STATUS)
+        self.assertEqual(repeat.headers["X-Duplicate-Of"], str(first.json()["transaction_id"]))
+        repeat_id = repeat.json()["transaction_id"]
+        confirmed = self.client.post(f"/transactions/{repeat_id}/confirm")
+        self.assertEqual(confirmed.json()["transaction_id"], repeat_id)
+        self.assertEqual(confirmed.json()["status"], "pending")
+        # The confirmed repeat is the held transaction itself, not a second one
+        transactions = self.client.get("/transactions/").json()["transactions"]
+        self.assertEqual(sorted((t["transaction_id"], t["status"]) for t in transactions),
+                         [(first.json()["transaction_id"], "pending"), (repeat_id, "pending")])
+        self.assertEqual(self.client.post(f"/transactions/{repeat_id}/confirm").status_code, 409)
+        self.assertEqual(self.client.post("/transactions/999/confirm").status_code, 404)
+
+    def test_cancel_held_repeat(self):
+        self.post("10")
+        repeat_id = self.post("10").json()["transaction_id"]
+        cancelled = self.client.post(f"/transactions/{repeat_id}/cancel")
+        self.assertEqual(cancelled.json()["status"], "cancelled")
+        self.assertEqual(self.client.post(f"/transactions/{repeat_id}/confirm").status_code, 409)
+        # Cancelled transfers are not counted as spending
+        self.assertEqual([row["transaction_count"] for row in storage.get_spending(self.user_id)], [1])
+
+    def test_assistant_holds_repeats(self):
+        args = {"sender_account_id": self.a, "recipient_account_id": self.b, "amount": 30}
+        first = assistant.create_transaction(self.user_id, **args)
+        repeat = assistant.create_transaction(self.user_id, **args)
+        self.assertEqual(repeat["status"], duplicates.HOLD_STATUS)
+        self.assertEqual(repeat["possible_duplicate_of"], first["transaction_id"])
+        other = storage.create_user("janedoe", "jane@example.com", "x", "Jane", "Doe", "2", True)
+        with self.assertRaises(assistant.ToolError):
+            assistant.confirm_transaction(other, repeat["transaction_id"])
+        confirmed = assistant.confirm_transaction(self.user_id, repeat["transaction_id"])
+        self.assertEqual(confirmed["status"], "pending")
+        with self.assertRaises(assistant.ToolError):
+            assistant.cancel_transaction(self.user_id, repeat["transaction_id"])
+        self.assertEqual(len(storage.list_transactions()), 2)
+
+if __name__ == '__main__':
+    unittest.main()
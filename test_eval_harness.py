@@ -0,0 +1,26 @@
+import asyncio
+import unittest
+from benchmarks import eval_harness
+
+class TestEvalHarness(unittest.TestCase):
+
+    def test_references_round_trip(self):
+        refs = {"account": [7, 9], "transaction": [], "recipient": [3]}
+        value = {"sender_account_id": 9, "recipient_id": 3, "amount": 9, "nested": [{"account_id": 7}]}
+        symbolic = eval_harness.symbolize(value, refs)
+        self.assertEqual(symbolic, {"sender_account_id": "$account:1", "recipient_id": "$recipient:0", "amount": 9,
+                                    "nested": [{"account_id": "$account:0"}]})
+        self.assertEqual(eval_harness.resolve(symbolic, refs), value)
+        self.assertEqual(eval_harness.resolve_text("Show account $account:1", refs), "Show account 9")
+
+    def test_corpus_replays_without_divergence(self):
+        corpus = eval_harness.read_jsonl(eval_harness.CORPUS_PATH)
+        turns, divergences, _ = asyncio.run(eval_harness.replay(corpus, 2, 4, 0.0))
+        summary = eval_harness.summarize(turns, divergences, 1.0)
+        self.assertEqual(summary["divergences"], 0)
+        self.assertEqual(summary["tool_errors"], 0)
+        self.assertEqual(summary["conversations"], 2 * len(corpus))
+        self.assertGreater(summary["routed_turns"], 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+import json
+import os
+import tempfile
+import unittest
+from decimal import Decimal
+from fastapi.testclient import TestClient
+import fx
+import storage
+from assistant import Assistant
+from fx import RateSnapshot, RateTable
+from storage import InMemoryStorage
+from main import app
+
+RATES = {"EUR": "0.9", "GBP": "0.8", "JPY": "150"}
+
+
+class TestRateSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.snapshot = RateSnapshot("USD", RATES, "2024-06-03T16:00:00")
+
+    def test_convert_rounds_to_target_exponent(self):
+        self.assertEqual(self.snapshot.convert("10", "USD", "EUR"), Decimal("9.00"))
+        self.assertEqual(self.snapshot.convert("1.23", "USD", "JPY"), Decimal("185"))  # 184.5 rounds up
+        self.assertEqual(self.snapshot.convert("100", "JPY", "USD"), Decimal("0.67"))
+        self.assertEqual(self.snapshot.convert("0.01", "EUR", "GBP"), Decimal("0.01"))
+        self.assertEqual(self.snapshot.convert("-1.23", "USD", "JPY"), Decimal("-185"))
+        self.assertEqual(self.snapshot.convert("5", "EUR", "EUR"), Decimal("5.00"))
+        with self.assertRaises(ValueError):
+            self.snapshot.convert("1", "USD", "CHF")
+
+    def test_convert_many_matches_one_at_a_time(self):
+        amounts = [Decimal(i) / 7 for i in range(1, 200)]
+        currencies = ["USD", "EUR", "GBP", "JPY"] * 50
+        batch = self.snapshot.convert_many(amounts, currencies[:len(amounts)], "GBP")
+        self.assertEqual(batch, [self.snapshot.convert(a, c, "GBP") for a, c in zip(amounts, currencies)])
+        self.assertEqual(self.snapshot.convert_many(["1", "2"], "USD", "JPY"), [Decimal("150"), Decimal("300")])
+
+    def test_total(self):
+        total = self.snapshot.total({"USD": Decimal("10"), "EUR": Decimal("9"), "JPY": Decimal("150")}, "USD")
+        self.assertEqual(total, Decimal("21.00"))
+
+    def test_version_depends_on_rates_only(self):
+        same = RateSnapshot("USD", {"EUR": "0.90", "GBP": "0.8", "JPY": "150.0"})
+        self.assertEqual(same.version, self.snapshot.version)
+        self.assertNotEqual(RateSnapshot("USD", dict(RATES, EUR="0.91")).version, self.snapshot.version)
+
+
+class TestRateTable(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "rates.json")
+        self.write(RATES)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, rates, mtime=None):
+        with open(self.path, "w") as f:
+            json.dump({"base": "USD", "rates": rates}, f)
+        if mtime is not None:
+            os.utime(self.path, (mtime, mtime))
+
+    def test_reloads_changed_file_and_keeps_old_snapshots(self):
+        table = RateTable(self.path, refresh_interval=0, kept=2)
+        first = table.current()
+        self.assertIs(table.current(), first)
+        self.write(dict(RATES, EUR="0.95"), mtime=os.stat(self.path).st_mtime + 10)
+        second = table.current()
+        self.assertEqual(second.rates["EUR"], Decimal("0.95"))
+        self.assertIs(table.snapshot(first.version), first)
+        self.write(dict(RATES, EUR="0.97"), mtime=os.stat(self.path).st_mtime + 10)
+        table.current()
+        self.assertIsNone(table.snapshot(first.version))
+        self.assertEqual(len(table.versions()), 2)
+
+    def test_bad_file_keeps_last_good_snapshot(self):
+        table = RateTable(self.path, refresh_interval=0)
+        first = table.current()
+        with open(self.path, "w") as f:
+            f.write("{")
+        os.utime(self.path, (os.stat(self.path).st_mtime + 10,) * 2)
+        self.assertIs(table.current(), first)
+
+    def test_defaults_without_a_file(self):
+        self.assertEqual(RateTable(None).current().base, "USD")
+
+
+class TestFxTransfers(unittest.TestCase):
+
+    def setUp(self):
+        storage.set_storage(InMemoryStorage())
+        self.user_id = storage.create_user("johndoe", "john@example.com", "x", "John", "Doe", "1", True)
+        self.usd = storage.create_account(self.user_id, 1000, "checking", "USD")
+        self.eur = storage.create_account(self.user_id, 1000, "savings", "EUR")
+        fx.rate_table.publish(RateSnapshot("USD", RATES))
+
+    def tearDown(self):
+        storage.set_storage(None)
+        fx.rate_table = RateTable()
+
+    def test_transfer_between_currencies(self):
+        content, is_error = Assistant().call_tool(self.user_id, "create_transaction", {
+            "sender_account_id": self.usd, "recipient_account_id": self.eur, "amount": "90", "currency": "EUR"})
+        self.assertFalse(is_error)
+        result = json.loads(content)
+        self.assertEqual((result["amount"], result["currency"]), ("100.00", "USD"))
+        self.assertEqual(result["fx"]["recipient_amount"], "90.00")
+        self.assertEqual(result["fx"]["rate_version"], fx.current().version)
+
+    def test_convert_endpoint(self):
+        with TestClient(app) as client:
+            fx.rate_table.publish(RateSnapshot("USD", RATES))
+            version = client.get("/fx/rates").json()["version"]
+            response = client.post("/fx/convert", json={"target": "USD", "amounts": [
+                {"amount": "9", "currency": "EUR"}, {"amount": "150", "currency": "JPY"}]})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json(), {"version": version, "target": "USD",
+                                               "amounts": ["10.00", "1.00"], "total": "11.00"})
+            self.assertEqual(client.get("/fx/rates", params={"version": "nope"}).status_code, 404)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import asyncio
+import unittest
+import storage
+from storage import InMemoryStorage
+from assistant import Assistant
+from intent_router import IntentRouter, classify
+from test_assistant import stub_client
+import stub_llm
+
+class TestClassify(unittest.TestCase):
+
+    def test_rules(self):
+        self.assertEqual(classify("What's my balance?")[0], "balance")
+        self.assertEqual(classify("Show my favourite recipients")[0], "favorite_recipients")
+        self.assertEqual(classify("last 5 transactions")[:2], ("recent_transactions", {"limit": 5}))
+        self.assertEqual(classify("my latest three payments")[:2], ("recent_transactions", {"limit": 3}))
+        self.assertEqual(classify("last 500 transactions")[1], {"limit": 20})
+
+    def test_classifier_catches_paraphrases(self):
+        self.assertEqual(classify("how much cash do i have right now")[::2], ("balance", "classifier"))
+        self.assertEqual(classify("what did i spend lately")[::2], ("recent_transactions", "classifier"))
+
+    def test_actions_and_open_questions_fall_through(self):
+        for prompt in ["Send 50 to my favorite recipient", "Why is my balance lower than expected?",
+                       "Transfer money to account 4", "What are your fees?", "Give me an overview"]:
+            self.assertIsNone(classify(prompt)[0], prompt)
+
+    def test_balances_at_other_times_go_to_the_model(self):
+        for prompt in ["What was my balance last month?", "my balance history", "how much did i have in march",
+                       "what were my balances at the end of 2023", "balance 3 weeks ago"]:
+            self.assertEqual(classify(prompt)[::2], (None, "historical"), prompt)
+        self.assertEqual(classify("what is my balance right now")[0], "balance")
+        self.assertEqual(classify("what were my last 3 payments")[0], "recent_transactions")
+
+
+class TestIntentRouter(unittest.TestCase):
+
+    def setUp(self):
+        storage.set_storage(InMemoryStorage())
+        self.user_id = storage.create_user("johndoe", "john@example.com", "x", "John", "Doe", "1", True)
+        other_id = storage.create_user("other", "other@example.com", "x", "O", "U", "1", True)
+        self.checking = storage.create_account(self.user_id, 1500, "checking", "USD")
+        self.savings = storage.create_account(self.user_id, 20, "savings", "EUR")
+        self.yen = storage.create_account(self.user_id, 12000, "savings", "JPY")
+        theirs = storage.create_account(other_id, 10, "checking", "USD")
+        storage.create_recipient(self.user_id, "Jane Doe", "123", "Test Bank", "TESTSWIFT", "friend", True)
+        storage.create_recipient(self.user_id, "Acme", "456", "Other Bank", "TESTSWIFT", "business", False)
+        storage.create_transaction(self.checking, theirs, 25, "USD", "completed", "transfer", "Lunch")
+        storage.create_transaction(theirs, self.checking, 40, "USD", "pending", "transfer", None)
+        storage.create_transaction(theirs, theirs, 99, "USD", "completed", "transfer", "Not mine")
+        self.stub = stub_llm.create_app()
+
+    def tearDown(self):
+        storage.set_storage(None)
+
+    def ask(self, prompt):
+        router = IntentRouter(Assistant(client=stub_client(self.stub)))
+        return asyncio.run(router.respond(self.user_id, [{"role": "user", "content": prompt}]))
+
+    def test_balance(self):
+        reply = self.ask("What is my balance?")
+        self.assertEqual(reply['intent'], "balance")
+        self.assertIn(f"Checking account #{self.checking}: 1,500.00 USD", reply['text'])
+        self.assertIn("20.00 EUR", reply['text'])
+        # Amounts have the currency's minor units
+        self.assertIn(f"Savings account #{self.yen}: 12,000 JPY", reply['text'])
+        self.assertEqual(self.stub.state.requests, 0)
+
+    def test_favorites(self):
+        reply = self.ask("show my favorite recipients")
+        self.assertIn("Jane Doe (Test Bank)", reply['text'])
+        self.assertNotIn("Acme", reply['text'])
+
+    def test_recent_transactions_newest_first(self):
+        text = self.ask("last 5 transactions")['text']
+        self.assertTrue(text.startswith("Your last 2 transactions"))
+        self.assertLess(text.index("received 40.00 USD"), text.index("sent 25.00 USD"))
+        self.assertIn("(Lunch)", text)
+        self.assertNotIn("Not mine", text)
+
+    def test_everything_else_goes_to_the_model(self):
+        reply = self.ask("Give me an overview")
+        self.assertNotIn("intent", reply)
+        self.assertEqual(reply['tool_calls'], 4)
+
+    def test_later_turns_go_to_the_model(self):
+        router = IntentRouter(Assistant(client=stub_client(self.stub)))
+        messages = [{"role": "user", "content": "I sent money to Jane yesterday"},
+                    {"role": "assistant", "content": [{"type": "text", "text": "How can I help with it?"}]},
+                    {"role": "user", "content": "What was my balance before the last transfer?"}]
+        reply = asyncio.run(router.respond(self.user_id, messages))
+        self.assertNotIn("intent", reply)
+        self.assertGreater(self.stub.state.requests, 0)
+        self.assertEqual(router.stats["model"], 1)
+
+if __name__ == '__main__':
+    unittest.main()
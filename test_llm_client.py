@@ -0,0 +1,91 @@
+import asyncio
+import time
+import unittest
+import anthropic
+import httpx
+import llm_client
+from llm_client import create_async_client, retry_after
+import stub_llm
+
+def failing_first(*statuses):
+    remaining = list(statuses)
+    return lambda: remaining.pop(0) if remaining else None
+
+
+class TestRetryingClient(unittest.TestCase):
+
+    def client(self, app, **options):
+        options.setdefault("retry_base", 0.01)
+        return create_async_client(api_key="stub", base_url="http://stub",
+                                   transport=httpx.ASGITransport(app=app), **options)
+
+    def ask(self, client, prompt="What are your fees?"):
+        return client.messages.create(model="stub", max_tokens=64, messages=[{"role": "user", "content": prompt}])
+
+    def test_retry_after_is_honoured(self):
+        stub = stub_llm.create_app(errors=failing_first(429, 429), retry_after=0.1)
+
+        async def run():
+            start = time.perf_counter()
+            response = await self.ask(self.client(stub))
+            return response, time.perf_counter() - start
+        response, elapsed = asyncio.run(run())
+        self.assertIn("Stub answer", response.content[0].text)
+        self.assertEqual(stub.state.requests, 3)
+        self.assertGreaterEqual(elapsed, 0.2)
+
+    def test_overloaded_and_server_errors_are_retried(self):
+        stub = stub_llm.create_app(errors=failing_first(529, 503, 500))
+        response = asyncio.run(self.ask(self.client(stub)))
+        self.assertEqual(response.stop_reason, "end_turn")
+        self.assertEqual(stub.state.requests, 4)
+
+    def test_gives_up_after_max_retries(self):
+        stub = stub_llm.create_app(errors=lambda: 500)
+        with self.assertRaises(anthropic.InternalServerError):
+            asyncio.run(self.ask(self.client(stub, max_retries=2)))
+        self.assertEqual(stub.state.requests, 3)
+
+    def test_client_errors_are_not_retried(self):
+        stub = stub_llm.create_app(errors=failing_first(400))
+        with self.assertRaises(anthropic.BadRequestError):
+            asyncio.run(self.ask(self.client(stub)))
+        self.assertEqual(stub.state.requests, 1)
+
+    def test_streams_are_retried_before_the_first_event(self):
+        stub = stub_llm.create_app(errors=failing_first(529))
+
+        async def run():
+            client = self.client(stub)
+            async with client.messages.stream(model="stub", max_tokens=64,
+                                              messages=[{"role": "user", "content": "hello"}]) as stream:
+                return "".join([text async for text in stream.text_stream])
+        self.assertIn("hello", asyncio.run(run()))
+        self.assertEqual(stub.state.streams_completed, 1)
+
+    def test_concurrency_is_capped(self):
+        stub = stub_llm.create_app(latency=0.02)
+
+        async def run():
+            client = self.client(stub, max_concurrency=3)
+            await asyncio.gather(*(self.ask(client, f"question {i}") for i in range(12)))
+        asyncio.run(run())
+        self.assertEqual(stub.state.requests, 12)
+        self.assertEqual(stub.state.max_in_flight, 3)
+
+    def test_retry_after_headers(self):
+        self.assertEqual(retry_after(httpx.Response(429, headers={"retry-after": "2"})), 2.0)
+        self.assertEqual(retry_after(httpx.Response(429, headers={"retry-after-ms": "250"})), 0.25)
+        self.assertIsNone(retry_after(httpx.Response(429, headers={"retry-after": "Wed, 21 Oct 2015 07:28:00 GMT"})))
+
+    def test_one_client_per_process(self):
+        async def run():
+            client = llm_client.get_async_client()
+            self.assertIs(llm_client.get_async_client(), client)
+            await llm_client.close_async_client()
+            self.assertIsNot(llm_client.get_async_client(), client)
+            await llm_client.close_async_client()
+        asyncio.run(run())
+
+if __name__ == '__main__':
+    unittest.main()
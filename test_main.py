@@ -0,0 +1,326 @@
+import asyncio
+import json
+import subprocess
+import sys
+import time
+import unittest
+import httpx
+from anthropic import AsyncAnthropic
+from fastapi.testclient import TestClient
+import fx
+import lifecycle
+import main
+import storage
+import stub_llm
+from storage import InMemoryStorage
+from main import app
+from test_assistant import stub_client
+
+class TestAPI(unittest.TestCase):
+
+    def setUp(self):
+        storage.set_storage(InMemoryStorage())
+        self.client = TestClient(app)
+        self.client.__enter__()
+        response = self.client.post("/users/", json={
+            "username": "johndoe",
+            "email": "john@example.com",
+            "first_name": "John",
+            "last_name": "Doe",
+            "phone_number": "1234567890",
+            "password": "securepassword",
+        })
+        self.assertEqual(response.status_code, 200)
+        self.user_id = response.json()['user_id']
+
+    def tearDown(self):
+        self.client.__exit__(None, None, None)
+        storage.set_storage(None)
+
+    def create_account(self, balance="1000.00", currency="USD"):
+        response = self.client.post("/accounts/", json={
+            "user_id": self.user_id, "balance": balance, "account_type": "checking", "currency": currency,
+        })
+        self.assertEqual(response.status_code, 200)
+        return response.json()['account_id']
+
+    def create_recipient(self, name="Jane Doe", is_favorite=False):
+        response = self.client.post("/recipients/", json={
+            "user_id": self.user_id, "name": name, "account_info": "123456789", "bank_name": "Test Bank",
+            "swift_code": "TESTSWIFT", "relationship": "friend", "is_favorite": is_favorite,
+        })
+        self.assertEqual(response.status_code, 200)
+        return response.json()['recipient_id']
+
+    def test_user_roundtrip(self):
+        response = self.client.get(f"/users/{self.user_id}")
+        self.assertEqual(response.json()['username'], "johndoe")
+        self.assertNotIn('password_hash', response.json())
+        self.assertEqual(self.client.get("/users/999").status_code, 404)
+
+    def test_duplicate_user(self):
+        response = self.client.post("/users/", json={
+            "username": "johndoe", "email": "john@example.com", "first_name": "John",
+            "last_name": "Doe", "phone_number": "1", "password": "x",
+        })
+        self.assertEqual(response.status_code, 400)
+
+    def test_transaction_roundtrip(self):
+        sender = self.create_account()
+        recipient = self.create_account("0.00")
+        response = self.client.post("/transactions/", json={
+            "sender_account_id": sender, "recipient_account_id": recipient, "amount": "25.50",
+            "currency": "USD", "status": "completed", "transaction_type": "transfer",
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['amount'], "25.50")
+        self.assertEqual(len(self.client.get("/transactions/").json()['transactions']), 1)
+
+    def test_transactions_are_booked_in_the_sender_currency(self):
+        sender = self.create_account()
+        recipient = self.create_account("0.00", "EUR")
+        fx.rate_table.publish(fx.RateSnapshot("USD", {"EUR": "0.9", "GBP": "0.8", "JPY": "150"}))
+        response = self.client.post("/transactions/", json={
+            "sender_account_id": sender, "recipient_account_id": recipient, "amount": "9.00",
+            "currency": "EUR", "status": "completed", "transaction_type": "transfer",
+        })
+        self.assertEqual((response.json()['amount'], response.json()['currency']), ("10.00", "USD"))
+        self.assertEqual(response.headers['X-FX-Rate-Version'], fx.current().version)
+        self.assertEqual(response.headers['X-Requested-Amount'], "9.00 EUR")
+        # Rounded to cents when booked; the header keeps the amount as sent
+        response = self.client.post("/transactions/", json={
+            "sender_account_id": sender, "recipient_account_id": recipient, "amount": "0.001",
+            "currency": "EUR", "status": "completed", "transaction_type": "transfer",
+        })
+        self.assertEqual((response.json()['amount'], response.headers['X-Requested-Amount']), ("0.00", "0.001 EUR"))
+        same_currency = self.client.post("/transactions/", json={
+            "sender_account_id": sender, "recipient_account_id": recipient, "amount": "1.00",
+            "currency": "USD", "status": "completed", "transaction_type": "transfer",
+        })
+        self.assertNotIn('X-Requested-Amount', same_currency.headers)
+        response = self.client.post("/transactions/", json={
+            "sender_account_id": sender, "recipient_account_id": recipient, "amount": "1.00",
+            "currency": "XYZ", "status": "completed", "transaction_type": "transfer",
+        })
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post("/transactions/", json={
+            "sender_account_id": 999, "recipient_account_id": recipient, "amount": "1.00",
+            "currency": "USD", "status": "completed", "transaction_type": "transfer",
+        })
+        self.assertEqual(response.status_code, 400)
+
+    def test_search_transactions(self):
+        sender = self.create_account()
+        recipient = self.create_account("0.00")
+        for description in ("Rent March", "Invoice 4471", "Groceries"):
+            self.client.post("/transactions/", json={
+                "sender_account_id": sender, "recipient_account_id": recipient, "amount": "10.00",
+                "currency": "USD", "status": "completed", "transaction_type": "transfer", "description": description,
+            })
+        response = self.client.get("/transactions/search", params={"q": "inv 447", "user_id": self.user_id})
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['transactions']
+        self.assertEqual([t['description'] for t in results], ["Invoice 4471"])
+        self.assertIn('rank', results[0])
+        response = self.client.get("/transactions/search", params={"q": "rent", "account_id": recipient,
+                                                                   "start": "2000-01-01", "end": "2000-02-01"})
+        self.assertEqual(response.json()['transactions'], [])
+        self.assertEqual(self.client.get("/transactions/search").status_code, 422)
+
+    def test_suggest_recipients(self):
+        jane = self.create_recipient("Jane Doe")
+        self.create_recipient("Janet Smith")
+        response = self.client.get(f"/users/{self.user_id}/recipients/suggest", params={"q": "jan"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([r['name'] for r in response.json()['recipients']], ["Jane Doe", "Janet Smith"])
+        self.client.post(f"/recipients/{jane}/toggle-favorite")
+        self.client.put(f"/recipients/{jane}", json={"name": "Mary Jane"})
+        response = self.client.get(f"/users/{self.user_id}/recipients/suggest", params={"q": "ja", "limit": 1})
+        self.assertEqual([r['name'] for r in response.json()['recipients']], ["Mary Jane"])
+        self.assertEqual(self.client.get(f"/users/{self.user_id}/recipients/suggest").status_code, 422)
+
+    def test_user_balances(self):
+        self.create_account("100.00", "USD")
+        eur = self.create_account("90.00", "EUR")
+        self.create_account("50.50", "USD")
+        fx.rate_table.publish(fx.RateSnapshot("USD", {"EUR": "0.9", "GBP": "0.8", "JPY": "150"}))
+        response = self.client.get(f"/users/{self.user_id}/balances", params={"currency": "USD"})
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual([(b['currency'], b['balance'], b['accounts']) for b in body['balances']],
+                         [("EUR", "90.00", 1), ("USD", "150.50", 2)])
+        self.assertEqual(body['total'], "250.50")
+        self.client.put(f"/accounts/{eur}", json={"balance": "180.00"})
+        body = self.client.get(f"/users/{self.user_id}/balances").json()
+        self.assertEqual(float(body['balances'][0]['balance']), 180)
+        self.assertIsNone(body['total'])
+        self.assertEqual(self.client.get("/users/999/balances").status_code, 404)
+        self.assertEqual(self.client.get(f"/users/{self.user_id}/balances", params={"currency": "CHF"}).status_code, 422)
+
+    def test_spending(self):
+        sender = self.create_account()
+        recipient = self.create_account()
+        for amount, transaction_type in (("10.00", "transfer"), ("5.00", "fee"), ("15.00", "transfer")):
+            self.client.post("/transactions/", json={
+                "sender_account_id": sender, "recipient_account_id": recipient, "amount": amount, "currency": "USD",
+                "status": "completed", "transaction_type": transaction_type})
+        response = self.client.get(f"/users/{self.user_id}/spending")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(r['transaction_type'], r['amount']) for r in response.json()['rows']],
+                         [("transfer", "25.00"), ("fee", "5.00")])
+        response = self.client.get(f"/users/{self.user_id}/spending", params={"group_by": "recipient_account_id"})
+        self.assertEqual([(r['recipient_account_id'], r['transaction_count']) for r in response.json()['rows']],
+                         [(recipient, 3)])
+        self.assertEqual(self.client.get("/users/999/spending").status_code, 404)
+
+    def test_toggle_favorite(self):
+        recipient_id = self.create_recipient()
+        response = self.client.post(f"/recipients/{recipient_id}/toggle-favorite")
+        self.assertEqual(response.json(), {"recipient_id": recipient_id, "is_favorite": True})
+        favorites = self.client.get(f"/users/{self.user_id}/recipients/favorites/").json()['recipients']
+        self.assertEqual([r['recipient_id'] for r in favorites], [recipient_id])
+        self.assertEqual(self.client.post("/recipients/999/toggle-favorite").status_code, 404)
+
+
+class CountingStorage(InMemoryStorage):
+
+    def __init__(self):
+        super().__init__()
+        self.pings = 0
+        self.closed = False
+
+    def ping(self):
+        self.pings += 1
+        return True
+
+    def close(self):
+        self.closed = True
+
+
+class TestLifecycle(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = CountingStorage()
+        storage.set_storage(self.backend)
+
+    def tearDown(self):
+        storage.set_storage(None)
+
+    def test_probes_answer_from_cached_state(self):
+        with TestClient(app) as client:
+            self.assertEqual(client.get("/health/live").status_code, 200)
+            pings_after_startup = self.backend.pings
+            for _ in range(5):
+                response = client.get("/health/ready")
+                self.assertEqual(response.status_code, 200)
+                self.assertTrue(response.json()['ready'])
+            self.assertEqual(self.backend.pings, pings_after_startup)
+        self.assertTrue(self.backend.closed)
+
+    def test_not_ready_when_database_down(self):
+        self.backend.ping = lambda: False
+        with TestClient(app) as client:
+            response = client.get("/health/ready")
+            self.assertEqual(response.status_code, 503)
+            self.assertFalse(response.json()['database_ok'])
+
+    def test_drain_waits_for_in_flight_requests(self):
+        tracker = lifecycle.InFlightTracker()
+
+        async def scenario():
+            tracker.started()
+            asyncio.get_running_loop().call_later(0.05, tracker.finished)
+            drained = await tracker.wait_idle(1.0)
+            tracker.started()
+            timed_out = await tracker.wait_idle(0.01)
+            return drained, timed_out
+
+        drained, timed_out = asyncio.run(scenario())
+        self.assertTrue(drained)
+        self.assertFalse(timed_out)
+
+
+def parse_sse(text):
+    events = []
+    for chunk in text.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in chunk.splitlines())
+        events.append(json.loads(lines["data"]))
+    return events
+
+
+class TestAssistantChat(unittest.TestCase):
+
+    def setUp(self):
+        storage.set_storage(InMemoryStorage())
+        self.user_id = storage.create_user("johndoe", "john@example.com", "x", "John", "Doe", "1", True)
+        self.account_id = storage.create_account(self.user_id, 1500, "checking", "USD")
+
+    def tearDown(self):
+        main.chat_assistant.client = None
+        main.response_cache._entries.clear()
+        storage.set_storage(None)
+
+    def test_streams_text_and_tool_events(self):
+        main.chat_assistant.client = stub_client(stub_llm.create_app())
+        with TestClient(app) as client:
+            response = client.post("/assistant/chat", json={
+                "user_id": self.user_id, "messages": [{"role": "user", "content": f"Show account {self.account_id}"}]})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers['content-type'].startswith("text/event-stream"))
+        events = parse_sse(response.text)
+        types = [event['type'] for event in events]
+        self.assertEqual(types[:2], ["tool_use", "tool_result"])
+        self.assertEqual(types[-1], "done")
+        self.assertIn("1500", "".join(event['text'] for event in events if event['type'] == "text"))
+        self.assertEqual(events[-1]['tool_calls'], 1)
+        self.assertIsNone(events[-1]['intent'])
+
+    def test_simple_intents_skip_the_model(self):
+        stub = stub_llm.create_app()
+        main.chat_assistant.client = stub_client(stub)
+        with TestClient(app) as client:
+            response = client.post("/assistant/chat", json={
+                "user_id": self.user_id, "messages": [{"role": "user", "content": "What is my balance?"}]})
+        events = parse_sse(response.text)
+        self.assertIn("1,500.00 USD", events[0]['text'])
+        self.assertEqual(events[-1]['intent'], "balance")
+        self.assertEqual(stub.state.requests, 0)
+
+    def test_unknown_user(self):
+        with TestClient(app) as client:
+            response = client.post("/assistant/chat", json={
+                "user_id": 999, "messages": [{"role": "user", "content": "hi"}]})
+        self.assertEqual(response.status_code, 404)
+
+    def test_disconnect_stops_generation(self):
+        stub = stub_llm.create_app(token_delay=0.05)
+        with stub_llm.serve_in_background(stub) as stub_url, \
+                stub_llm.serve_in_background(app, lifespan="on") as api_url:
+            main.chat_assistant.client = AsyncAnthropic(api_key="stub", base_url=stub_url, max_retries=0)
+            body = {"user_id": self.user_id, "messages": [{"role": "user", "content": "tell me " + "a " * 200}]}
+            start = time.perf_counter()
+            with httpx.stream("POST", f"{api_url}/assistant/chat", json=body, timeout=10) as response:
+                for line in response.iter_lines():
+                    if line.startswith("event: text"):
+                        break
+            deadline = time.perf_counter() + 5
+            while stub.state.streams_cancelled == 0 and time.perf_counter() < deadline:
+                time.sleep(0.05)
+            self.assertEqual(stub.state.streams_cancelled, 1)
+            self.assertEqual(stub.state.streams_completed, 0)
+            self.assertLess(time.perf_counter() - start, 5)
+
+
+class TestImportSideEffects(unittest.TestCase):
+
+    def test_entry_points_import_without_database_or_llm(self):
+        code = (
+            "import sys, main, agent; "
+            "assert 'psycopg2' not in sys.modules, 'psycopg2 imported'; "
+            "assert 'anthropic' not in sys.modules, 'anthropic imported'"
+        )
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stderr)
+
+if __name__ == '__main__':
+    unittest.main()
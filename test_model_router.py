@@ -0,0 +1,104 @@
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+import storage
+from storage import InMemoryStorage
+from assistant import Assistant, CANNED_RESPONSE
+from model_router import (
+    MODEL_ROUTER_LARGE, MODEL_ROUTER_SMALL, ModelRouter, extract_features, load_routes,
+)
+from test_assistant import stub_client
+import stub_llm
+
+def user(text):
+    return {"role": "user", "content": text}
+
+
+def assistant_text(text):
+    return {"role": "assistant", "content": [{"type": "text", "text": text}]}
+
+
+class TestRouting(unittest.TestCase):
+
+    def setUp(self):
+        self.router = ModelRouter(Assistant(client=None), log_path=None)
+
+    def test_features(self):
+        features = extract_features([user("hi"), assistant_text("Hello"), user("Send 50 USD to Jane")])
+        self.assertEqual(features["tools"], ["create_transaction"])
+        self.assertTrue(features["writes"])
+        self.assertTrue(features["action"])
+        self.assertEqual(features["turns"], 2)
+        self.assertFalse(features["previous_failed"])
+
+    def test_lookups_go_to_the_small_model(self):
+        for prompt in ["Show my profile", "What are your fees?", "Show account 4"]:
+            rule, model, _ = self.router.route([user(prompt)])
+            self.assertEqual((rule, model), ("lookup", MODEL_ROUTER_SMALL), prompt)
+
+    def test_escalations(self):
+        self.assertEqual(self.router.route([user("Pay my rent from checking")])[:2],
+                         ("transfer_planning", MODEL_ROUTER_LARGE))
+        self.assertEqual(self.router.route([user("Give me an overview")])[0], "multi_step")
+        failed = [user("Show my profile"), assistant_text(CANNED_RESPONSE), user("Show my profile")]
+        self.assertEqual(self.router.route(failed)[0], "previous_failed")
+        long = [message for i in range(10) for message in (user(f"question {i}"), assistant_text("answer"))]
+        self.assertEqual(self.router.route(long + [user("and now?")])[0], "long_conversation")
+
+    def test_routes_from_file(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as f:
+            json.dump([{"name": "recipients", "model": "large", "when": {"tools": ["list_recipients"]}},
+                       {"name": "rest", "model": "custom-model"}], f)
+        try:
+            router = ModelRouter(Assistant(client=None), routes=load_routes(f.name), log_path=None)
+            self.assertEqual(router.route([user("List my recipients")])[:2], ("recipients", MODEL_ROUTER_LARGE))
+            self.assertEqual(router.route([user("hello")])[:2], ("rest", "custom-model"))
+            with open(f.name, "w") as out:
+                json.dump([{"name": "bad", "model": "small", "when": {"min_turn": 3}}], out)
+            with self.assertRaises(ValueError):
+                load_routes(f.name)
+        finally:
+            os.unlink(f.name)
+
+
+class TestModelRouter(unittest.TestCase):
+
+    def setUp(self):
+        storage.set_storage(InMemoryStorage())
+        self.user_id = storage.create_user("johndoe", "john@example.com", "x", "John", "Doe", "1", True)
+        storage.create_account(self.user_id, 1500, "checking", "USD")
+        self.stub = stub_llm.create_app()
+        self.directory = tempfile.TemporaryDirectory()
+        self.log_path = os.path.join(self.directory.name, "routes.jsonl")
+        self.router = ModelRouter(Assistant(client=stub_client(self.stub)), log_path=self.log_path)
+
+    def tearDown(self):
+        storage.set_storage(None)
+        self.directory.cleanup()
+
+    def test_model_is_sent_and_logged(self):
+        asyncio.run(self.router.respond(self.user_id, [user("Show my profile")]))
+        asyncio.run(self.router.respond(self.user_id, [user("Send 10 USD to account 99")]))
+        self.assertEqual(self.stub.state.models[MODEL_ROUTER_SMALL], 2)
+        # Every model call of a turn, tool rounds included, uses the turn's model
+        self.assertEqual(self.stub.state.models[MODEL_ROUTER_LARGE], 2)
+        with open(self.log_path) as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual([r["rule"] for r in records], ["lookup", "transfer_planning"])
+        self.assertEqual(records[0]["tool_calls"], 1)
+        self.assertFalse(records[0]["failed"])
+        # The stub asks for get_account 99, which the customer does not own
+        self.assertTrue(records[1]["failed"])
+        self.assertGreater(records[1]["input_tokens"], 0)
+
+    def test_stream_logs_on_done(self):
+        async def run():
+            return [event async for event in self.router.stream(self.user_id, [user("Show my profile")])]
+        events = asyncio.run(run())
+        self.assertEqual(events[-1]["type"], "done")
+        self.assertEqual(self.router.stats["lookup"], 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+import json
+import os
+import tempfile
+import unittest
+import storage
+import stub_llm
+import stub_webhook
+from outbox import FileSink, HttpSink, OutboxDispatcher, QueueSink, create_sinks
+from storage import InMemoryStorage
+
+
+class FailingSink:
+    name = "failing"
+
+    def __init__(self, failures):
+        self.failures = failures
+
+    def deliver(self, events):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("unavailable")
+
+    def close(self):
+        pass
+
+
+class TestOutbox(unittest.TestCase):
+
+    def setUp(self):
+        backend = InMemoryStorage()
+        backend.set_outbox(True)
+        storage.set_storage(backend)
+        self.user_id = storage.create_user("johndoe", "john@example.com", "secret", "John", "Doe", "1", True)
+        self.a = storage.create_account(self.user_id, 100, "checking", "USD")
+        self.b = storage.create_account(self.user_id, 100, "checking", "USD")
+
+    def tearDown(self):
+        storage.set_storage(None)
+
+    def test_writes_append_events(self):
+        transaction_id = storage.create_transaction(self.a, self.b, 10, "USD", "pending", "transfer", None)
+        storage.update_transaction(transaction_id, status="completed")
+        storage.delete_transaction(transaction_id)
+        self.assertEqual(storage.update_account(999, balance=1), 0)
+        events = storage.claim_outbox(100, 30)
+        self.assertEqual([(e["aggregate_type"], e["operation"]) for e in events], [
+            ("users", "create"), ("accounts", "create"), ("accounts", "create"),
+            ("transactions", "create"), ("transactions", "update"), ("transactions", "delete")])
+        self.assertNotIn("password_hash", events[0]["payload"])
+        self.assertEqual(events[4]["payload"]["status"], "completed")
+        self.assertEqual(events[5]["payload"]["transaction_id"], transaction_id)
+
+    def test_writes_without_dispatch_append_no_events(self):
+        backend = InMemoryStorage()
+        storage.set_storage(backend)
+        user_id = storage.create_user("janedoe", "jane@example.com", "secret", "Jane", "Doe", "1", True)
+        account_id = storage.create_account(user_id, 100, "checking", "USD")
+        storage.update_account(account_id, balance=50)
+        self.assertEqual(backend._outbox, {})
+        self.assertEqual(storage.claim_outbox(100, 30), [])
+
+    def test_deletes_report_removed_children(self):
+        transaction_id = storage.create_transaction(self.a, self.b, 10, "USD", "pending", "transfer", None)
+        recipient_id = storage.create_recipient(self.user_id, "Jane", "111", "Bank", "TESTSWIFT", "friend", False)
+        storage.ack_outbox([e["event_id"] for e in storage.claim_outbox(100, 30)])
+        storage.delete_user(self.user_id)
+        events = storage.claim_outbox(100, 30)
+        self.assertEqual([(e["aggregate_type"], e["aggregate_id"], e["operation"]) for e in events], [
+            ("transactions", transaction_id, "delete"), ("accounts", self.a, "delete"), ("accounts", self.b, "delete"),
+            ("recipients", recipient_id, "delete"), ("users", self.user_id, "delete")])
+
+    def test_claimed_aggregates_are_leased(self):
+        storage.update_account(self.a, balance=50)
+        first = storage.claim_outbox(2, 30)
+        # The oldest event of two aggregates: the user and account a
+        self.assertEqual([(e["aggregate_type"], e["aggregate_id"]) for e in first],
+                         [("users", self.user_id), ("accounts", self.a)])
+        # Account a's update waits behind its leased create; account b is free
+        second = storage.claim_outbox(10, 30)
+        self.assertEqual([(e["aggregate_type"], e["aggregate_id"]) for e in second], [("accounts", self.b)])
+        self.assertEqual(storage.ack_outbox([e["event_id"] for e in first + second]), 3)
+        self.assertEqual([e["operation"] for e in storage.claim_outbox(10, 30)], ["update"])
+
+    def test_retries_then_dead_letters(self):
+        events = storage.claim_outbox(1, 30)
+        self.assertEqual(storage.retry_outbox([events[0]["event_id"]], "down", 0, 0, 2), 0)
+        retried = storage.claim_outbox(1, 30)
+        self.assertEqual(retried[0]["attempts"], 1)
+        self.assertEqual(storage.retry_outbox([retried[0]["event_id"]], "down", 0, 0, 2), 1)
+        self.assertEqual(storage.claim_outbox(1, 30)[0]["aggregate_type"], "accounts")
+
+
+class TestDispatcher(unittest.TestCase):
+
+    def setUp(self):
+        backend = InMemoryStorage()
+        backend.set_outbox(True)
+        storage.set_storage(backend)
+        self.user_id = storage.create_user("johndoe", "john@example.com", "secret", "John", "Doe", "1", True)
+        self.account_id = storage.create_account(self.user_id, 100, "checking", "USD")
+        for balance in (90, 80, 70):
+            storage.update_account(self.account_id, balance=balance)
+
+    def tearDown(self):
+        storage.set_storage(None)
+
+    def test_delivers_in_order_per_aggregate(self):
+        sink = QueueSink()
+        dispatcher = OutboxDispatcher([sink], batch_size=2)
+        self.assertEqual(dispatcher.drain(), 5)
+        events = [sink.queue.get_nowait() for _ in range(5)]
+        self.assertEqual([e["payload"]["balance"] for e in events if e["aggregate_type"] == "accounts"],
+                         [100, 90, 80, 70])
+        self.assertEqual(dispatcher.stats(), {"delivered": 5, "failed": 0, "dead": 0})
+        self.assertEqual(dispatcher.drain(), 0)
+
+    def test_failed_batches_are_retried(self):
+        sink = QueueSink()
+        dispatcher = OutboxDispatcher([sink, FailingSink(1)], retry_delay=0)
+        self.assertEqual(dispatcher.dispatch_once(), 5)
+        self.assertEqual(dispatcher.stats()["failed"], 5)
+        self.assertEqual(dispatcher.drain(), 5)
+        # Delivery is at least once: the sink that took the failed batch gets it again
+        self.assertEqual(sink.queue.qsize(), 10)
+        dispatcher = OutboxDispatcher([FailingSink(10)], retry_delay=0, max_attempts=2)
+        storage.update_account(self.account_id, balance=1)
+        dispatcher.drain()
+        self.assertEqual(dispatcher.stats()["dead"], 1)
+
+    def test_file_and_http_sinks(self):
+        receiver = stub_webhook.create_app(errors=iter([503, None, None]).__next__)
+        with tempfile.TemporaryDirectory() as tmp, stub_llm.serve_in_background(receiver) as url:
+            path = os.path.join(tmp, "outbox.jsonl")
+            sinks = create_sinks(f"file:{path}, {url}/events")
+            self.assertEqual([type(sink) for sink in sinks], [FileSink, HttpSink])
+            dispatcher = OutboxDispatcher(sinks, retry_delay=0)
+            dispatcher.drain()
+            dispatcher.close()
+            with open(path) as f:
+                lines = [json.loads(line) for line in f]
+            # The batch that failed over HTTP was written to the file twice
+            self.assertEqual(len(lines), 10)
+            self.assertEqual([e["event_id"] for e in receiver.state.events], [1, 2, 3, 4, 5])
+            self.assertEqual(receiver.state.requests, 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+import asyncio
+import json
+import unittest
+from fastapi.testclient import TestClient
+import realtime
+import storage
+from main import app, subscription_hub
+from realtime import SubscriptionHub
+from storage import InMemoryStorage
+
+
+class TestSubscriptionHub(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.hub = SubscriptionHub(queue_size=2, max_subscriptions=3)
+        self.hub.start(self.loop)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def messages(self, subscriber):
+        messages = []
+        while not subscriber.queue.empty():
+            text = subscriber.queue.get_nowait()
+            messages.append(json.loads(text) if text is not None else None)
+        return messages
+
+    def test_fan_out(self):
+        a, b = self.hub.connect(), self.hub.connect()
+        self.assertEqual(self.hub.subscribe(a, "accounts", [1, 1, 2]), [1, 2])
+        self.assertEqual(self.hub.subscribe(b, "accounts", [1]), [1])
+        self.hub._fan_out({"table": "accounts", "id": 1, "operation": "update", "balance": "5.00", "currency": "USD"})
+        self.hub._fan_out({"table": "accounts", "id": 3, "operation": "update", "balance": "1.00", "currency": "USD"})
+        self.assertEqual(self.messages(a), [{"type": "change", "table": "accounts", "id": 1, "operation": "update",
+                                             "balance": "5.00", "currency": "USD"}])
+        self.assertEqual(len(self.messages(b)), 1)
+        self.hub.unsubscribe(b, "accounts", [1])
+        self.hub._fan_out({"table": "accounts", "id": 1, "operation": "delete"})
+        self.assertEqual(len(self.messages(a)), 1)
+        self.assertEqual(self.messages(b), [])
+        self.assertEqual(self.hub.subscriptions(a), {"accounts": [2], "transactions": []})
+        self.hub.disconnect(a)
+        self.assertEqual(self.hub.stats()["rows"], 0)
+
+    def test_limits(self):
+        subscriber = self.hub.connect()
+        with self.assertRaises(ValueError):
+            self.hub.subscribe(subscriber, "transactions", [1, 2, 3, 4])
+        self.hub.subscribe(subscriber, "transactions", [1])
+        for status in ("pending", "completed", "failed"):
+            self.hub._fan_out({"table": "transactions", "id": 1, "operation": "update", "status": status})
+        # Too far behind: the backlog is dropped and the connection closed
+        self.assertEqual(self.messages(subscriber), [None])
+        self.assertEqual(self.hub.stats()["disconnected"], 1)
+        self.assertEqual(self.hub.subscriptions(subscriber), {"accounts": [], "transactions": []})
+
+    def test_notifications_from_other_processes(self):
+        subscriber = self.hub.connect()
+        self.hub.subscribe(subscriber, "accounts", [1])
+        self.hub.on_notify({"table": "accounts", "id": 1, "operation": "update", "user_ids": [7],
+                            "balance": "5.00", "currency": "USD"})
+        self.hub.on_notify({"table": "users", "id": 7, "operation": "update", "user_ids": [7]})
+        self.hub.on_notify(realtime.RESYNC)
+        self.loop.run_until_complete(asyncio.sleep(0))
+        # Owners are not passed on to subscribers
+        self.assertEqual(self.messages(subscriber), [
+            {"type": "change", "table": "accounts", "id": 1, "operation": "update", "balance": "5.00", "currency": "USD"},
+            {"type": "resync"},
+        ])
+
+    def test_writes_are_handed_to_the_loop_without_reading_subscriptions(self):
+        subscriber = self.hub.connect()
+        self.hub.subscribe(subscriber, "accounts", [1])
+        subscriptions = self.hub._subscriptions
+        self.hub._subscriptions = None  # any lookup from the writing thread would fail here
+        self.hub.on_change({"table": "accounts", "id": 1, "operation": "update", "user_ids": [7],
+                            "balance": "5.00", "currency": "USD"})
+        self.hub._subscriptions = subscriptions
+        self.loop.run_until_complete(asyncio.sleep(0))
+        self.assertEqual(self.messages(subscriber), [
+            {"type": "change", "table": "accounts", "id": 1, "operation": "update", "balance": "5.00", "currency": "USD"},
+        ])
+
+
+class TestSubscriptionEndpoint(unittest.TestCase):
+
+    def setUp(self):
+        storage.set_storage(InMemoryStorage())
+        self.user_id = storage.create_user("johndoe", "john@example.com", "x", "John", "Doe", "1", True)
+        self.a = storage.create_account(self.user_id, 100, "checking", "USD")
+        self.b = storage.create_account(self.user_id, 100, "checking", "USD")
+        self.client = TestClient(app)
+        self.client.__enter__()
+
+    def tearDown(self):
+        self.client.__exit__(None, None, None)
+        storage.set_storage(None)
+
+    def test_subscribe_and_receive_changes(self):
+        transaction_id = storage.create_transaction(self.a, self.b, 10, "USD", "pending", "transfer", None)
+        with self.client.websocket_connect("/subscriptions") as ws:
+            ws.send_json({"action": "subscribe", "accounts": [self.a, 999], "transactions": [transaction_id]})
+            self.assertEqual(ws.receive_json(), {"type": "snapshot", "table": "accounts", "id": self.a,
+                                                 "balance": "100", "currency": "USD"})
+            self.assertEqual(ws.receive_json(), {"type": "snapshot", "table": "transactions", "id": transaction_id,
+                                                 "status": "pending"})
+            self.assertEqual(ws.receive_json(), {"type": "subscribed", "accounts": [self.a],
+                                                 "transactions": [transaction_id], "not_found": {"accounts": [999]}})
+            storage.update_account(self.b, balance=1)
+            storage.update_account(self.a, balance=90)
+            self.assertEqual(ws.receive_json(), {"type": "change", "table": "accounts", "id": self.a,
+                                                 "operation": "update", "balance": "90", "currency": "USD"})
+            self.client.put(f"/transactions/{transaction_id}", json={"status": "completed"})
+            self.assertEqual(ws.receive_json()["status"], "completed")
+            ws.send_json({"action": "unsubscribe", "accounts": [self.a]})
+            self.assertEqual(ws.receive_json()["accounts"], [])
+            ws.send_json({"action": "watch"})
+            self.assertEqual(ws.receive_json()["type"], "error")
+        self.assertEqual(subscription_hub.stats()["subscribers"], 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+import unittest
+import storage
+from storage import InMemoryStorage
+from recipient_index import RecipientIndex, UserRecipientIndex
+
+def recipient(recipient_id, name, account_info="000", bank_name="Test Bank", is_favorite=False):
+    return {"recipient_id": recipient_id, "user_id": 1, "name": name, "account_info": account_info,
+            "bank_name": bank_name, "swift_code": "TESTSWIFT", "relationship": "friend", "is_favorite": is_favorite}
+
+
+class TestUserRecipientIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index = UserRecipientIndex([
+            recipient(1, "Jane Doe", "DE44 5001 0517", "Commerzbank"),
+            recipient(2, "John Smith", "123456789", "Chase"),
+            recipient(3, "Acme Corp", "987654321", "Chase", is_favorite=True),
+            recipient(4, "Janet Jackson", "555000111", "Bank of Jane"),
+        ])
+
+    def names(self, query, **kwargs):
+        return [r["name"] for r in self.index.search(query, **kwargs)]
+
+    def test_prefix_on_name_bank_and_account(self):
+        self.assertEqual(self.names("jan"), ["Jane Doe", "Janet Jackson"])
+        self.assertEqual(self.names("DOE"), ["Jane Doe"])
+        self.assertEqual(self.names("chase"), ["Acme Corp", "John Smith"])
+        self.assertEqual(self.names("de445"), ["Jane Doe"])
+        self.assertEqual(self.names("1234"), ["John Smith"])
+        self.assertEqual(self.names("jane d"), ["Jane Doe"])
+        self.assertEqual(self.names("xyz"), [])
+        self.assertEqual(self.names(" "), [])
+
+    def test_bulk_build_matches_incremental_adds(self):
+        incremental = UserRecipientIndex()
+        for recipient_id in (4, 2, 3, 1):
+            incremental.add(self.index.recipients[recipient_id])
+        self.assertEqual(incremental.keys, self.index.keys)
+        self.assertEqual(self.index.keys, sorted(self.index.keys))
+
+    def test_name_matches_rank_above_bank_matches(self):
+        # "jane" is Janet's bank, but the name prefix of Jane Doe wins
+        self.assertEqual(self.names("jane"), ["Jane Doe", "Janet Jackson"])
+        self.assertEqual(self.names("jane", limit=1), ["Jane Doe"])
+
+    def test_favorites_rank_higher(self):
+        self.index.add(dict(recipient(4, "Janet Jackson", "555000111", "Bank of Jane"), is_favorite=True))
+        self.assertEqual(self.names("jan"), ["Janet Jackson", "Jane Doe"])
+
+    def test_updates_and_removals(self):
+        self.index.add(recipient(2, "Johnny Smith", "123456789", "Chase"))
+        self.assertEqual(self.names("johnny"), ["Johnny Smith"])
+        self.index.remove(2)
+        self.assertEqual(self.names("john"), [])
+        self.assertEqual(len(self.index.keys), sum(len(tokens) for tokens in self.index.tokens.values()))
+
+
+class TestRecipientIndex(unittest.TestCase):
+
+    def setUp(self):
+        storage.set_storage(InMemoryStorage())
+        self.user_id = storage.create_user("johndoe", "john@example.com", "x", "John", "Doe", "1", True)
+        self.account = storage.create_account(self.user_id, 100, "checking", "USD")
+        self.index = RecipientIndex()
+        self.index.attach()
+
+    def tearDown(self):
+        self.index.detach()
+        storage.set_storage(None)
+
+    def names(self, query):
+        return [r["name"] for r in self.index.suggest(self.user_id, query)]
+
+    def test_maintained_from_storage_writes(self):
+        jane = storage.create_recipient(self.user_id, "Jane Doe", "111", "Test Bank", "TESTSWIFT", "friend", False)
+        self.assertEqual(self.names("ja"), ["Jane Doe"])
+        janet = storage.create_recipient(self.user_id, "Janet", "222", "Test Bank", "TESTSWIFT", "friend", False)
+        self.assertEqual(self.names("ja"), ["Jane Doe", "Janet"])
+        storage.toggle_favorite_recipient(janet)
+        self.assertEqual(self.names("ja"), ["Janet", "Jane Doe"])
+        storage.update_recipient(jane, name="Mary Jane")
+        self.assertEqual(self.names("mary"), ["Mary Jane"])
+        storage.delete_recipient(janet)
+        self.assertEqual(self.names("ja"), ["Mary Jane"])
+        self.assertEqual(self.index.loads, 1)
+
+    def test_writes_during_load_are_replayed(self):
+        storage.create_recipient(self.user_id, "Anna", "111", "Test Bank", "TESTSWIFT", "friend", False)
+        load = self.index._load
+
+        def slow_load(user_id):
+            index = load(user_id)
+            # Lands after the recipients were read, before the index is in place
+            storage.create_recipient(self.user_id, "Annette", "222", "Test Bank", "TESTSWIFT", "friend", False)
+            return index
+
+        self.index._load = slow_load
+        self.assertEqual(self.names("ann"), ["Anna", "Annette"])
+        self.assertEqual(self.index._loading, {})
+
+    def test_reloads_after_ttl(self):
+        self.index.ttl = 0
+        self.names("a")
+        self.names("a")
+        self.assertEqual(self.index.loads, 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+import asyncio
+import os
+import tempfile
+import time
+import unittest
+import realtime
+import storage
+from storage import InMemoryStorage
+from assistant import Assistant
+from response_cache import ResponseCache, make_key, normalize_prompt
+from test_assistant import stub_client
+import stub_llm
+
+class TestResponseCache(unittest.TestCase):
+
+    def test_normalize_prompt(self):
+        self.assertEqual(normalize_prompt("  What are your FEES?? "), "what are your fees")
+        self.assertEqual(make_key("What are your fees?", "m", {}), make_key("what are your fees", "m", {}))
+        self.assertNotEqual(make_key("fees", "m", {}), make_key("fees", "other", {}))
+        self.assertNotEqual(make_key("fees", "m", {}, 1), make_key("fees", "m", {}, 2))
+
+    def test_lru_eviction(self):
+        cache = ResponseCache(max_entries=2, path=None)
+        cache.put("a", "1")
+        cache.put("b", "2")
+        cache.get("a")
+        cache.put("c", "3")
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), "1")
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_ttl_expiry(self):
+        cache = ResponseCache(ttl=0.01, data_ttl=60, path=None)
+        cache.put("faq", "answer")
+        cache.put("data", "balance", data_dependent=True)
+        time.sleep(0.02)
+        self.assertIsNone(cache.get("faq"))
+        self.assertEqual(cache.get("data"), "balance")
+        self.assertEqual(cache.stats()['expirations'], 1)
+
+    def test_hit_rate_counts_one_lookup_per_get(self):
+        cache = ResponseCache(path=None)
+        cache.put("b", "2")
+        cache.get("a", "b")
+        cache.get("a", "c")
+        self.assertEqual(cache.stats()['hits'], 1)
+        self.assertEqual(cache.stats()['misses'], 1)
+        self.assertEqual(cache.stats()['hit_rate'], 0.5)
+
+    def test_persistence_skips_data_dependent_entries(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "cache.jsonl")
+            cache = ResponseCache(path=path)
+            cache.put("faq", "answer")
+            cache.put("data", "balance", data_dependent=True)
+            self.assertEqual(cache.save(), 1)
+            restored = ResponseCache(path=path)
+            self.assertEqual(restored.load(), 1)
+            self.assertEqual(restored.get("faq"), "answer")
+            self.assertIsNone(restored.get("data"))
+
+    def test_data_versions_follow_changes_and_resyncs(self):
+        versions = ResponseCache(path=None).versions
+        before = versions.get(1)
+        # As delivered by the change listener for a write in another worker
+        versions({"table": "accounts", "operation": "update", "id": 5, "user_ids": [1], "balance": "1.00"})
+        self.assertNotEqual(versions.get(1), before)
+        other = versions.get(2)
+        versions(realtime.RESYNC)
+        self.assertNotEqual(versions.get(2), other)
+
+
+class TestAssistantCaching(unittest.TestCase):
+
+    def setUp(self):
+        self.db = InMemoryStorage()
+        storage.set_storage(self.db)
+        self.user_id = storage.create_user("johndoe", "john@example.com", "x", "John", "Doe", "1", True)
+        self.account_id = storage.create_account(self.user_id, 1500, "checking", "USD")
+        self.cache = ResponseCache(path=None)
+        self.cache.attach()
+        self.stub = stub_llm.create_app()
+
+    def tearDown(self):
+        self.cache.detach()
+        storage.set_storage(None)
+
+    def ask(self, prompt, user_id=None):
+        async def run():
+            assistant = Assistant(client=stub_client(self.stub), cache=self.cache)
+            return await assistant.respond(user_id or self.user_id, [{"role": "user", "content": prompt}])
+        return asyncio.run(run())
+
+    def test_faq_answers_survive_data_changes(self):
+        first = self.ask("What are your fees?")
+        storage.update_account(self.account_id, balance=20)
+        second = self.ask("what are your fees")
+        self.assertFalse(first['cached'])
+        self.assertTrue(second['cached'])
+        self.assertEqual(first['text'], second['text'])
+        self.assertEqual(self.stub.state.requests, 1)
+
+    def test_answers_are_keyed_to_the_customer_system_block(self):
+        # Another customer is sent a different system prompt, so gets their own answer
+        other_id = storage.create_user("other", "other@example.com", "x", "O", "U", "1", True)
+        self.ask("What are your fees?")
+        self.assertFalse(self.ask("What are your fees?", user_id=other_id)['cached'])
+        self.assertEqual(self.stub.state.requests, 2)
+
+    def test_data_answers_invalidate_on_balance_change(self):
+        self.assertIn("1500", self.ask("What is my balance?")['text'])
+        self.assertTrue(self.ask("What is my balance?")['cached'])
+        storage.update_account(self.account_id, balance=20)
+        reply = self.ask("What is my balance?")
+        self.assertFalse(reply['cached'])
+        self.assertIn("20", reply['text'])
+
+    def test_follow_up_turns_are_not_cached(self):
+        async def run():
+            assistant = Assistant(client=stub_client(self.stub), cache=self.cache)
+            history = [{"role": "user", "content": "hi"}, {"role": "assistant", "content": "hello"},
+                       {"role": "user", "content": "What are your fees?"}]
+            await assistant.respond(self.user_id, history)
+            return await assistant.respond(self.user_id, history)
+        self.assertFalse(asyncio.run(run())['cached'])
+        self.assertEqual(self.cache.stats()['hits'] + self.cache.stats()['misses'], 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,31 @@
+import unittest
+from datetime import date, timedelta
+import spending
+import storage
+from storage import InMemoryStorage
+
+class TestSpendingMaintenance(unittest.TestCase):
+
+    def setUp(self):
+        storage.set_storage(InMemoryStorage())
+        user_id = storage.create_user("johndoe", "john@example.com", "x", "John", "Doe", "1", True)
+        a = storage.create_account(user_id, 1000, "checking", "USD")
+        b = storage.create_account(user_id, 1000, "checking", "USD")
+        for amount in (1, 2, 3):
+            storage.create_transaction(a, b, amount, "USD", "completed", "transfer", None)
+
+    def tearDown(self):
+        storage.set_storage(None)
+
+    def test_backfill_repairs_what_check_finds(self):
+        self.assertEqual(spending.check(), [])
+        storage.get_storage()._spending.clear()
+        self.assertEqual(len(spending.check()), 1)
+        batches = []
+        rows = spending.backfill(date.today() - timedelta(days=20), batch_days=7,
+                                 progress=lambda start, end, rows: batches.append(rows))
+        self.assertEqual((rows, batches), (1, [0, 0, 1]))
+        self.assertEqual(spending.check(), [])
+
+if __name__ == '__main__':
+    unittest.main()
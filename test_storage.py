@@ -0,0 +1,302 @@
+import unittest
+from decimal import Decimal
+from schemas import AccountType, Currency, RelationshipType
+from storage import InMemoryStorage, create_storage
+import storage
+
+class TestInMemoryStorage(unittest.TestCase):
+
+    def setUp(self):
+        self.db = InMemoryStorage()
+        self.user_id = self.db.create_user("johndoe", "john@example.com", "password_hash", "John", "Doe", "1234567890", True)
+
+    def test_create_user_unique_username_and_email(self):
+        self.assertIsNotNone(self.user_id)
+        self.assertIsNone(self.db.create_user("johndoe", "other@example.com", "x", "A", "B", "1", False))
+        self.assertIsNone(self.db.create_user("other", "john@example.com", "x", "A", "B", "1", False))
+        self.assertIsNotNone(self.db.create_user("other", "other@example.com", "x", "A", "B", "1", False))
+
+    def test_get_user(self):
+        user = self.db.get_user(self.user_id)
+        self.assertEqual(user['username'], "johndoe")
+        self.assertEqual(user['email'], "john@example.com")
+        self.assertIn('created_at', user)
+        self.assertIsNone(self.db.get_user(999))
+
+    def test_returned_rows_are_copies(self):
+        user = self.db.get_user(self.user_id)
+        user['username'] = "changed"
+        self.assertEqual(self.db.get_user(self.user_id)['username'], "johndoe")
+
+    def test_update_user(self):
+        self.assertEqual(self.db.update_user(self.user_id, username="janedoe"), 1)
+        self.assertEqual(self.db.get_user(self.user_id)['username'], "janedoe")
+        self.assertEqual(self.db.update_user(999, username="nobody"), 0)
+        # The old username is free again, the new one is taken
+        self.assertIsNotNone(self.db.create_user("johndoe", "x@example.com", "x", "A", "B", "1", False))
+        self.assertIsNone(self.db.create_user("janedoe", "y@example.com", "x", "A", "B", "1", False))
+
+    def test_update_user_rejects_duplicate_and_unknown_columns(self):
+        other_id = self.db.create_user("other", "other@example.com", "x", "A", "B", "1", False)
+        with self.assertRaises(ValueError):
+            self.db.update_user(other_id, email="john@example.com")
+        with self.assertRaises(ValueError):
+            self.db.update_user(other_id, password="secret")
+
+    def test_account_values_match_database_types(self):
+        account_id = self.db.create_account(self.user_id, 1000.00, AccountType.SAVINGS, Currency.USD)
+        account = self.db.get_account(account_id)
+        self.assertEqual(account['balance'], Decimal("1000.0"))
+        self.assertEqual(account['account_type'], "savings")
+        self.assertEqual(account['currency'], "USD")
+        self.assertEqual(self.db.update_account(account_id, balance=2000.00), 1)
+        self.assertEqual(self.db.get_account(account_id)['balance'], Decimal("2000.0"))
+
+    def test_user_balances_grouped_by_currency(self):
+        self.db.create_account(self.user_id, 10, "savings", "USD")
+        self.db.create_account(self.user_id, "2.50", "checking", "USD")
+        self.db.create_account(self.user_id, 7, "checking", "JPY")
+        self.assertEqual(self.db.get_user_balances(self.user_id), [
+            {"currency": "JPY", "balance": Decimal("7"), "accounts": 1},
+            {"currency": "USD", "balance": Decimal("12.50"), "accounts": 2}])
+        self.assertEqual(self.db.get_user_balances(999), [])
+
+    def test_create_account_requires_user(self):
+        with self.assertRaises(ValueError):
+            self.db.create_account(999, 10, "savings", "USD")
+
+    def test_create_transaction_requires_accounts(self):
+        account_id = self.db.create_account(self.user_id, 100, "savings", "USD")
+        self.assertIsNone(self.db.create_transaction(account_id, 999, 10, "USD", "completed", "transfer", None))
+
+    def test_delete_account_cascades_to_transactions(self):
+        sender = self.db.create_account(self.user_id, 1000, "savings", "USD")
+        recipient = self.db.create_account(self.user_id, 500, "checking", "USD")
+        transaction_id = self.db.create_transaction(sender, recipient, 100, "USD", "completed", "transfer", "Test")
+        self.assertEqual(self.db.delete_account(recipient), 1)
+        self.assertIsNone(self.db.get_transaction(transaction_id))
+        self.assertEqual(self.db.delete_account(recipient), 0)
+        self.assertIsNotNone(self.db.get_account(sender))
+
+    def test_delete_user_cascades(self):
+        other_id = self.db.create_user("other", "other@example.com", "x", "A", "B", "1", False)
+        mine = self.db.create_account(self.user_id, 1000, "savings", "USD")
+        theirs = self.db.create_account(other_id, 1000, "savings", "USD")
+        transaction_id = self.db.create_transaction(theirs, mine, 100, "USD", "completed", "transfer", None)
+        recipient_id = self.db.create_recipient(self.user_id, "Jane", "123", "Bank", "TESTSWIFT", "friend", True)
+
+        self.assertEqual(self.db.delete_user(self.user_id), 1)
+        self.assertIsNone(self.db.get_account(mine))
+        self.assertIsNone(self.db.get_transaction(transaction_id))
+        self.assertIsNone(self.db.get_recipient(recipient_id))
+        self.assertIsNotNone(self.db.get_account(theirs))
+        self.assertEqual(self.db.delete_user(self.user_id), 0)
+        # Username and email can be reused once the user is gone
+        self.assertIsNotNone(self.db.create_user("johndoe", "john@example.com", "x", "A", "B", "1", False))
+
+    def test_update_transaction_moves_account_index(self):
+        a = self.db.create_account(self.user_id, 1000, "savings", "USD")
+        b = self.db.create_account(self.user_id, 1000, "savings", "USD")
+        c = self.db.create_account(self.user_id, 1000, "savings", "USD")
+        transaction_id = self.db.create_transaction(a, b, 100, "USD", "completed", "transfer", None)
+        self.assertEqual(self.db.update_transaction(transaction_id, recipient_account_id=c, status="pending"), 1)
+        self.db.delete_account(b)
+        self.assertEqual(self.db.get_transaction(transaction_id)['status'], "pending")
+        self.db.delete_account(c)
+        self.assertIsNone(self.db.get_transaction(transaction_id))
+
+    def test_spending_rollups_follow_transaction_writes(self):
+        a = self.db.create_account(self.user_id, 1000, "savings", "USD")
+        b = self.db.create_account(self.user_id, 1000, "savings", "USD")
+        rent = self.db.create_transaction(a, b, 100, "USD", "completed", "transfer", None)
+        self.db.create_transaction(a, b, "20.50", "USD", "pending", "transfer", None)
+        fee = self.db.create_transaction(a, b, 5, "USD", "completed", "fee", None)
+        self.db.create_transaction(a, b, 999, "USD", "rejected", "transfer", None)
+        month = self.db.get_transaction(rent)['created_at'].date().replace(day=1)
+        self.assertEqual(self.db.get_spending(self.user_id), [
+            {"month": month, "transaction_type": "transfer", "currency": "USD", "transaction_count": 2,
+             "amount": Decimal("120.50")},
+            {"month": month, "transaction_type": "fee", "currency": "USD", "transaction_count": 1, "amount": Decimal("5")}])
+        self.db.update_transaction(rent, transaction_type="fee", amount=50)
+        self.db.update_transaction(fee, status="cancelled")
+        by_recipient = self.db.get_spending(self.user_id, group_by="recipient_account_id")
+        self.assertEqual([(r['recipient_account_id'], r['transaction_count'], r['amount']) for r in by_recipient],
+                         [(b, 2, Decimal("70.50"))])
+        self.assertEqual(self.db.get_spending(self.user_id, end=month), [])
+        self.assertEqual(self.db.diff_spending(), [])
+        self.db.delete_account(b)
+        self.assertEqual(self.db.get_spending(self.user_id), [])
+        with self.assertRaises(ValueError):
+            self.db.get_spending(self.user_id, group_by="description")
+
+    def test_spending_diff_and_rebuild(self):
+        a = self.db.create_account(self.user_id, 1000, "savings", "USD")
+        b = self.db.create_account(self.user_id, 1000, "savings", "USD")
+        self.db.create_transaction(a, b, 100, "USD", "completed", "transfer", None)
+        self.db._spending.clear()
+        differences = self.db.diff_spending()
+        self.assertEqual([(d['rollup_count'], d['actual_count'], d['actual_amount']) for d in differences],
+                         [(None, 1, Decimal("100"))])
+        self.assertEqual(self.db.rebuild_spending(), 1)
+        self.assertEqual(self.db.diff_spending(), [])
+
+    def test_user_transactions_newest_first(self):
+        other_id = self.db.create_user("other", "other@example.com", "x", "A", "B", "1", False)
+        mine = self.db.create_account(self.user_id, 1000, "savings", "USD")
+        theirs = self.db.create_account(other_id, 1000, "savings", "USD")
+        first = self.db.create_transaction(mine, theirs, 1, "USD", "completed", "transfer", None)
+        second = self.db.create_transaction(theirs, mine, 2, "USD", "completed", "transfer", None)
+        self.db.create_transaction(theirs, theirs, 3, "USD", "completed", "transfer", None)
+        self.assertEqual([t['transaction_id'] for t in self.db.get_user_transactions(self.user_id)], [second, first])
+        self.assertEqual([t['transaction_id'] for t in self.db.get_user_transactions(self.user_id, 1)], [second])
+        self.assertEqual(self.db.get_user_transactions(999), [])
+
+    def test_search_transactions(self):
+        other_id = self.db.create_user("other", "other@example.com", "x", "A", "B", "1", False)
+        mine = self.db.create_account(self.user_id, 1000, "checking", "USD")
+        theirs = self.db.create_account(other_id, 1000, "checking", "USD")
+        rent = self.db.create_transaction(mine, theirs, 900, "USD", "completed", "transfer", "Rent March")
+        invoice = self.db.create_transaction(mine, theirs, 50, "USD", "completed", "transfer", "Invoice 4471 march")
+        self.db.create_transaction(theirs, theirs, 60, "USD", "completed", "transfer", "rent march")
+        self.db.create_transaction(mine, theirs, 10, "USD", "completed", "transfer", None)
+
+        ids = lambda rows: [t['transaction_id'] for t in rows]
+        self.assertEqual(ids(self.db.search_transactions("rent march", user_id=self.user_id)), [rent])
+        self.assertEqual(ids(self.db.search_transactions("inv 447", account_id=mine)), [invoice])
+        # Whole-word matches rank above partial ones
+        self.assertEqual(ids(self.db.search_transactions("march", user_id=self.user_id)), [invoice, rent])
+        self.assertEqual(ids(self.db.search_transactions("marc", user_id=self.user_id)), [invoice, rent])
+        self.assertEqual(len(self.db.search_transactions("march")), 3)
+        self.assertEqual(len(self.db.search_transactions("march", limit=1)), 1)
+        created = self.db.get_transaction(rent)["created_at"]
+        self.assertEqual(self.db.search_transactions("rent", user_id=self.user_id, end=created), [])
+        self.assertEqual(ids(self.db.search_transactions("rent", user_id=self.user_id, start=created)), [rent])
+        self.assertEqual(self.db.search_transactions("  ", user_id=self.user_id), [])
+        self.assertEqual(self.db.search_transactions("rent", user_id=999), [])
+
+    def test_recipients_and_favorites(self):
+        first = self.db.create_recipient(self.user_id, "Jane", "123", "Bank", "TESTSWIFT", RelationshipType.FRIEND, False)
+        second = self.db.create_recipient(self.user_id, "Acme", "456", "Bank", "TESTSWIFT", "business", True)
+        self.assertEqual(self.db.get_recipient(first)['relationship'], "friend")
+        self.assertEqual([r['recipient_id'] for r in self.db.get_all_recipients(self.user_id)], [first, second])
+        self.assertEqual([r['recipient_id'] for r in self.db.get_favorite_recipients(self.user_id)], [second])
+
+        self.assertTrue(self.db.toggle_favorite_recipient(first))
+        self.assertFalse(self.db.toggle_favorite_recipient(second))
+        self.assertEqual([r['recipient_id'] for r in self.db.get_favorite_recipients(self.user_id)], [first])
+        self.assertIsNone(self.db.toggle_favorite_recipient(999))
+
+        self.assertEqual(self.db.delete_recipient(first), 1)
+        self.assertEqual(self.db.get_all_recipients(self.user_id), [self.db.get_recipient(second)])
+
+    def test_create_recipient_requires_user(self):
+        self.assertIsNone(self.db.create_recipient(999, "Jane", "123", "Bank", "TESTSWIFT", "friend", False))
+
+
+class BackendContract:
+    # Behaviour both backends must agree on; subclasses set self.db and self.user_id
+
+    def test_toggle_favorite_of_missing_recipient_returns_none(self):
+        self.assertIsNone(self.db.toggle_favorite_recipient(2 ** 31 - 1))
+
+    def test_recipients_are_listed_by_id(self):
+        ids = [self.db.create_recipient(self.user_id, name, "123", "Bank", "TESTSWIFT", "friend", True) for name in ("Zoe", "Adam", "Mia")]
+        self.assertTrue(self.db.toggle_favorite_recipient(ids[1]) is False)
+        self.assertEqual([r['recipient_id'] for r in self.db.get_all_recipients(self.user_id)], sorted(ids))
+        self.assertEqual([r['recipient_id'] for r in self.db.get_favorite_recipients(self.user_id)], sorted([ids[0], ids[2]]))
+
+
+class TestInMemoryBackend(BackendContract, unittest.TestCase):
+
+    def setUp(self):
+        self.db = InMemoryStorage()
+        self.user_id = self.db.create_user("contract", "contract@example.com", "x", "A", "B", "1", False)
+
+
+class TestPostgresBackend(BackendContract, unittest.TestCase):
+
+    def setUp(self):
+        self.db = create_storage("postgres")
+        if not self.db.ping():
+            self.skipTest("PostgreSQL is not available")
+        self.user_id = self.db.create_user("storage_contract", "storage_contract@example.com", "x", "A", "B", "1", False)
+        self.assertIsNotNone(self.user_id)
+
+    def tearDown(self):
+        if getattr(self, "user_id", None) is not None:
+            self.db.delete_user(self.user_id)
+        self.db.close()
+
+
+class TestStorageSelection(unittest.TestCase):
+
+    def test_incomplete_backend_cannot_be_created(self):
+        class Partial(storage.Storage):
+            def get_user(self, user_id):
+                return None
+
+        with self.assertRaises(TypeError):
+            Partial()
+        self.assertIsInstance(create_storage("postgres"), storage.Storage)
+
+    def tearDown(self):
+        storage.set_storage(None)
+
+    def test_module_dispatches_to_active_backend(self):
+        backend = InMemoryStorage()
+        storage.set_storage(backend)
+        user_id = storage.create_user("a", "a@example.com", "x", "A", "B", "1", False)
+        self.assertEqual(backend.get_user(user_id)['username'], "a")
+
+    def test_writes_notify_listeners_with_affected_users(self):
+        storage.set_storage(InMemoryStorage())
+        changes = []
+        storage.subscribe(changes.append)
+        try:
+            alice = storage.create_user("alice", "alice@example.com", "x", "A", "B", "1", False)
+            bob = storage.create_user("bob", "bob@example.com", "x", "B", "C", "1", False)
+            sender = storage.create_account(alice, 100, "checking", "USD")
+            recipient = storage.create_account(bob, 0, "checking", "USD")
+            del changes[:]
+            transaction_id = storage.create_transaction(sender, recipient, 10, "USD", "completed", "transfer", None)
+            storage.update_account(sender, balance=90)
+            storage.update_account(999, balance=1)
+            self.assertEqual(storage.toggle_favorite_recipient(999), None)
+            storage.delete_account(recipient)
+        finally:
+            storage.unsubscribe(changes.append)
+        created_at = changes[0]["created_at"]
+        self.assertEqual(changes, [
+            # Written rows carry their fields, so listeners need not read them back
+            {"table": "transactions", "operation": "create", "id": transaction_id, "user_ids": [alice, bob],
+             "sender_account_id": sender, "recipient_account_id": recipient, "amount": Decimal("10"),
+             "currency": "USD", "status": "completed", "created_at": created_at},
+            {"table": "accounts", "operation": "update", "id": sender, "user_ids": [alice],
+             "balance": Decimal("90"), "currency": "USD"},
+            # The account's transactions are deleted with it
+            {"table": "transactions", "operation": "delete", "id": transaction_id, "user_ids": [alice, bob]},
+            {"table": "accounts", "operation": "delete", "id": recipient, "user_ids": [bob]},
+        ])
+
+    def test_moved_rows_report_old_and_new_owners(self):
+        storage.set_storage(InMemoryStorage())
+        alice = storage.create_user("alice", "alice@example.com", "x", "A", "B", "1", False)
+        bob = storage.create_user("bob", "bob@example.com", "x", "B", "C", "1", False)
+        carol = storage.create_user("carol", "carol@example.com", "x", "C", "D", "1", False)
+        a, b, c = (storage.create_account(user_id, 100, "checking", "USD") for user_id in (alice, bob, carol))
+        transaction_id = storage.create_transaction(a, b, 10, "USD", "pending", "transfer", None)
+        changes = []
+        storage.subscribe(changes.append)
+        try:
+            storage.update_transaction(transaction_id, recipient_account_id=c)
+            storage.update_account(c, user_id=alice)
+        finally:
+            storage.unsubscribe(changes.append)
+        self.assertEqual([change["user_ids"] for change in changes], [[alice, bob, carol], [alice, carol]])
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            create_storage("sqlite")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,169 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+from fastapi.testclient import TestClient
+import storage
+import velocity
+from storage import InMemoryStorage
+from velocity import EventWindow, VelocityChecker, load_rules
+from main import app
+
+RULES = [
+    {"name": "burst", "scope": "account", "window": "1m", "max_count": 3, "action": "block"},
+    {"name": "hourly_amount", "scope": "account", "window": "1h", "max_amount": 1000, "action": "hold"},
+    {"name": "fan_in", "scope": "recipient", "window": "24h", "max_count": 5, "action": "hold"},
+]
+
+
+class TestEventWindow(unittest.TestCase):
+
+    def test_counts_and_sums_are_exact(self):
+        window = EventWindow()
+        for when, amount in ((10, 1), (20, 2), (30, 4), (15, 8)):
+            window.add(when, amount)
+        self.assertEqual(list(window.times), [10, 15, 20, 30])
+        self.assertEqual(window.stats(0), (4, 15))
+        self.assertEqual(window.stats(15), (2, 6))
+        self.assertEqual(window.stats(30), (0, 0))
+        self.assertEqual(window.prune(15), 2)
+        self.assertEqual(window.stats(0), (2, 6))
+
+
+class TestVelocityChecker(unittest.TestCase):
+
+    def setUp(self):
+        storage.set_storage(InMemoryStorage())
+        self.user_id = storage.create_user("johndoe", "john@example.com", "x", "John", "Doe", "1", True)
+        self.a = storage.create_account(self.user_id, 10000, "checking", "USD")
+        self.b = storage.create_account(self.user_id, 10000, "checking", "USD")
+        self.checker = VelocityChecker(rules=RULES)
+        self.checker.attach()
+
+    def tearDown(self):
+        self.checker.detach()
+        storage.set_storage(None)
+
+    def transfer(self, amount=10, sender=None, recipient=None, backend=storage):
+        return backend.create_transaction(sender or self.a, recipient or self.b, amount, "USD", "completed", "transfer",
+                                          None)
+
+    def check(self, *args, **kwargs):
+        # A check that is not followed by a transfer
+        result = self.checker.check(*args, **kwargs)
+        self.checker.release(result["reservation"])
+        return result
+
+    def test_count_and_amount_rules(self):
+        self.assertEqual(self.check(self.a, self.b, 10, "USD")["action"], "allow")
+        self.transfer()
+        self.transfer()
+        self.transfer()
+        self.assertEqual(self.check(self.a, self.b, 10, "USD"), {"action": "block", "rules": ["burst"], "reservation": None})
+        # An hour later the burst has passed
+        self.assertEqual(self.check(self.a, self.b, 10, "USD", now=time.time() + 3600)["action"], "allow")
+        self.assertEqual(self.check(self.b, self.a, 1001, "USD")["rules"], ["hourly_amount"])
+        self.assertEqual(self.check(self.b, self.a, 1000, "USD")["action"], "allow")
+        # Amounts are compared in USD
+        self.assertEqual(self.check(self.b, self.a, 200000, "JPY")["action"], "hold")
+
+    def test_checks_reserve_until_recorded_or_released(self):
+        # Concurrent checks: only as many pass as the limit allows
+        results = [self.checker.check(self.a, self.b, 10, "USD") for _ in range(4)]
+        self.assertEqual([r["action"] for r in results], ["allow", "allow", "allow", "block"])
+        # A reservation becomes the transaction's entry instead of being counted twice
+        self.transfer()
+        self.assertEqual(self.checker.stats()["events"], 6)
+        self.checker.release(results[1]["reservation"])
+        self.checker.release(results[2]["reservation"])
+        self.assertEqual(self.checker.stats()["events"], 2)
+        self.assertEqual(self.check(self.a, self.b, 10, "USD")["action"], "allow")
+
+    def test_amount_limits_are_exact_at_the_boundary(self):
+        now = time.time()
+        for transaction_id, amount, age in ((100, "99999.99", 7200), (101, "0.10", 60)):
+            self.checker.record({"transaction_id": transaction_id, "sender_account_id": self.b,
+                                 "recipient_account_id": self.a, "amount": amount, "currency": "USD",
+                                 "created_at": now - age})
+        # 0.10 + 999.90 is exactly the hourly limit; with float running sums the large
+        # transfer from two hours ago left the hour's total a little above 0.10
+        self.assertEqual(self.check(self.b, self.a, "999.90", "USD", now=now)["action"], "allow")
+        self.assertEqual(self.check(self.b, self.a, "999.91", "USD", now=now)["action"], "hold")
+
+    def test_recipient_rules_count_all_senders(self):
+        others = [storage.create_account(self.user_id, 100, "checking", "USD") for _ in range(5)]
+        for sender in others:
+            self.transfer(sender=sender)
+        self.assertEqual(self.check(self.a, self.b, 1, "USD")["rules"], ["fan_in"])
+
+    def test_transfers_are_counted_from_change_records(self):
+        reads = []
+        backend = storage.get_storage()
+        get_transaction = backend.get_transaction
+        backend.get_transaction = lambda transaction_id: reads.append(transaction_id) or get_transaction(transaction_id)
+        self.transfer()
+        self.assertEqual(reads, [])
+        self.assertEqual(self.checker.stats()["events"], 2)
+
+    def test_sync_picks_up_writes_of_other_workers(self):
+        # Written straight to the backend, so no change notification reaches the checker
+        backend = storage.get_storage()
+        for _ in range(3):
+            self.transfer(backend=backend)
+        self.assertEqual(self.check(self.a, self.b, 10, "USD")["action"], "allow")
+        self.assertEqual(self.checker.sync(), 3)
+        self.assertEqual(self.checker.sync(), 0)
+        self.assertEqual(self.check(self.a, self.b, 10, "USD")["action"], "block")
+
+    def test_rebuilt_from_storage(self):
+        for _ in range(3):
+            self.transfer()
+        checker = VelocityChecker(rules=RULES)
+        self.assertEqual(checker.rebuild(), 3)
+        self.assertEqual(checker.stats()["events"], 6)
+        self.assertEqual(checker.check(self.a, self.b, 10, "USD")["action"], "block")
+
+    def test_load_rules(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "rules.json")
+            with open(path, "w") as f:
+                json.dump(RULES, f)
+            self.assertEqual(load_rules(path), RULES)
+            with open(path, "w") as f:
+                json.dump([{"name": "x", "scope": "account", "window": "2h", "max_count": 1, "action": "block"}], f)
+            with self.assertRaises(ValueError):
+                load_rules(path)
+
+
+class TestTransferRiskChecks(unittest.TestCase):
+
+    def setUp(self):
+        storage.set_storage(InMemoryStorage())
+        self.user_id = storage.create_user("johndoe", "john@example.com", "x", "John", "Doe", "1", True)
+        self.a = storage.create_account(self.user_id, 10000, "checking", "USD")
+        self.b = storage.create_account(self.user_id, 10000, "checking", "USD")
+        self.client = TestClient(app)
+        self.client.__enter__()
+        velocity.get_checker().rules = RULES
+
+    def tearDown(self):
+        self.client.__exit__(None, None, None)
+        storage.set_storage(None)
+
+    def post(self, amount):
+        return self.client.post("/transactions/", json={
+            "sender_account_id": self.a, "recipient_account_id": self.b, "amount": amount, "currency": "USD",
+            "status": "pending", "transaction_type": "transfer"})
+
+    def test_held_and_blocked_transfers(self):
+        self.assertEqual(self.post("2000").json()["status"], "held")
+        self.assertEqual(self.post("10").json()["status"], "held")
+        self.assertEqual(self.post("10").json()["status"], "held")
+        response = self.post("10")
+        self.assertEqual(response.status_code, 403)
+        self.assertIn("burst", response.json()["detail"])
+        self.assertEqual(len(storage.list_transactions()), 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,269 @@
+import bisect
+import json
+import os
+import time
+from array import array
+
+import fx
+import recent_transfers
+from recent_transfers import RecentTransfers, timestamp
+
+# Velocity checks on new transfers. Before a transaction is inserted, the count and
+# sum of recent transfers from the sender account and into the recipient account are
+# compared with the rules; a transfer over a "block" limit is refused and one over a
+# "hold" limit is created with status "held" for review.
+#
+# A transfer that is not refused is counted in the same step, under the lock, so
+# concurrent transfers cannot all pass a limit that only one of them should. Its
+# reservation becomes the transaction's own entry once the transaction is recorded,
+# and is released when the transaction could not be created.
+#
+# Each account keeps its transfers of the last 24 hours as two arrays: sorted
+# timestamps and the running sum of amounts. Count and sum over any window are then a
+# bisect and a subtraction, and exact, whatever the rate. Amounts are summed as integer
+# minor units of VELOCITY_CURRENCY at the current FX rates.
+#
+# The windows are rebuilt from the database on startup. Transfers created by this
+# process are added from storage change notifications; those of other workers are
+# read back every VELOCITY_SYNC_INTERVAL seconds, so a worker sees them within that
+# interval. Transactions whose insert commits more than VELOCITY_SYNC_OVERLAP seconds
+# after their created_at can be missed by the sync.
+
+VELOCITY_CHECKS = os.getenv("VELOCITY_CHECKS", "1") == "1"
+VELOCITY_RULES_PATH = os.getenv("VELOCITY_RULES_PATH")
+VELOCITY_CURRENCY = os.getenv("VELOCITY_CURRENCY", "USD")
+VELOCITY_SYNC_INTERVAL = float(os.getenv("VELOCITY_SYNC_INTERVAL", "1"))
+VELOCITY_SYNC_OVERLAP = float(os.getenv("VELOCITY_SYNC_OVERLAP", "10"))
+
+WINDOWS = {"1m": 60, "1h": 3600, "24h": 86400}
+HISTORY = max(WINDOWS.values())
+SCOPES = {"account": "sender_account_id", "recipient": "recipient_account_id"}
+ACTIONS = ("hold", "block")
+SEVERITY = {"allow": 0, "hold": 1, "block": 2}
+# Idle accounts are dropped by a sweep that visits this many per sync
+PRUNE_BATCH = 500
+
+DEFAULT_RULES = [
+    {"name": "account_burst", "scope": "account", "window": "1m", "max_count": 5, "action": "block"},
+    {"name": "account_hourly_count", "scope": "account", "window": "1h", "max_count": 30, "action": "hold"},
+    {"name": "account_hourly_amount", "scope": "account", "window": "1h", "max_amount": 10000, "action": "hold"},
+    {"name": "account_daily_amount", "scope": "account", "window": "24h", "max_amount": 50000, "action": "block"},
+    {"name": "recipient_fan_in", "scope": "recipient", "window": "1h", "max_count": 50, "action": "hold"},
+    {"name": "recipient_daily_amount", "scope": "recipient", "window": "24h", "max_amount": 100000, "action": "hold"},
+]
+
+
+def load_rules(path=VELOCITY_RULES_PATH):
+    if not path:
+        return DEFAULT_RULES
+    with open(path) as f:
+        rules = json.load(f)
+    for rule in rules:
+        if (rule.get("scope") not in SCOPES or rule.get("window") not in WINDOWS or rule.get("action") not in ACTIONS
+                or ("max_count" not in rule and "max_amount" not in rule)):
+            raise ValueError(f"Invalid velocity rule {rule.get('name')!r}: needs scope ({', '.join(SCOPES)}), "
+                             f"window ({', '.join(WINDOWS)}), action ({', '.join(ACTIONS)}) and a limit")
+    return rules
+
+
+class EventWindow:
+    # Transfers of one account, oldest first
+    __slots__ = ("times", "sums")
+
+    def __init__(self):
+        self.times = array("d")
+        self.sums = array("q")  # sums[i] = amounts of events 0..i, in minor units
+
+    def add(self, when, amount):
+        if len(self.times) >= 64 and self.times[0] < when - HISTORY:
+            self.prune(when - HISTORY)
+        if not self.times or when >= self.times[-1]:
+            self.times.append(when)
+            self.sums.append((self.sums[-1] if self.sums else 0) + amount)
+            return
+        # Arrived out of order, e.g. synced from another worker
+        i = bisect.bisect_right(self.times, when)
+        self.times.insert(i, when)
+        self.sums.insert(i, (self.sums[i - 1] if i else 0) + amount)
+        for j in range(i + 1, len(self.sums)):
+            self.sums[j] += amount
+
+    def remove(self, when, amount):
+        # Takes back an event added with add(when, amount); False once it was pruned
+        i = bisect.bisect_left(self.times, when)
+        if i == len(self.times) or self.times[i] != when:
+            return False
+        del self.times[i]
+        del self.sums[i]
+        for j in range(i, len(self.sums)):
+            self.sums[j] -= amount
+        return True
+
+    def stats(self, since):
+        # (count, sum) of events after since
+        i = bisect.bisect_right(self.times, since)
+        count = len(self.times) - i
+        if not count:
+            return 0, 0
+        return count, self.sums[-1] - (self.sums[i - 1] if i else 0)
+
+    def prune(self, before):
+        i = bisect.bisect_right(self.times, before)
+        if i:
+            base = self.sums[i - 1]
+            del self.times[:i]
+            del self.sums[:i]
+            for j in range(len(self.sums)):
+                self.sums[j] -= base
+        return len(self.times)
+
+
+class VelocityChecker(RecentTransfers):
+    def __init__(self, rules=None, currency=VELOCITY_CURRENCY, overlap=VELOCITY_SYNC_OVERLAP):
+        super().__init__(HISTORY, overlap)
+        self.currency = currency
+        self.rules = load_rules() if rules is None else rules
+        self._windows = {}  # (scope, account_id) -> EventWindow
+        self._seen = {}  # transaction_id -> created_at, for transactions the next sync may return again
+        # reservation id -> ((sender, recipient, amount), time) of transfers checked but not yet recorded
+        self._reserved = {}
+        self._next_reservation = 1
+        self._sweep = []  # keys still to visit in the current pruning sweep
+        self.decisions = {"allow": 0, "hold": 0, "block": 0}
+
+    @property
+    def rules(self):
+        return self._rules
+
+    @rules.setter
+    def rules(self, rules):
+        # Limits are kept with the amount limit in minor units, as the windows sum them
+        self._rules = rules
+        self._limits = [(rule, rule.get("max_count", float("inf")),
+                         fx.to_minor(rule["max_amount"], self.currency) if "max_amount" in rule else float("inf"))
+                        for rule in rules]
+
+    def _clear(self):
+        self._windows.clear()
+        self._seen.clear()
+        self._reserved.clear()
+        self._sweep = []
+
+    def _amount(self, amount, currency):
+        # Minor units of self.currency
+        try:
+            return fx.current().convert_minor((fx.to_minor(amount, currency),), currency, self.currency)[0]
+        except (KeyError, ValueError):
+            # Currencies without a rate are counted at face value
+            return fx.to_minor(amount, self.currency)
+
+    def _add(self, sender_account_id, recipient_account_id, when, amount):
+        for key in (("account", sender_account_id), ("recipient", recipient_account_id)):
+            window = self._windows.get(key)
+            if window is None:
+                window = self._windows[key] = EventWindow()
+            window.add(when, amount)
+
+    def _record(self, transaction):
+        # Caller holds the lock; returns False for a transaction already counted
+        transaction_id = transaction["transaction_id"]
+        if transaction_id in self._seen:
+            return False
+        when = timestamp(transaction["created_at"])
+        self._seen[transaction_id] = when
+        transfer = (transaction["sender_account_id"], transaction["recipient_account_id"],
+                    self._amount(transaction["amount"], transaction["currency"]))
+        # A transfer reserved by check() is already counted; any reservation of the same
+        # transfer will do, as they count the same
+        for reservation, (reserved, _) in self._reserved.items():
+            if reserved == transfer:
+                del self._reserved[reservation]
+                return True
+        self._add(*transfer[:2], when, transfer[2])
+        return True
+
+    def _prune(self, now):
+        # Only transactions created within the overlap can come back from the next sync
+        for transaction_id in [t for t, when in self._seen.items() if when < now - self.overlap]:
+            del self._seen[transaction_id]
+        # Left behind by a transfer that was neither created nor released; its events
+        # have aged out of the windows by now
+        for reservation in [r for r, (_, when) in self._reserved.items() if when < now - HISTORY]:
+            del self._reserved[reservation]
+        if not self._sweep:
+            self._sweep = list(self._windows)
+        for _ in range(min(PRUNE_BATCH, len(self._sweep))):
+            key = self._sweep.pop()
+            window = self._windows.get(key)
+            if window is not None and not window.prune(now - HISTORY):
+                del self._windows[key]
+
+    def check(self, sender_account_id, recipient_account_id, amount, currency, now=None):
+        # Returns {"action": "allow" | "hold" | "block", "rules": [names of the rules hit],
+        # "reservation": id to release if the transfer is not created, None when blocked}
+        now = time.time() if now is None else now
+        amount = self._amount(amount, currency)
+        accounts = {"account": sender_account_id, "recipient": recipient_account_id}
+        hits = []
+        action = "allow"
+        reservation = None
+        with self._lock:
+            for rule, max_count, max_amount in self._limits:
+                window = self._windows.get((rule["scope"], accounts[rule["scope"]]))
+                count, total = window.stats(now - WINDOWS[rule["window"]]) if window is not None else (0, 0)
+                if count + 1 > max_count or total + amount > max_amount:
+                    hits.append(rule["name"])
+                    action = max(action, rule["action"], key=SEVERITY.get)
+            self.decisions[action] += 1
+            if action != "block":
+                reservation = self._next_reservation
+                self._next_reservation += 1
+                self._reserved[reservation] = ((sender_account_id, recipient_account_id, amount), now)
+                self._add(sender_account_id, recipient_account_id, now, amount)
+        return {"action": action, "rules": hits, "reservation": reservation}
+
+    def release(self, reservation):
+        # Takes back a reservation whose transfer was never created
+        with self._lock:
+            entry = self._reserved.pop(reservation, None)
+            if entry is None:
+                return
+            (sender_account_id, recipient_account_id, amount), when = entry
+            for key in (("account", sender_account_id), ("recipient", recipient_account_id)):
+                window = self._windows.get(key)
+                if window is not None:
+                    window.remove(when, amount)
+
+    def stats(self):
+        with self._lock:
+            return {"accounts": len(self._windows), "events": sum(len(w.times) for w in self._windows.values()),
+                    "decisions": dict(self.decisions)}
+
+
+async def run_sync(checker, interval=VELOCITY_SYNC_INTERVAL):
+    await recent_transfers.run_sync(checker, interval, "Velocity")
+
+
+_checker = None
+
+
+def get_checker():
+    return _checker
+
+
+def set_checker(checker):
+    global _checker
+    _checker = checker
+
+
+def check_transfer(sender_account_id, recipient_account_id, amount, currency):
+    # Every transfer passes when checks are off or not yet loaded
+    if _checker is None:
+        return {"action": "allow", "rules": [], "reservation": None}
+    return _checker.check(sender_account_id, recipient_account_id, amount, currency)
+
+
+def release(result):
+    # Called when the transfer checked with check_transfer could not be created
+    if _checker is not None and result["reservation"] is not None:
+        _checker.release(result["reservation"])